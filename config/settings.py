@@ -32,6 +32,7 @@ class DatabaseConfig:
     created_date: Optional[str] = None
     force_recreate_tables: bool = False
     allow_data_loss_recovery: bool = False
+    replica_urls: List[str] = field(default_factory=list)
 
 
 @dataclass  
@@ -172,7 +173,11 @@ class Settings:
             pool_size=self._get_int("DB_POOL_SIZE", 5),
             created_date=os.getenv("DATABASE_CREATED_DATE"),
             force_recreate_tables=self._get_bool("FORCE_RECREATE_TABLES", False),
-            allow_data_loss_recovery=self._get_bool("ALLOW_DATA_LOSS_RECOVERY", False)
+            allow_data_loss_recovery=self._get_bool("ALLOW_DATA_LOSS_RECOVERY", False),
+            replica_urls=[
+                url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",")
+                if url.strip()
+            ]
         )
         
         # Telegram
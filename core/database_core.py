@@ -13,11 +13,10 @@ from contextlib import asynccontextmanager
 import traceback
 
 try:
-    from sqlalchemy import create_engine, text, MetaData, Table
+    from sqlalchemy import text, event, MetaData, Table
     from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
     from sqlalchemy.ext.declarative import declarative_base
     from sqlalchemy.orm import sessionmaker
-    from sqlalchemy.pool import QueuePool
     from sqlalchemy.exc import SQLAlchemyError, OperationalError
     import asyncpg
 except ImportError as e:
@@ -26,11 +25,63 @@ except ImportError as e:
 from config.settings import Settings
 from utils.logger import get_logger
 from core.exceptions import DatabaseConnectionError, DatabaseOperationError
+from database.migrations import MigrationsManager, Migration, CreateIndexStep, SQLStep
+from database.replicas import ReplicaRouter, REPLICA_LAG_SQL
+from database.engines import engine_registry, get_pool_stats
 
 
 # Базовый класс для всех моделей
 Base = declarative_base()
 
+# Миграции таблиц модулей (область 'core' в schema_migrations).
+# create_all добавляет индексы только вместе с новой таблицей,
+# для существующих таблиц они строятся здесь без блокировки записи
+CORE_MIGRATIONS = [
+    Migration(1, 'module_composite_indexes', [
+        CreateIndexStep('idx_music_users_group_karma', 'music_users', ['group_id', 'karma_points']),
+        CreateIndexStep('idx_karma_history_user_date', 'karma_history', ['user_id', 'created_at']),
+        CreateIndexStep('idx_user_statistics_user_date', 'user_statistics', ['user_id', 'stat_date']),
+        CreateIndexStep('idx_user_sessions_active', 'user_sessions', ['user_id', 'is_active', 'last_activity']),
+    ]),
+    Migration(2, 'music_users_username_lower', [
+        # Поиск @username без учета регистра (modules/user_management/user_index.py):
+        # text_pattern_ops обслуживает и равенство, и LIKE 'префикс%'
+        CreateIndexStep(
+            'idx_music_users_username_lower', 'music_users', ['lower(username) text_pattern_ops'],
+            dialects=['postgresql']
+        ),
+        CreateIndexStep(
+            'idx_music_users_username_lower', 'music_users', ['lower(username)'],
+            dialects=['sqlite']
+        ),
+    ]),
+    Migration(3, 'user_statistics_daily_unique', [
+        # Пакетный upsert дневных счетчиков (modules/user_management/daily_stats.py)
+        CreateIndexStep(
+            'uq_user_statistics_user_group_date', 'user_statistics',
+            ['user_id', 'group_id', 'stat_date'], unique=True
+        ),
+    ]),
+    Migration(4, 'karma_history_opening_balance', [
+        # Балансы, появившиеся до журнала кармы (modules/user_management/ledger.py):
+        # разница между karma_points и суммой журнала становится записью
+        # 'opening_balance' на дату регистрации. Повторно не срабатывает -
+        # после вставки сумма журнала равна балансу
+        SQLStep("""
+            INSERT INTO karma_history (group_id, user_id, karma_change, karma_before, karma_after,
+                                       reason, change_type, created_at)
+            SELECT u.group_id, u.user_id, u.karma_points - COALESCE(h.total, 0), 0,
+                   u.karma_points - COALESCE(h.total, 0), 'Стартовая карма', 'opening_balance',
+                   u.registration_date
+            FROM music_users u
+            LEFT JOIN (
+                SELECT user_id, SUM(karma_change) AS total FROM karma_history GROUP BY user_id
+            ) h ON h.user_id = u.user_id
+            WHERE u.karma_points <> COALESCE(h.total, 0)
+        """),
+    ]),
+]
+
 
 class DatabaseCore:
     """Ядро работы с базой данных PostgreSQL"""
@@ -51,6 +102,9 @@ class DatabaseCore:
         self.async_session_maker = None
         self.sync_session_maker = None
         
+        # Реплики чтения (DATABASE_REPLICA_URLS)
+        self.replicas: Optional[ReplicaRouter] = None
+        
         # Метаданные
         self.metadata = MetaData()
         
@@ -99,36 +153,28 @@ class DatabaseCore:
         if not db_url:
             raise ValueError("DATABASE_URL не установлен")
         
-        # Преобразуем URL для async режима
-        if db_url.startswith("postgresql://"):
-            async_db_url = db_url.replace("postgresql://", "postgresql+asyncpg://", 1)
-        else:
-            async_db_url = db_url
+        # Async движок (общий с AsyncDatabaseManager для того же URL)
+        self.async_engine = self._create_async_engine(db_url)
         
-        # Async движок
-        self.async_engine = create_async_engine(
-            async_db_url,
-            poolclass=QueuePool,
-            pool_size=self.settings.database.pool_size,
-            max_overflow=10,
-            pool_timeout=self.settings.database.pool_timeout,
-            pool_recycle=3600,  # 1 час
-            echo=self.settings.debug,  # SQL логи в debug режиме
-            echo_pool=self.settings.debug
+        # Sync движок (для миграций и синхронных операций; общий с DatabaseManager)
+        self.sync_engine = engine_registry.get_engine(db_url, echo=self.settings.debug)
+        
+        # Async движки реплик: только для читающих сессий
+        self.replicas = ReplicaRouter(
+            self.async_engine,
+            self.settings.database.replica_urls,
+            self._create_async_engine
         )
         
-        # Sync движок (для миграций и синхронных операций)
-        self.sync_engine = create_engine(
+        self.logger.info("🔧 Движки SQLAlchemy получены из общего реестра")
+    
+    def _create_async_engine(self, db_url: str):
+        """Async движок из реестра: размер пула - DB_POOL_SIZE на процесс (database/engines.py)"""
+        return engine_registry.get_async_engine(
             db_url,
-            poolclass=QueuePool,
-            pool_size=self.settings.database.pool_size,
-            max_overflow=10,
-            pool_timeout=self.settings.database.pool_timeout,
-            pool_recycle=3600,
-            echo=self.settings.debug
+            echo=self.settings.debug,  # SQL логи в debug режиме
+            echo_pool=self.settings.debug
         )
-        
-        self.logger.info("🔧 Движки SQLAlchemy созданы")
     
     async def _test_connection(self):
         """Тестирование подключения к БД"""
@@ -165,10 +211,27 @@ class DatabaseCore:
             # Создание индексов и триггеров (если нужно)
             await self._create_additional_database_objects()
             
+            # Версионированные миграции (sync движок, вне event loop)
+            try:
+                await self._run_migrations()
+            except Exception as e:
+                # Не применившаяся версия будет повторена при следующем запуске
+                self.logger.error(f"❌ Ошибка миграций схемы: {e}")
+            
         except Exception as e:
             self.logger.error(f"❌ Ошибка настройки схемы БД: {e}")
             raise
     
+    async def _run_migrations(self, dry_run: bool = None) -> List[Dict[str, Any]]:
+        """Применение ожидающих миграций области 'core'"""
+        migrations = MigrationsManager(self.sync_engine, CORE_MIGRATIONS, scope='core')
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: migrations.run(dry_run=dry_run))
+    
+    def get_migrations_status(self) -> Dict[str, Any]:
+        """Состояние миграций области 'core'"""
+        return MigrationsManager(self.sync_engine, CORE_MIGRATIONS, scope='core').status()
+    
     async def _create_additional_database_objects(self):
         """Создание дополнительных объектов БД (индексы, триггеры, функции)"""
         try:
@@ -242,19 +305,25 @@ class DatabaseCore:
     
     def _setup_sessions(self):
         """Настройка фабрик сессий"""
-        # Async сессии
-        self.async_session_maker = async_sessionmaker(
-            bind=self.async_engine,
-            class_=AsyncSession,
-            expire_on_commit=False
-        )
-        
         # Sync сессии
         self.sync_session_maker = sessionmaker(
             bind=self.sync_engine,
             expire_on_commit=False
         )
         
+        # Async сессии (внутри - класс sync сессий, чтобы события были общими)
+        self.async_session_maker = async_sessionmaker(
+            bind=self.async_engine,
+            class_=AsyncSession,
+            expire_on_commit=False,
+            sync_session_class=self.sync_session_maker.class_
+        )
+        
+        if self.replicas and self.replicas.enabled:
+            # Read-your-writes для читающих сессий
+            event.listen(self.sync_session_maker, 'after_flush',
+                         lambda session, context: self.replicas.note_write())
+        
         self.logger.info("🎭 Фабрики сессий настроены")
     
     # === МЕТОДЫ РАБОТЫ С СЕССИЯМИ ===
@@ -278,6 +347,53 @@ class DatabaseCore:
             await session.close()
             self.query_count += 1
     
+    @asynccontextmanager
+    async def get_read_session(self, consistent: bool = False):
+        """
+        Async сессия только для чтения: реплика по кругу или основная БД
+        
+        Args:
+            consistent: Читать с основной БД (read-your-writes)
+        """
+        if not self.async_session_maker:
+            raise DatabaseOperationError("Async сессии не инициализированы")
+        
+        target = self.replicas.choose(consistent)
+        session = self.async_session_maker(bind=self.replicas.engine_for(target))
+        
+        try:
+            if target is not None:
+                try:
+                    await session.connection()
+                except SQLAlchemyError as e:
+                    self.replicas.mark_failed(target, e)
+                    await session.close()
+                    session = self.async_session_maker()
+            
+            yield session
+        except Exception as e:
+            self.error_count += 1
+            self.logger.error(f"❌ Ошибка в сессии чтения: {e}")
+            raise DatabaseOperationError(f"Ошибка БД операции: {e}")
+        finally:
+            await session.rollback()
+            await session.close()
+            self.query_count += 1
+    
+    async def check_replicas_health(self) -> Dict[str, bool]:
+        """Проверка подключения и отставания реплик"""
+        result = {}
+        for target in self.replicas.replicas if self.replicas else []:
+            try:
+                async with target.engine.connect() as conn:
+                    lag = await conn.execute(text(REPLICA_LAG_SQL))
+                    lag = lag.scalar()
+                self.replicas.check_lag(target, float(lag) if lag is not None else None)
+            except Exception as e:
+                self.replicas.mark_failed(target, e)
+            result[target.name] = target.healthy
+        return result
+    
     @asynccontextmanager
     async def get_sync_session(self):
         """Получение sync сессии с автоматическим управлением"""
@@ -378,8 +494,11 @@ class DatabaseCore:
             response_time = time.time() - start_time
             self.last_health_check = time.time()
             
+            replicas = await self.check_replicas_health()
+            
             return {
                 "healthy": True,
+                "replicas": replicas,
                 "database_version": db_version,
                 "response_time_ms": round(response_time * 1000, 2),
                 "pool_status": pool_status,
@@ -437,6 +556,7 @@ class DatabaseCore:
                 "pool_checked_in": self.async_engine.pool.checkedin(),
                 "pool_checked_out": self.async_engine.pool.checkedout(),
                 "pool_overflow": self.async_engine.pool.overflow(),
+                "pools": get_pool_stats(),
                 "query_count": self.query_count,
                 "error_count": self.error_count
             }
@@ -499,11 +619,16 @@ class DatabaseCore:
         self.is_connected = False
         
         try:
+            # Пулы общие с DatabaseManager: закрываются после последнего пользователя
             if self.async_engine:
-                await self.async_engine.dispose()
+                await engine_registry.release_async(self.async_engine)
+            
+            if self.replicas:
+                for target in self.replicas.replicas:
+                    await engine_registry.release_async(target.engine)
             
             if self.sync_engine:
-                self.sync_engine.dispose()
+                engine_registry.release(self.sync_engine)
             
             self.logger.info("✅ Все подключения к БД закрыты")
             
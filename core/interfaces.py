@@ -369,6 +369,8 @@ class EventTypes:
     USER_REGISTERED = "user.registered"
     USER_KARMA_CHANGED = "user.karma_changed"
     USER_RANK_CHANGED = "user.rank_changed"
+    USER_LINKS_CHANGED = "user.links_changed"
+    USER_PROFILE_UPDATED = "user.profile_updated"
     TRACK_SUPPORT_REQUESTED = "track.support_requested"
     TRACK_SUPPORT_CONFIRMED = "track.support_confirmed"
     MODULE_LOADED = "module.loaded"
@@ -23,16 +23,30 @@ from .models import (
     User,
     Link,
     Settings,
+    Counter,
+    # ПЛАН 4: История backup
+    BackupHistory,
     # Заглушки моделей для будущих планов
     # UserKarma,      # ПЛАН 2
     # KarmaHistory,   # ПЛАН 2
     # PresaveRequest, # ПЛАН 3
     # ApprovalClaim,  # ПЛАН 3
     # ClaimScreenshot,# ПЛАН 3
-    # BackupLog,      # ПЛАН 4
 )
 
 from .manager import DatabaseManager
+from .link_buffer import LinkIngestionBuffer
+from .settings_cache import SettingsCache
+from .counters import CounterStore
+from .user_cache import UserProfileCache
+from .stats_rollup import StatsRollupManager
+from .activity_rollup import ActivityRollupManager
+from .partitions import LinkPartitionManager
+from .bulk_jobs import BulkJobManager
+from .search import LinkSearchManager
+from .engines import EngineRegistry, engine_registry
+from .migrations import MigrationsManager, Migration, MigrationError
+from .async_manager import AsyncDatabaseManager, AsyncDatabaseAdapter
 
 # ПЛАН 1: Аналитика (АКТИВНАЯ)
 from .analytics import AnalyticsManager
@@ -57,7 +71,6 @@ from .analytics import AnalyticsManager
 # ============================================
 
 # TODO: Импорт будет активирован в ПЛАНЕ 4
-# from .migrations import MigrationsManager
 # from .backup_manager import BackupDataManager
 
 # ============================================
@@ -70,10 +83,28 @@ __all__ = [
     
     # ПЛАН 1 (АКТИВНЫЕ)
     'DatabaseManager',
+    'LinkIngestionBuffer',
+    'SettingsCache',
+    'CounterStore',
+    'UserProfileCache',
+    'StatsRollupManager',
+    'ActivityRollupManager',
+    'LinkPartitionManager',
+    'BulkJobManager',
+    'LinkSearchManager',
+    'EngineRegistry',
+    'engine_registry',
+    'MigrationsManager',
+    'Migration',
+    'MigrationError',
+    'AsyncDatabaseManager',
+    'AsyncDatabaseAdapter',
     'AnalyticsManager',
     'User',
     'Link', 
     'Settings',
+    'Counter',
+    'BackupHistory',
     
     # ПЛАН 2 (ЗАГЛУШКИ)
     # 'KarmaDataManager',
@@ -88,9 +119,7 @@ __all__ = [
     # 'ClaimScreenshot',
     
     # ПЛАН 4 (ЗАГЛУШКИ)
-    # 'MigrationsManager',
     # 'BackupDataManager',
-    # 'BackupLog',
 ]
 
 # ============================================
@@ -0,0 +1,342 @@
+"""
+Агрегаты активности Do Presave Reminder Bot v25+
+Количество ссылок по часам и дням в разрезе пользователя и топика
+
+ПЛАН 1: Часовые корзины + уплотнение в дневные (АКТИВНАЯ)
+
+Каждая вставка ссылок в той же транзакции увеличивает счетчик корзины
+(час, пользователь, топик) в link_activity. Часовые корзины старше
+ACTIVITY_HOURLY_RETENTION_DAYS фоновое уплотнение сворачивает в
+дневные. Экраны «Активность по дням» читают несколько сотен строк
+агрегатов, а не таблицу links. Для существующей истории есть
+backfill(), пересчитывающий агрегаты по таблице links.
+"""
+
+import os
+import threading
+from collections import Counter as TallyCounter
+from datetime import datetime, date, timedelta
+from typing import Dict, List, Optional, Any, Iterable, Tuple
+
+from sqlalchemy import update, select, delete, func, and_
+from sqlalchemy.exc import IntegrityError
+
+from database.models import Link, LinkActivity, LinkArchive
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+HOUR = 'hour'
+DAY = 'day'
+
+# Ключ корзины: (гранулярность, начало, user_id, thread_id)
+BucketKey = Tuple[str, datetime, int, int]
+
+
+def hour_start(moment: datetime) -> datetime:
+    """Начало часа"""
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def day_start(moment) -> datetime:
+    """Начало дня (для date и datetime)"""
+    return datetime(moment.year, moment.month, moment.day)
+
+
+class ActivityRollupManager:
+    """Инкрементальные агрегаты активности по часам и дням"""
+
+    def __init__(self, db_manager, hourly_retention_days: int = None,
+                 compact_interval: float = None):
+        """Инициализация агрегатов активности"""
+        self.db = db_manager
+        self.hourly_retention_days = hourly_retention_days if hourly_retention_days is not None else \
+            int(os.getenv('ACTIVITY_HOURLY_RETENTION_DAYS', '2'))
+        self.compact_interval = compact_interval if compact_interval is not None else \
+            float(os.getenv('ACTIVITY_COMPACT_INTERVAL', '3600'))
+        self.backfill_batch_size = int(os.getenv('ACTIVITY_BACKFILL_BATCH_SIZE', '5000'))
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = False
+
+    # ============================================
+    # ПЛАН 1: ЖИЗНЕННЫЙ ЦИКЛ
+    # ============================================
+
+    def start(self):
+        """Запуск периодического уплотнения"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="activity-compactor", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"✅ Уплотнение активности запущено (каждые {self.compact_interval}s)")
+
+    def stop(self):
+        """Остановка периодического уплотнения"""
+        self._stop.set()
+        self._started = False
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        """Фоновый цикл уплотнения"""
+        while not self._stop.wait(self.compact_interval):
+            try:
+                self.compact()
+            except Exception as e:
+                logger.error(f"❌ Ошибка уплотнения активности: {e}")
+
+    # ============================================
+    # ПЛАН 1: ИНКРЕМЕНТАЛЬНЫЕ ОБНОВЛЕНИЯ
+    # ============================================
+
+    def record_links(self, session, links: Iterable[Tuple[int, Optional[int], datetime]]):
+        """
+        Учет добавленных ссылок (в транзакции вставки)
+
+        Args:
+            links: Тройки (user_id, thread_id, created_at)
+        """
+        buckets = TallyCounter(
+            (HOUR, hour_start(created_at), user_id, thread_id or 0)
+            for user_id, thread_id, created_at in links
+        )
+        for key, amount in buckets.items():
+            self._add(session, key, amount)
+
+    @staticmethod
+    def _add(session, key: BucketKey, amount: int):
+        """UPDATE link_activity SET links = links + :n (или вставка)"""
+        granularity, bucket_start, user_id, thread_id = key
+        condition = and_(
+            LinkActivity.granularity == granularity,
+            LinkActivity.bucket_start == bucket_start,
+            LinkActivity.user_id == user_id,
+            LinkActivity.thread_id == thread_id,
+        )
+
+        result = session.execute(
+            update(LinkActivity).where(condition).values(links=LinkActivity.links + amount)
+        )
+        if result.rowcount:
+            return
+        try:
+            with session.begin_nested():
+                session.add(LinkActivity(
+                    granularity=granularity, bucket_start=bucket_start,
+                    user_id=user_id, thread_id=thread_id, links=amount
+                ))
+        except IntegrityError:
+            session.execute(
+                update(LinkActivity).where(condition).values(links=LinkActivity.links + amount)
+            )
+
+    # ============================================
+    # ПЛАН 1: УПЛОТНЕНИЕ
+    # ============================================
+
+    def compact(self, before: datetime = None) -> int:
+        """Свертка часовых корзин старше срока хранения в дневные"""
+        if before is None:
+            before = day_start(datetime.now()) - timedelta(days=self.hourly_retention_days)
+
+        with self.db.get_session() as session:
+            rows = session.execute(
+                select(LinkActivity.bucket_start, LinkActivity.user_id,
+                       LinkActivity.thread_id, LinkActivity.links)
+                .where(and_(LinkActivity.granularity == HOUR,
+                            LinkActivity.bucket_start < before))
+            ).all()
+
+            if not rows:
+                return 0
+
+            days = TallyCounter()
+            for bucket_start, user_id, thread_id, links in rows:
+                days[(DAY, day_start(bucket_start), user_id, thread_id)] += links
+
+            for key, amount in days.items():
+                self._add(session, key, amount)
+
+            # Вычитаем ровно прочитанное: запоздавшие вставки (например, из
+            # spool буфера ссылок) останутся и попадут в следующую свертку
+            for bucket_start, user_id, thread_id, links in rows:
+                session.execute(
+                    update(LinkActivity).where(and_(
+                        LinkActivity.granularity == HOUR,
+                        LinkActivity.bucket_start == bucket_start,
+                        LinkActivity.user_id == user_id,
+                        LinkActivity.thread_id == thread_id,
+                    )).values(links=LinkActivity.links - links)
+                )
+            session.execute(
+                delete(LinkActivity).where(and_(
+                    LinkActivity.granularity == HOUR,
+                    LinkActivity.bucket_start < before,
+                    LinkActivity.links <= 0
+                ))
+            )
+
+        logger.info(f"✅ Активность уплотнена: {len(rows)} часовых корзин -> {len(days)} дневных")
+        return len(rows)
+
+    # ============================================
+    # ПЛАН 1: ЗАПОЛНЕНИЕ ПО ИСТОРИИ
+    # ============================================
+
+    def backfill(self) -> Dict[str, int]:
+        """
+        Пересчет агрегатов по всей таблице links
+
+        Ссылки читаются пачками по диапазонам id. Вставки, пришедшие во
+        время чтения, досчитываются в финальной транзакции замены.
+        """
+        cutoff = day_start(datetime.now()) - timedelta(days=self.hourly_retention_days)
+
+        with self.db.get_session() as session:
+            last_id = session.execute(select(func.max(Link.id))).scalar() or 0
+
+        buckets = TallyCounter()
+        scanned = 0
+        start_id = 0
+        while start_id < last_id:
+            end_id = min(start_id + self.backfill_batch_size, last_id)
+            with self.db.get_session() as session:
+                rows = session.execute(
+                    select(Link.user_id, Link.thread_id, Link.created_at)
+                    .where(and_(Link.id > start_id, Link.id <= end_id))
+                ).all()
+            self._accumulate(buckets, rows, cutoff)
+            scanned += len(rows)
+            start_id = end_id
+
+        with self.db.get_session() as session:
+            tail = session.execute(
+                select(Link.user_id, Link.thread_id, Link.created_at)
+                .where(Link.id > last_id)
+            ).all()
+            self._accumulate(buckets, tail, cutoff)
+            scanned += len(tail)
+
+            # Месяцы, перенесенные в архив, в links уже не видны - их
+            # агрегаты сохраняем как есть
+            for month in session.execute(select(LinkArchive.month).distinct()).scalars():
+                start = day_start(month)
+                upper = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+                kept = session.execute(
+                    select(LinkActivity.granularity, LinkActivity.bucket_start,
+                           LinkActivity.user_id, LinkActivity.thread_id, LinkActivity.links)
+                    .where(and_(LinkActivity.bucket_start >= start, LinkActivity.bucket_start < upper))
+                ).all()
+                for granularity, bucket_start, user_id, thread_id, links in kept:
+                    buckets[(granularity, bucket_start, user_id, thread_id)] += links
+
+            session.execute(delete(LinkActivity))
+            if buckets:
+                session.bulk_insert_mappings(LinkActivity, [
+                    {'granularity': granularity, 'bucket_start': bucket_start,
+                     'user_id': user_id, 'thread_id': thread_id, 'links': links}
+                    for (granularity, bucket_start, user_id, thread_id), links in buckets.items()
+                ])
+
+        result = {'links': scanned, 'buckets': len(buckets)}
+        logger.info(f"✅ Агрегаты активности пересчитаны: {result}")
+        return result
+
+    @staticmethod
+    def _accumulate(buckets: TallyCounter, rows, cutoff: datetime):
+        for user_id, thread_id, created_at in rows:
+            if created_at >= cutoff:
+                key = (HOUR, hour_start(created_at), user_id, thread_id or 0)
+            else:
+                key = (DAY, day_start(created_at), user_id, thread_id or 0)
+            buckets[key] += 1
+
+    # ============================================
+    # ПЛАН 1: ЧТЕНИЕ
+    # ============================================
+
+    def _ensure_started(self):
+        if not self._started:
+            self.start()
+
+    def get_daily(self, days: int = 14, user_id: int = None,
+                  thread_id: int = None) -> List[Tuple[date, int]]:
+        """Ссылки по дням за последние days дней (включая дни без ссылок)"""
+        self._ensure_started()
+
+        today = datetime.now().date()
+        since_day = today - timedelta(days=days - 1)
+
+        query = select(LinkActivity.bucket_start, func.sum(LinkActivity.links)) \
+            .where(LinkActivity.bucket_start >= day_start(since_day))
+        if user_id is not None:
+            query = query.where(LinkActivity.user_id == user_id)
+        if thread_id is not None:
+            query = query.where(LinkActivity.thread_id == thread_id)
+        query = query.group_by(LinkActivity.bucket_start)
+
+        with self.db.get_read_session() as session:
+            rows = session.execute(query).all()
+
+        totals = TallyCounter()
+        for bucket_start, links in rows:
+            totals[bucket_start.date()] += int(links or 0)
+
+        return [
+            (since_day + timedelta(days=offset), totals.get(since_day + timedelta(days=offset), 0))
+            for offset in range(days)
+        ]
+
+    def get_by_thread(self, days: int = 14, user_id: int = None) -> Dict[int, int]:
+        """Ссылки по топикам за последние days дней"""
+        self._ensure_started()
+
+        since = day_start(datetime.now()) - timedelta(days=days - 1)
+        query = select(LinkActivity.thread_id, func.sum(LinkActivity.links)) \
+            .where(LinkActivity.bucket_start >= since)
+        if user_id is not None:
+            query = query.where(LinkActivity.user_id == user_id)
+        query = query.group_by(LinkActivity.thread_id)
+
+        with self.db.get_read_session() as session:
+            return {thread_id: int(links or 0) for thread_id, links in session.execute(query).all()}
+
+    def get_hourly(self, hours: int = 24, user_id: int = None) -> List[Tuple[datetime, int]]:
+        """Ссылки по часам за последние hours часов (в пределах срока хранения)"""
+        self._ensure_started()
+
+        since = hour_start(datetime.now()) - timedelta(hours=hours - 1)
+        query = select(LinkActivity.bucket_start, func.sum(LinkActivity.links)) \
+            .where(and_(LinkActivity.granularity == HOUR, LinkActivity.bucket_start >= since))
+        if user_id is not None:
+            query = query.where(LinkActivity.user_id == user_id)
+        query = query.group_by(LinkActivity.bucket_start)
+
+        with self.db.get_read_session() as session:
+            totals = {bucket_start: int(links or 0) for bucket_start, links in session.execute(query).all()}
+
+        return [
+            (since + timedelta(hours=offset), totals.get(since + timedelta(hours=offset), 0))
+            for offset in range(hours)
+        ]
+
+
+def render_bar_chart(series: List[Tuple[Any, int]], label_format: str = '%d.%m',
+                     width: int = 12) -> str:
+    """Текстовая гистограмма для сообщений Telegram"""
+    peak = max((value for _, value in series), default=0)
+    lines = []
+    for moment, value in series:
+        bar = '▇' * (round(value / peak * width) if peak else 0)
+        lines.append(f"{moment.strftime(label_format)} {bar or '·'} {value}")
+    return '\n'.join(lines)
@@ -7,7 +7,7 @@ database/analytics.py - Аналитика и статистика
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 from sqlalchemy import func, desc
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, contains_eager
 
 from utils.logger import get_logger
 from database.models import User, Link, Settings
@@ -31,7 +31,7 @@ class AnalyticsManager:
     def get_user_stats(self, user_id: int) -> Dict:
         """Получение статистики пользователя для команды /mystat"""
         try:
-            with self.db_manager.get_session() as session:
+            with self.db_manager.get_read_session() as session:
                 # Базовая информация о пользователе
                 user = session.query(User).filter(User.telegram_id == user_id).first()
                 if not user:
@@ -73,44 +73,27 @@ class AnalyticsManager:
             return {"error": "Ошибка получения статистики"}
     
     def get_community_stats(self) -> Dict:
-        """Получение общей статистики сообщества"""
+        """Получение общей статистики сообщества (из инкрементальных агрегатов)"""
         try:
-            with self.db_manager.get_session() as session:
-                # Общее количество пользователей
-                total_users = session.query(User).count()
-                
-                # Активные пользователи за последние 30 дней
-                month_ago = datetime.utcnow() - timedelta(days=30)
-                active_users = session.query(User).filter(
-                    User.last_activity >= month_ago
-                ).count()
-                
-                # Общее количество ссылок
-                total_links = session.query(Link).count()
-                
-                # Ссылки за последние 7 дней
-                week_ago = datetime.utcnow() - timedelta(days=7)
-                recent_links = session.query(Link).filter(
-                    Link.created_at >= week_ago
-                ).count()
-                
-                stats = {
-                    "total_users": total_users,
-                    "active_users_30d": active_users,
-                    "total_links": total_links,
-                    "links_last_7d": recent_links,
-                    "updated_at": datetime.utcnow(),
-                    # ПЛАН 2: Статистика кармы (ЗАГЛУШКИ)
-                    "avg_karma": 0,  # TODO: Добавить в Плане 2
-                    "top_karma_users": [],  # TODO: Добавить в Плане 2
-                    # ПЛАН 3: Расширенная аналитика (ЗАГЛУШКИ)
-                    "total_forms_submitted": 0,  # TODO: Добавить в Плане 3
-                    "ai_interactions_today": 0,  # TODO: Добавить в Плане 3
-                }
-                
-                logger.info("📊 Общая статистика сообщества получена")
-                return stats
-                
+            snapshot = self.db_manager.stats.get_snapshot()
+            
+            stats = {
+                "total_users": snapshot['total_users'],
+                "active_users_30d": snapshot['active_users_30d'],
+                "total_links": snapshot['total_links_all'],
+                "links_last_7d": snapshot['links_last_7d'],
+                "updated_at": datetime.utcnow(),
+                # ПЛАН 2: Статистика кармы (ЗАГЛУШКИ)
+                "avg_karma": 0,  # TODO: Добавить в Плане 2
+                "top_karma_users": [],  # TODO: Добавить в Плане 2
+                # ПЛАН 3: Расширенная аналитика (ЗАГЛУШКИ)
+                "total_forms_submitted": 0,  # TODO: Добавить в Плане 3
+                "ai_interactions_today": 0,  # TODO: Добавить в Плане 3
+            }
+            
+            logger.info("📊 Общая статистика сообщества получена")
+            return stats
+            
         except Exception as e:
             logger.error(f"❌ Ошибка получения статистики сообщества: {e}")
             return {"error": "Ошибка получения статистики"}
@@ -118,8 +101,11 @@ class AnalyticsManager:
     def get_links_history(self, limit: int = 10) -> List[Dict]:
         """Получение истории ссылок для команд /last10links и /last30links"""
         try:
-            with self.db_manager.get_session() as session:
-                links = session.query(Link).join(User).order_by(
+            with self.db_manager.get_read_session() as session:
+                # Автор подгружается тем же JOIN, без запроса на каждую строку
+                links = session.query(Link).join(User).options(
+                    contains_eager(Link.user)
+                ).order_by(
                     desc(Link.created_at)
                 ).limit(limit).all()
                 
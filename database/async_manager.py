@@ -0,0 +1,447 @@
+"""
+Асинхронный менеджер БД Do Presave Reminder Bot v25+
+Асинхронный двойник CRUD-операций DatabaseManager на нативном драйвере
+
+ПЛАН 1: Async CRUD пользователей, ссылок, настроек и статистики (АКТИВНАЯ)
+
+AsyncDatabaseManager выполняет запросы через общий async движок
+(asyncpg для PostgreSQL, aiosqlite для SQLite) и не блокирует event loop
+AsyncTeleBot. Семантика совпадает с синхронным DatabaseManager: он
+разделяет с ним кеш настроек, счетчики, кеш профилей и агрегаты
+статистики (сессии создаются с классом сессий DatabaseManager, поэтому
+события after_commit агрегатов срабатывают и здесь).
+
+AsyncDatabaseAdapter позволяет переводить обработчики на async по
+одному: методы с нативным async-двойником вызываются напрямую, а все
+остальные методы DatabaseManager выполняются в пуле потоков.
+"""
+
+import asyncio
+import functools
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List, Optional, Dict, Any, Tuple
+
+from sqlalchemy import select, update, func, cast, Integer, Text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database.models import User, Link, Settings
+from database.settings_cache import SETTINGS_VERSION_KEY, convert_setting_value
+from database.counters import REMINDER_COUNT
+from database.pagination import encode_cursor
+from database.statements import USER_BY_ID, SETTING_BY_KEY, SETTING_VALUE, USER_LINK_COUNTS, link_params
+from database.engines import engine_registry, to_async_url
+from utils.logger import get_logger
+from utils.urls import url_hash
+
+logger = get_logger(__name__)
+
+class AsyncDatabaseManager:
+    """Асинхронные CRUD-операции с общими кешами DatabaseManager"""
+
+    def __init__(self, sync_manager, database_url: str = None):
+        """
+        Инициализация асинхронного менеджера БД
+
+        Args:
+            sync_manager: DatabaseManager, с которым разделяются кеши
+            database_url: URL БД (по умолчанию - URL sync_manager)
+        """
+        self.sync = sync_manager
+        self.database_url = to_async_url(database_url or sync_manager.database_url)
+
+        # Общий async движок процесса (его же использует DatabaseCore)
+        self.engine = engine_registry.get_async_engine(self.database_url)
+
+        # Класс сессий DatabaseManager: на нем висят события агрегатов статистики
+        self.SessionLocal = async_sessionmaker(
+            self.engine,
+            expire_on_commit=False,
+            autoflush=False,
+            sync_session_class=sync_manager.SessionLocal.class_
+        )
+
+        logger.info(f"AsyncDatabaseManager инициализирован: {self.database_url.split('@')[-1]}")
+
+    @asynccontextmanager
+    async def get_session(self):
+        """Асинхронный контекстный менеджер сессии БД"""
+        session = self.SessionLocal()
+        try:
+            yield session
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Ошибка async БД сессии: {e}")
+            raise
+        finally:
+            await session.close()
+
+    async def close(self):
+        """Закрытие асинхронных соединений"""
+        try:
+            await engine_registry.release_async(self.engine)
+            logger.info("✅ Async соединения с БД закрыты")
+        except Exception as e:
+            logger.error(f"❌ Ошибка закрытия async БД: {e}")
+
+    async def _active_floor(self) -> datetime:
+        """Граница партиций активных ссылок (из общего кеша)"""
+        floor = self.sync.partitions.cached_active_floor()
+        if floor is None:
+            floor = await self._in_thread(self.sync.partitions.active_floor)
+        return floor
+
+    @staticmethod
+    async def _in_thread(func_, *args, **kwargs):
+        """Выполнение синхронного вызова в пуле потоков"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(func_, *args, **kwargs))
+
+    # ============================================
+    # ПЛАН 1: ПОЛЬЗОВАТЕЛИ
+    # ============================================
+
+    async def get_or_create_user(self, user_id: int, username: str = None,
+                                 first_name: str = None, last_name: str = None) -> User:
+        """Получение или создание пользователя"""
+        try:
+            async with self.get_session() as session:
+                user = (await session.execute(
+                    USER_BY_ID, {'user_id': user_id}
+                )).scalars().first()
+
+                if not user:
+                    is_admin = user_id in self.sync._get_admin_ids()
+
+                    user = User(
+                        user_id=user_id,
+                        username=username,
+                        first_name=first_name,
+                        last_name=last_name,
+                        is_admin=is_admin
+                    )
+                    session.add(user)
+                    await session.run_sync(
+                        self.sync.stats.record_users_created, 1, 1 if is_admin else 0
+                    )
+                else:
+                    if username and user.username != username:
+                        user.username = username
+                    if first_name and user.first_name != first_name:
+                        user.first_name = first_name
+                    if last_name and user.last_name != last_name:
+                        user.last_name = last_name
+
+                    user.last_seen_at = datetime.now()
+
+            self.sync.user_cache.remember(user.user_id, user.username, user.first_name, user.last_name)
+            return user
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка async get_or_create_user: {e}")
+            raise
+
+    async def touch_user(self, user_id: int, username: str = None,
+                         first_name: str = None, last_name: str = None):
+        """Отметка активности пользователя (без запроса к БД для известных)"""
+        try:
+            self.sync.stats.record_user_seen(user_id)
+            if self.sync.user_cache.touch(user_id, username, first_name, last_name):
+                return
+
+            await self.get_or_create_user(user_id, username, first_name, last_name)
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка async touch_user: {e}")
+            raise
+
+    async def get_user_by_id(self, user_id: int) -> Optional[User]:
+        """Получение пользователя по ID"""
+        try:
+            async with self.get_session() as session:
+                return (await session.execute(
+                    USER_BY_ID, {'user_id': user_id}
+                )).scalars().first()
+        except Exception as e:
+            logger.error(f"❌ Ошибка async get_user_by_id: {e}")
+            return None
+
+    async def get_user_by_username(self, username: str) -> Optional[User]:
+        """Получение пользователя по username"""
+        try:
+            async with self.get_session() as session:
+                return (await session.execute(
+                    select(User).where(func.lower(User.username) == username.lstrip('@').lower()).limit(1)
+                )).scalar_one_or_none()
+        except Exception as e:
+            logger.error(f"❌ Ошибка async get_user_by_username: {e}")
+            return None
+
+    async def get_user_id_by_username(self, username: str) -> Optional[int]:
+        """Получение Telegram user_id по username"""
+        try:
+            async with self.get_session() as session:
+                return (await session.execute(
+                    select(User.user_id).where(func.lower(User.username) == username.lstrip('@').lower()).limit(1)
+                )).scalar()
+        except Exception as e:
+            logger.error(f"❌ Ошибка async get_user_id_by_username: {e}")
+            return None
+
+    async def get_all_admins(self) -> List[User]:
+        """Получение всех администраторов"""
+        try:
+            async with self.get_session() as session:
+                return list((await session.execute(
+                    select(User).where(User.is_admin == True)
+                )).scalars())
+        except Exception as e:
+            logger.error(f"❌ Ошибка async get_all_admins: {e}")
+            return []
+
+    # ============================================
+    # ПЛАН 1: ССЫЛКИ
+    # ============================================
+
+    async def add_link(self, user_id: int, url: str, message_text: str = None,
+                       message_id: int = None, thread_id: int = None) -> Link:
+        """Добавление новой ссылки"""
+        try:
+            await self.get_or_create_user(user_id)
+
+            async with self.get_session() as session:
+                link = Link(
+                    user_id=user_id,
+                    url=url,
+                    url_hash=url_hash(url),
+                    message_text=message_text,
+                    message_id=message_id,
+                    thread_id=thread_id
+                )
+                session.add(link)
+                now = datetime.now()
+                await session.run_sync(
+                    self.sync.stats.record_links_added, {now.date(): 1}
+                )
+                await session.run_sync(
+                    self.sync.activity.record_links, [(user_id, thread_id, now)]
+                )
+
+            return link
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка async add_link: {e}")
+            raise
+
+    async def get_links_page(self, limit: int = 10, cursor: str = None, user_id: int = None,
+                             thread_id: int = None, backward: bool = False) -> Tuple[List[dict], Optional[str]]:
+        """Страница активных ссылок (keyset-пагинация по created_at, id), см. DatabaseManager"""
+        stmt, params = link_params(await self._active_floor(), limit + 1, user_id,
+                                   thread_id, cursor, with_user=True, backward=backward)
+
+        async with self.get_session() as session:
+            results = (await session.execute(stmt, params)).all()
+
+        if backward and cursor:
+            results = results[:limit][::-1]
+            has_more = True
+        else:
+            has_more = len(results) > limit
+            results = results[:limit]
+        links = [self.sync._link_to_dict(link, user) for link, user in results]
+
+        next_cursor = None
+        if has_more and links:
+            next_cursor = encode_cursor(links[-1]['created_at'], links[-1]['id'])
+
+        return links, next_cursor
+
+    async def get_recent_links_safe(self, limit: int = 10, cursor: str = None) -> List[dict]:
+        """Последние ссылки как словари"""
+        try:
+            links, _ = await self.get_links_page(limit=limit, cursor=cursor)
+            return links
+        except Exception as e:
+            logger.error(f"❌ Ошибка async get_recent_links_safe: {e}")
+            return []
+
+    async def get_links_by_username_safe(self, username: str, limit: int = 20,
+                                         cursor: str = None) -> List[dict]:
+        """Ссылки пользователя по username как словари"""
+        try:
+            user_id = await self.get_user_id_by_username(username)
+            if not user_id:
+                return []
+
+            links, _ = await self.get_links_page(limit=limit, cursor=cursor, user_id=user_id)
+            return links
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка async get_links_by_username_safe: {e}")
+            return []
+
+    async def clear_all_links(self) -> int:
+        """Очистка всех ссылок пакетами (см. database/bulk_jobs.py) в пуле потоков"""
+        return await self._in_thread(self.sync.clear_all_links)
+
+    # ============================================
+    # ПЛАН 1: НАСТРОЙКИ
+    # ============================================
+
+    async def get_setting(self, key: str, default_value: Any = None) -> Any:
+        """Получение настройки (общий кеш; перезагрузка кеша - в пуле потоков)"""
+        return await self._in_thread(self.sync.get_setting, key, default_value)
+
+    async def get_all_settings(self) -> Dict[str, Any]:
+        """Получение всех настроек"""
+        return await self._in_thread(self.sync.get_all_settings)
+
+    async def set_setting(self, key: str, value: Any, value_type: str = 'string',
+                          description: str = None, updated_by: int = None):
+        """Установка настройки с увеличением settings_version"""
+        try:
+            if value_type == 'json':
+                import ujson
+                str_value = ujson.dumps(value)
+            else:
+                str_value = str(value)
+
+            async with self.get_session() as session:
+                setting = (await session.execute(
+                    SETTING_BY_KEY, {'key': key}
+                )).scalars().first()
+
+                if setting:
+                    setting.value = str_value
+                    setting.value_type = value_type
+                    setting.updated_by = updated_by
+                    if description:
+                        setting.description = description
+                else:
+                    session.add(Settings(
+                        key=key,
+                        value=str_value,
+                        value_type=value_type,
+                        description=description,
+                        updated_by=updated_by
+                    ))
+
+                await session.flush()
+                version = await self._bump_settings_version(session)
+
+            self.sync.settings_cache.apply_local(key, convert_setting_value(str_value, value_type), version)
+
+        except Exception as e:
+            self.sync.settings_cache.invalidate()
+            logger.error(f"❌ Ошибка async set_setting: {e}")
+            raise
+
+    async def _bump_settings_version(self, session) -> int:
+        """Атомарное увеличение версии настроек в текущей транзакции"""
+        result = await session.execute(
+            update(Settings).where(Settings.key == SETTINGS_VERSION_KEY)
+            .values(value=cast(cast(Settings.value, Integer) + 1, Text))
+            .execution_options(synchronize_session=False)
+        )
+
+        if not result.rowcount:
+            session.add(Settings(
+                key=SETTINGS_VERSION_KEY,
+                value='1',
+                value_type='int',
+                description='Версия настроек (синхронизация кешей процессов)'
+            ))
+            return 1
+
+        return int((await session.execute(
+            SETTING_VALUE, {'key': SETTINGS_VERSION_KEY}
+        )).scalar())
+
+    # ============================================
+    # ПЛАН 1: СЧЕТЧИКИ И СТАТИСТИКА
+    # ============================================
+
+    async def increment_counter(self, name: str, amount: int = 1):
+        """Увеличение счетчика (только в памяти, не блокирует)"""
+        self.sync.increment_counter(name, amount)
+
+    async def get_counter(self, name: str, default: int = 0) -> int:
+        """Получение значения счетчика"""
+        return await self._in_thread(self.sync.get_counter, name, default)
+
+    async def get_basic_stats(self) -> Dict[str, Any]:
+        """Базовая статистика (зеркало агрегатов, обновление - в пуле потоков)"""
+        return await self._in_thread(self.sync.get_basic_stats)
+
+    async def get_user_stats(self, user_id: int) -> Dict[str, Any]:
+        """Получение статистики пользователя"""
+        try:
+            month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            floor = await self._active_floor()
+
+            async with self.get_session() as session:
+                user = (await session.execute(
+                    USER_BY_ID, {'user_id': user_id}
+                )).scalars().first()
+
+                if not user:
+                    return {}
+
+                total_links, links_this_month = (await session.execute(
+                    USER_LINK_COUNTS,
+                    {'user_id': user_id, 'floor': floor, 'since': month_start}
+                )).one()
+
+            return {
+                'user_id': user_id,
+                'username': user.username,
+                'first_name': user.first_name,
+                'is_admin': user.is_admin,
+                'total_links': total_links,
+                'links_this_month': links_this_month,
+                'member_since': user.created_at,
+                'last_seen': user.last_seen_at,
+            }
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка async get_user_stats: {e}")
+            return {}
+
+
+class AsyncDatabaseAdapter:
+    """
+    Единый await-интерфейс для обработчиков, переводимых на async
+
+    Методы AsyncDatabaseManager вызываются нативно, остальные методы
+    DatabaseManager - в пуле потоков, чтобы не блокировать event loop.
+    Любой метод адаптера возвращает awaitable.
+    """
+
+    def __init__(self, sync_manager, async_manager: AsyncDatabaseManager = None):
+        self.sync = sync_manager
+        self.native = async_manager or sync_manager.get_async_manager()
+
+    def __getattr__(self, name: str):
+        native = getattr(self.native, name, None)
+        if native is not None and not name.startswith('_'):
+            if not callable(native) or asyncio.iscoroutinefunction(native):
+                return native
+
+            # Синхронный нативный метод (работа в памяти) - только await-обертка
+            @functools.wraps(native)
+            async def awaitable(*args, **kwargs):
+                return native(*args, **kwargs)
+
+            return awaitable
+
+        method = getattr(self.sync, name)
+        if not callable(method):
+            return method
+
+        @functools.wraps(method)
+        async def in_thread(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, functools.partial(method, *args, **kwargs))
+
+        return in_thread
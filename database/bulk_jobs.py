@@ -0,0 +1,389 @@
+"""
+Пакетные операции Do Presave Reminder Bot v25+
+Массовые UPDATE/DELETE пакетами по диапазонам первичного ключа
+
+ПЛАН 1: Фоновые задания с прогрессом и продолжением (АКТИВНАЯ)
+
+Массовое изменение (например, очистка всех ссылок) не выполняется одним
+UPDATE: диапазон первичного ключа на момент запуска делится на пакеты
+по BULK_JOB_BATCH_SIZE ключей, каждый пакет - отдельная короткая
+транзакция. В той же транзакции в bulk_jobs сдвигается last_key, поэтому
+после рестарта задание продолжается с места остановки, а отмена
+(status = 'cancelled') срабатывает на ближайшем пакете: пакет, который
+не смог сдвинуть last_key у работающего задания, откатывается.
+
+Прогресс раз в BULK_JOB_PROGRESS_INTERVAL секунд передается слушателям
+(add_listener) - меню обновляет им сообщение, из которого запущена
+операция.
+"""
+
+import os
+import time
+import queue
+import threading
+from collections import Counter as TallyCounter
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Callable, Tuple
+
+from sqlalchemy import select, update, func, and_
+
+from database.models import Link, BulkJob
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Статусы заданий
+RUNNING = 'running'
+DONE = 'done'
+CANCELLED = 'cancelled'
+FAILED = 'failed'
+
+
+class BulkOperation:
+    """Массовая операция над таблицей по диапазонам первичного ключа"""
+
+    kind = None
+    title = ''
+    model = None
+
+    def prepare(self, db, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Фиксация параметров при запуске (сохраняются в задании)"""
+        return params
+
+    def condition(self, db, params: Dict[str, Any]):
+        """Условие отбора строк (None - все строки)"""
+        return None
+
+    def key_range(self, db, session, params: Dict[str, Any]) -> Tuple[int, int]:
+        """Границы ключа на момент запуска: обрабатывается (min - 1, max]"""
+        key = self.model.id
+        query = select(func.min(key), func.max(key))
+        condition = self.condition(db, params)
+        if condition is not None:
+            query = query.where(condition)
+        low, high = session.execute(query).one()
+        if low is None:
+            return 0, 0
+        return low - 1, high
+
+    def apply_batch(self, db, session, low: int, high: int, params: Dict[str, Any]) -> int:
+        """Изменение строк с ключом в (low, high], возвращает число строк"""
+        raise NotImplementedError
+
+    def on_finish(self, db, job: Dict[str, Any]):
+        """Действия после завершения или отмены задания"""
+
+
+class ClearLinksOperation(BulkOperation):
+    """Очистка ссылок: is_active = false для активных ссылок"""
+
+    kind = 'clear_links'
+    title = '🗑️ Очистка ссылок'
+    model = Link
+
+    def prepare(self, db, params: Dict[str, Any]) -> Dict[str, Any]:
+        # Граница партиций фиксируется при запуске: активные ссылки не старше нее
+        params = dict(params)
+        params.setdefault('floor', db.partitions.active_floor().isoformat())
+        return params
+
+    def condition(self, db, params: Dict[str, Any]):
+        return db.partitions.active_filter(datetime.fromisoformat(params['floor']))
+
+    def apply_batch(self, db, session, low: int, high: int, params: Dict[str, Any]) -> int:
+        created = session.execute(
+            update(Link)
+            .where(and_(Link.id > low, Link.id <= high, self.condition(db, params)))
+            .values(is_active=False)
+            .returning(Link.created_at)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+
+        if created:
+            db.stats.record_links_deactivated(
+                session, TallyCounter(moment.date() for moment in created)
+            )
+        return len(created)
+
+    def on_finish(self, db, job: Dict[str, Any]):
+        if job['status'] == DONE:
+            # Активных ссылок не осталось: запросы читают только текущий месяц
+            db.partitions.reset_active_floor(datetime.now())
+        else:
+            db.partitions.reset_active_floor()
+
+
+# Зарегистрированные операции: kind -> операция
+OPERATIONS: Dict[str, BulkOperation] = {
+    operation.kind: operation for operation in (ClearLinksOperation(),)
+}
+
+
+class BulkJobManager:
+    """Запуск, выполнение и отмена пакетных заданий"""
+
+    def __init__(self, db_manager, batch_size: int = None, pause: float = None,
+                 progress_interval: float = None):
+        """Инициализация пакетных заданий"""
+        self.db = db_manager
+        self.batch_size = batch_size if batch_size is not None else \
+            int(os.getenv('BULK_JOB_BATCH_SIZE', '5000'))
+        self.pause = pause if pause is not None else \
+            float(os.getenv('BULK_JOB_PAUSE', '0.05'))
+        self.progress_interval = progress_interval if progress_interval is not None else \
+            float(os.getenv('BULK_JOB_PROGRESS_INTERVAL', '3'))
+
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self._queue: queue.Queue = queue.Queue()
+        self._active = set()
+        self._lock = threading.Lock()
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = False
+
+    # ============================================
+    # ПЛАН 1: ЖИЗНЕННЫЙ ЦИКЛ
+    # ============================================
+
+    def start(self):
+        """Запуск исполнителя и продолжение незавершенных заданий"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="bulk-jobs", daemon=True
+        )
+        self._thread.start()
+
+        try:
+            with self.db.get_session() as session:
+                pending = session.execute(
+                    select(BulkJob.id).where(BulkJob.status == RUNNING).order_by(BulkJob.id)
+                ).scalars().all()
+        except Exception as e:
+            logger.error(f"❌ Ошибка поиска незавершенных заданий: {e}")
+            pending = []
+
+        for job_id in pending:
+            logger.info(f"🔄 Продолжение пакетного задания #{job_id}")
+            self._queue.put(job_id)
+
+        logger.info("✅ Исполнитель пакетных заданий запущен")
+
+    def stop(self):
+        """Остановка исполнителя (текущее задание продолжится после рестарта)"""
+        self._stop.set()
+        self._started = False
+        self._queue.put(None)
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        """Фоновый цикл: задания по очереди"""
+        while not self._stop.is_set():
+            job_id = self._queue.get()
+            if job_id is None:
+                continue
+            try:
+                self.execute(job_id)
+            except Exception as e:
+                logger.error(f"❌ Ошибка пакетного задания #{job_id}: {e}")
+
+    def add_listener(self, listener: Callable[[Dict[str, Any]], None]):
+        """Подписка на прогресс и завершение заданий (вызывается из потока исполнителя)"""
+        self._listeners.append(listener)
+
+    # ============================================
+    # ПЛАН 1: УПРАВЛЕНИЕ ЗАДАНИЯМИ
+    # ============================================
+
+    def submit(self, kind: str, params: Dict[str, Any] = None, created_by: int = None,
+               chat_id: int = None, message_id: int = None,
+               background: bool = True) -> Dict[str, Any]:
+        """
+        Создание задания
+
+        Незавершенное задание того же вида не дублируется - возвращается оно.
+        background=False выполняет задание в текущем потоке до конца.
+        """
+        operation = OPERATIONS[kind]
+
+        with self.db.get_session() as session:
+            existing = session.execute(
+                select(BulkJob).where(and_(BulkJob.kind == kind, BulkJob.status == RUNNING))
+                .order_by(BulkJob.id).limit(1)
+            ).scalar_one_or_none()
+            existing_id = existing.id if existing is not None else None
+
+        if existing_id is not None:
+            # Уже запущено: ждем его в текущем потоке или возвращаем состояние
+            return self.get_job(existing_id) if background else self.execute(existing_id)
+
+        with self.db.get_session() as session:
+            params = operation.prepare(self.db, params or {})
+            min_key, max_key = operation.key_range(self.db, session, params)
+
+            job = BulkJob(
+                kind=kind, status=RUNNING, params=params,
+                min_key=min_key, last_key=min_key, max_key=max_key,
+                processed=0, created_by=created_by,
+                chat_id=chat_id, message_id=message_id,
+            )
+            session.add(job)
+            session.flush()
+            job_id = job.id
+
+        logger.info(f"✅ Пакетное задание #{job_id} ({kind}): ключи ({min_key}, {max_key}]")
+
+        if background:
+            self.start()
+            self._queue.put(job_id)
+            return self.get_job(job_id)
+
+        return self.execute(job_id)
+
+    def cancel(self, job_id: int) -> bool:
+        """Отмена задания (срабатывает на ближайшем пакете)"""
+        with self.db.get_session() as session:
+            cancelled = session.execute(
+                update(BulkJob)
+                .where(and_(BulkJob.id == job_id, BulkJob.status == RUNNING))
+                .values(status=CANCELLED, updated_at=datetime.now(), finished_at=datetime.now())
+            ).rowcount
+
+        if cancelled:
+            logger.info(f"⚠️ Пакетное задание #{job_id} отменено")
+        return bool(cancelled)
+
+    def get_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Состояние задания"""
+        with self.db.get_session() as session:
+            job = session.get(BulkJob, job_id)
+            return self._to_dict(job) if job else None
+
+    def list_jobs(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Последние задания"""
+        with self.db.get_session() as session:
+            jobs = session.execute(
+                select(BulkJob).order_by(BulkJob.id.desc()).limit(limit)
+            ).scalars().all()
+            return [self._to_dict(job) for job in jobs]
+
+    # ============================================
+    # ПЛАН 1: ВЫПОЛНЕНИЕ
+    # ============================================
+
+    def execute(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Выполнение задания с last_key до max_key пакетами"""
+        with self._lock:
+            if job_id in self._active:
+                return self.get_job(job_id)
+            self._active.add(job_id)
+
+        try:
+            return self._execute(job_id)
+        finally:
+            with self._lock:
+                self._active.discard(job_id)
+
+    def _execute(self, job_id: int) -> Optional[Dict[str, Any]]:
+        job = self.get_job(job_id)
+        if job is None or job['status'] != RUNNING:
+            return job
+
+        operation = OPERATIONS[job['kind']]
+        params = job['params'] or {}
+        low = job['last_key']
+        notified_at = time.monotonic()
+
+        try:
+            while low < job['max_key']:
+                if self._stop.is_set():
+                    # Остановка процесса: задание продолжится после рестарта
+                    return self.get_job(job_id)
+
+                high = min(low + self.batch_size, job['max_key'])
+
+                with self.db.get_session() as session:
+                    affected = operation.apply_batch(self.db, session, low, high, params)
+                    advanced = session.execute(
+                        update(BulkJob)
+                        .where(and_(BulkJob.id == job_id, BulkJob.status == RUNNING))
+                        .values(last_key=high, processed=BulkJob.processed + affected,
+                                updated_at=datetime.now())
+                    ).rowcount
+                    if not advanced:
+                        # Задание отменено: пакет не применяется
+                        session.rollback()
+                        break
+
+                low = high
+                job['last_key'] = high
+                job['processed'] += affected
+                job['progress'] = (high - job['min_key']) / (job['max_key'] - job['min_key'])
+
+                if time.monotonic() - notified_at >= self.progress_interval:
+                    notified_at = time.monotonic()
+                    self._notify(job)
+
+                if self.pause:
+                    time.sleep(self.pause)
+            else:
+                with self.db.get_session() as session:
+                    session.execute(
+                        update(BulkJob)
+                        .where(and_(BulkJob.id == job_id, BulkJob.status == RUNNING))
+                        .values(status=DONE, updated_at=datetime.now(), finished_at=datetime.now())
+                    )
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка пакетного задания #{job_id}: {e}")
+            with self.db.get_session() as session:
+                session.execute(
+                    update(BulkJob).where(BulkJob.id == job_id)
+                    .values(status=FAILED, error=str(e)[:1000],
+                            updated_at=datetime.now(), finished_at=datetime.now())
+                )
+
+        job = self.get_job(job_id)
+        operation.on_finish(self.db, job)
+        logger.info(
+            f"✅ Пакетное задание #{job_id} ({job['kind']}): {job['status']}, строк {job['processed']}"
+        )
+        self._notify(job)
+        return job
+
+    def _notify(self, job: Dict[str, Any]):
+        for listener in list(self._listeners):
+            try:
+                listener(job)
+            except Exception as e:
+                logger.error(f"❌ Ошибка уведомления о задании #{job['id']}: {e}")
+
+    @staticmethod
+    def _to_dict(job: BulkJob) -> Dict[str, Any]:
+        span = job.max_key - job.min_key
+        operation = OPERATIONS.get(job.kind)
+        return {
+            'id': job.id,
+            'kind': job.kind,
+            'title': operation.title if operation else job.kind,
+            'status': job.status,
+            'params': job.params,
+            'min_key': job.min_key,
+            'last_key': job.last_key,
+            'max_key': job.max_key,
+            'processed': job.processed,
+            'progress': 1.0 if span <= 0 else (job.last_key - job.min_key) / span,
+            'created_by': job.created_by,
+            'chat_id': job.chat_id,
+            'message_id': job.message_id,
+            'error': job.error,
+            'created_at': job.created_at,
+            'finished_at': job.finished_at,
+        }
@@ -0,0 +1,203 @@
+"""
+Счетчики Do Presave Reminder Bot v25+
+Атомарные счетчики с накоплением приращений в памяти
+
+ПЛАН 1: Счетчик напоминаний и служебные метрики (АКТИВНАЯ)
+
+increment() только увеличивает локальную дельту. Накопленные дельты
+сбрасываются в таблицу counters по таймеру и при остановке, через
+UPDATE counters SET value = value + :n, поэтому несколько процессов
+не теряют приращения друг друга.
+"""
+
+import os
+import threading
+from typing import Dict, List, Optional
+
+from sqlalchemy import update, select
+from sqlalchemy.exc import IntegrityError
+
+from database.models import Counter, Settings
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Имена счетчиков
+REMINDER_COUNT = 'reminder_count'
+
+# Счетчики, которые раньше хранились в settings (переносятся при первом запуске)
+LEGACY_SETTINGS_COUNTERS = [REMINDER_COUNT]
+
+
+class CounterStore:
+    """Хранилище атомарных счетчиков с отложенным сбросом"""
+
+    def __init__(self, db_manager, flush_interval: float = None):
+        """Инициализация хранилища счетчиков"""
+        self.db = db_manager
+        self.flush_interval = flush_interval if flush_interval is not None else \
+            float(os.getenv('COUNTERS_FLUSH_INTERVAL', '10'))
+
+        self._pending: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = False
+        self._legacy_migrated = False
+
+    # ============================================
+    # ПЛАН 1: ЖИЗНЕННЫЙ ЦИКЛ
+    # ============================================
+
+    def start(self):
+        """Запуск фонового сброса счетчиков"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="counters-flusher", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"✅ Счетчики запущены (сброс каждые {self.flush_interval}s)")
+
+    def stop(self):
+        """Остановка фонового сброса с финальным сбросом дельт"""
+        self._stop.set()
+        self._started = False
+
+        if self._thread:
+            self._thread.join(timeout=max(self.flush_interval, 5))
+            self._thread = None
+
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"❌ Ошибка финального сброса счетчиков: {e}")
+
+    def _run(self):
+        """Фоновый цикл сброса"""
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                # Дельты возвращены в накопитель, повторим на следующем тике
+                logger.error(f"❌ Ошибка фонового сброса счетчиков: {e}")
+
+    # ============================================
+    # ПЛАН 1: ОПЕРАЦИИ СО СЧЕТЧИКАМИ
+    # ============================================
+
+    def increment(self, name: str, amount: int = 1):
+        """Увеличение счетчика (без обращения к БД)"""
+        if not amount:
+            return
+
+        with self._lock:
+            self._pending[name] = self._pending.get(name, 0) + amount
+            need_start = not self._started
+            self._started = True
+
+        if need_start:
+            self.start()
+
+    def get(self, name: str, default: int = 0) -> int:
+        """Текущее значение счетчика: сохраненное + еще не сброшенное"""
+        return self.get_many([name], default).get(name, default)
+
+    def get_many(self, names: List[str], default: int = 0) -> Dict[str, int]:
+        """Значения нескольких счетчиков одним запросом"""
+        self._migrate_legacy_settings()
+
+        with self.db.get_session() as session:
+            rows = session.execute(
+                select(Counter.name, Counter.value).where(Counter.name.in_(names))
+            ).all()
+
+        stored = {name: value for name, value in rows}
+
+        with self._lock:
+            return {
+                name: stored.get(name, default) + self._pending.get(name, 0)
+                for name in names
+            }
+
+    def flush(self) -> int:
+        """Сброс накопленных дельт в БД, возвращает количество счетчиков"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch = self._pending
+                self._pending = {}
+
+            try:
+                self._migrate_legacy_settings()
+                self._apply_deltas(batch)
+            except Exception:
+                with self._lock:
+                    for name, amount in batch.items():
+                        self._pending[name] = self._pending.get(name, 0) + amount
+                raise
+
+            logger.debug(f"💾 Счетчики сброшены: {batch}")
+            return len(batch)
+
+    def _apply_deltas(self, batch: Dict[str, int]):
+        """Атомарное применение дельт: UPDATE ... SET value = value + :n"""
+        with self.db.get_session() as session:
+            for name, amount in sorted(batch.items()):
+                result = session.execute(
+                    update(Counter)
+                    .where(Counter.name == name)
+                    .values(value=Counter.value + amount)
+                )
+
+                if result.rowcount == 0:
+                    self._insert_counter(session, name, amount)
+
+    def _insert_counter(self, session, name: str, value: int, add_on_conflict: bool = True):
+        """Создание счетчика; при гонке с другим процессом - повторный UPDATE"""
+        try:
+            with session.begin_nested():
+                session.add(Counter(name=name, value=value))
+        except IntegrityError:
+            if not add_on_conflict:
+                return
+            session.execute(
+                update(Counter)
+                .where(Counter.name == name)
+                .values(value=Counter.value + value)
+            )
+
+    # ============================================
+    # ПЛАН 1: ПЕРЕНОС ИЗ SETTINGS
+    # ============================================
+
+    def _migrate_legacy_settings(self):
+        """Перенос значений счетчиков, которые раньше жили в settings"""
+        if self._legacy_migrated:
+            return
+
+        with self.db.get_session() as session:
+            for name in LEGACY_SETTINGS_COUNTERS:
+                exists = session.execute(
+                    select(Counter.name).where(Counter.name == name)
+                ).first()
+                if exists:
+                    continue
+
+                legacy_value = session.execute(
+                    select(Settings.value).where(Settings.key == name)
+                ).scalar()
+
+                try:
+                    initial = int(legacy_value) if legacy_value is not None else 0
+                except ValueError:
+                    initial = 0
+
+                self._insert_counter(session, name, initial, add_on_conflict=False)
+                logger.info(f"✅ Счетчик {name} перенесен из settings: {initial}")
+
+        self._legacy_migrated = True
@@ -0,0 +1,288 @@
+"""
+Реестр движков Do Presave Reminder Bot v25+
+Общие пулы соединений для DatabaseManager, AsyncDatabaseManager и DatabaseCore
+
+ПЛАН 1: Один движок на (URL, sync/async) + метрики пула (АКТИВНАЯ)
+
+Все слои берут движки из engine_registry: для одного URL создается один
+sync и один async движок, повторные запросы получают тот же движок
+(со счетчиком ссылок, release() закрывает пул после последнего
+пользователя). Размер пулов задается одной настройкой на базу:
+DB_POOL_SIZE постоянных соединений и DB_POOL_MAX_OVERFLOW временных
+на процесс, делятся между sync и async пулом в пропорции
+DB_POOL_ASYNC_SHARE.
+
+Пулы - подклассы QueuePool/AsyncAdaptedQueuePool, которые считают
+выдачи соединений, время ожидания свободного соединения и таймауты.
+"""
+
+import os
+import time
+import threading
+from typing import Dict, List, Optional, Any, Tuple
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+from database.instrumentation import instrumentation
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+SYNC = 'sync'
+ASYNC = 'async'
+
+_ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'postgres': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def to_async_url(database_url: str) -> str:
+    """Преобразование URL БД в URL асинхронного драйвера"""
+    scheme, sep, rest = database_url.partition('://')
+    if not sep:
+        raise ValueError(f"Некорректный DATABASE_URL: {database_url}")
+    return f"{_ASYNC_DRIVERS.get(scheme, scheme)}://{rest}"
+
+
+def _safe_url(url: str) -> str:
+    """URL без учетных данных для логов и метрик"""
+    return url.split('@')[-1]
+
+
+class PoolMetrics:
+    """Счетчики выдачи соединений пула"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.waits = 0          # выдачи дольше 1 мс: ожидание свободного или открытие нового
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def record(self, elapsed_ms: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            if elapsed_ms >= 1.0:
+                self.waits += 1
+                self.wait_ms_total += elapsed_ms
+                self.wait_ms_max = max(self.wait_ms_max, elapsed_ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'wait_ms_total': round(self.wait_ms_total, 1),
+                'wait_ms_avg': round(self.wait_ms_total / self.waits, 2) if self.waits else 0.0,
+                'wait_ms_max': round(self.wait_ms_max, 1),
+                'timeouts': self.timeouts,
+            }
+
+
+def _instrumented_pool_class(base, metrics: PoolMetrics):
+    """
+    Подкласс пула с метриками
+
+    Метрики - атрибут класса: pool.recreate() (после dispose) создает
+    новый пул того же класса, и счетчики сохраняются.
+    """
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = base._do_get(self)
+        except PoolTimeoutError:
+            self.metrics.record((time.perf_counter() - started) * 1000, timed_out=True)
+            raise
+        self.metrics.record((time.perf_counter() - started) * 1000)
+        return connection
+
+    return type(f"Instrumented{base.__name__}", (base,), {'metrics': metrics, '_do_get': _do_get})
+
+
+class _Entry:
+    """Движок реестра"""
+
+    __slots__ = ('engine', 'kind', 'url', 'refs', 'metrics', 'pool_size', 'max_overflow')
+
+    def __init__(self, engine, kind: str, url: str, metrics: Optional[PoolMetrics],
+                 pool_size: Optional[int], max_overflow: Optional[int]):
+        self.engine = engine
+        self.kind = kind
+        self.url = url
+        self.refs = 1
+        self.metrics = metrics
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+
+
+class EngineRegistry:
+    """Общие движки процесса с единым бюджетом соединений"""
+
+    def __init__(self, pool_size: int = None, max_overflow: int = None,
+                 async_share: float = None):
+        """Инициализация реестра движков"""
+        self.pool_size = pool_size if pool_size is not None else \
+            int(os.getenv('DB_POOL_SIZE', '5'))
+        self.max_overflow = max_overflow if max_overflow is not None else \
+            int(os.getenv('DB_POOL_MAX_OVERFLOW', str(self.pool_size)))
+        self.async_share = async_share if async_share is not None else \
+            float(os.getenv('DB_POOL_ASYNC_SHARE', '0.5'))
+        self.pool_timeout = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+        self.pool_recycle = int(os.getenv('DB_POOL_RECYCLE', '3600'))
+
+        self._entries: Dict[Tuple[str, str], _Entry] = {}
+        self._by_engine: Dict[int, Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+
+    # ============================================
+    # ПЛАН 1: ПОЛУЧЕНИЕ ДВИЖКОВ
+    # ============================================
+
+    def get_engine(self, url: str, **options):
+        """Общий sync движок для URL (options учитываются при создании)"""
+        return self._get(SYNC, url, options)
+
+    def get_async_engine(self, url: str, **options):
+        """Общий async движок для URL (URL приводится к async драйверу)"""
+        return self._get(ASYNC, to_async_url(url), options)
+
+    def pool_limits(self, kind: str) -> Tuple[int, int]:
+        """Доля бюджета соединений для sync или async пула"""
+        # Остаток от деления достается sync пулу: на нем работают потоки бота
+        async_size = int(self.pool_size * self.async_share)
+        async_overflow = int(self.max_overflow * self.async_share)
+        if kind == ASYNC:
+            return max(1, async_size), async_overflow
+        return max(1, self.pool_size - async_size), self.max_overflow - async_overflow
+
+    def _get(self, kind: str, url: str, options: Dict[str, Any]):
+        key = (kind, make_url(url).render_as_string(hide_password=False))
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.refs += 1
+                return entry.engine
+
+            entry = self._create(kind, url, options)
+            self._entries[key] = entry
+            self._by_engine[id(entry.engine)] = key
+
+        logger.info(
+            f"✅ Движок {kind} {_safe_url(url)}: пул {entry.pool_size or '-'}"
+            f"+{entry.max_overflow or 0}"
+        )
+        return entry.engine
+
+    def _create(self, kind: str, url: str, options: Dict[str, Any]) -> _Entry:
+        options = dict(options)
+        options.setdefault('pool_pre_ping', True)
+        options.setdefault('echo', False)
+
+        metrics = pool_size = max_overflow = None
+        # Async SQLite (aiosqlite) - пул диалекта по умолчанию, без бюджета соединений
+        if not url.startswith('sqlite') or kind == SYNC:
+            pool_size, max_overflow = self.pool_limits(kind)
+            metrics = PoolMetrics()
+            base = AsyncAdaptedQueuePool if kind == ASYNC else QueuePool
+            options.update(
+                poolclass=_instrumented_pool_class(base, metrics),
+                pool_size=pool_size,
+                max_overflow=max_overflow,
+                pool_timeout=self.pool_timeout,
+                pool_recycle=self.pool_recycle,
+            )
+
+        factory = create_async_engine if kind == ASYNC else create_engine
+        engine = factory(url, **options)
+        instrumentation.attach(engine)
+
+        return _Entry(engine, kind, url, metrics, pool_size, max_overflow)
+
+    # ============================================
+    # ПЛАН 1: ОСВОБОЖДЕНИЕ
+    # ============================================
+
+    def _release(self, engine) -> bool:
+        """Уменьшение счетчика ссылок: True - движок пора закрыть"""
+        with self._lock:
+            key = self._by_engine.get(id(engine))
+            if key is None:
+                # Движок создан в обход реестра
+                return True
+
+            entry = self._entries[key]
+            entry.refs -= 1
+            if entry.refs > 0:
+                return False
+
+            del self._entries[key]
+            del self._by_engine[id(engine)]
+            return True
+
+    def release(self, engine):
+        """Освобождение sync движка (пул закрывается после последнего пользователя)"""
+        if self._release(engine):
+            engine.dispose()
+
+    async def release_async(self, engine):
+        """Освобождение async движка"""
+        if self._release(engine):
+            await engine.dispose()
+
+    # ============================================
+    # ПЛАН 1: МЕТРИКИ
+    # ============================================
+
+    def get_stats(self, include_url: bool = True) -> List[Dict[str, Any]]:
+        """
+        Состояние пулов: занятость, ожидание соединений, таймауты
+
+        Args:
+            include_url: Добавлять адрес БД (без пароля) - не для публичных ответов
+        """
+        with self._lock:
+            entries = list(self._entries.values())
+
+        stats = []
+        for entry in entries:
+            pool = entry.engine.pool
+            item = {
+                'kind': entry.kind,
+                'users': entry.refs,
+                'pool_size': entry.pool_size,
+                'max_overflow': entry.max_overflow,
+                'status': pool.status(),
+            }
+            if include_url:
+                item['url'] = _safe_url(entry.url)
+            if isinstance(pool, QueuePool):
+                item.update(
+                    checked_out=pool.checkedout(),
+                    checked_in=pool.checkedin(),
+                    overflow=pool.overflow(),
+                )
+            if entry.metrics is not None:
+                item.update(entry.metrics.snapshot())
+            stats.append(item)
+        return stats
+
+
+# Общий реестр процесса
+engine_registry = EngineRegistry()
+
+
+def get_pool_stats(include_url: bool = True) -> List[Dict[str, Any]]:
+    """Состояние всех пулов соединений процесса"""
+    return engine_registry.get_stats(include_url)
@@ -0,0 +1,269 @@
+"""
+Инструментирование SQL Do Presave Reminder Bot v25+
+Статистика запросов по отпечаткам и детектор N+1
+
+ПЛАН 1: События движка SQLAlchemy (АКТИВНАЯ)
+
+К каждому движку подключаются события before/after_cursor_execute.
+Запросы группируются по отпечатку (SQL без литералов и параметров),
+для отпечатка считаются количество, время (гистограмма), строки.
+
+Обработка одного update (сообщения, callback'а) оборачивается в
+statement_scope(): если внутри одной области один и тот же отпечаток
+выполняется больше SQL_N_PLUS_ONE_THRESHOLD раз - это вероятный N+1
+(например, ленивая загрузка link.user для каждой строки).
+"""
+
+import os
+import re
+import time
+import threading
+from collections import Counter as TallyCounter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Dict, List, Optional, Any
+
+from sqlalchemy import event
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Границы корзин гистограммы времени выполнения, мс
+LATENCY_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000)
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAM_RE = re.compile(r'%\(\w+\)s|%s|\$\d+|:\w+|\?')
+_IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*\?\s*,?)+\)', re.IGNORECASE)
+_VALUES_RE = re.compile(r'\bVALUES\s*(\([^()]*\)\s*,?\s*)+', re.IGNORECASE)
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(statement: str) -> str:
+    """Отпечаток SQL: без литералов, параметров и длины списков IN/VALUES"""
+    sql = _WHITESPACE_RE.sub(' ', statement).strip()
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _PARAM_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    sql = _VALUES_RE.sub('VALUES (...) ', sql)
+    return sql.strip()
+
+
+class _StatementStats:
+    """Накопленная статистика одного отпечатка"""
+
+    __slots__ = ('count', 'total_ms', 'max_ms', 'rows', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def add(self, elapsed_ms: float, rows: Optional[int]):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        if rows and rows > 0:
+            self.rows += rows
+
+        for index, bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                self.buckets[index] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def percentile(self, fraction: float) -> float:
+        """Оценка перцентиля по гистограмме (верхняя граница корзины)"""
+        target = self.count * fraction
+        seen = 0
+        for index, amount in enumerate(self.buckets):
+            seen += amount
+            if seen >= target and amount:
+                return LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+
+class _Scope:
+    """Область обработки одного update"""
+
+    __slots__ = ('label', 'counts', 'started')
+
+    def __init__(self, label: str):
+        self.label = label
+        self.counts: TallyCounter = TallyCounter()
+        self.started = time.perf_counter()
+
+
+class QueryInstrumentation:
+    """Сбор статистики SQL через события движков"""
+
+    def __init__(self, n_plus_one_threshold: int = None, max_fingerprints: int = None):
+        """Инициализация инструментирования"""
+        self.n_plus_one_threshold = n_plus_one_threshold if n_plus_one_threshold is not None else \
+            int(os.getenv('SQL_N_PLUS_ONE_THRESHOLD', '10'))
+        self.max_fingerprints = max_fingerprints if max_fingerprints is not None else \
+            int(os.getenv('SQL_STATS_MAX_FINGERPRINTS', '500'))
+        self.slow_query_ms = float(os.getenv('SQL_SLOW_QUERY_MS', '500'))
+        self.enabled = os.getenv('SQL_INSTRUMENTATION_ENABLED', 'true').lower() == 'true'
+
+        self._stats: Dict[str, _StatementStats] = {}
+        self._suspects: deque = deque(maxlen=20)
+        self._scope: ContextVar[Optional[_Scope]] = ContextVar('sql_scope', default=None)
+        self._lock = threading.Lock()
+        self._started_at = time.time()
+        self._dropped = 0
+        self._engines = set()
+
+    # ============================================
+    # ПЛАН 1: ПОДКЛЮЧЕНИЕ К ДВИЖКАМ
+    # ============================================
+
+    def attach(self, engine):
+        """Подключение к движку (для async движка - к его sync_engine)"""
+        engine = getattr(engine, 'sync_engine', engine)
+        if not self.enabled or id(engine) in self._engines:
+            return
+
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        self._engines.add(id(engine))
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('sql_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('sql_started')
+        if not started:
+            return
+        elapsed_ms = (time.perf_counter() - started.pop()) * 1000
+
+        rowcount = getattr(cursor, 'rowcount', -1)
+        self.record(statement, elapsed_ms, rowcount if rowcount >= 0 else None)
+
+    def record(self, statement: str, elapsed_ms: float, rows: Optional[int] = None):
+        """Учет выполненного запроса"""
+        key = fingerprint(statement)
+
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None and len(self._stats) < self.max_fingerprints:
+                stats = self._stats[key] = _StatementStats()
+
+            if stats is not None:
+                stats.add(elapsed_ms, rows)
+            else:
+                self._dropped += 1
+
+        scope = self._scope.get()
+        if scope is not None:
+            scope.counts[key] += 1
+
+        if elapsed_ms >= self.slow_query_ms:
+            logger.warning(f"🐢 Медленный запрос {elapsed_ms:.0f} мс: {key[:200]}")
+
+    # ============================================
+    # ПЛАН 1: ОБЛАСТИ И ДЕТЕКТОР N+1
+    # ============================================
+
+    @contextmanager
+    def scope(self, label: str):
+        """Область обработки одного update для поиска N+1"""
+        if self._scope.get() is not None:
+            # Вложенная область - учитываем во внешней
+            yield
+            return
+
+        current = _Scope(label)
+        token = self._scope.set(current)
+        try:
+            yield
+        finally:
+            self._scope.reset(token)
+            self._check_scope(current)
+
+    def _check_scope(self, scope: _Scope):
+        """Поиск повторяющихся запросов в завершенной области"""
+        for key, count in scope.counts.items():
+            if count <= self.n_plus_one_threshold:
+                continue
+
+            suspect = {
+                'scope': scope.label,
+                'fingerprint': key[:300],
+                'count': count,
+                'duration_ms': round((time.perf_counter() - scope.started) * 1000, 1),
+                'detected_at': time.time(),
+            }
+            with self._lock:
+                self._suspects.append(suspect)
+
+            logger.warning(
+                f"⚠️ Вероятный N+1 в {scope.label}: {count} одинаковых запросов: {key[:200]}"
+            )
+
+    # ============================================
+    # ПЛАН 1: ОТЧЕТ
+    # ============================================
+
+    def get_report(self, top: int = 10) -> Dict[str, Any]:
+        """Сводка: самые затратные отпечатки и подозрения на N+1"""
+        with self._lock:
+            items = list(self._stats.items())
+            suspects = list(self._suspects)
+            dropped = self._dropped
+
+        items.sort(key=lambda item: item[1].total_ms, reverse=True)
+
+        return {
+            'since': self._started_at,
+            'statements': sum(stats.count for _, stats in items),
+            'total_ms': round(sum(stats.total_ms for _, stats in items), 1),
+            'fingerprints': len(items),
+            'dropped_fingerprints': dropped,
+            'top': [
+                {
+                    'fingerprint': key[:300],
+                    'count': stats.count,
+                    'total_ms': round(stats.total_ms, 1),
+                    'avg_ms': round(stats.total_ms / stats.count, 2),
+                    'p95_ms': stats.percentile(0.95),
+                    'max_ms': round(stats.max_ms, 1),
+                    'rows': stats.rows,
+                    'histogram': dict(zip(
+                        [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + ['slower'],
+                        stats.buckets
+                    )),
+                }
+                for key, stats in items[:top]
+            ],
+            'n_plus_one': list(reversed(suspects)),
+        }
+
+    def reset(self):
+        """Сброс накопленной статистики"""
+        with self._lock:
+            self._stats.clear()
+            self._suspects.clear()
+            self._dropped = 0
+            self._started_at = time.time()
+
+
+# Общий экземпляр: статистика всех движков процесса
+instrumentation = QueryInstrumentation()
+
+
+def statement_scope(label: str):
+    """Область обработки одного update (см. QueryInstrumentation.scope)"""
+    return instrumentation.scope(label)
+
+
+def get_sql_report(top: int = 10) -> Dict[str, Any]:
+    """Сводка статистики SQL процесса"""
+    return instrumentation.get_report(top)
@@ -0,0 +1,479 @@
+"""
+Буфер записи ссылок Do Presave Reminder Bot v25+
+Отложенная (write-behind) пакетная запись ссылок в БД
+
+ПЛАН 1: Пакетная вставка ссылок + spool-файл (АКТИВНАЯ)
+
+Ссылки копятся в памяти и сбрасываются одним multi-row INSERT
+по таймеру или при достижении размера пакета. Каждая ссылка до
+подтверждения дописывается в spool-файл (NDJSON), поэтому при падении
+процесса необработанные ссылки восстанавливаются при следующем запуске.
+"""
+
+import os
+import json
+import threading
+from collections import OrderedDict
+from collections import Counter as TallyCounter
+from datetime import datetime
+from typing import List, Optional, Dict, Any
+
+from sqlalchemy import insert, select, and_
+from sqlalchemy.exc import IntegrityError, DataError
+
+from database.models import User, Link
+from utils.logger import get_logger
+from utils.urls import url_hash
+
+logger = get_logger(__name__)
+
+
+class LinkIngestionBuffer:
+    """Буфер отложенной пакетной записи ссылок"""
+
+    # Сколько последних выданных ID ссылок храним для resolve()
+    MAX_RESOLVED_TOKENS = 10000
+
+    def __init__(self, db_manager, flush_interval: float = None,
+                 batch_size: int = None, spool_path: str = None, max_retries: int = None):
+        """Инициализация буфера ссылок"""
+        self.db = db_manager
+
+        self.flush_interval = flush_interval if flush_interval is not None else \
+            float(os.getenv('LINK_BUFFER_FLUSH_INTERVAL', '2'))
+        self.batch_size = batch_size if batch_size is not None else \
+            int(os.getenv('LINK_BUFFER_BATCH_SIZE', '100'))
+        self.spool_path = spool_path if spool_path is not None else \
+            os.getenv('LINK_BUFFER_SPOOL_PATH', 'link_buffer.spool')
+        # Сколько раз подряд пакет может не записаться, прежде чем ссылки пойдут по одной
+        self.max_retries = max_retries if max_retries is not None else \
+            int(os.getenv('LINK_BUFFER_MAX_RETRIES', '3'))
+        self.inflight_path = f"{self.spool_path}.inflight" if self.spool_path else None
+        # Ссылки, которые БД отвергла (NDJSON с текстом ошибки)
+        self.rejected_path = f"{self.spool_path}.rejected" if self.spool_path else None
+
+        # Очередь ожидающих записи ссылок: (token, row)
+        self._pending: List[tuple] = []
+        self._resolved: "OrderedDict[int, int]" = OrderedDict()
+        self._next_token = 1
+        # Токены пакета, который сейчас записывается
+        self._inflight_tokens: set = set()
+        self._failed_attempts = 0
+        # (thread_id, url_hash) ожидающих ссылок - для поиска повторов до сброса
+        self._pending_keys: TallyCounter = TallyCounter()
+
+        # _lock защищает очередь и spool, _flush_lock сериализует сбросы
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._stats = {
+            'enqueued': 0,
+            'flushed': 0,
+            'flushes': 0,
+            'failed_flushes': 0,
+            'quarantined': 0,
+            'recovered': 0,
+        }
+
+    # ============================================
+    # ПЛАН 1: ЖИЗНЕННЫЙ ЦИКЛ
+    # ============================================
+
+    def start(self):
+        """Восстановление spool и запуск фонового сброса"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._recover_spool()
+
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="link-buffer-flusher", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"✅ Буфер ссылок запущен (интервал {self.flush_interval}s, пакет {self.batch_size})")
+
+    def stop(self):
+        """Остановка фонового сброса с финальным сбросом очереди"""
+        self._stop.set()
+        self._wakeup.set()
+
+        if self._thread:
+            self._thread.join(timeout=max(self.flush_interval * 2, 5))
+            self._thread = None
+
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"❌ Ошибка финального сброса буфера ссылок: {e}")
+
+    def _run(self):
+        """Фоновый цикл сброса"""
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+
+            if self._stop.is_set():
+                break
+
+            try:
+                self.flush()
+            except Exception as e:
+                # Ссылки остаются в очереди и spool, повторим на следующем тике
+                logger.error(f"❌ Ошибка фонового сброса буфера ссылок: {e}")
+
+    # ============================================
+    # ПЛАН 1: ПОСТАНОВКА В ОЧЕРЕДЬ
+    # ============================================
+
+    def enqueue(self, user_id: int, url: str, message_text: str = None,
+                message_id: int = None, thread_id: int = None) -> int:
+        """Постановка ссылки в очередь, возвращает токен для resolve()"""
+        row = {
+            'user_id': user_id,
+            'url': url,
+            'url_hash': url_hash(url),
+            'message_text': message_text,
+            'message_id': message_id,
+            'thread_id': thread_id,
+            'created_at': datetime.now(),
+        }
+
+        with self._lock:
+            token = self._next_token
+            self._next_token += 1
+
+            self._append_to_spool([row])
+            self._pending.append((token, row))
+            self._pending_keys[(thread_id, row['url_hash'])] += 1
+            self._stats['enqueued'] += 1
+            pending_count = len(self._pending)
+
+        if pending_count >= self.batch_size:
+            self._wakeup.set()
+
+        return token
+
+    def resolve(self, token: int) -> Optional[int]:
+        """
+        Получение ID ссылки по токену (сбрасывает очередь при необходимости)
+
+        None - токен неизвестен или ссылка отвергнута БД
+        """
+        with self._lock:
+            if token in self._resolved:
+                return self._resolved[token]
+            still_pending = any(t == token for t, _ in self._pending)
+            in_flight = token in self._inflight_tokens
+
+        if still_pending:
+            self.flush()
+        elif in_flight:
+            # Пакет с токеном пишет другой поток: ждем конца его сброса
+            with self._flush_lock:
+                pass
+
+        with self._lock:
+            return self._resolved.get(token)
+
+    def has_pending(self, hash_value: str, thread_id: int = None) -> bool:
+        """Есть ли в очереди ссылка с таким хешем в топике"""
+        with self._lock:
+            return self._pending_keys[(thread_id, hash_value)] > 0
+
+    def pending_count(self) -> int:
+        """Количество ссылок, ожидающих записи"""
+        with self._lock:
+            return len(self._pending)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика буфера"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+        return stats
+
+    # ============================================
+    # ПЛАН 1: СБРОС В БД
+    # ============================================
+
+    def flush(self) -> Dict[int, int]:
+        """Сброс очереди одним INSERT, возвращает {token: link_id}"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return {}
+                batch = self._pending
+                self._pending = []
+                self._inflight_tokens = {token for token, _ in batch}
+                self._move_spool_to_inflight()
+
+            try:
+                ids = self._insert_batch([row for _, row in batch])
+            except Exception as e:
+                self._failed_attempts += 1
+                if self._failed_attempts < self.max_retries:
+                    self._requeue(batch)
+                    raise
+
+                # Пакет не проходит несколько раз подряд: ищем строки, которые его ломают
+                logger.warning(
+                    f"⚠️ Пакет ссылок не записан {self._failed_attempts} раз подряд, "
+                    f"запись по одной: {e}"
+                )
+                result, saved, rejected, retry = self._insert_separately(batch)
+            else:
+                result = {token: link_id for (token, _), link_id in zip(batch, ids)}
+                saved, rejected, retry = batch, [], []
+
+            if not retry:
+                self._failed_attempts = 0
+
+            with self._lock:
+                self._inflight_tokens = set()
+                done = saved + [(token, row) for token, row, _ in rejected]
+                self._pending_keys.subtract((row['thread_id'], row['url_hash']) for _, row in done)
+                self._pending_keys += TallyCounter()  # убираем нулевые ключи
+                self._resolved.update(result)
+                while len(self._resolved) > self.MAX_RESOLVED_TOKENS:
+                    self._resolved.popitem(last=False)
+                self._stats['flushed'] += len(saved)
+                self._stats['flushes'] += 1
+
+                if retry:
+                    self._pending = retry + self._pending
+                    self._rewrite_spool()
+                    self._stats['failed_flushes'] += 1
+                else:
+                    self._remove_inflight()
+
+            if rejected:
+                self._quarantine(rejected)
+
+            logger.debug(f"💾 Буфер ссылок сброшен: {len(saved)} шт.")
+            return result
+
+    def _requeue(self, batch: List[tuple]):
+        """Возврат пакета в начало очереди и восстановление spool"""
+        with self._lock:
+            self._inflight_tokens = set()
+            self._pending = batch + self._pending
+            self._rewrite_spool()
+            self._stats['failed_flushes'] += 1
+
+    def _insert_separately(self, batch: List[tuple]):
+        """
+        Запись пакета по одной ссылке
+
+        Ссылки, которые БД отвергает сами по себе (ограничения, неверные
+        данные), уходят в карантин. При любой другой ошибке (БД недоступна)
+        оставшиеся ссылки ждут следующего сброса.
+
+        Returns:
+            tuple: (result, saved, rejected, retry)
+        """
+        result: Dict[int, int] = {}
+        saved: List[tuple] = []
+        rejected: List[tuple] = []
+
+        for index, (token, row) in enumerate(batch):
+            try:
+                link_id = self._insert_batch([row])[0]
+            except (IntegrityError, DataError) as e:
+                rejected.append((token, row, str(e.orig if e.orig is not None else e)))
+            except Exception as e:
+                logger.error(f"❌ Поштучная запись ссылок прервана, осталось {len(batch) - index}: {e}")
+                return result, saved, rejected, batch[index:]
+            else:
+                result[token] = link_id
+                saved.append((token, row))
+
+        return result, saved, rejected, []
+
+    def _quarantine(self, rejected: List[tuple]):
+        """Отвергнутые БД ссылки: в лог и в файл карантина, из очереди и spool - прочь"""
+        for _, row, error in rejected:
+            logger.error(
+                f"❌ Ссылка отвергнута БД и снята с очереди: user_id={row['user_id']} "
+                f"url={str(row['url'])[:100]} ({error})"
+            )
+
+        with self._lock:
+            self._stats['quarantined'] += len(rejected)
+            if not self.rejected_path:
+                return
+            try:
+                with open(self.rejected_path, 'a', encoding='utf-8') as f:
+                    for _, row, error in rejected:
+                        data = json.loads(self._serialize(row))
+                        data['error'] = error
+                        data['rejected_at'] = datetime.now().isoformat()
+                        f.write(json.dumps(data, ensure_ascii=False) + '\n')
+            except OSError as e:
+                logger.error(f"❌ Ошибка записи карантина буфера ссылок: {e}")
+
+    def _insert_batch(self, rows: List[Dict[str, Any]]) -> List[int]:
+        """Пакетная вставка: недостающие пользователи + один multi-row INSERT ссылок"""
+        with self.db.get_session() as session:
+            user_ids = {row['user_id'] for row in rows}
+
+            existing = set(session.execute(
+                select(User.user_id).where(User.user_id.in_(user_ids))
+            ).scalars())
+
+            missing = user_ids - existing
+            if missing:
+                admin_ids = set(self.db._get_admin_ids())
+                session.execute(insert(User), [
+                    {'user_id': uid, 'is_admin': uid in admin_ids}
+                    for uid in missing
+                ])
+                self.db.stats.record_users_created(
+                    session, len(missing), len(missing & admin_ids)
+                )
+
+            # Порядок RETURNING при многострочной вставке не гарантирован:
+            # id сопоставляются токенам по позиции, поэтому - в порядке параметров
+            ids = session.execute(
+                insert(Link).returning(Link.id, sort_by_parameter_order=True), rows
+            ).scalars().all()
+
+            self.db.stats.record_links_added(
+                session, dict(TallyCounter(row['created_at'].date() for row in rows))
+            )
+            self.db.activity.record_links(
+                session, [(row['user_id'], row['thread_id'], row['created_at']) for row in rows]
+            )
+
+        return list(ids)
+
+    # ============================================
+    # ПЛАН 1: SPOOL-ФАЙЛ
+    # ============================================
+
+    @staticmethod
+    def _serialize(row: Dict[str, Any]) -> str:
+        data = dict(row)
+        data['created_at'] = row['created_at'].isoformat()
+        return json.dumps(data, ensure_ascii=False)
+
+    @staticmethod
+    def _deserialize(line: str) -> Dict[str, Any]:
+        data = json.loads(line)
+        data['created_at'] = datetime.fromisoformat(data['created_at'])
+        # Spool, записанный до появления url_hash
+        data.setdefault('url_hash', url_hash(data['url']))
+        return data
+
+    def _append_to_spool(self, rows: List[Dict[str, Any]]):
+        """Дозапись строк в spool (вызывается под _lock)"""
+        if not self.spool_path:
+            return
+        try:
+            with open(self.spool_path, 'a', encoding='utf-8') as f:
+                for row in rows:
+                    f.write(self._serialize(row) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            logger.error(f"❌ Ошибка записи spool буфера ссылок: {e}")
+
+    def _move_spool_to_inflight(self):
+        """Перенос spool в inflight на время сброса (вызывается под _lock)"""
+        if not self.spool_path or not os.path.exists(self.spool_path):
+            return
+        try:
+            if os.path.exists(self.inflight_path):
+                # Хвост прошлого неудачного сброса уже переписан в spool
+                os.remove(self.inflight_path)
+            os.replace(self.spool_path, self.inflight_path)
+        except OSError as e:
+            logger.error(f"❌ Ошибка ротации spool буфера ссылок: {e}")
+
+    def _remove_inflight(self):
+        """Удаление inflight после успешного сброса (вызывается под _lock)"""
+        if not self.inflight_path:
+            return
+        try:
+            if os.path.exists(self.inflight_path):
+                os.remove(self.inflight_path)
+        except OSError as e:
+            logger.error(f"❌ Ошибка удаления inflight буфера ссылок: {e}")
+
+    def _rewrite_spool(self):
+        """Перезапись spool текущей очередью (вызывается под _lock)"""
+        if not self.spool_path:
+            return
+        try:
+            tmp_path = f"{self.spool_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for _, row in self._pending:
+                    f.write(self._serialize(row) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.spool_path)
+            self._remove_inflight()
+        except OSError as e:
+            logger.error(f"❌ Ошибка перезаписи spool буфера ссылок: {e}")
+
+    def _read_spool_file(self, path: str) -> List[Dict[str, Any]]:
+        rows = []
+        if not path or not os.path.exists(path):
+            return rows
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rows.append(self._deserialize(line))
+                except (ValueError, KeyError) as e:
+                    # Оборванная последняя строка при падении процесса
+                    logger.warning(f"⚠️ Пропущена поврежденная строка spool: {e}")
+        return rows
+
+    def _recover_spool(self):
+        """Восстановление необработанных ссылок после перезапуска"""
+        try:
+            inflight_rows = self._read_spool_file(self.inflight_path)
+            spool_rows = self._read_spool_file(self.spool_path)
+
+            # Пакет inflight мог успеть закоммититься перед падением
+            if inflight_rows:
+                inflight_rows = self._drop_already_saved(inflight_rows)
+
+            rows = inflight_rows + spool_rows
+
+            with self._lock:
+                for row in rows:
+                    self._pending.append((self._next_token, row))
+                    self._pending_keys[(row['thread_id'], row['url_hash'])] += 1
+                    self._next_token += 1
+                self._stats['recovered'] += len(rows)
+                self._rewrite_spool()
+
+            if rows:
+                logger.warning(f"⚠️ Восстановлено из spool {len(rows)} несохраненных ссылок")
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка восстановления spool буфера ссылок: {e}")
+
+    def _drop_already_saved(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Отбрасывает строки inflight, которые уже есть в БД"""
+        with self.db.get_session() as session:
+            remaining = []
+            for row in rows:
+                exists = session.execute(
+                    select(Link.id).where(and_(
+                        Link.user_id == row['user_id'],
+                        Link.url == row['url'],
+                        Link.message_id == row['message_id'],
+                        Link.created_at == row['created_at'],
+                    )).limit(1)
+                ).first()
+                if not exists:
+                    remaining.append(row)
+            return remaining
@@ -4,16 +4,32 @@ CRUD операции и управление соединениями для в
 """
 
 import os
-from datetime import datetime, timedelta
+import html
+import threading
+from datetime import datetime, date, timedelta
 from typing import List, Optional, Dict, Any, Tuple
 from contextlib import contextmanager
 
-from sqlalchemy import create_engine, desc, func, and_, or_
+from sqlalchemy import event, desc, func, and_, or_, cast, Integer, Text
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.pool import QueuePool
 
 from database.models import Base, User, Link, Settings
+from database.settings_cache import SettingsCache, SETTINGS_VERSION_KEY, convert_setting_value
+from database.counters import CounterStore, REMINDER_COUNT
+from database.user_cache import UserProfileCache
+from database.stats_rollup import StatsRollupManager
+from database.activity_rollup import ActivityRollupManager
+from database.partitions import LinkPartitionManager
+from database.bulk_jobs import BulkJobManager
+from database.search import LinkSearchManager
+from database.pagination import encode_cursor
+from database.statements import USER_BY_ID, SETTING_BY_KEY, USER_LINK_COUNTS, link_params
+from database.migrations import MigrationsManager
+from database.replicas import ReplicaRouter, parse_replica_urls
+from database.instrumentation import get_sql_report
+from database.engines import engine_registry, get_pool_stats
+from utils.urls import url_hash
 # ПЛАН 2: Импорты кармы (ЗАГЛУШКИ)
 # from database.models import UserKarma, KarmaHistory
 # ПЛАН 3: Импорты ИИ и форм (ЗАГЛУШКИ)  
@@ -28,7 +44,7 @@ logger = get_logger(__name__)
 class DatabaseManager:
     """Менеджер базы данных с поддержкой всех планов развития"""
     
-    def __init__(self, database_url: str = None):
+    def __init__(self, database_url: str = None, replica_urls: List[str] = None):
         """Инициализация менеджера БД"""
         
         # Получаем URL БД из параметра или переменной окружения
@@ -37,18 +53,8 @@ class DatabaseManager:
         if not self.database_url:
             raise ValueError("DATABASE_URL не указан!")
         
-        # Настройка пула соединений
-        pool_size = int(os.getenv('DB_POOL_SIZE', '5'))
-        
         # Создание движка БД
-        self.engine = create_engine(
-            self.database_url,
-            poolclass=QueuePool,
-            pool_size=pool_size,
-            max_overflow=pool_size * 2,
-            pool_pre_ping=True,  # Проверка соединений
-            echo=False  # Отключаем SQL логи для production
-        )
+        self.engine = self._create_engine(self.database_url)
         
         # Создание фабрики сессий
         self.SessionLocal = sessionmaker(
@@ -57,8 +63,57 @@ class DatabaseManager:
             bind=self.engine
         )
         
+        # Реплики чтения (DATABASE_REPLICA_URLS) и фабрика читающих сессий
+        self.replicas = ReplicaRouter(
+            self.engine,
+            replica_urls if replica_urls is not None else parse_replica_urls(),
+            self._create_engine
+        )
+        self.ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False)
+        
+        if self.replicas.enabled:
+            # Read-your-writes: запись в потоке временно направляет его чтения на основную БД
+            event.listen(self.SessionLocal, 'after_flush', self._note_write)
+            event.listen(self.SessionLocal, 'do_orm_execute', self._note_bulk_write)
+        
+        # Буфер отложенной записи ссылок (создается при первом использовании)
+        self.link_buffer = None
+        self._link_buffer_lock = threading.Lock()
+        
+        # Асинхронный двойник (создается при первом использовании)
+        self.async_manager = None
+        
+        # Типизированный кеш настроек
+        self.settings_cache = SettingsCache(self)
+        
+        # Атомарные счетчики с отложенным сбросом
+        self.counters = CounterStore(self)
+        
+        # Кеш профилей пользователей (отложенный last_seen_at)
+        self.user_cache = UserProfileCache(self)
+        
+        # Инкрементальные агрегаты статистики
+        self.stats = StatsRollupManager(self)
+        
+        # Активность по часам и дням (пользователь, топик)
+        self.activity = ActivityRollupManager(self)
+        
+        # Помесячные партиции links, архив старых месяцев, отсечение партиций
+        self.partitions = LinkPartitionManager(self)
+        
+        # Массовые изменения пакетами по диапазонам ключа (очистка ссылок)
+        self.bulk_jobs = BulkJobManager(self)
+        
+        # Поиск по URL и тексту сообщений (аналитика админов)
+        self.search = LinkSearchManager(self)
+        
         logger.info(f"DatabaseManager инициализирован: {self.database_url.split('@')[-1]}")
     
+    @staticmethod
+    def _create_engine(url: str):
+        """Общий движок из реестра (пул разделяется с DatabaseCore, см. database/engines.py)"""
+        return engine_registry.get_engine(url)
+    
     @contextmanager
     def get_session(self):
         """Контекстный менеджер для получения сессии БД"""
@@ -73,6 +128,58 @@ class DatabaseManager:
         finally:
             session.close()
     
+    @contextmanager
+    def get_read_session(self, consistent: bool = False):
+        """
+        Сессия только для чтения: реплика по кругу или основная БД
+        
+        Args:
+            consistent: Читать с основной БД (read-your-writes)
+        """
+        target = self.replicas.choose(consistent)
+        
+        if target is not None:
+            self.replicas.start()
+        
+        session = self.ReadSessionLocal(bind=self.replicas.engine_for(target))
+        try:
+            if target is not None:
+                try:
+                    # Проверяем реплику до передачи сессии вызывающему коду
+                    session.connection()
+                except SQLAlchemyError as e:
+                    self.replicas.mark_failed(target, e)
+                    session.close()
+                    session = self.ReadSessionLocal(bind=self.engine)
+            
+            yield session
+        except Exception as e:
+            logger.error(f"Ошибка БД сессии чтения: {e}")
+            raise
+        finally:
+            # Только чтение - фиксировать нечего
+            session.rollback()
+            session.close()
+    
+    def _note_write(self, session, flush_context):
+        self.replicas.note_write()
+    
+    def _note_bulk_write(self, orm_execute_state):
+        if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+            self.replicas.note_write()
+    
+    def get_sql_stats(self, top: int = 10) -> Dict[str, Any]:
+        """Статистика SQL по отпечаткам запросов и подозрения на N+1"""
+        return get_sql_report(top)
+    
+    def get_pool_stats(self) -> List[Dict[str, Any]]:
+        """Пулы соединений процесса: занятость, ожидание, таймауты"""
+        return get_pool_stats()
+    
+    def get_replica_stats(self) -> Dict[str, Any]:
+        """Состояние реплик чтения"""
+        return self.replicas.get_stats()
+    
     def create_tables(self, force_recreate: bool = False):
         """Создание всех таблиц БД с опцией принудительного пересоздания"""
         try:
@@ -109,6 +216,19 @@ class DatabaseManager:
                         logger.error(f"❌ Неизвестная ошибка создания таблиц: {e}")
                         raise
             
+            # Версионированные миграции: индексы и колонки для существующих таблиц
+            try:
+                self.run_migrations()
+            except Exception as migration_error:
+                # Не применившаяся версия будет повторена при следующем запуске
+                logger.error(f"❌ Ошибка миграций схемы: {migration_error}")
+            
+            # Партиции на следующие месяцы и архивация старых (фоном)
+            self.partitions.start()
+            
+            # Продолжение пакетных заданий, прерванных рестартом
+            self.bulk_jobs.start()
+            
             # Инициализация базовых настроек с защитой от ошибок
             try:
                 self._init_default_settings()
@@ -124,13 +244,25 @@ class DatabaseManager:
             logger.error(f"❌ Общая ошибка создания таблиц: {e}")
             raise
     
+    def run_migrations(self, target: int = None, dry_run: bool = None) -> List[Dict[str, Any]]:
+        """Применение ожидающих миграций схемы (см. database/migrations.py)"""
+        return MigrationsManager(self.engine).run(target=target, dry_run=dry_run)
+    
+    def get_migrations_status(self) -> Dict[str, Any]:
+        """Текущая и последняя версии схемы, ожидающие миграции"""
+        try:
+            return MigrationsManager(self.engine).status()
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения статуса миграций: {e}")
+            return {}
+    
     def _init_default_settings(self):
         """Инициализация настроек по умолчанию"""
         default_settings = [
             ('bot_enabled', 'true', 'bool', 'Включен ли бот'),
             ('current_limit_mode', 'BURST', 'string', 'Текущий режим лимитов API'),
-            ('reminder_count', '0', 'int', 'Счетчик отправленных напоминаний'),
             ('last_reset_date', datetime.now().isoformat(), 'string', 'Дата последнего сброса статистики'),
+            (SETTINGS_VERSION_KEY, '0', 'int', 'Версия настроек (синхронизация кешей процессов)'),
             
             # ПЛАН 2: Настройки кармы (ЗАГЛУШКИ)
             # ('karma_enabled', 'false', 'bool', 'Включена ли система кармы'),
@@ -161,6 +293,8 @@ class DatabaseManager:
                 
                 session.commit()
                 log_database_operation(logger, "INIT", "settings", len(default_settings))
+            
+            self.settings_cache.invalidate()
                 
         except Exception as e:
             logger.error(f"❌ Ошибка инициализации настроек: {e}")
@@ -168,42 +302,85 @@ class DatabaseManager:
     def close(self):
         """Закрытие соединений с БД"""
         try:
-            self.engine.dispose()
+            if self.link_buffer:
+                self.link_buffer.stop()
+            self.counters.stop()
+            self.user_cache.stop()
+            self.stats.stop()
+            self.activity.stop()
+            self.partitions.stop()
+            self.bulk_jobs.stop()
+            self.replicas.close()
+            engine_registry.release(self.engine)
             logger.info("✅ Соединения с БД закрыты")
         except Exception as e:
             logger.error(f"❌ Ошибка закрытия БД: {e}")
 
-    def get_recent_links_safe(self, limit: int = 10) -> List[dict]:
+    def get_async_manager(self):
+        """Получение асинхронного двойника (AsyncDatabaseManager) с общими кешами"""
+        if self.async_manager is None:
+            from database.async_manager import AsyncDatabaseManager
+            self.async_manager = AsyncDatabaseManager(self)
+        return self.async_manager
+
+    def get_recent_links_safe(self, limit: int = 10, cursor: str = None) -> List[dict]:
         """Безопасное получение последних ссылок как словарей (исправляет проблему сессии)"""
         try:
-            with self.get_session() as session:
-                # Получаем ссылки с JOIN к пользователям для одного запроса
-                query = session.query(Link, User).outerjoin(User, Link.user_id == User.user_id)\
-                              .filter(Link.is_active == True)\
-                              .order_by(Link.created_at.desc())\
-                              .limit(limit)
-                
-                results = query.all()
-                
-                # Преобразуем в словари для избежания проблем с сессией
-                safe_links = []
-                for link, user in results:
-                    safe_links.append({
-                        'id': link.id,
-                        'user_id': link.user_id,
-                        'username': user.username if user else None,
-                        'first_name': user.first_name if user else None,
-                        'url': link.url,
-                        'created_at': link.created_at,
-                        'thread_id': getattr(link, 'thread_id', None)
-                    })
-                
-                logger.info(f"✅ Загружено {len(safe_links)} ссылок (безопасный метод)")
-                return safe_links
+            safe_links, _ = self.get_links_page(limit=limit, cursor=cursor)
+            
+            logger.info(f"✅ Загружено {len(safe_links)} ссылок (безопасный метод)")
+            return safe_links
                 
         except Exception as e:
             logger.error(f"❌ Ошибка get_recent_links_safe: {e}")
             return []
+    
+    def get_links_page(self, limit: int = 10, cursor: str = None, user_id: int = None,
+                       thread_id: int = None, backward: bool = False) -> Tuple[List[dict], Optional[str]]:
+        """
+        Страница активных ссылок (keyset-пагинация по created_at, id)
+        
+        backward=True - страница перед cursor (ссылки новее него), для кнопки «назад»
+        
+        Returns:
+            tuple: (ссылки как словари, курсор следующей страницы или None)
+        """
+        with self.get_read_session() as session:
+            # Ссылки с JOIN к пользователям одним запросом; берем на одну
+            # запись больше, чтобы узнать есть ли следующая страница
+            stmt, params = link_params(self.partitions.active_floor(), limit + 1, user_id,
+                                       thread_id, cursor, with_user=True, backward=backward)
+            results = session.execute(stmt, params).all()
+            
+            if backward and cursor:
+                # Страница, с которой пришли, идет следующей
+                results = results[:limit][::-1]
+                has_more = True
+            else:
+                has_more = len(results) > limit
+                results = results[:limit]
+            
+            # Преобразуем в словари для избежания проблем с сессией
+            links = [self._link_to_dict(link, user) for link, user in results]
+            
+            next_cursor = None
+            if has_more and links:
+                next_cursor = encode_cursor(links[-1]['created_at'], links[-1]['id'])
+            
+            return links, next_cursor
+    
+    @staticmethod
+    def _link_to_dict(link: Link, user: Optional[User]) -> dict:
+        """Ссылка с данными автора в виде словаря (не зависит от сессии)"""
+        return {
+            'id': link.id,
+            'user_id': link.user_id,
+            'username': user.username if user else None,
+            'first_name': user.first_name if user else None,
+            'url': link.url,
+            'created_at': link.created_at,
+            'thread_id': getattr(link, 'thread_id', None)
+        }
 
     # ============================================
     # ПЛАН 1: CRUD ОПЕРАЦИИ ДЛЯ БАЗОВЫХ МОДЕЛЕЙ
@@ -216,7 +393,7 @@ class DatabaseManager:
         """Получение или создание пользователя"""
         try:
             with self.get_session() as session:
-                user = session.query(User).filter(User.user_id == user_id).first()
+                user = session.execute(USER_BY_ID, {'user_id': user_id}).scalars().first()
                 
                 if not user:
                     # Создаем нового пользователя
@@ -230,6 +407,7 @@ class DatabaseManager:
                         is_admin=is_admin
                     )
                     session.add(user)
+                    self.stats.record_users_created(session, 1, 1 if is_admin else 0)
                     session.commit()
                     
                     log_database_operation(logger, "CREATE", "users", 1, user_id=user_id)
@@ -252,17 +430,33 @@ class DatabaseManager:
                         session.commit()
                         log_database_operation(logger, "UPDATE", "users", 1, user_id=user_id)
                 
+                self.user_cache.remember(user.user_id, user.username, user.first_name, user.last_name)
                 return user
                 
         except Exception as e:
             logger.error(f"❌ Ошибка get_or_create_user: {e}")
             raise
     
+    def touch_user(self, user_id: int, username: str = None,
+                   first_name: str = None, last_name: str = None):
+        """Отметка активности пользователя (без запроса к БД для известных)"""
+        try:
+            self.stats.record_user_seen(user_id)
+            if self.user_cache.touch(user_id, username, first_name, last_name):
+                return
+            
+            # Новый или вытесненный из кеша пользователь - синхронно
+            self.get_or_create_user(user_id, username, first_name, last_name)
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка touch_user: {e}")
+            raise
+    
     def get_user_by_id(self, user_id: int) -> Optional[User]:
         """Получение пользователя по ID"""
         try:
             with self.get_session() as session:
-                user = session.query(User).filter(User.user_id == user_id).first()
+                user = session.execute(USER_BY_ID, {'user_id': user_id}).scalars().first()
                 return user
         except Exception as e:
             logger.error(f"❌ Ошибка get_user_by_id: {e}")
@@ -275,12 +469,23 @@ class DatabaseManager:
             username = username.lstrip('@')
             
             with self.get_session() as session:
-                user = session.query(User).filter(User.username == username).first()
+                user = session.query(User).filter(func.lower(User.username) == username.lower()).first()
                 return user
         except Exception as e:
             logger.error(f"❌ Ошибка get_user_by_username: {e}")
             return None
     
+    def get_user_id_by_username(self, username: str) -> Optional[int]:
+        """Получение Telegram user_id по username"""
+        try:
+            username = username.lstrip('@')
+            
+            with self.get_session() as session:
+                return session.query(User.user_id).filter(func.lower(User.username) == username.lower()).limit(1).scalar()
+        except Exception as e:
+            logger.error(f"❌ Ошибка get_user_id_by_username: {e}")
+            return None
+    
     def get_all_admins(self) -> List[User]:
         """Получение всех администраторов"""
         try:
@@ -313,12 +518,16 @@ class DatabaseManager:
                 link = Link(
                     user_id=user_id,
                     url=url,
+                    url_hash=url_hash(url),
                     message_text=message_text,
                     message_id=message_id,
                     thread_id=thread_id
                 )
                 
                 session.add(link)
+                now = datetime.now()
+                self.stats.record_links_added(session, {now.date(): 1})
+                self.activity.record_links(session, [(user_id, thread_id, now)])
                 session.commit()
                 
                 log_database_operation(logger, "CREATE", "links", 1, 
@@ -330,16 +539,111 @@ class DatabaseManager:
             logger.error(f"❌ Ошибка add_link: {e}")
             raise
     
-    def get_recent_links(self, limit: int = 10, thread_id: int = None) -> List[Link]:
-        """Получение последних ссылок"""
+    def get_link_buffer(self):
+        """Получение (и запуск) буфера отложенной записи ссылок"""
+        if self.link_buffer is None:
+            with self._link_buffer_lock:
+                if self.link_buffer is None:
+                    from database.link_buffer import LinkIngestionBuffer
+                    link_buffer = LinkIngestionBuffer(self)
+                    link_buffer.start()
+                    self.link_buffer = link_buffer
+        return self.link_buffer
+    
+    def enqueue_link(self, user_id: int, url: str, message_text: str = None,
+                     message_id: int = None, thread_id: int = None) -> int:
+        """Постановка ссылки в буфер пакетной записи, возвращает токен"""
+        return self.get_link_buffer().enqueue(
+            user_id=user_id,
+            url=url,
+            message_text=message_text,
+            message_id=message_id,
+            thread_id=thread_id
+        )
+    
+    def resolve_link_id(self, token: int) -> Optional[int]:
+        """Получение ID ссылки по токену буфера (сбрасывает буфер при необходимости)"""
         try:
-            with self.get_session() as session:
-                query = session.query(Link).filter(Link.is_active == True)
-                
-                if thread_id:
-                    query = query.filter(Link.thread_id == thread_id)
-                
-                links = query.order_by(desc(Link.created_at)).limit(limit).all()
+            return self.get_link_buffer().resolve(token)
+        except Exception as e:
+            logger.error(f"❌ Ошибка resolve_link_id: {e}")
+            return None
+    
+    def flush_links(self) -> int:
+        """Принудительный сброс буфера ссылок, возвращает количество записанных"""
+        if self.link_buffer is None:
+            return 0
+        try:
+            return len(self.link_buffer.flush())
+        except Exception as e:
+            logger.error(f"❌ Ошибка flush_links: {e}")
+            return 0
+    
+    def find_recent_links(self, urls: List[str], thread_id: int = None,
+                          hours: float = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Последние публикации тех же ссылок (по каноническому URL) в топике
+        
+        Проверка еще не сброшенного буфера ссылок и один запрос
+        url_hash IN (...) по индексу (thread_id, url_hash, created_at) к
+        основной БД: реплика может еще не видеть ссылку из соседнего сообщения.
+        
+        Args:
+            hours: Окно поиска (по умолчанию LINK_DEDUP_WINDOW_HOURS)
+        
+        Returns:
+            dict: url -> {'id', 'user_id', 'created_at', 'pending'} для найденных
+        """
+        try:
+            if hours is None:
+                hours = float(os.getenv('LINK_DEDUP_WINDOW_HOURS', '24'))
+            
+            found = {}
+            by_hash: Dict[str, List[str]] = {}
+            for url in urls:
+                hash_value = url_hash(url)
+                if self.link_buffer is not None and self.link_buffer.has_pending(hash_value, thread_id):
+                    found[url] = {'id': None, 'user_id': None, 'created_at': datetime.now(), 'pending': True}
+                else:
+                    by_hash.setdefault(hash_value, []).append(url)
+            
+            if not by_hash:
+                return found
+            
+            with self.get_read_session(consistent=True) as session:
+                rows = session.query(Link.id, Link.user_id, Link.created_at, Link.url_hash).filter(
+                    Link.thread_id.is_(None) if thread_id is None else Link.thread_id == thread_id,
+                    Link.url_hash.in_(list(by_hash)),
+                    Link.created_at >= datetime.now() - timedelta(hours=hours)
+                ).order_by(desc(Link.created_at)).all()
+            
+            for row in rows:
+                for url in by_hash.pop(row.url_hash, []):
+                    found[url] = {'id': row.id, 'user_id': row.user_id,
+                                  'created_at': row.created_at, 'pending': False}
+            
+            return found
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка find_recent_links: {e}")
+            return {}
+    
+    def find_recent_link(self, url: str, thread_id: int = None,
+                         hours: float = None) -> Optional[Dict[str, Any]]:
+        """Последняя публикация той же ссылки в топике (см. find_recent_links)"""
+        return self.find_recent_links([url], thread_id, hours).get(url)
+    
+    def is_link_seen_recently(self, url: str, thread_id: int = None, hours: float = None) -> bool:
+        """Публиковалась ли ссылка в топике за последние hours часов"""
+        return self.find_recent_link(url, thread_id, hours) is not None
+    
+    def get_recent_links(self, limit: int = 10, thread_id: int = None, cursor: str = None) -> List[Link]:
+        """Получение последних ссылок (cursor - продолжение после предыдущей страницы)"""
+        try:
+            with self.get_read_session() as session:
+                stmt, params = link_params(self.partitions.active_floor(), limit,
+                                           thread_id=thread_id, cursor=cursor)
+                links = session.execute(stmt, params).scalars().all()
                 
                 log_database_operation(logger, "SELECT", "links", len(links), limit=limit)
                 
@@ -349,13 +653,13 @@ class DatabaseManager:
             logger.error(f"❌ Ошибка get_recent_links: {e}")
             return []
     
-    def get_user_links(self, user_id: int, limit: int = 50) -> List[Link]:
-        """Получение ссылок пользователя"""
+    def get_user_links(self, user_id: int, limit: int = 50, cursor: str = None) -> List[Link]:
+        """Получение ссылок пользователя (cursor - продолжение после предыдущей страницы)"""
         try:
-            with self.get_session() as session:
-                links = session.query(Link).filter(
-                    and_(Link.user_id == user_id, Link.is_active == True)
-                ).order_by(desc(Link.created_at)).limit(limit).all()
+            with self.get_read_session() as session:
+                stmt, params = link_params(self.partitions.active_floor(), limit,
+                                           user_id=user_id, cursor=cursor)
+                links = session.execute(stmt, params).scalars().all()
                 
                 return links
                 
@@ -363,6 +667,48 @@ class DatabaseManager:
             logger.error(f"❌ Ошибка get_user_links: {e}")
             return []
     
+    def get_links_by_username_safe(self, username: str, limit: int = 20,
+                                   cursor: str = None) -> List[dict]:
+        """Безопасное получение ссылок пользователя по username как словарей"""
+        try:
+            user_id = self.get_user_id_by_username(username)
+            if not user_id:
+                return []
+            
+            links, _ = self.get_links_page(limit=limit, cursor=cursor, user_id=user_id)
+            return links
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка get_links_by_username_safe: {e}")
+            return []
+    
+    def format_links_for_display(self, links: List[dict], title: str,
+                                 start_index: int = 1) -> str:
+        """Форматирование списка ссылок (словарей) для отправки в Telegram (title - готовый HTML)"""
+        if not links:
+            return f"📎 <b>{title}</b>\n\n🤷 Ссылок пока нет."
+        
+        text_parts = [f"📎 <b>{title}</b>\n"]
+        
+        for i, link in enumerate(links, start_index):
+            if link.get('username'):
+                author = f"@{link['username']}"
+            else:
+                author = link.get('first_name') or f"ID{link['user_id']}"
+            
+            created_at = link.get('created_at')
+            date_str = created_at.strftime("%d.%m.%Y %H:%M") if created_at else "—"
+            
+            url = link['url']
+            display_url = url if len(url) <= 50 else url[:47] + "..."
+            
+            # Имя и ссылка вводятся пользователями - сообщение идет с parse_mode HTML
+            text_parts.append(f"{i}. <b>{html.escape(author)}</b> ({date_str})")
+            text_parts.append(f"   🔗 {html.escape(display_url)}")
+            text_parts.append("")
+        
+        return "\n".join(text_parts).rstrip()
+    
     def get_links_by_username(self, username: str, limit: int = 50) -> List[Link]:
         """Получение ссылок по username"""
         try:
@@ -376,49 +722,50 @@ class DatabaseManager:
             logger.error(f"❌ Ошибка get_links_by_username: {e}")
             return []
     
+    def search_links(self, query: str, page: int = 1) -> Optional[Dict[str, Any]]:
+        """Ранжированный поиск по ссылкам (см. database/search.py)"""
+        try:
+            return self.search.search(query, page)
+        except Exception as e:
+            logger.error(f"❌ Ошибка search_links: {e}")
+            return None
+    
     def clear_all_links(self) -> int:
-        """Очистка всех ссылок (помечаем как неактивные)"""
+        """Очистка всех ссылок (помечаем как неактивные) пакетами в текущем потоке"""
         try:
-            with self.get_session() as session:
-                count = session.query(Link).filter(Link.is_active == True).count()
-                
-                session.query(Link).filter(Link.is_active == True).update(
-                    {Link.is_active: False}
-                )
-                session.commit()
-                
-                log_database_operation(logger, "UPDATE", "links", count, action="clear_all")
-                
-                return count
+            job = self.bulk_jobs.submit('clear_links', background=False)
+            log_database_operation(logger, "UPDATE", "links", job['processed'], action="clear_all")
+            return job['processed']
                 
         except Exception as e:
             logger.error(f"❌ Ошибка clear_all_links: {e}")
             return 0
     
+    def start_clear_links(self, created_by: int = None, chat_id: int = None,
+                          message_id: int = None) -> Optional[Dict[str, Any]]:
+        """Фоновая очистка ссылок с прогрессом в сообщении chat_id/message_id"""
+        try:
+            return self.bulk_jobs.submit(
+                'clear_links', created_by=created_by, chat_id=chat_id, message_id=message_id
+            )
+        except Exception as e:
+            logger.error(f"❌ Ошибка start_clear_links: {e}")
+            return None
+    
+    def cancel_bulk_job(self, job_id: int) -> bool:
+        """Отмена пакетного задания"""
+        try:
+            return self.bulk_jobs.cancel(job_id)
+        except Exception as e:
+            logger.error(f"❌ Ошибка cancel_bulk_job: {e}")
+            return False
+    
     # --- Управление настройками ---
     
     def get_setting(self, key: str, default_value: Any = None) -> Any:
-        """Получение настройки"""
+        """Получение настройки (из кеша настроек)"""
         try:
-            with self.get_session() as session:
-                setting = session.query(Settings).filter(Settings.key == key).first()
-                
-                if not setting:
-                    return default_value
-                
-                # Преобразуем значение в нужный тип
-                if setting.value_type == 'bool':
-                    return setting.value.lower() == 'true'
-                elif setting.value_type == 'int':
-                    return int(setting.value)
-                elif setting.value_type == 'float':
-                    return float(setting.value)
-                elif setting.value_type == 'json':
-                    import ujson
-                    return ujson.loads(setting.value)
-                else:
-                    return setting.value
-                    
+            return self.settings_cache.get(key, default_value)
         except Exception as e:
             logger.error(f"❌ Ошибка get_setting: {e}")
             return default_value
@@ -428,7 +775,7 @@ class DatabaseManager:
         """Установка настройки"""
         try:
             with self.get_session() as session:
-                setting = session.query(Settings).filter(Settings.key == key).first()
+                setting = session.execute(SETTING_BY_KEY, {'key': key}).scalars().first()
                 
                 # Преобразуем значение в строку
                 if value_type == 'json':
@@ -455,89 +802,155 @@ class DatabaseManager:
                     )
                     session.add(setting)
                 
+                session.flush()
+                version = self._bump_settings_version(session)
                 session.commit()
                 
                 log_database_operation(logger, "UPSERT", "settings", 1, 
                                      key=key, value=str_value[:50])
+            
+            self.settings_cache.apply_local(key, convert_setting_value(str_value, value_type), version)
                 
         except Exception as e:
+            self.settings_cache.invalidate()
             logger.error(f"❌ Ошибка set_setting: {e}")
             raise
     
+    def _bump_settings_version(self, session: Session) -> int:
+        """Атомарное увеличение версии настроек в текущей транзакции"""
+        updated = session.query(Settings).filter(Settings.key == SETTINGS_VERSION_KEY).update(
+            {Settings.value: cast(cast(Settings.value, Integer) + 1, Text)},
+            synchronize_session=False
+        )
+        
+        if not updated:
+            session.add(Settings(
+                key=SETTINGS_VERSION_KEY,
+                value='1',
+                value_type='int',
+                description='Версия настроек (синхронизация кешей процессов)'
+            ))
+            return 1
+        
+        return int(session.query(Settings.value).filter(
+            Settings.key == SETTINGS_VERSION_KEY
+        ).scalar())
+    
     def get_all_settings(self) -> Dict[str, Any]:
         """Получение всех настроек"""
         try:
-            with self.get_session() as session:
-                settings = session.query(Settings).all()
-                
-                result = {}
-                for setting in settings:
-                    if setting.value_type == 'bool':
-                        result[setting.key] = setting.value.lower() == 'true'
-                    elif setting.value_type == 'int':
-                        result[setting.key] = int(setting.value)
-                    elif setting.value_type == 'float':
-                        result[setting.key] = float(setting.value)
-                    elif setting.value_type == 'json':
-                        import ujson
-                        result[setting.key] = ujson.loads(setting.value)
-                    else:
-                        result[setting.key] = setting.value
-                
-                return result
-                
+            return self.settings_cache.get_all()
         except Exception as e:
             logger.error(f"❌ Ошибка get_all_settings: {e}")
             return {}
     
+    def get_settings_cache_stats(self) -> Dict[str, Any]:
+        """Статистика кеша настроек (попадания/промахи)"""
+        return self.settings_cache.get_stats()
+    
+    # --- Счетчики ---
+    
+    def increment_counter(self, name: str, amount: int = 1):
+        """Увеличение счетчика (сбрасывается в БД пакетно)"""
+        try:
+            self.counters.increment(name, amount)
+        except Exception as e:
+            logger.error(f"❌ Ошибка increment_counter: {e}")
+    
+    def get_counter(self, name: str, default: int = 0) -> int:
+        """Получение значения счетчика"""
+        try:
+            return self.counters.get(name, default)
+        except Exception as e:
+            logger.error(f"❌ Ошибка get_counter: {e}")
+            return default
+    
     # --- Статистика ПЛАН 1 ---
     
+    def reconcile_stats(self) -> Dict[str, int]:
+        """Принудительная сверка агрегатов статистики"""
+        try:
+            return self.stats.reconcile()
+        except Exception as e:
+            logger.error(f"❌ Ошибка reconcile_stats: {e}")
+            return {}
+    
     def get_basic_stats(self) -> Dict[str, Any]:
-        """Получение базовой статистики"""
+        """Получение базовой статистики (из инкрементальных агрегатов)"""
         try:
-            with self.get_session() as session:
-                stats = {
-                    'total_users': session.query(User).count(),
-                    'total_admins': session.query(User).filter(User.is_admin == True).count(),
-                    'total_links': session.query(Link).filter(Link.is_active == True).count(),
-                    'links_today': session.query(Link).filter(
-                        and_(
-                            Link.is_active == True,
-                            Link.created_at >= datetime.now().replace(hour=0, minute=0, second=0)
-                        )
-                    ).count(),
-                    'active_users_week': session.query(User).filter(
-                        User.last_seen_at >= datetime.now() - timedelta(days=7)
-                    ).count()
-                }
-                
-                return stats
+            snapshot = self.stats.get_snapshot()
+            stats = {
+                'total_users': snapshot['total_users'],
+                'total_admins': snapshot['total_admins'],
+                'total_links': snapshot['total_links'],
+                'links_today': snapshot['links_today'],
+                'active_users_week': snapshot['active_users_week']
+            }
+            
+            stats['reminders_sent'] = self.get_counter(REMINDER_COUNT)
+            
+            return stats
                 
         except Exception as e:
             logger.error(f"❌ Ошибка get_basic_stats: {e}")
             return {}
     
+    def get_daily_activity(self, days: int = 14, user_id: int = None,
+                           thread_id: int = None) -> List[Tuple[date, int]]:
+        """Ссылки по дням (из агрегатов активности)"""
+        try:
+            return self.activity.get_daily(days, user_id=user_id, thread_id=thread_id)
+        except Exception as e:
+            logger.error(f"❌ Ошибка get_daily_activity: {e}")
+            return []
+    
+    def get_thread_activity(self, days: int = 14, user_id: int = None) -> Dict[int, int]:
+        """Ссылки по топикам (из агрегатов активности)"""
+        try:
+            return self.activity.get_by_thread(days, user_id=user_id)
+        except Exception as e:
+            logger.error(f"❌ Ошибка get_thread_activity: {e}")
+            return {}
+    
+    def archive_links(self, dry_run: bool = False) -> List[Dict[str, Any]]:
+        """Архивация старых месяцев ссылок (см. database/partitions.py)"""
+        try:
+            return self.partitions.archive(dry_run=dry_run)
+        except Exception as e:
+            logger.error(f"❌ Ошибка archive_links: {e}")
+            return []
+    
+    def get_partition_stats(self) -> Dict[str, Any]:
+        """Партиции ссылок и объем архива"""
+        try:
+            return self.partitions.get_stats()
+        except Exception as e:
+            logger.error(f"❌ Ошибка get_partition_stats: {e}")
+            return {}
+    
+    def backfill_activity(self) -> Dict[str, int]:
+        """Пересчет агрегатов активности по истории ссылок"""
+        try:
+            return self.activity.backfill()
+        except Exception as e:
+            logger.error(f"❌ Ошибка backfill_activity: {e}")
+            return {}
+    
     def get_user_stats(self, user_id: int) -> Dict[str, Any]:
         """Получение статистики пользователя"""
         try:
-            with self.get_session() as session:
-                user = session.query(User).filter(User.user_id == user_id).first()
+            with self.get_read_session() as session:
+                user = session.execute(USER_BY_ID, {'user_id': user_id}).scalars().first()
                 
                 if not user:
                     return {}
                 
-                # Базовая статистика
-                total_links = session.query(Link).filter(
-                    and_(Link.user_id == user_id, Link.is_active == True)
-                ).count()
-                
-                links_this_month = session.query(Link).filter(
-                    and_(
-                        Link.user_id == user_id,
-                        Link.is_active == True,
-                        Link.created_at >= datetime.now().replace(day=1, hour=0, minute=0, second=0)
-                    )
-                ).count()
+                # Базовая статистика - оба счетчика одним запросом
+                total_links, links_this_month = session.execute(USER_LINK_COUNTS, {
+                    'user_id': user_id,
+                    'floor': self.partitions.active_floor(),
+                    'since': datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0),
+                }).one()
                 
                 stats = {
                     'user_id': user_id,
@@ -570,11 +983,9 @@ class DatabaseManager:
     def get_links_by_user_id(self, user_id: int, limit: int = 10):
         """Получение ссылок пользователя по ID (для menu.py)"""
         try:
-            with self.get_session() as session:
-                links = session.query(Link).filter(
-                    Link.user_id == user_id,
-                    Link.is_active == True
-                ).order_by(Link.created_at.desc()).limit(limit).all()
+            with self.get_read_session() as session:
+                stmt, params = link_params(self.partitions.active_floor(), limit, user_id=user_id)
+                links = session.execute(stmt, params).scalars().all()
                 
                 return links
                 
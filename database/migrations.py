@@ -0,0 +1,743 @@
+"""
+Миграции схемы Do Presave Reminder Bot v25+
+Версионированные онлайн-миграции без пересоздания таблиц
+
+ПЛАН 1: Таблица версий и упорядоченные шаги миграций (АКТИВНАЯ)
+
+create_all создает только отсутствующие таблицы: индексы и колонки для
+уже существующих таблиц он не добавляет. Такие изменения описываются
+здесь как миграции с номером версии. Примененные версии хранятся в
+таблице schema_migrations (отдельно для каждой области - scope), поэтому
+каждая миграция выполняется ровно один раз.
+
+Шаги рассчитаны на живую БД:
+- индексы на PostgreSQL строятся через CREATE INDEX CONCURRENTLY
+  (без блокировки записи в таблицу);
+- заполнение данных идет пакетами по диапазонам первичного ключа,
+  каждый пакет - в своей короткой транзакции;
+- транзакционные шаги на PostgreSQL выполняются с lock_timeout, чтобы
+  не выстраивать очередь запросов за ALTER TABLE.
+
+MIGRATIONS_DRY_RUN=true только выводит план, ничего не меняя.
+"""
+
+import os
+import re
+import time
+import zlib
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Sequence, Callable
+
+from sqlalchemy import (
+    MetaData, Table, Column, String, Integer, DateTime, text, select, insert, inspect
+)
+
+from database.partitions import month_start, add_months, create_partition_sql, is_partitioned
+from database.search import SEARCH_TSVECTOR_SQL
+from utils.logger import get_logger
+from utils.urls import url_hash
+
+logger = get_logger(__name__)
+
+# Таблица версий намеренно не входит в Base.metadata:
+# drop_all/пересоздание схемы не должны стирать историю миграций
+MIGRATIONS_TABLE = 'schema_migrations'
+
+_metadata = MetaData()
+
+schema_migrations = Table(
+    MIGRATIONS_TABLE, _metadata,
+    Column('scope', String(50), primary_key=True),
+    Column('version', Integer, primary_key=True),
+    Column('name', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+    Column('duration_ms', Integer, nullable=False, default=0),
+)
+
+
+class MigrationError(Exception):
+    """Ошибка применения миграции"""
+    pass
+
+
+# ============================================
+# ПЛАН 1: ШАГИ МИГРАЦИЙ
+# ============================================
+
+class MigrationStep:
+    """Базовый шаг миграции"""
+
+    def describe(self) -> str:
+        """Описание шага для логов и dry-run"""
+        raise NotImplementedError
+
+    def apply(self, engine):
+        """Выполнение шага (шаг сам управляет подключениями)"""
+        raise NotImplementedError
+
+    @staticmethod
+    def _lock_timeout(conn):
+        """Ограничение ожидания блокировок для транзакционных шагов"""
+        if conn.dialect.name == 'postgresql':
+            timeout = os.getenv('MIGRATIONS_LOCK_TIMEOUT', '5s')
+            conn.execute(text(f"SET LOCAL lock_timeout = '{timeout}'"))
+
+
+class SQLStep(MigrationStep):
+    """Произвольный SQL в транзакции"""
+
+    def __init__(self, sql: str, dialects: Sequence[str] = None):
+        self.sql = sql.strip()
+        self.dialects = set(dialects) if dialects else None
+
+    def describe(self) -> str:
+        return self.sql
+
+    def apply(self, engine):
+        if self.dialects and engine.dialect.name not in self.dialects:
+            logger.debug(f"Шаг пропущен для {engine.dialect.name}: {self.sql[:60]}")
+            return
+
+        with engine.begin() as conn:
+            self._lock_timeout(conn)
+            conn.execute(text(self.sql))
+
+
+class CreateIndexStep(MigrationStep):
+    """
+    Создание индекса; на PostgreSQL - CONCURRENTLY, вне транзакции
+
+    Для секционированной таблицы индекс создается на родителе (ON ONLY),
+    затем CONCURRENTLY на каждой партиции и присоединяется к родителю.
+    Новые партиции получают индекс автоматически.
+    """
+
+    def __init__(self, name: str, table: str, columns: Sequence[str],
+                 where: str = None, unique: bool = False, using: str = None,
+                 dialects: Sequence[str] = None):
+        self.name = name
+        self.table = table
+        self.columns = list(columns)
+        self.where = where
+        self.unique = unique
+        self.using = using
+        self.dialects = set(dialects) if dialects else None
+
+    def _sql(self, concurrently: bool, name: str = None, table: str = None,
+             only: bool = False) -> str:
+        sql = (
+            f"CREATE {'UNIQUE ' if self.unique else ''}INDEX "
+            f"{'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {name or self.name} "
+            f"ON {'ONLY ' if only else ''}{table or self.table} "
+            f"{f'USING {self.using} ' if self.using else ''}({', '.join(self.columns)})"
+        )
+        if self.where:
+            sql += f" WHERE {self.where}"
+        return sql
+
+    def describe(self) -> str:
+        return self._sql(concurrently=True)
+
+    def apply(self, engine):
+        if self.dialects and engine.dialect.name not in self.dialects:
+            logger.debug(f"Индекс {self.name} пропущен для {engine.dialect.name}")
+            return
+
+        if engine.dialect.name != 'postgresql':
+            with engine.begin() as conn:
+                conn.execute(text(self._sql(concurrently=False)))
+            return
+
+        # CONCURRENTLY нельзя выполнять внутри транзакции
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            if is_partitioned(conn, self.table):
+                self._apply_partitioned(conn)
+                return
+
+            self._drop_invalid(conn, self.name)
+            conn.execute(text(self._sql(concurrently=True)))
+
+    @staticmethod
+    def _drop_invalid(conn, name: str):
+        """Прерванная сборка CONCURRENTLY оставляет невалидный индекс,
+        который IF NOT EXISTS посчитал бы готовым"""
+        invalid = conn.execute(text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ), {'name': name}).first()
+        if invalid:
+            logger.warning(f"⚠️ Индекс {name} невалиден, пересоздаем")
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+    def _apply_partitioned(self, conn):
+        """Индекс секционированной таблицы: родитель ON ONLY + партиции CONCURRENTLY"""
+        conn.execute(text(self._sql(concurrently=False, only=True)))
+
+        partitions = conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = CAST(:table AS regclass) ORDER BY c.relname"
+        ), {'table': self.table}).scalars().all()
+        attached = set(conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = CAST(:name AS regclass)"
+        ), {'name': self.name}).scalars().all())
+
+        for partition in partitions:
+            child = f"{self.name[:40]}_{partition}"[:63]
+            if child in attached:
+                continue
+            self._drop_invalid(conn, child)
+            conn.execute(text(self._sql(concurrently=True, name=child, table=partition)))
+            conn.execute(text(f"ALTER INDEX {self.name} ATTACH PARTITION {child}"))
+
+
+class BackfillStep(MigrationStep):
+    """Пакетное заполнение данных по диапазонам первичного ключа"""
+
+    def __init__(self, table: str, set_clause: str, where: str = None,
+                 key: str = 'id', batch_size: int = None):
+        self.table = table
+        self.set_clause = set_clause
+        self.where = where
+        self.key = key
+        self.batch_size = batch_size if batch_size is not None else \
+            int(os.getenv('MIGRATIONS_BACKFILL_BATCH_SIZE', '5000'))
+        self.pause = float(os.getenv('MIGRATIONS_BACKFILL_PAUSE', '0'))
+
+    def _sql(self) -> str:
+        where = f" AND ({self.where})" if self.where else ""
+        return (
+            f"UPDATE {self.table} SET {self.set_clause} "
+            f"WHERE {self.key} > :lo AND {self.key} <= :hi{where}"
+        )
+
+    def describe(self) -> str:
+        return f"{self._sql()} -- пакетами по {self.batch_size}"
+
+    def apply(self, engine):
+        with engine.connect() as conn:
+            bounds = conn.execute(text(
+                f"SELECT MIN({self.key}), MAX({self.key}) FROM {self.table}"
+            )).first()
+
+        if not bounds or bounds[0] is None:
+            return
+
+        low, high = bounds[0] - 1, bounds[1]
+        sql = text(self._sql())
+        updated = 0
+
+        while low < high:
+            upper = min(low + self.batch_size, high)
+            # Каждый пакет - отдельная короткая транзакция
+            with engine.begin() as conn:
+                self._lock_timeout(conn)
+                updated += conn.execute(sql, {'lo': low, 'hi': upper}).rowcount or 0
+            low = upper
+
+            if self.pause:
+                time.sleep(self.pause)
+
+        logger.info(f"✅ Заполнение {self.table}: обновлено {updated} строк")
+
+
+class AddColumnStep(MigrationStep):
+    """Добавление nullable-колонки (без DEFAULT - без перезаписи таблицы)"""
+
+    def __init__(self, table: str, column: str, column_type: str):
+        self.table = table
+        self.column = column
+        self.column_type = column_type
+
+    def describe(self) -> str:
+        return f"ALTER TABLE {self.table} ADD COLUMN {self.column} {self.column_type}"
+
+    def apply(self, engine):
+        # IF NOT EXISTS для колонок есть не во всех СУБД (SQLite)
+        columns = {column['name'] for column in inspect(engine).get_columns(self.table)}
+        if self.column in columns:
+            return
+
+        with engine.begin() as conn:
+            self._lock_timeout(conn)
+            conn.execute(text(self.describe()))
+
+
+class ComputedBackfillStep(BackfillStep):
+    """Пакетное заполнение колонки значением, вычисляемым в Python"""
+
+    def __init__(self, table: str, source: str, target: str,
+                 compute: Callable[[Any], Any], key: str = 'id', batch_size: int = None):
+        super().__init__(table, f"{target} = :value", where=f"{target} IS NULL",
+                         key=key, batch_size=batch_size)
+        self.source = source
+        self.target = target
+        self.compute = compute
+
+    def describe(self) -> str:
+        return (
+            f"UPDATE {self.table} SET {self.target} = {self.compute.__name__}({self.source}) "
+            f"WHERE {self.target} IS NULL -- пакетами по {self.batch_size}"
+        )
+
+    def apply(self, engine):
+        with engine.connect() as conn:
+            bounds = conn.execute(text(
+                f"SELECT MIN({self.key}), MAX({self.key}) FROM {self.table}"
+            )).first()
+
+        if not bounds or bounds[0] is None:
+            return
+
+        low, high = bounds[0] - 1, bounds[1]
+        select_sql = text(
+            f"SELECT {self.key}, {self.source} FROM {self.table} "
+            f"WHERE {self.key} > :lo AND {self.key} <= :hi AND {self.where}"
+        )
+        update_sql = text(
+            f"UPDATE {self.table} SET {self.set_clause} WHERE {self.key} = :key"
+        )
+        updated = 0
+
+        while low < high:
+            upper = min(low + self.batch_size, high)
+            with engine.begin() as conn:
+                self._lock_timeout(conn)
+                rows = conn.execute(select_sql, {'lo': low, 'hi': upper}).all()
+                if rows:
+                    conn.execute(update_sql, [
+                        {'key': row[0], 'value': self.compute(row[1])} for row in rows
+                    ])
+                    updated += len(rows)
+            low = upper
+
+            if self.pause:
+                time.sleep(self.pause)
+
+        logger.info(f"✅ Заполнение {self.table}.{self.target}: обновлено {updated} строк")
+
+
+class PartitionByMonthStep(MigrationStep):
+    """
+    Онлайн-перевод таблицы в помесячные RANGE-партиции (только PostgreSQL)
+
+    1. Рядом создается секционированная копия {table}_partitioned с теми
+       же колонками, внешними ключами и индексами, PK - (key, column).
+    2. Строки копируются пакетами по диапазонам key, без блокировки записи.
+    3. В короткой транзакции под ACCESS EXCLUSIVE (с lock_timeout)
+       докопируются новые строки, применяется sync_sql для строк,
+       измененных во время копирования, и таблицы меняются именами.
+       Старая таблица остается как {table}_unpartitioned до ручного удаления.
+    Если переключение не удалось, шаг при следующем запуске начинается заново.
+    """
+
+    def __init__(self, table: str, column: str, key: str = 'id', sync_sql: str = None,
+                 months_ahead: int = None, batch_size: int = None):
+        self.table = table
+        self.column = column
+        self.key = key
+        self.sync_sql = sync_sql
+        self.months_ahead = months_ahead if months_ahead is not None else \
+            int(os.getenv('LINK_PARTITIONS_AHEAD', '2'))
+        self.batch_size = batch_size if batch_size is not None else \
+            int(os.getenv('MIGRATIONS_BACKFILL_BATCH_SIZE', '5000'))
+        self.pause = float(os.getenv('MIGRATIONS_BACKFILL_PAUSE', '0'))
+
+    @property
+    def staging(self) -> str:
+        return f"{self.table}_partitioned"
+
+    def describe(self) -> str:
+        return (
+            f"{self.table} -> PARTITION BY RANGE ({self.column}) помесячно: "
+            f"копирование в {self.staging} пакетами по {self.batch_size}, переключение имен"
+        )
+
+    def apply(self, engine):
+        if engine.dialect.name != 'postgresql':
+            logger.debug(f"Секционирование {self.table} пропущено для {engine.dialect.name}")
+            return
+
+        with engine.connect() as conn:
+            if is_partitioned(conn, self.table):
+                return
+            bounds = conn.execute(text(
+                f"SELECT MIN({self.column}), MAX({self.key}) FROM {self.table}"
+            )).first()
+            indexes = conn.execute(text(
+                "SELECT indexname, indexdef FROM pg_indexes "
+                "WHERE schemaname = current_schema() AND tablename = :table"
+            ), {'table': self.table}).all()
+            foreign_keys = conn.execute(text(
+                "SELECT pg_get_constraintdef(oid) FROM pg_constraint "
+                "WHERE conrelid = CAST(:table AS regclass) AND contype = 'f'"
+            ), {'table': self.table}).scalars().all()
+            pk_name = conn.execute(text(
+                "SELECT conname FROM pg_constraint "
+                "WHERE conrelid = CAST(:table AS regclass) AND contype = 'p'"
+            ), {'table': self.table}).scalar()
+
+        oldest, last_id = bounds[0], bounds[1] or 0
+        index_names = self._create_staging(engine, oldest, indexes, foreign_keys, pk_name)
+        self._copy(engine, last_id)
+        self._swap(engine, last_id, index_names, pk_name)
+
+    def _create_staging(self, engine, oldest, indexes, foreign_keys, pk_name) -> List[str]:
+        """Секционированная копия таблицы с партициями и индексами"""
+        staging = self.staging
+        copied_indexes = []
+
+        with engine.begin() as conn:
+            # Остатки прерванного запуска
+            conn.execute(text(f"DROP TABLE IF EXISTS {staging} CASCADE"))
+            conn.execute(text(
+                f"CREATE TABLE {staging} (LIKE {self.table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+                f"PARTITION BY RANGE ({self.column})"
+            ))
+            conn.execute(text(
+                f"ALTER TABLE {staging} ADD CONSTRAINT {staging}_pkey PRIMARY KEY ({self.key}, {self.column})"
+            ))
+            for definition in foreign_keys:
+                conn.execute(text(f"ALTER TABLE {staging} ADD {definition}"))
+
+            current = month_start(datetime.now())
+            month = month_start(oldest) if oldest else current
+            while month <= add_months(current, self.months_ahead):
+                conn.execute(text(create_partition_sql(staging, month, table=self.table)))
+                month = add_months(month, 1)
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {self.table}_default PARTITION OF {staging} DEFAULT"))
+
+            # Индексы на пустой родительской таблице создаются мгновенно
+            for name, definition in indexes:
+                if name == pk_name:
+                    continue
+                if definition.startswith('CREATE UNIQUE'):
+                    logger.warning(f"⚠️ Уникальный индекс {name} без {self.column} не переносится")
+                    continue
+                definition = re.sub(
+                    r'^CREATE INDEX (\S+) ON (?:ONLY )?(\S+) ',
+                    f"CREATE INDEX {name}_p ON {staging} ",
+                    definition
+                )
+                conn.execute(text(definition))
+                copied_indexes.append(name)
+
+        return copied_indexes
+
+    def _copy(self, engine, last_id: int):
+        """Копирование строк пакетами по диапазонам ключа"""
+        sql = text(
+            f"INSERT INTO {self.staging} SELECT * FROM {self.table} "
+            f"WHERE {self.key} > :lo AND {self.key} <= :hi"
+        )
+        low, copied = 0, 0
+        while low < last_id:
+            upper = min(low + self.batch_size, last_id)
+            with engine.begin() as conn:
+                copied += conn.execute(sql, {'lo': low, 'hi': upper}).rowcount or 0
+            low = upper
+
+            if self.pause:
+                time.sleep(self.pause)
+
+        logger.info(f"✅ В {self.staging} скопировано {copied} строк")
+
+    def _swap(self, engine, last_id: int, index_names: List[str], pk_name: str):
+        """Докопирование и переключение имен в одной короткой транзакции"""
+        old = f"{self.table}_unpartitioned"
+
+        with engine.begin() as conn:
+            self._lock_timeout(conn)
+            conn.execute(text(f"LOCK TABLE {self.table} IN ACCESS EXCLUSIVE MODE"))
+
+            conn.execute(text(
+                f"INSERT INTO {self.staging} SELECT * FROM {self.table} WHERE {self.key} > :last_id"
+            ), {'last_id': last_id})
+            if self.sync_sql:
+                conn.execute(text(self.sync_sql.format(staging=self.staging, table=self.table)))
+
+            sequence = conn.execute(text(
+                "SELECT pg_get_serial_sequence(:table, :column)"
+            ), {'table': self.table, 'column': self.key}).scalar()
+
+            conn.execute(text(f"ALTER TABLE {self.table} RENAME TO {old}"))
+            conn.execute(text(f"ALTER TABLE {self.staging} RENAME TO {self.table}"))
+
+            for name in index_names:
+                conn.execute(text(f"ALTER INDEX {name} RENAME TO {name[:50]}_unpart"))
+                conn.execute(text(f"ALTER INDEX {name}_p RENAME TO {name}"))
+            if pk_name:
+                conn.execute(text(f"ALTER TABLE {old} RENAME CONSTRAINT {pk_name} TO {old}_pkey"))
+                conn.execute(text(f"ALTER TABLE {self.table} RENAME CONSTRAINT {self.staging}_pkey TO {pk_name}"))
+            if sequence:
+                conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {self.table}.{self.key}"))
+
+        logger.warning(f"⚠️ {self.table} секционирована; старая таблица сохранена как {old}")
+
+
+class Migration:
+    """Версия схемы: упорядоченный набор шагов"""
+
+    def __init__(self, version: int, name: str, steps: List[MigrationStep]):
+        self.version = version
+        self.name = name
+        self.steps = steps
+
+    def __repr__(self):
+        return f"<Migration({self.version}, '{self.name}')>"
+
+
+# ============================================
+# ПЛАН 1: МИГРАЦИИ ТАБЛИЦ БОТА
+# ============================================
+
+# Шаги должны быть идемпотентны: на новой БД create_all уже создал
+# объекты из моделей, а миграция лишь фиксирует версию
+MIGRATIONS = [
+    Migration(1, 'links_active_created_id', [
+        # Keyset-пагинация по активным ссылкам (см. Link.__table_args__)
+        CreateIndexStep(
+            'idx_links_active_created_id', 'links', ['created_at', 'id'],
+            where='is_active'
+        ),
+    ]),
+    Migration(2, 'links_url_hash', [
+        # Хеш канонического URL для поиска повторов (см. utils.urls)
+        AddColumnStep('links', 'url_hash', 'VARCHAR(32)'),
+        ComputedBackfillStep('links', 'url', 'url_hash', url_hash),
+        CreateIndexStep(
+            'idx_links_thread_hash_created', 'links', ['thread_id', 'url_hash', 'created_at']
+        ),
+    ]),
+    Migration(3, 'links_monthly_partitions', [
+        # Ссылки, очищенные (/clearlinks) во время копирования: активных строк
+        # немного, поиск идет по частичному индексу
+        PartitionByMonthStep(
+            'links', 'created_at',
+            sync_sql=(
+                "UPDATE {staging} AS p SET is_active = FALSE FROM {table} AS l "
+                "WHERE p.is_active AND l.id = p.id AND NOT l.is_active"
+            )
+        ),
+    ]),
+    Migration(4, 'links_search_indexes', [
+        # Поиск по ссылкам (см. database/search.py): полнотекстовый индекс
+        # по словам URL и текста сообщения, триграммы для подстрок URL.
+        # Только PostgreSQL - на других СУБД поиск идет по индексу в памяти
+        SQLStep("CREATE EXTENSION IF NOT EXISTS pg_trgm", dialects=['postgresql']),
+        CreateIndexStep(
+            'idx_links_search_tsv', 'links', [f"({SEARCH_TSVECTOR_SQL})"],
+            using='gin', dialects=['postgresql']
+        ),
+        CreateIndexStep(
+            'idx_links_url_trgm', 'links', ['url gin_trgm_ops'],
+            using='gin', dialects=['postgresql']
+        ),
+    ]),
+    Migration(5, 'links_updated_at', [
+        # Водяной знак инкрементальных backup (services/backup_incremental.py):
+        # время изменения ссылки, NULL у неизменявшихся - индекс маленький
+        AddColumnStep('links', 'updated_at', 'TIMESTAMP'),
+        CreateIndexStep(
+            'idx_links_updated_at', 'links', ['updated_at'],
+            where='updated_at IS NOT NULL'
+        ),
+    ]),
+    Migration(6, 'users_username_lower', [
+        # Поиск по @username без учета регистра: idx_users_username
+        # регистрозависимый, а username в Telegram - нет
+        CreateIndexStep('idx_users_username_lower', 'users', ['lower(username)']),
+    ]),
+]
+
+
+# ============================================
+# ПЛАН 1: ПРИМЕНЕНИЕ МИГРАЦИЙ
+# ============================================
+
+class MigrationsManager:
+    """Применение миграций с учетом версий в schema_migrations"""
+
+    def __init__(self, engine, migrations: List[Migration] = None,
+                 scope: str = 'database', dry_run: bool = None):
+        """Инициализация менеджера миграций"""
+        self.engine = engine
+        self.scope = scope
+        self.migrations = sorted(
+            migrations if migrations is not None else MIGRATIONS,
+            key=lambda m: m.version
+        )
+        self.dry_run = dry_run if dry_run is not None else \
+            os.getenv('MIGRATIONS_DRY_RUN', 'false').lower() == 'true'
+
+        versions = [m.version for m in self.migrations]
+        if len(versions) != len(set(versions)):
+            raise MigrationError(f"Повторяющиеся версии миграций в области {scope}")
+
+    def ensure_version_table(self):
+        """Создание таблицы версий при первом запуске"""
+        _metadata.create_all(self.engine, checkfirst=True)
+
+    def get_applied_versions(self) -> Dict[int, Dict[str, Any]]:
+        """Примененные версии области"""
+        self.ensure_version_table()
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(
+                    schema_migrations.c.version,
+                    schema_migrations.c.name,
+                    schema_migrations.c.applied_at,
+                    schema_migrations.c.duration_ms,
+                ).where(schema_migrations.c.scope == self.scope)
+            ).all()
+
+        return {
+            row.version: {
+                'name': row.name,
+                'applied_at': row.applied_at,
+                'duration_ms': row.duration_ms,
+            }
+            for row in rows
+        }
+
+    def get_pending(self) -> List[Migration]:
+        """Миграции, которые еще не применены"""
+        applied = self.get_applied_versions()
+        return [m for m in self.migrations if m.version not in applied]
+
+    def run(self, target: Optional[int] = None, dry_run: bool = None) -> List[Dict[str, Any]]:
+        """
+        Применение ожидающих миграций по порядку версий
+
+        Args:
+            target: Последняя версия для применения (None - все)
+            dry_run: Только вывести план (по умолчанию MIGRATIONS_DRY_RUN)
+
+        Returns:
+            List[Dict]: Отчет по каждой миграции
+        """
+        dry_run = self.dry_run if dry_run is None else dry_run
+        report = []
+
+        with self._lock():
+            pending = [
+                m for m in self.get_pending()
+                if target is None or m.version <= target
+            ]
+
+            if not pending:
+                logger.info(f"✅ Схема [{self.scope}] актуальна, миграций нет")
+                return report
+
+            for migration in pending:
+                steps = [step.describe() for step in migration.steps]
+
+                if dry_run:
+                    logger.info(f"🧪 [dry-run] {self.scope} v{migration.version} {migration.name}")
+                    for sql in steps:
+                        logger.info(f"🧪     {sql}")
+                    report.append({
+                        'version': migration.version,
+                        'name': migration.name,
+                        'steps': steps,
+                        'applied': False,
+                    })
+                    continue
+
+                report.append(self._apply(migration, steps))
+
+        return report
+
+    def _apply(self, migration: Migration, steps: List[str]) -> Dict[str, Any]:
+        """Выполнение шагов одной миграции и запись версии"""
+        logger.info(f"🔄 Миграция {self.scope} v{migration.version}: {migration.name}")
+        started = time.monotonic()
+
+        for index, step in enumerate(migration.steps, 1):
+            try:
+                step.apply(self.engine)
+            except Exception as e:
+                logger.error(
+                    f"❌ Миграция {self.scope} v{migration.version}, "
+                    f"шаг {index}/{len(migration.steps)}: {e}"
+                )
+                raise MigrationError(
+                    f"Миграция {migration.version} ({migration.name}) не применена: {e}"
+                ) from e
+
+        duration_ms = int((time.monotonic() - started) * 1000)
+        with self.engine.begin() as conn:
+            conn.execute(insert(schema_migrations).values(
+                scope=self.scope,
+                version=migration.version,
+                name=migration.name,
+                applied_at=datetime.now(),
+                duration_ms=duration_ms,
+            ))
+
+        logger.info(f"✅ Миграция {self.scope} v{migration.version} применена за {duration_ms} мс")
+        return {
+            'version': migration.version,
+            'name': migration.name,
+            'steps': steps,
+            'applied': True,
+            'duration_ms': duration_ms,
+        }
+
+    def reset(self) -> int:
+        """
+        Удаление истории версий области (после пересоздания схемы)
+
+        Returns:
+            int: Количество удаленных записей
+        """
+        self.ensure_version_table()
+        with self.engine.begin() as conn:
+            deleted = conn.execute(
+                schema_migrations.delete().where(schema_migrations.c.scope == self.scope)
+            ).rowcount or 0
+        logger.warning(f"⚠️ История миграций [{self.scope}] сброшена: {deleted} версий")
+        return deleted
+
+    def status(self) -> Dict[str, Any]:
+        """Состояние миграций области"""
+        applied = self.get_applied_versions()
+        return {
+            'scope': self.scope,
+            'current_version': max(applied) if applied else 0,
+            'latest_version': self.migrations[-1].version if self.migrations else 0,
+            'applied': applied,
+            'pending': [
+                {'version': m.version, 'name': m.name}
+                for m in self.migrations if m.version not in applied
+            ],
+            'dry_run': self.dry_run,
+        }
+
+    def _lock(self):
+        """Блокировка от одновременного запуска миграций несколькими процессами"""
+        return _AdvisoryLock(self.engine, f"{MIGRATIONS_TABLE}:{self.scope}")
+
+
+class _AdvisoryLock:
+    """pg_advisory_lock на отдельном подключении (на других СУБД - no-op)"""
+
+    def __init__(self, engine, name: str):
+        self.engine = engine
+        self.key = zlib.crc32(name.encode('utf-8'))
+        self._conn = None
+
+    def __enter__(self):
+        if self.engine.dialect.name == 'postgresql':
+            self._conn = self.engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+            self._conn.execute(text("SELECT pg_advisory_lock(:key)"), {'key': self.key})
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._conn is not None:
+            try:
+                self._conn.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': self.key})
+            finally:
+                self._conn.close()
+                self._conn = None
+        return False
@@ -5,13 +5,13 @@ SQLAlchemy модели для всех планов развития
 ПЛАН 1: Базовые таблицы (АКТИВНЫЕ)
 ПЛАН 2: Система кармы (ЗАГЛУШКИ)  
 ПЛАН 3: ИИ и формы (ЗАГЛУШКИ)
-ПЛАН 4: Backup система (ЗАГЛУШКИ)
+ПЛАН 4: Backup система (история backup АКТИВНА)
 """
 
 from datetime import datetime
 from typing import Optional
 from sqlalchemy import (
-    Column, Integer, String, Text, DateTime, Boolean, 
+    Column, Integer, BigInteger, String, Text, DateTime, Date, Boolean, 
     ForeignKey, Index, JSON, Float, LargeBinary
 )
 from sqlalchemy.ext.declarative import declarative_base
@@ -74,6 +74,7 @@ class Link(Base):
     
     # Данные ссылки
     url = Column(Text, nullable=False)
+    url_hash = Column(String(32), nullable=True)  # Хеш канонического URL (utils.urls)
     message_text = Column(Text, nullable=True)  # Полный текст сообщения
     message_id = Column(Integer, nullable=True)  # ID сообщения в Telegram
     thread_id = Column(Integer, nullable=True)  # ID топика
@@ -81,6 +82,8 @@ class Link(Base):
     # Метаданные
     created_at = Column(DateTime, default=func.now(), nullable=False)
     is_active = Column(Boolean, default=True, nullable=False)
+    # Время последнего изменения (NULL - не менялась), водяной знак инкрементальных backup
+    updated_at = Column(DateTime, nullable=True, onupdate=func.now())
     
     # Связи
     user = relationship("User", back_populates="links")
@@ -89,6 +92,16 @@ class Link(Base):
     __table_args__ = (
         Index('idx_links_user_id_created', 'user_id', 'created_at'),
         Index('idx_links_thread_id', 'thread_id'),
+        # Поиск повторов ссылки в топике за период
+        Index('idx_links_thread_hash_created', 'thread_id', 'url_hash', 'created_at'),
+        # Keyset-пагинация активных ссылок по (created_at, id)
+        Index('idx_links_active_created_id', 'created_at', 'id',
+              postgresql_where=(is_active == True),
+              sqlite_where=(is_active == True)),
+        # Измененные ссылки для инкрементальных backup
+        Index('idx_links_updated_at', 'updated_at',
+              postgresql_where=(updated_at.isnot(None)),
+              sqlite_where=(updated_at.isnot(None))),
     )
     
     def __repr__(self):
@@ -119,6 +132,109 @@ class Settings(Base):
         return f"<Settings(key={self.key}, value={self.value})>"
 
 
+class Counter(Base):
+    """Атомарные счетчики (напоминания и другие метрики)"""
+    __tablename__ = 'counters'
+    
+    name = Column(String(100), primary_key=True)
+    value = Column(BigInteger, default=0, nullable=False)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
+    
+    def __repr__(self):
+        return f"<Counter(name={self.name}, value={self.value})>"
+
+
+class StatsRollup(Base):
+    """Агрегаты статистики, поддерживаемые инкрементально"""
+    __tablename__ = 'stats_rollup'
+    
+    name = Column(String(100), primary_key=True)
+    value = Column(BigInteger, default=0, nullable=False)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
+    
+    def __repr__(self):
+        return f"<StatsRollup(name={self.name}, value={self.value})>"
+
+
+class LinkDailyStats(Base):
+    """Количество ссылок по дням (для «сегодня» и «за 7 дней»)"""
+    __tablename__ = 'link_daily_stats'
+    
+    day = Column(Date, primary_key=True)
+    links_created = Column(Integer, default=0, nullable=False)
+    links_active = Column(Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f"<LinkDailyStats(day={self.day}, created={self.links_created})>"
+
+
+class LinkActivity(Base):
+    """Ссылки по часам и дням в разрезе пользователя и топика"""
+    __tablename__ = 'link_activity'
+    
+    # 'hour' - свежие часовые корзины, 'day' - уплотненные дневные
+    granularity = Column(String(5), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    user_id = Column(Integer, primary_key=True)
+    thread_id = Column(Integer, primary_key=True, default=0)  # 0 - без топика
+    links = Column(Integer, default=0, nullable=False)
+    
+    # Индексы для производительности
+    __table_args__ = (
+        Index('idx_link_activity_user_bucket', 'user_id', 'bucket_start'),
+        Index('idx_link_activity_bucket', 'bucket_start'),
+    )
+    
+    def __repr__(self):
+        return f"<LinkActivity({self.granularity} {self.bucket_start}, user_id={self.user_id}, links={self.links})>"
+
+
+class LinkArchive(Base):
+    """Архив ссылок за месяц (gzip NDJSON в payload или в файле path)"""
+    __tablename__ = 'link_archives'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    month = Column(Date, nullable=False, index=True)
+    rows = Column(Integer, default=0, nullable=False)
+    active_rows = Column(Integer, default=0, nullable=False)
+    size_bytes = Column(Integer, default=0, nullable=False)
+    payload = Column(LargeBinary, nullable=True)
+    path = Column(Text, nullable=True)
+    archived_at = Column(DateTime, default=func.now(), nullable=False)
+    
+    def __repr__(self):
+        return f"<LinkArchive(month={self.month}, rows={self.rows})>"
+
+
+class BulkJob(Base):
+    """Фоновая пакетная операция (состояние для продолжения после рестарта)"""
+    __tablename__ = 'bulk_jobs'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String(50), nullable=False)
+    status = Column(String(20), default='running', nullable=False, index=True)  # running, done, cancelled, failed
+    params = Column(JSON, nullable=True)
+    
+    # Диапазон первичного ключа: обработано (min_key, last_key], всего (min_key, max_key]
+    min_key = Column(BigInteger, default=0, nullable=False)
+    last_key = Column(BigInteger, default=0, nullable=False)
+    max_key = Column(BigInteger, default=0, nullable=False)
+    processed = Column(Integer, default=0, nullable=False)
+    
+    # Кто запустил и какое сообщение обновлять прогрессом
+    created_by = Column(BigInteger, nullable=True)
+    chat_id = Column(BigInteger, nullable=True)
+    message_id = Column(Integer, nullable=True)
+    
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+    updated_at = Column(DateTime, default=func.now(), nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f"<BulkJob(id={self.id}, kind='{self.kind}', status='{self.status}')>"
+
+
 # ============================================
 # ПЛАН 2: СИСТЕМА КАРМЫ (ЗАГЛУШКИ)
 # ============================================
@@ -344,34 +460,38 @@ class Settings(Base):
 
 
 # ============================================
-# ПЛАН 4: BACKUP СИСТЕМА (ЗАГЛУШКИ)
+# ПЛАН 4: BACKUP СИСТЕМА
 # ============================================
 
-# class BackupHistory(Base):
-#     """История backup операций"""
-#     __tablename__ = 'backup_history'
-#     
-#     id = Column(Integer, primary_key=True, autoincrement=True)
-#     
-#     # Данные backup
-#     filename = Column(String(255), nullable=False)
-#     file_size_mb = Column(Float, nullable=True)
-#     backup_type = Column(String(20), default='manual', nullable=False)  # manual, auto
-#     
-#     # Метаданные
-#     created_at = Column(DateTime, default=func.now(), nullable=False, index=True)
-#     created_by = Column(Integer, ForeignKey('users.user_id'), nullable=True)
-#     
-#     # Статистика
-#     tables_count = Column(Integer, nullable=True)
-#     records_count = Column(Integer, nullable=True)
-#     compression_ratio = Column(Float, nullable=True)
-#     
-#     # Связи
-#     creator = relationship("User")
-#     
-#     def __repr__(self):
-#         return f"<BackupHistory(id={self.id}, filename={self.filename}, size={self.file_size_mb}MB)>"
+class BackupHistory(Base):
+    """История backup операций (цепочки полный + инкрементальные)"""
+    __tablename__ = 'backup_history'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    
+    # Данные backup
+    backup_id = Column(String(64), unique=True, nullable=False)
+    kind = Column(String(20), default='full', nullable=False)  # full, incremental
+    parent_id = Column(String(64), nullable=True)  # предыдущий backup цепочки
+    base_id = Column(String(64), nullable=True)  # полный backup цепочки
+    filename = Column(String(255), nullable=False)
+    path = Column(Text, nullable=True)  # локальная копия (None - только отправлен)
+    file_size_mb = Column(Float, nullable=True)
+    backup_type = Column(String(20), default='manual', nullable=False)  # manual, auto
+    
+    # Водяные знаки таблиц после backup (основа следующего инкрементального)
+    watermarks = Column(JSON, nullable=True)
+    
+    # Метаданные
+    created_at = Column(DateTime, default=func.now(), nullable=False, index=True)
+    created_by = Column(BigInteger, nullable=True)
+    
+    # Статистика
+    tables_count = Column(Integer, nullable=True)
+    records_count = Column(Integer, nullable=True)
+    
+    def __repr__(self):
+        return f"<BackupHistory(id={self.id}, kind={self.kind}, filename={self.filename}, size={self.file_size_mb}MB)>"
 
 
 # ============================================
@@ -396,8 +516,7 @@ class Settings(Base):
 # Index('idx_ai_interactions_user_created', AIInteraction.user_id, AIInteraction.created_at)
 # Index('idx_auto_karma_to_user_timestamp', AutoKarmaLog.to_user_id, AutoKarmaLog.timestamp)
 
-# ПЛАН 4: Индексы для backup (ЗАГЛУШКИ)
-# Index('idx_backup_history_created', BackupHistory.created_at)
+# ПЛАН 4: Индекс backup_history.created_at задан в модели (index=True)
 
 
 def init_database_models(engine):
@@ -438,25 +557,43 @@ def drop_all_tables(engine):
         # Получаем соединение
         from sqlalchemy import text
         
+        # CASCADE есть только в PostgreSQL (там он снимает и партиции links)
+        cascade = " CASCADE" if engine.dialect.name == 'postgresql' else ""
+        
         with engine.begin() as conn:
             # Простое удаление таблиц в правильном порядке (от зависимых к независимым)
             # 1. Сначала удаляем таблицы с foreign keys
-            conn.execute(text("DROP TABLE IF EXISTS links CASCADE;"))
+            conn.execute(text(f"DROP TABLE IF EXISTS links{cascade};"))
             
             # 2. Потом удаляем основные таблицы
-            conn.execute(text("DROP TABLE IF EXISTS users CASCADE;"))
-            conn.execute(text("DROP TABLE IF EXISTS settings CASCADE;"))
+            conn.execute(text(f"DROP TABLE IF EXISTS users{cascade};"))
+            conn.execute(text(f"DROP TABLE IF EXISTS settings{cascade};"))
+            conn.execute(text(f"DROP TABLE IF EXISTS counters{cascade};"))
+            conn.execute(text(f"DROP TABLE IF EXISTS stats_rollup{cascade};"))
+            conn.execute(text(f"DROP TABLE IF EXISTS link_daily_stats{cascade};"))
+            conn.execute(text(f"DROP TABLE IF EXISTS link_activity{cascade};"))
+            conn.execute(text(f"DROP TABLE IF EXISTS link_archives{cascade};"))
+            conn.execute(text(f"DROP TABLE IF EXISTS bulk_jobs{cascade};"))
+            conn.execute(text(f"DROP TABLE IF EXISTS backup_history{cascade};"))
             
             # 3. Удаляем все индексы если остались
             try:
-                conn.execute(text("DROP INDEX IF EXISTS idx_users_user_id CASCADE;"))
-                conn.execute(text("DROP INDEX IF EXISTS idx_users_username CASCADE;"))
-                conn.execute(text("DROP INDEX IF EXISTS idx_links_user_id_created CASCADE;"))
-                conn.execute(text("DROP INDEX IF EXISTS idx_links_thread_id CASCADE;"))
-                conn.execute(text("DROP INDEX IF EXISTS idx_settings_key CASCADE;"))
+                conn.execute(text(f"DROP INDEX IF EXISTS idx_users_user_id{cascade};"))
+                conn.execute(text(f"DROP INDEX IF EXISTS idx_users_username{cascade};"))
+                conn.execute(text(f"DROP INDEX IF EXISTS idx_links_user_id_created{cascade};"))
+                conn.execute(text(f"DROP INDEX IF EXISTS idx_links_thread_id{cascade};"))
+                conn.execute(text(f"DROP INDEX IF EXISTS idx_links_active_created_id{cascade};"))
+                conn.execute(text(f"DROP INDEX IF EXISTS idx_links_thread_hash_created{cascade};"))
+                conn.execute(text(f"DROP INDEX IF EXISTS idx_links_updated_at{cascade};"))
+                conn.execute(text(f"DROP INDEX IF EXISTS idx_settings_key{cascade};"))
             except Exception as idx_error:
                 print(f"⚠️ Некоторые индексы уже удалены: {idx_error}")
         
+        # История версий тоже сбрасывается: иначе миграции, создающие то,
+        # чего нет в моделях (партиции, индексы поиска), считались бы примененными
+        from database.migrations import MigrationsManager
+        MigrationsManager(engine).reset()
+        
         print("✅ Все таблицы успешно удалены")
         return True
         
@@ -503,7 +640,13 @@ def get_table_info():
     tables_info['active_tables'] = [
         ('users', 'Пользователи бота'),
         ('links', 'Ссылки пользователей'), 
-        ('settings', 'Настройки бота')
+        ('settings', 'Настройки бота'),
+        ('counters', 'Атомарные счетчики'),
+        ('stats_rollup', 'Агрегаты статистики'),
+        ('link_daily_stats', 'Ссылки по дням'),
+        ('link_activity', 'Активность по часам и дням'),
+        ('link_archives', 'Архив ссылок по месяцам'),
+        ('bulk_jobs', 'Фоновые пакетные операции')
     ]
     
     # ПЛАН 2: Таблицы кармы (заглушки)
@@ -522,9 +665,9 @@ def get_table_info():
         # ('message_stats', 'Статистика сообщений')
     ]
     
-    # ПЛАН 4: Таблицы backup (заглушки)
+    # ПЛАН 4: Таблицы backup
     tables_info['plan4_tables'] = [
-        # ('backup_history', 'История backup операций')
+        ('backup_history', 'История backup операций')
     ]
     
     return tables_info
@@ -0,0 +1,33 @@
+"""
+Пагинация Do Presave Reminder Bot v25+
+Курсоры keyset-пагинации по (created_at, id)
+
+ПЛАН 1: Курсоры для списков ссылок (АКТИВНАЯ)
+
+Курсор - компактная строка «<микросекунды от эпохи hex>.<id hex>»,
+помещается в callback_data (лимит Telegram - 64 байта) вместе с
+префиксом и номером страницы.
+"""
+
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Кодирование позиции (created_at, id) в курсор"""
+    micros = (created_at.replace(tzinfo=None) - _EPOCH) // _MICROSECOND
+    return f"{micros:x}.{row_id:x}"
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """Декодирование курсора, None для пустого или поврежденного"""
+    if not cursor:
+        return None
+    try:
+        micros, row_id = cursor.split('.', 1)
+        return _EPOCH + int(micros, 16) * _MICROSECOND, int(row_id, 16)
+    except (ValueError, OverflowError):
+        return None
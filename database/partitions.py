@@ -0,0 +1,403 @@
+"""
+Партиции ссылок Do Presave Reminder Bot v25+
+Помесячные партиции таблицы links и архивация старых месяцев
+
+ПЛАН 1: RANGE-партиции по created_at + архив (АКТИВНАЯ)
+
+На PostgreSQL таблица links секционируется по месяцам (миграция
+PartitionByMonthStep переводит существующую таблицу онлайн). Фоновое
+обслуживание заранее создает партиции на LINK_PARTITIONS_AHEAD месяцев
+вперед и архивирует старые месяцы: строки месяца сжимаются (gzip NDJSON)
+в таблицу link_archives или в файл LINK_ARCHIVE_DIR, после чего
+партиция отсоединяется и удаляется. На других СУБД архивация работает
+так же, но строки удаляются обычным DELETE по диапазону дат.
+
+Архивация включается явно: архивируется месяц, в котором все ссылки
+неактивны и который старше LINK_ARCHIVE_AFTER_MONTHS, или любой месяц
+старше LINK_ARCHIVE_MAX_AGE_MONTHS (0 - выключено, по умолчанию обе).
+Архивированные ссылки уходят из links, но остаются в TOTAL_LINKS_ALL,
+а инкрементальный backup передает их удаление диапазоном created_at.
+
+Отсечение партиций: активные ссылки не бывают старше «нижней границы
+активных» (месяц самой старой активной ссылки), поэтому запросы по
+is_active дополнительно ограничиваются created_at >= active_floor().
+После /clearlinks граница сдвигается на текущий месяц и запросы
+читают только свежие партиции.
+"""
+
+import os
+import io
+import gzip
+import json
+import time
+import threading
+from datetime import datetime, date
+from typing import List, Dict, Optional, Any
+
+from sqlalchemy import select, delete, func, and_, text
+
+from database.models import Link, LinkArchive
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def month_start(moment) -> datetime:
+    """Начало месяца (для date и datetime)"""
+    return datetime(moment.year, moment.month, 1)
+
+
+def add_months(moment: datetime, months: int) -> datetime:
+    """Сдвиг начала месяца на months месяцев"""
+    index = moment.year * 12 + moment.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    """Имя партиции месяца: links_y2025m07"""
+    return f"{table}_y{month.year:04d}m{month.month:02d}"
+
+
+def create_partition_sql(parent: str, month: datetime, table: str = None) -> str:
+    """CREATE TABLE партиции месяца (table - базовое имя для партиции)"""
+    name = partition_name(table or parent, month)
+    upper = add_months(month, 1)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {parent} "
+        f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{upper:%Y-%m-%d}')"
+    )
+
+
+def is_partitioned(conn, table: str) -> bool:
+    """Секционирована ли таблица (только PostgreSQL)"""
+    if conn.dialect.name != 'postgresql':
+        return False
+    return bool(conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = :table AND pg_table_is_visible(c.oid)"
+    ), {'table': table}).first())
+
+
+class LinkPartitionManager:
+    """Обслуживание партиций links и архивация старых месяцев"""
+
+    TABLE = 'links'
+
+    def __init__(self, db_manager, months_ahead: int = None, archive_after_months: int = None,
+                 max_age_months: int = None, archive_dir: str = None):
+        """Инициализация обслуживания партиций"""
+        self.db = db_manager
+        self.months_ahead = months_ahead if months_ahead is not None else \
+            int(os.getenv('LINK_PARTITIONS_AHEAD', '2'))
+        self.archive_after_months = archive_after_months if archive_after_months is not None else \
+            int(os.getenv('LINK_ARCHIVE_AFTER_MONTHS', '0'))
+        self.max_age_months = max_age_months if max_age_months is not None else \
+            int(os.getenv('LINK_ARCHIVE_MAX_AGE_MONTHS', '0'))
+        self.archive_dir = archive_dir if archive_dir is not None else \
+            os.getenv('LINK_ARCHIVE_DIR', '')
+        self.maintenance_interval = float(os.getenv('LINK_PARTITION_MAINTENANCE_INTERVAL', '86400'))
+        self.floor_ttl = float(os.getenv('LINK_ACTIVE_FLOOR_TTL', '300'))
+
+        self._floor: Optional[datetime] = None
+        self._floor_at = 0.0
+        self._lock = threading.Lock()
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = False
+
+    # ============================================
+    # ПЛАН 1: ЖИЗНЕННЫЙ ЦИКЛ
+    # ============================================
+
+    def start(self):
+        """Запуск периодического обслуживания партиций"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="link-partitions", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"✅ Обслуживание партиций ссылок запущено (каждые {self.maintenance_interval}s)")
+
+    def stop(self):
+        """Остановка периодического обслуживания"""
+        self._stop.set()
+        self._started = False
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        """Фоновый цикл: партиции вперед, затем архивация"""
+        while True:
+            try:
+                self.maintain()
+            except Exception as e:
+                logger.error(f"❌ Ошибка обслуживания партиций: {e}")
+
+            if self._stop.wait(self.maintenance_interval):
+                break
+
+    def maintain(self) -> Dict[str, Any]:
+        """Один проход обслуживания"""
+        return {
+            'created_partitions': self.ensure_partitions(),
+            'archived': self.archive(),
+        }
+
+    # ============================================
+    # ПЛАН 1: ПАРТИЦИИ
+    # ============================================
+
+    def ensure_partitions(self) -> List[str]:
+        """Создание партиций текущего и следующих месяцев"""
+        with self.db.engine.connect() as conn:
+            if not is_partitioned(conn, self.TABLE):
+                return []
+
+        created = []
+        current = month_start(datetime.now())
+        for offset in range(self.months_ahead + 1):
+            month = add_months(current, offset)
+            name = partition_name(self.TABLE, month)
+            try:
+                with self.db.engine.begin() as conn:
+                    exists = conn.execute(text("SELECT to_regclass(:name)"), {'name': name}).scalar()
+                    if exists:
+                        continue
+                    conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+                    conn.execute(text(create_partition_sql(self.TABLE, month)))
+                created.append(name)
+                logger.info(f"✅ Создана партиция {name}")
+            except Exception as e:
+                # Обычно - строки этого месяца уже лежат в партиции DEFAULT
+                logger.error(f"❌ Не удалось создать партицию {name}: {e}")
+
+        return created
+
+    def list_partitions(self) -> List[Dict[str, Any]]:
+        """Помесячные партиции links (пусто, если таблица не секционирована)"""
+        with self.db.engine.connect() as conn:
+            if not is_partitioned(conn, self.TABLE):
+                return []
+            names = conn.execute(text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "JOIN pg_class p ON p.oid = i.inhparent "
+                "WHERE p.relname = :table AND pg_table_is_visible(p.oid) ORDER BY c.relname"
+            ), {'table': self.TABLE}).scalars().all()
+
+        partitions = []
+        prefix = f"{self.TABLE}_y"
+        for name in names:
+            if not name.startswith(prefix):
+                continue  # DEFAULT-партиция
+            try:
+                year, month = name[len(prefix):].split('m')
+                partitions.append({'name': name, 'month': datetime(int(year), int(month), 1)})
+            except ValueError:
+                continue
+        return partitions
+
+    # ============================================
+    # ПЛАН 1: ОТСЕЧЕНИЕ ПАРТИЦИЙ
+    # ============================================
+
+    def active_floor(self) -> datetime:
+        """Начало месяца самой старой активной ссылки (кешируется на floor_ttl)"""
+        cached = self.cached_active_floor()
+        if cached is not None:
+            return cached
+
+        with self.db.get_read_session(consistent=True) as session:
+            # Поиск по частичному индексу idx_links_active_created_id
+            oldest = session.query(func.min(Link.created_at)).filter(Link.is_active == True).scalar()
+
+        floor = month_start(oldest or datetime.now())
+        with self._lock:
+            self._floor = floor
+            self._floor_at = time.monotonic()
+        return floor
+
+    def cached_active_floor(self) -> Optional[datetime]:
+        """Граница из кеша без обращения к БД (None - кеш устарел)"""
+        with self._lock:
+            if self._floor is not None and time.monotonic() - self._floor_at < self.floor_ttl:
+                return self._floor
+        return None
+
+    def reset_active_floor(self, floor: datetime = None):
+        """Сброс кеша границы (floor - известная новая граница)"""
+        with self._lock:
+            self._floor = month_start(floor) if floor else None
+            self._floor_at = time.monotonic()
+
+    def active_filter(self, floor: datetime = None):
+        """Условие «активная ссылка» с отсечением старых партиций"""
+        return and_(Link.is_active == True, Link.created_at >= (floor or self.active_floor()))
+
+    # ============================================
+    # ПЛАН 1: АРХИВАЦИЯ
+    # ============================================
+
+    def archive(self, dry_run: bool = False) -> List[Dict[str, Any]]:
+        """Архивация подходящих месяцев, возвращает отчет по месяцам"""
+        if self.archive_after_months <= 0 and self.max_age_months <= 0:
+            return []
+
+        current = month_start(datetime.now())
+        inactive_cutoff = add_months(current, -self.archive_after_months) \
+            if self.archive_after_months > 0 else None
+        age_cutoff = add_months(current, -self.max_age_months) if self.max_age_months > 0 else None
+
+        partitions = {p['month']: p['name'] for p in self.list_partitions()}
+        months = sorted(partitions) if partitions else self._months_with_links(inactive_cutoff, age_cutoff)
+
+        report = []
+        for month in months:
+            old_enough = age_cutoff is not None and month < age_cutoff
+            inactive_old = inactive_cutoff is not None and month < inactive_cutoff
+            if month >= current or not (inactive_old or old_enough):
+                continue
+
+            upper = add_months(month, 1)
+            with self.db.get_session() as session:
+                total, active = session.query(
+                    func.count(Link.id),
+                    func.count(Link.id).filter(Link.is_active == True)
+                ).filter(Link.created_at >= month, Link.created_at < upper).one()
+
+            if not total:
+                # Пустая старая партиция архивировать нечего - просто удаляем
+                if month in partitions and not dry_run:
+                    self._drop_partition(partitions[month])
+                continue
+
+            # Месяц с активными ссылками архивируется только по возрасту
+            if active and not old_enough:
+                continue
+
+            entry = {'month': month.date(), 'rows': total, 'active_rows': active,
+                     'partition': partitions.get(month)}
+            if not dry_run:
+                entry.update(self._archive_month(month, partitions.get(month)))
+            report.append(entry)
+
+        if report:
+            logger.info(f"✅ Архивация ссылок: {report}")
+        return report
+
+    def _months_with_links(self, inactive_cutoff: Optional[datetime],
+                           age_cutoff: Optional[datetime]) -> List[datetime]:
+        """Месяцы-кандидаты для несекционированной таблицы"""
+        limit = max(cutoff for cutoff in (inactive_cutoff, age_cutoff) if cutoff is not None)
+        with self.db.get_session() as session:
+            oldest = session.query(func.min(Link.created_at)).scalar()
+        if not oldest:
+            return []
+
+        months = []
+        month = month_start(oldest)
+        while month < limit:
+            months.append(month)
+            month = add_months(month, 1)
+        return months
+
+    def _archive_month(self, month: datetime, partition: Optional[str]) -> Dict[str, Any]:
+        """Перенос строк месяца в архив и удаление их из links"""
+        upper = add_months(month, 1)
+        columns = Link.__table__.columns
+
+        with self.db.get_session() as session:
+            rows = session.execute(
+                select(Link.__table__).where(and_(Link.created_at >= month, Link.created_at < upper))
+                .order_by(Link.id)
+            ).mappings().all()
+            active = sum(1 for row in rows if row['is_active'])
+
+            buffer = io.BytesIO()
+            with gzip.GzipFile(fileobj=buffer, mode='wb') as archive:
+                for row in rows:
+                    record = {column.name: row[column.name] for column in columns}
+                    archive.write((json.dumps(record, ensure_ascii=False, default=str) + '\n').encode('utf-8'))
+            payload = buffer.getvalue()
+
+            path = None
+            if self.archive_dir:
+                os.makedirs(self.archive_dir, exist_ok=True)
+                path = os.path.join(self.archive_dir, f"{partition_name(self.TABLE, month)}.ndjson.gz")
+                with open(path, 'wb') as f:
+                    f.write(payload)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            session.add(LinkArchive(
+                month=month.date(),
+                rows=len(rows),
+                active_rows=active,
+                size_bytes=len(payload),
+                payload=None if path else payload,
+                path=path,
+            ))
+
+            if partition:
+                self._drop_partition(partition, session)
+            else:
+                session.execute(delete(Link).where(and_(Link.created_at >= month, Link.created_at < upper)))
+
+            self.db.stats.record_links_archived(session, active)
+
+        if active:
+            self.reset_active_floor()
+
+        return {'archived': True, 'size_bytes': len(payload), 'path': path}
+
+    def _drop_partition(self, partition: str, session=None):
+        """Отсоединение и удаление партиции (в транзакции session или своей)"""
+        if session is None:
+            with self.db.get_session() as own_session:
+                return self._drop_partition(partition, own_session)
+
+        session.execute(text("SET LOCAL lock_timeout = '5s'"))
+        session.execute(text(f"ALTER TABLE {self.TABLE} DETACH PARTITION {partition}"))
+        session.execute(text(f"DROP TABLE {partition}"))
+        logger.info(f"✅ Партиция {partition} удалена")
+
+    def read_archive(self, month: date) -> List[Dict[str, Any]]:
+        """Строки архивного месяца (для выгрузки или восстановления)"""
+        rows = []
+        with self.db.get_session() as session:
+            archives = session.query(LinkArchive).filter(LinkArchive.month == month)\
+                              .order_by(LinkArchive.id).all()
+            for item in archives:
+                if item.path:
+                    with open(item.path, 'rb') as f:
+                        payload = f.read()
+                else:
+                    payload = item.payload or b''
+                for line in gzip.decompress(payload).decode('utf-8').splitlines():
+                    if line:
+                        rows.append(json.loads(line))
+        return rows
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Состояние партиций и архива"""
+        with self.db.get_session() as session:
+            archived_months, archived_rows, archived_bytes = session.query(
+                func.count(LinkArchive.id),
+                func.coalesce(func.sum(LinkArchive.rows), 0),
+                func.coalesce(func.sum(LinkArchive.size_bytes), 0)
+            ).one()
+
+        return {
+            'partitions': [p['name'] for p in self.list_partitions()],
+            'active_floor': self.cached_active_floor(),
+            'archived_months': archived_months,
+            'archived_rows': int(archived_rows),
+            'archived_bytes': int(archived_bytes),
+        }
@@ -0,0 +1,269 @@
+"""
+Реплики чтения Do Presave Reminder Bot v25+
+Маршрутизация читающих сессий на реплики PostgreSQL
+
+ПЛАН 1: Round-robin по здоровым репликам + read-your-writes (АКТИВНАЯ)
+
+Реплики задаются списком URL (DATABASE_REPLICA_URLS через запятую).
+Читающие сессии получают реплики по кругу; реплика, на которой упало
+подключение или проверка здоровья, исключается на REPLICA_RETRY_INTERVAL
+секунд. Если здоровых реплик нет - чтение идет с основной БД.
+
+Read-your-writes: после записи в потоке (или asyncio-задаче) его чтения
+REPLICA_STICKY_SECONDS секунд идут на основную БД. Явно требовать актуальных данных можно через
+consistent=True.
+"""
+
+import os
+import time
+import threading
+from contextvars import ContextVar
+from typing import List, Optional, Dict, Any, Callable
+
+from sqlalchemy import text
+
+from database.engines import engine_registry
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Отставание реплики PostgreSQL в секундах (NULL на основной БД).
+# Если весь полученный WAL применен, реплика актуальна даже при давней
+# последней транзакции
+REPLICA_LAG_SQL = (
+    "SELECT CASE "
+    "WHEN NOT pg_is_in_recovery() THEN NULL "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+def parse_replica_urls(value: Optional[str] = None) -> List[str]:
+    """Разбор списка URL реплик (по умолчанию из DATABASE_REPLICA_URLS)"""
+    if value is None:
+        value = os.getenv('DATABASE_REPLICA_URLS', '')
+    return [url.strip() for url in value.split(',') if url.strip()]
+
+
+def _safe_url(url: str) -> str:
+    """URL без учетных данных для логов"""
+    return url.split('@')[-1]
+
+
+class ReplicaTarget:
+    """Реплика: движок и состояние здоровья"""
+
+    def __init__(self, url: str, engine):
+        self.url = url
+        self.name = _safe_url(url)
+        self.engine = engine
+        self.healthy = True
+        self.failed_at = 0.0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.reads = 0
+        self.lag_seconds: Optional[float] = None
+
+
+class ReplicaRouter:
+    """Выбор движка для чтения: реплика по кругу или основная БД"""
+
+    def __init__(self, primary_engine, replica_urls: List[str],
+                 engine_factory: Callable[[str], Any],
+                 retry_interval: float = None, sticky_seconds: float = None,
+                 max_lag: float = None):
+        """
+        Инициализация маршрутизатора реплик
+
+        Args:
+            primary_engine: Движок основной БД
+            replica_urls: URL реплик
+            engine_factory: Функция создания движка по URL
+        """
+        self.primary = primary_engine
+        self.retry_interval = retry_interval if retry_interval is not None else \
+            float(os.getenv('REPLICA_RETRY_INTERVAL', '30'))
+        self.sticky_seconds = sticky_seconds if sticky_seconds is not None else \
+            float(os.getenv('REPLICA_STICKY_SECONDS', '2'))
+        self.max_lag = max_lag if max_lag is not None else \
+            float(os.getenv('REPLICA_MAX_LAG', '10'))
+        self.health_interval = float(os.getenv('REPLICA_HEALTH_INTERVAL', '15'))
+
+        self.replicas = [ReplicaTarget(url, engine_factory(url)) for url in replica_urls]
+
+        self._next = 0
+        self._lock = threading.Lock()
+        # Контекст у каждого потока и asyncio-задачи свой
+        self._last_write: ContextVar[Optional[float]] = ContextVar(
+            f'replica_last_write_{id(self)}', default=None
+        )
+        self._primary_reads = 0
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = False
+
+        if self.replicas:
+            logger.info(f"✅ Реплики чтения: {', '.join(r.name for r in self.replicas)}")
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    # ============================================
+    # ПЛАН 1: ЖИЗНЕННЫЙ ЦИКЛ
+    # ============================================
+
+    def start(self):
+        """Запуск фоновой проверки здоровья (для синхронных движков)"""
+        with self._lock:
+            if self._started or not self.replicas:
+                return
+            self._started = True
+
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="replica-health", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"✅ Проверка реплик запущена (каждые {self.health_interval}s)")
+
+    def stop(self):
+        """Остановка фоновой проверки здоровья"""
+        self._stop.set()
+        self._started = False
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def close(self):
+        """Остановка проверки и закрытие подключений к репликам"""
+        self.stop()
+        for target in self.replicas:
+            engine_registry.release(target.engine)
+
+    def _run(self):
+        """Фоновый цикл проверки здоровья"""
+        while not self._stop.wait(self.health_interval):
+            try:
+                self.check_health()
+            except Exception as e:
+                logger.error(f"❌ Ошибка проверки реплик: {e}")
+
+    # ============================================
+    # ПЛАН 1: ВЫБОР ДВИЖКА
+    # ============================================
+
+    def choose(self, consistent: bool = False) -> Optional[ReplicaTarget]:
+        """
+        Выбор реплики для чтения
+
+        Returns:
+            ReplicaTarget или None, если читать нужно с основной БД
+        """
+        if not self.replicas or consistent or self.recently_wrote():
+            self._count_primary_read()
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            for _ in range(len(self.replicas)):
+                target = self.replicas[self._next % len(self.replicas)]
+                self._next += 1
+
+                # Исключенная реплика получает новый шанс после retry_interval
+                if target.healthy or now - target.failed_at >= self.retry_interval:
+                    target.reads += 1
+                    return target
+
+            self._primary_reads += 1
+
+        return None
+
+    def engine_for(self, target: Optional[ReplicaTarget]):
+        """Движок выбранной реплики или основной БД"""
+        return target.engine if target else self.primary
+
+    def _count_primary_read(self):
+        with self._lock:
+            self._primary_reads += 1
+
+    # ============================================
+    # ПЛАН 1: ЗДОРОВЬЕ РЕПЛИК
+    # ============================================
+
+    def mark_failed(self, target: ReplicaTarget, error: Exception):
+        """Исключение реплики после ошибки подключения"""
+        with self._lock:
+            was_healthy = target.healthy
+            target.healthy = False
+            target.failed_at = time.monotonic()
+            target.failures += 1
+            target.last_error = str(error)[:200]
+
+        if was_healthy:
+            logger.warning(f"⚠️ Реплика {target.name} исключена: {error}")
+
+    def mark_healthy(self, target: ReplicaTarget, lag_seconds: float = None):
+        """Возврат реплики в ротацию"""
+        with self._lock:
+            was_healthy = target.healthy
+            target.healthy = True
+            target.lag_seconds = lag_seconds
+
+        if not was_healthy:
+            logger.info(f"✅ Реплика {target.name} снова доступна")
+
+    def check_lag(self, target: ReplicaTarget, lag_seconds: Optional[float]):
+        """Учет отставания реплики: слишком отставшая исключается"""
+        if lag_seconds is not None and lag_seconds > self.max_lag:
+            self.mark_failed(target, RuntimeError(f"отставание {lag_seconds:.1f}s > {self.max_lag}s"))
+        else:
+            self.mark_healthy(target, lag_seconds)
+
+    def check_health(self) -> Dict[str, bool]:
+        """Проверка всех реплик (для синхронных движков)"""
+        result = {}
+        for target in self.replicas:
+            try:
+                with target.engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+                    lag = None
+                    if conn.dialect.name == 'postgresql':
+                        lag = conn.execute(text(REPLICA_LAG_SQL)).scalar()
+                self.check_lag(target, float(lag) if lag is not None else None)
+            except Exception as e:
+                self.mark_failed(target, e)
+            result[target.name] = target.healthy
+        return result
+
+    # ============================================
+    # ПЛАН 1: READ-YOUR-WRITES
+    # ============================================
+
+    def note_write(self):
+        """Отметка записи в текущем потоке/задаче"""
+        self._last_write.set(time.monotonic())
+
+    def recently_wrote(self) -> bool:
+        """Была ли запись в текущем потоке/задаче в пределах sticky_seconds"""
+        last_write = self._last_write.get()
+        return last_write is not None and time.monotonic() - last_write < self.sticky_seconds
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Состояние реплик и распределение чтений"""
+        with self._lock:
+            return {
+                'primary_reads': self._primary_reads,
+                'replicas': [
+                    {
+                        'name': target.name,
+                        'healthy': target.healthy,
+                        'reads': target.reads,
+                        'failures': target.failures,
+                        'lag_seconds': target.lag_seconds,
+                        'last_error': target.last_error,
+                    }
+                    for target in self.replicas
+                ],
+            }
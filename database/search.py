@@ -0,0 +1,287 @@
+"""
+Поиск по ссылкам Do Presave Reminder Bot v25+
+Ранжированный поиск по URL и тексту сообщений для аналитики админов
+
+ПЛАН 1: Индексы PostgreSQL + индекс в памяти для SQLite (АКТИВНАЯ)
+
+На PostgreSQL поиск идет по индексам миграции links_search_indexes:
+GIN по tsvector из слов URL и текста сообщения (каждое слово запроса -
+префикс, все слова обязательны) и GIN-триграммы по url для подстрок
+(домен, часть идентификатора релиза). Ранг - ts_rank_cd плюс триграммное
+сходство URL с запросом.
+
+На других СУБД (SQLite в разработке и тестах) строится обратный индекс
+в памяти: слово -> id ссылок. Он заполняется при первом поиске и перед
+каждым поиском догружает ссылки с id больше последнего
+проиндексированного, поэтому хуки на вставку не нужны.
+
+Архивированные месяцы (database/partitions.py) в поиск не попадают.
+"""
+
+import os
+import re
+import math
+import time
+import bisect
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any, Set, Tuple
+
+from sqlalchemy import select, text
+
+from database.models import Link, User
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Выражение индекса idx_links_search_tsv: запрос должен использовать его дословно.
+# Знаки URL заменяются пробелами, чтобы «open.spotify.com/artist/...» дал слова
+SEARCH_TSVECTOR_SQL = (
+    "to_tsvector('simple', regexp_replace(coalesce(url, ''), '[^[:alnum:]]+', ' ', 'g') "
+    "|| ' ' || coalesce(message_text, ''))"
+)
+
+_WORD_RE = re.compile(r'[^\W_]+', re.UNICODE)
+MIN_TOKEN_LENGTH = 2
+
+
+def tokenize(value: Optional[str]) -> List[str]:
+    """Слова для поиска: нижний регистр, без знаков, от двух символов"""
+    if not value:
+        return []
+    return [word for word in _WORD_RE.findall(value.lower()) if len(word) >= MIN_TOKEN_LENGTH]
+
+
+class InvertedLinkIndex:
+    """Обратный индекс ссылок в памяти: слово -> id ссылок"""
+
+    def __init__(self, batch_size: int = 5000):
+        self.batch_size = batch_size
+        self._postings: Dict[str, Set[int]] = {}
+        self._words: List[str] = []  # отсортированные слова для поиска по префиксу
+        self._last_id = 0
+        self._documents = 0
+        self._lock = threading.Lock()
+
+    def add(self, link_id: int, *values: Optional[str]):
+        """Добавление ссылки в индекс"""
+        words = set()
+        for value in values:
+            words.update(tokenize(value))
+
+        with self._lock:
+            for word in words:
+                postings = self._postings.get(word)
+                if postings is None:
+                    postings = self._postings[word] = set()
+                    bisect.insort(self._words, word)
+                postings.add(link_id)
+            self._documents += 1
+            self._last_id = max(self._last_id, link_id)
+
+    def catch_up(self, session) -> int:
+        """Догрузка ссылок, добавленных после последней индексации"""
+        added = 0
+        while True:
+            rows = session.execute(
+                select(Link.id, Link.url, Link.message_text)
+                .where(Link.id > self._last_id)
+                .order_by(Link.id)
+                .limit(self.batch_size)
+            ).all()
+            for link_id, url, message_text in rows:
+                self.add(link_id, url, message_text)
+            added += len(rows)
+            if len(rows) < self.batch_size:
+                return added
+
+    def search(self, words: List[str]) -> List[Tuple[int, float]]:
+        """
+        Ссылки, содержащие все слова (слово запроса - префикс)
+
+        Returns:
+            list: (id, ранг) по убыванию ранга, затем id
+        """
+        scores: Optional[Dict[int, float]] = None
+
+        with self._lock:
+            total = max(self._documents, 1)
+            for word in words:
+                matched: Dict[int, float] = {}
+                start = bisect.bisect_left(self._words, word)
+                for candidate in self._words[start:]:
+                    if not candidate.startswith(word):
+                        break
+                    postings = self._postings[candidate]
+                    # Редкие слова весят больше, точное совпадение - больше префикса
+                    weight = math.log(1 + total / len(postings))
+                    if candidate != word:
+                        weight *= 0.5
+                    for link_id in postings:
+                        if weight > matched.get(link_id, 0.0):
+                            matched[link_id] = weight
+
+                if scores is None:
+                    scores = matched
+                else:
+                    scores = {
+                        link_id: score + matched[link_id]
+                        for link_id, score in scores.items() if link_id in matched
+                    }
+                if not scores:
+                    return []
+
+        return sorted((scores or {}).items(), key=lambda item: (-item[1], -item[0]))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'documents': self._documents, 'words': len(self._words), 'last_id': self._last_id}
+
+
+class LinkSearchManager:
+    """Ранжированный постраничный поиск по ссылкам"""
+
+    def __init__(self, db_manager, page_size: int = None, max_results: int = None):
+        """Инициализация поиска"""
+        self.db = db_manager
+        self.page_size = page_size if page_size is not None else \
+            int(os.getenv('SEARCH_PAGE_SIZE', '10'))
+        self.max_results = max_results if max_results is not None else \
+            int(os.getenv('SEARCH_MAX_RESULTS', '500'))
+
+        self._index: Optional[InvertedLinkIndex] = None
+        self._index_lock = threading.Lock()
+
+        # Запросы для кнопок пагинации: в callback_data помещается только ключ
+        self._queries: 'OrderedDict[str, str]' = OrderedDict()
+        self._queries_lock = threading.Lock()
+
+    @property
+    def backend(self) -> str:
+        return 'postgresql' if self.db.engine.dialect.name == 'postgresql' else 'memory'
+
+    # ============================================
+    # ПЛАН 1: ПОИСК
+    # ============================================
+
+    def search(self, query: str, page: int = 1) -> Dict[str, Any]:
+        """
+        Страница результатов поиска
+
+        Returns:
+            dict: query, page, total (не больше max_results), total_pages,
+                  links (словари как в get_links_page), elapsed_ms, backend
+        """
+        started = time.perf_counter()
+        words = tokenize(query)
+        page = max(1, page)
+        offset = (page - 1) * self.page_size
+
+        if not words:
+            ranked, total = [], 0
+        elif self.backend == 'postgresql':
+            ranked, total = self._search_postgresql(query, words, offset)
+        else:
+            ranked, total = self._search_memory(words, offset)
+
+        links = self._load_links([link_id for link_id, _ in ranked])
+        total = min(total, self.max_results)
+
+        return {
+            'query': query,
+            'page': page,
+            'total': total,
+            'total_pages': max(1, -(-total // self.page_size)),
+            'links': links,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+            'backend': self.backend,
+        }
+
+    def _search_postgresql(self, query: str, words: List[str], offset: int) -> Tuple[List[Tuple[int, float]], int]:
+        """Поиск по GIN-индексам tsvector и триграмм"""
+        pattern = '%' + re.sub(r'([\\%_])', r'\\\1', query.strip()) + '%'
+        limit = max(0, min(self.page_size, self.max_results - offset))
+
+        sql = text(
+            f"SELECT id, ts_rank_cd({SEARCH_TSVECTOR_SQL}, q) + similarity(url, :query) AS rank, "
+            f"count(*) OVER () AS total "
+            f"FROM links, to_tsquery('simple', :tsquery) AS q "
+            f"WHERE {SEARCH_TSVECTOR_SQL} @@ q OR url ILIKE :pattern "
+            f"ORDER BY rank DESC, created_at DESC, id DESC "
+            f"LIMIT :limit OFFSET :offset"
+        )
+        params = {
+            'query': query.strip(),
+            'tsquery': ' & '.join(f"{word}:*" for word in words),
+            'pattern': pattern,
+            'limit': limit,
+            'offset': offset,
+        }
+
+        with self.db.get_read_session() as session:
+            rows = session.execute(sql, params).all()
+
+        total = rows[0].total if rows else 0
+        return [(row.id, row.rank) for row in rows], total
+
+    def _search_memory(self, words: List[str], offset: int) -> Tuple[List[Tuple[int, float]], int]:
+        """Поиск по обратному индексу в памяти"""
+        index = self._get_index()
+        matches = index.search(words)[:self.max_results]
+        return matches[offset:offset + self.page_size], len(matches)
+
+    def _get_index(self) -> InvertedLinkIndex:
+        with self._index_lock:
+            if self._index is None:
+                self._index = InvertedLinkIndex(int(os.getenv('SEARCH_INDEX_BATCH_SIZE', '5000')))
+                logger.info("🔄 Построение индекса поиска по ссылкам в памяти...")
+
+            with self.db.get_read_session(consistent=True) as session:
+                added = self._index.catch_up(session)
+            if added > 1000:
+                logger.info(f"✅ В индекс поиска добавлено ссылок: {added}")
+            return self._index
+
+    def _load_links(self, link_ids: List[int]) -> List[dict]:
+        """Ссылки с авторами в порядке ранга (удаленные архивацией пропускаются)"""
+        if not link_ids:
+            return []
+
+        with self.db.get_read_session() as session:
+            rows = session.query(Link, User).outerjoin(User, Link.user_id == User.user_id)\
+                          .filter(Link.id.in_(link_ids)).all()
+            by_id = {link.id: self.db._link_to_dict(link, user) for link, user in rows}
+
+        return [by_id[link_id] for link_id in link_ids if link_id in by_id]
+
+    # ============================================
+    # ПЛАН 1: КЛЮЧИ ЗАПРОСОВ ДЛЯ ПАГИНАЦИИ
+    # ============================================
+
+    def remember_query(self, query: str) -> str:
+        """Короткий ключ запроса для callback_data"""
+        key = hashlib.blake2b(query.encode('utf-8'), digest_size=4).hexdigest()
+        with self._queries_lock:
+            self._queries[key] = query
+            self._queries.move_to_end(key)
+            while len(self._queries) > 256:
+                self._queries.popitem(last=False)
+        return key
+
+    def lookup_query(self, key: str) -> Optional[str]:
+        """Запрос по ключу (None - ключ устарел, например после рестарта)"""
+        with self._queries_lock:
+            return self._queries.get(key)
+
+    def reset_index(self):
+        """Сброс индекса в памяти (после восстановления БД строится заново)"""
+        with self._index_lock:
+            self._index = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Состояние поиска"""
+        stats = {'backend': self.backend}
+        if self._index is not None:
+            stats['memory_index'] = self._index.get_stats()
+        return stats
@@ -0,0 +1,187 @@
+"""
+Кеш настроек Do Presave Reminder Bot v25+
+Типизированный кеш таблицы settings в памяти процесса
+
+ПЛАН 1: Кеш настроек с синхронизацией по версии (АКТИВНАЯ)
+
+Таблица settings загружается целиком один раз и обновляется при
+set_setting. Для согласованности между несколькими процессами (репликами)
+каждое изменение увеличивает служебную настройку settings_version, а кеш
+не чаще раза в SETTINGS_CACHE_POLL_INTERVAL секунд сверяет ее со своей
+версией и при расхождении перезагружает таблицу.
+"""
+
+import os
+import copy
+import time
+import threading
+from typing import Any, Dict, Optional
+
+from database.statements import SETTING_VALUE, ALL_SETTINGS
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Служебная настройка - номер версии таблицы settings
+SETTINGS_VERSION_KEY = 'settings_version'
+
+
+def convert_setting_value(value: Optional[str], value_type: str) -> Any:
+    """Преобразование строкового значения настройки в нужный тип"""
+    if value_type == 'bool':
+        return value.lower() == 'true'
+    elif value_type == 'int':
+        return int(value)
+    elif value_type == 'float':
+        return float(value)
+    elif value_type == 'json':
+        import ujson
+        return ujson.loads(value)
+    else:
+        return value
+
+
+class SettingsCache:
+    """Типизированный кеш настроек с проверкой версии"""
+
+    def __init__(self, db_manager, poll_interval: float = None):
+        """Инициализация кеша настроек"""
+        self.db = db_manager
+        self.poll_interval = poll_interval if poll_interval is not None else \
+            float(os.getenv('SETTINGS_CACHE_POLL_INTERVAL', '5'))
+
+        self._values: Dict[str, Any] = {}
+        self._version: Optional[int] = None
+        self._loaded = False
+        self._last_check = 0.0
+        self._lock = threading.RLock()
+
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'reloads': 0,
+            'version_checks': 0,
+        }
+
+    # ============================================
+    # ПЛАН 1: ЧТЕНИЕ
+    # ============================================
+
+    def get(self, key: str, default_value: Any = None) -> Any:
+        """Получение типизированного значения настройки"""
+        with self._lock:
+            if self._ensure_fresh():
+                self._stats['misses'] += 1
+            else:
+                self._stats['hits'] += 1
+
+            if key not in self._values:
+                return default_value
+            return self._copy(self._values[key])
+
+    def get_all(self) -> Dict[str, Any]:
+        """Получение всех настроек (без служебных)"""
+        with self._lock:
+            if self._ensure_fresh():
+                self._stats['misses'] += 1
+            else:
+                self._stats['hits'] += 1
+
+            return {
+                key: self._copy(value)
+                for key, value in self._values.items()
+                if key != SETTINGS_VERSION_KEY
+            }
+
+    # ============================================
+    # ПЛАН 1: ОБНОВЛЕНИЕ
+    # ============================================
+
+    def apply_local(self, key: str, value: Any, version: Optional[int] = None):
+        """Обновление кеша после успешного set_setting в этом процессе"""
+        with self._lock:
+            if not self._loaded:
+                return
+
+            self._values[key] = value
+
+            if version is not None:
+                if self._version is not None and version != self._version + 1:
+                    # Между нашими записями были изменения в другом процессе
+                    self._loaded = False
+                else:
+                    self._version = version
+                    self._values[SETTINGS_VERSION_KEY] = version
+
+    def invalidate(self):
+        """Сброс кеша (следующее чтение перезагрузит таблицу)"""
+        with self._lock:
+            self._loaded = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика кеша: попадания, промахи, перезагрузки"""
+        with self._lock:
+            stats = dict(self._stats)
+            total = stats['hits'] + stats['misses']
+            stats['hit_rate'] = round(stats['hits'] / total * 100, 1) if total else 0.0
+            stats['version'] = self._version
+            stats['size'] = len(self._values)
+        return stats
+
+    # ============================================
+    # ПЛАН 1: СИНХРОНИЗАЦИЯ С БД
+    # ============================================
+
+    def _ensure_fresh(self) -> bool:
+        """Проверка актуальности кеша, True если пришлось читать таблицу"""
+        now = time.monotonic()
+
+        if not self._loaded:
+            self._reload()
+            self._last_check = now
+            return True
+
+        if now - self._last_check < self.poll_interval:
+            return False
+
+        self._last_check = now
+        self._stats['version_checks'] += 1
+
+        if self._read_version() != self._version:
+            self._reload()
+            return True
+
+        return False
+
+    def _read_version(self) -> Optional[int]:
+        """Чтение текущей версии настроек из БД"""
+        with self.db.get_session() as session:
+            value = session.execute(SETTING_VALUE, {'key': SETTINGS_VERSION_KEY}).scalar()
+            return int(value) if value is not None else None
+
+    def _reload(self):
+        """Полная загрузка таблицы settings"""
+        with self.db.get_session() as session:
+            rows = session.execute(ALL_SETTINGS).all()
+
+        values = {}
+        for key, value, value_type in rows:
+            try:
+                values[key] = convert_setting_value(value, value_type)
+            except (ValueError, TypeError, AttributeError) as e:
+                logger.error(f"❌ Некорректное значение настройки {key}: {e}")
+
+        self._values = values
+        version = values.get(SETTINGS_VERSION_KEY)
+        self._version = version if isinstance(version, int) else None
+        self._loaded = True
+        self._stats['reloads'] += 1
+
+        logger.debug(f"⚙️ Кеш настроек загружен: {len(values)} шт., версия {self._version}")
+
+    @staticmethod
+    def _copy(value: Any) -> Any:
+        # json-настройки изменяемы, отдаем копию чтобы не портить кеш
+        if isinstance(value, (dict, list)):
+            return copy.deepcopy(value)
+        return value
@@ -0,0 +1,204 @@
+"""
+Готовые запросы Do Presave Reminder Bot v25+
+Заранее построенные select() для горячих путей DatabaseManager
+
+ПЛАН 1: Запросы с bindparam вместо построения на каждый вызов (АКТИВНАЯ)
+
+session.query(...).filter(...) на каждом вызове заново строит дерево
+выражений, считает по нему ключ кеша компиляции и собирает ORM-контекст.
+Здесь запросы строятся один раз при импорте (или один раз на вариант
+фильтров для списков ссылок), все значения - bindparam. Ключ кеша у
+готового select() запоминается в самом объекте, поэтому на вызов остается
+только поиск скомпилированного SQL в кеше движка и выполнение.
+
+Значения передаются вторым аргументом session.execute(stmt, params).
+
+Замер накладных расходов: python -m database.statements
+"""
+
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+from sqlalchemy import select, func, bindparam, tuple_
+
+from database.models import User, Link, Settings
+from database.pagination import decode_cursor
+
+# ============================================
+# ПЛАН 1: ПОЛЬЗОВАТЕЛИ И НАСТРОЙКИ
+# ============================================
+
+# Параметр: user_id
+USER_BY_ID = select(User).where(User.user_id == bindparam('user_id')).limit(1)
+
+# Параметр: key
+SETTING_BY_KEY = select(Settings).where(Settings.key == bindparam('key')).limit(1)
+SETTING_VALUE = select(Settings.value).where(Settings.key == bindparam('key'))
+
+ALL_SETTINGS = select(Settings.key, Settings.value, Settings.value_type)
+
+# ============================================
+# ПЛАН 1: ССЫЛКИ
+# ============================================
+
+# Условие active_filter() с границей партиций как параметром floor
+_ACTIVE = (Link.is_active == True, Link.created_at >= bindparam('floor'))
+
+# Параметры: user_id, floor, since
+USER_LINK_COUNTS = select(
+    func.count(Link.id),
+    func.count(Link.id).filter(Link.created_at >= bindparam('since'))
+).where(Link.user_id == bindparam('user_id'), *_ACTIVE)
+
+
+@lru_cache(maxsize=None)
+def links_statement(with_user: bool = False, by_user: bool = False,
+                    by_thread: bool = False, after_cursor: bool = False,
+                    before_cursor: bool = False):
+    """
+    Список активных ссылок в порядке (created_at DESC, id DESC)
+
+    before_cursor - ссылки новее курсора в обратном порядке (страница «назад»).
+    Каждый вариант фильтров строится один раз.
+    Параметры: floor, limit, + user_id / thread_id / cursor_created_at и
+    cursor_id (см. link_params)
+    """
+    if with_user:
+        stmt = select(Link, User).outerjoin(User, Link.user_id == User.user_id)
+    else:
+        stmt = select(Link)
+
+    stmt = stmt.where(*_ACTIVE)
+
+    if by_user:
+        stmt = stmt.where(Link.user_id == bindparam('user_id'))
+
+    if by_thread:
+        stmt = stmt.where(Link.thread_id == bindparam('thread_id'))
+
+    if after_cursor:
+        stmt = stmt.where(
+            tuple_(Link.created_at, Link.id) <
+            tuple_(bindparam('cursor_created_at'), bindparam('cursor_id'))
+        )
+
+    if before_cursor:
+        return stmt.where(
+            tuple_(Link.created_at, Link.id) >
+            tuple_(bindparam('cursor_created_at'), bindparam('cursor_id'))
+        ).order_by(Link.created_at, Link.id).limit(bindparam('limit'))
+
+    return stmt.order_by(Link.created_at.desc(), Link.id.desc()).limit(bindparam('limit'))
+
+
+def link_params(floor, limit: int, user_id: int = None, thread_id: int = None,
+                cursor: Optional[str] = None, with_user: bool = False,
+                backward: bool = False):
+    """
+    Готовый запрос списка ссылок и его параметры
+
+    backward - ссылки новее курсора, от ближайших к нему (см. links_statement)
+
+    Returns:
+        tuple: (statement, params) для session.execute
+    """
+    params: Dict[str, Any] = {'floor': floor, 'limit': limit}
+
+    if user_id:
+        params['user_id'] = user_id
+
+    if thread_id:
+        params['thread_id'] = thread_id
+
+    position = decode_cursor(cursor)
+    if position:
+        params['cursor_created_at'], params['cursor_id'] = position
+
+    backward = backward and bool(position)
+    stmt = links_statement(with_user, bool(user_id), bool(thread_id),
+                           bool(position) and not backward, backward)
+    return stmt, params
+
+
+# ============================================
+# ПЛАН 1: ЗАМЕР НАКЛАДНЫХ РАСХОДОВ
+# ============================================
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+    import time
+    from datetime import datetime, timedelta
+
+    from sqlalchemy import create_engine, and_, desc
+    from sqlalchemy.orm import sessionmaker
+
+    from database.models import Base
+
+    ITERATIONS = int(os.getenv('BENCH_ITERATIONS', '3000'))
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    now = datetime.now()
+    floor = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0) - timedelta(days=62)
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+    with Session() as session:
+        for user_id in range(1, 51):
+            session.add(User(user_id=user_id, username=f"user{user_id}"))
+        for i in range(2000):
+            session.add(Link(
+                user_id=i % 50 + 1, url=f"https://example.com/{i}", message_id=i,
+                thread_id=i % 3 + 1, created_at=now - timedelta(hours=i)
+            ))
+        session.add(Settings(key='settings_version', value='1', value_type='int'))
+        session.commit()
+
+    def bench(name, func_):
+        with Session() as session:
+            for _ in range(100):
+                func_(session)
+                session.expunge_all()
+            started = time.perf_counter()
+            for _ in range(ITERATIONS):
+                func_(session)
+                session.expunge_all()
+            return (time.perf_counter() - started) / ITERATIONS * 1_000_000
+
+    cases = {
+        'user by user_id': (
+            lambda s: s.query(User).filter(User.user_id == 7).first(),
+            lambda s: s.execute(USER_BY_ID, {'user_id': 7}).scalars().first(),
+        ),
+        'setting value': (
+            lambda s: s.query(Settings.value).filter(Settings.key == 'settings_version').scalar(),
+            lambda s: s.execute(SETTING_VALUE, {'key': 'settings_version'}).scalar(),
+        ),
+        'recent links': (
+            lambda s: s.query(Link).filter(and_(Link.is_active == True, Link.created_at >= floor))
+                       .order_by(desc(Link.created_at), desc(Link.id)).limit(10).all(),
+            lambda s: s.execute(*link_params(floor, 10)).scalars().all(),
+        ),
+        'user link counts': (
+            lambda s: (
+                s.query(Link).filter(and_(Link.user_id == 7, Link.is_active == True,
+                                          Link.created_at >= floor)).count(),
+                s.query(Link).filter(and_(Link.user_id == 7, Link.is_active == True,
+                                          Link.created_at >= month_start)).count(),
+            ),
+            lambda s: s.execute(USER_LINK_COUNTS,
+                                {'user_id': 7, 'floor': floor, 'since': month_start}).one(),
+        ),
+    }
+
+    print(f"Итераций: {ITERATIONS}, SQLite в файле, мкс на вызов\n")
+    print(f"{'запрос':<20}{'ORM query':>12}{'готовый':>12}{'выигрыш':>10}")
+    for name, (before, after) in cases.items():
+        before_us = bench(name, before)
+        after_us = bench(name, after)
+        print(f"{name:<20}{before_us:>12.1f}{after_us:>12.1f}{before_us / after_us:>9.2f}x")
+
+    engine.dispose()
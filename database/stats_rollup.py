@@ -0,0 +1,408 @@
+"""
+Агрегаты статистики Do Presave Reminder Bot v25+
+Инкрементально поддерживаемая статистика для экранов диагностики
+
+ПЛАН 1: Rollup-таблицы + зеркало в памяти (АКТИВНАЯ)
+
+Итоги (пользователи, админы, ссылки) хранятся в stats_rollup, ссылки по
+дням - в link_daily_stats. Они обновляются в той же транзакции, что и
+вставка ссылок, создание пользователя или очистка ссылок. Зеркало в
+памяти обновляется после коммита, поэтому экраны статистики не зависят
+от размера таблицы links. Периодическая сверка пересчитывает все точно
+и исправляет накопившееся расхождение.
+
+Окна активности (7 и 30 дней) считаются по зеркалу user_id -> last_seen_at
+за последние 30 дней: touch_user отмечает в нем пользователя сразу, а
+снимок считает попавших в окно на момент запроса, поэтому выбывшие из
+окна перестают учитываться без ожидания сверки.
+"""
+
+import os
+import time
+import threading
+from datetime import datetime, date, timedelta
+from typing import Dict, Optional, Any, Iterable
+
+from sqlalchemy import event, update, select, func, case
+from sqlalchemy.exc import IntegrityError
+
+from database.models import User, Link, StatsRollup, LinkDailyStats, LinkArchive
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Имена агрегатов
+TOTAL_USERS = 'total_users'
+TOTAL_ADMINS = 'total_admins'
+TOTAL_LINKS = 'total_links'            # активные ссылки
+TOTAL_LINKS_ALL = 'total_links_all'    # все ссылки, включая очищенные
+ACTIVE_USERS_WEEK = 'active_users_week'
+ACTIVE_USERS_MONTH = 'active_users_30d'
+
+# Самое длинное окно активности
+ACTIVITY_WINDOW_DAYS = 30
+
+# Ключ в session.info для дельт, применяемых к зеркалу после коммита
+_SESSION_KEY = 'stats_rollup_deltas'
+
+
+class StatsRollupManager:
+    """Инкрементальные агрегаты статистики с периодической сверкой"""
+
+    def __init__(self, db_manager, reconcile_interval: float = None,
+                 mirror_ttl: float = None):
+        """Инициализация агрегатов статистики"""
+        self.db = db_manager
+        self.reconcile_interval = reconcile_interval if reconcile_interval is not None else \
+            float(os.getenv('STATS_RECONCILE_INTERVAL', '600'))
+        self.mirror_ttl = mirror_ttl if mirror_ttl is not None else \
+            float(os.getenv('STATS_MIRROR_TTL', '30'))
+        self.reconcile_days = int(os.getenv('STATS_RECONCILE_DAYS', '31'))
+
+        # Зеркало в памяти
+        self._totals: Dict[str, int] = {}
+        self._days: Dict[date, list] = {}  # day -> [links_created, links_active]
+        self._last_seen: Dict[int, datetime] = {}  # user_id -> last_seen_at за окно
+        self._last_seen_loaded = False
+        self._loaded_at = 0.0
+        self._reconciled_at: Optional[datetime] = None
+        self._loaded = False
+        self._lock = threading.RLock()
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = False
+
+        # Дельты попадают в зеркало только после успешного коммита
+        event.listen(self.db.SessionLocal, 'after_commit', self._after_commit)
+        event.listen(self.db.SessionLocal, 'after_rollback', self._after_rollback)
+
+    # ============================================
+    # ПЛАН 1: ЖИЗНЕННЫЙ ЦИКЛ
+    # ============================================
+
+    def start(self):
+        """Запуск периодической сверки"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="stats-reconciler", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"✅ Сверка статистики запущена (каждые {self.reconcile_interval}s)")
+
+    def stop(self):
+        """Остановка периодической сверки"""
+        self._stop.set()
+        self._started = False
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        """Фоновый цикл сверки"""
+        while not self._stop.wait(self.reconcile_interval):
+            try:
+                self.reconcile()
+            except Exception as e:
+                logger.error(f"❌ Ошибка сверки статистики: {e}")
+
+    # ============================================
+    # ПЛАН 1: ИНКРЕМЕНТАЛЬНЫЕ ОБНОВЛЕНИЯ
+    # ============================================
+
+    def record_users_created(self, session, count: int = 1, admins: int = 0):
+        """Учет созданных пользователей (в транзакции создания)"""
+        deltas = {TOTAL_USERS: count}
+        if admins:
+            deltas[TOTAL_ADMINS] = admins
+        self._record(session, totals=deltas)
+
+    def record_links_added(self, session, created_days: Dict[date, int]):
+        """Учет добавленных ссылок (в транзакции вставки)"""
+        count = sum(created_days.values())
+        if not count:
+            return
+        self._record(
+            session,
+            totals={TOTAL_LINKS: count, TOTAL_LINKS_ALL: count},
+            days=created_days
+        )
+
+    def record_links_deactivated(self, session, active_days: Dict[date, int]):
+        """Учет пакета очищенных ссылок по дням создания (в транзакции пакета)"""
+        count = sum(active_days.values())
+        if not count:
+            return
+        for day, amount in active_days.items():
+            session.execute(
+                update(LinkDailyStats).where(LinkDailyStats.day == day)
+                .values(links_active=LinkDailyStats.links_active - amount)
+            )
+        stash = self._stash(session)
+        for day, amount in active_days.items():
+            stash['deactivated'][day] = stash['deactivated'].get(day, 0) + amount
+        self._record(session, totals={TOTAL_LINKS: -count})
+
+    def record_links_archived(self, session, active: int):
+        """Учет архивации месяца ссылок (TOTAL_LINKS_ALL учитывает архив)"""
+        if active:
+            self._record(session, totals={TOTAL_LINKS: -active})
+
+    def record_user_seen(self, user_id: int, seen_at: datetime = None):
+        """Отметка активности пользователя для окон активности (без БД)"""
+        seen_at = seen_at or datetime.now()
+        with self._lock:
+            previous = self._last_seen.get(user_id)
+            if previous is None or previous < seen_at:
+                self._last_seen[user_id] = seen_at
+
+    def _record(self, session, totals: Dict[str, int] = None, days: Dict[date, int] = None):
+        """Применение дельт в БД и откладывание их для зеркала"""
+        stash = self._stash(session)
+
+        for name, amount in (totals or {}).items():
+            self._add_total(session, name, amount)
+            stash['totals'][name] = stash['totals'].get(name, 0) + amount
+
+        for day, amount in (days or {}).items():
+            self._add_day(session, day, amount)
+            stash['days'][day] = stash['days'].get(day, 0) + amount
+
+    @staticmethod
+    def _stash(session) -> Dict[str, Any]:
+        return session.info.setdefault(_SESSION_KEY, {
+            'totals': {}, 'days': {}, 'deactivated': {}
+        })
+
+    @staticmethod
+    def _add_total(session, name: str, amount: int):
+        """UPDATE stats_rollup SET value = value + :n (или вставка)"""
+        result = session.execute(
+            update(StatsRollup).where(StatsRollup.name == name)
+            .values(value=StatsRollup.value + amount)
+        )
+        if result.rowcount:
+            return
+        try:
+            with session.begin_nested():
+                session.add(StatsRollup(name=name, value=amount))
+        except IntegrityError:
+            session.execute(
+                update(StatsRollup).where(StatsRollup.name == name)
+                .values(value=StatsRollup.value + amount)
+            )
+
+    @staticmethod
+    def _add_day(session, day: date, amount: int):
+        """Увеличение счетчиков ссылок за день (или вставка)"""
+        values = {
+            'links_created': LinkDailyStats.links_created + amount,
+            'links_active': LinkDailyStats.links_active + amount,
+        }
+        result = session.execute(
+            update(LinkDailyStats).where(LinkDailyStats.day == day).values(**values)
+        )
+        if result.rowcount:
+            return
+        try:
+            with session.begin_nested():
+                session.add(LinkDailyStats(day=day, links_created=amount, links_active=amount))
+        except IntegrityError:
+            session.execute(
+                update(LinkDailyStats).where(LinkDailyStats.day == day).values(**values)
+            )
+
+    def _after_commit(self, session):
+        # Событие приходит и при освобождении SAVEPOINT - ждем внешний коммит
+        if session.in_nested_transaction():
+            return
+
+        stash = session.info.pop(_SESSION_KEY, None)
+        if not stash:
+            return
+
+        with self._lock:
+            if not self._loaded:
+                return
+
+            for name, amount in stash['totals'].items():
+                self._totals[name] = self._totals.get(name, 0) + amount
+
+            for day, amount in stash['days'].items():
+                counts = self._days.setdefault(day, [0, 0])
+                counts[0] += amount
+                counts[1] += amount
+
+            for day, amount in stash['deactivated'].items():
+                if day in self._days:
+                    self._days[day][1] -= amount
+
+    def _after_rollback(self, session):
+        if session.in_nested_transaction():
+            return
+        session.info.pop(_SESSION_KEY, None)
+
+    # ============================================
+    # ПЛАН 1: ЧТЕНИЕ
+    # ============================================
+
+    def get_snapshot(self) -> Dict[str, Any]:
+        """Снимок статистики из зеркала в памяти"""
+        with self._lock:
+            need_start = not self._started
+            self._started = True
+            self._ensure_loaded()
+
+        if need_start:
+            self.start()
+
+        with self._lock:
+
+            now = datetime.now()
+            today = now.date()
+            week_start = today - timedelta(days=6)
+            active_week, active_month = self._count_active(now)
+
+            return {
+                TOTAL_USERS: self._totals.get(TOTAL_USERS, 0),
+                TOTAL_ADMINS: self._totals.get(TOTAL_ADMINS, 0),
+                TOTAL_LINKS: self._totals.get(TOTAL_LINKS, 0),
+                TOTAL_LINKS_ALL: self._totals.get(TOTAL_LINKS_ALL, 0),
+                ACTIVE_USERS_WEEK: active_week,
+                ACTIVE_USERS_MONTH: active_month,
+                'links_today': self._days.get(today, [0, 0])[1],
+                'links_last_7d': sum(
+                    counts[0] for day, counts in self._days.items() if day >= week_start
+                ),
+                'reconciled_at': self._reconciled_at,
+            }
+
+    def _count_active(self, now: datetime) -> tuple:
+        """Активные за 7 и 30 дней; выбывших из окна убирает (вызывается под _lock)"""
+        week_since = now - timedelta(days=7)
+        month_since = now - timedelta(days=ACTIVITY_WINDOW_DAYS)
+
+        expired = [user_id for user_id, seen in self._last_seen.items() if seen < month_since]
+        for user_id in expired:
+            del self._last_seen[user_id]
+
+        week = sum(1 for seen in self._last_seen.values() if seen >= week_since)
+        return week, len(self._last_seen)
+
+    def _merge_last_seen(self, rows: Iterable[tuple]):
+        """Слияние last_seen_at из БД с отметками, еще не сброшенными кешем профилей"""
+        merged = {user_id: seen for user_id, seen in rows if seen is not None}
+        for user_id, seen in self._last_seen.items():
+            if merged.get(user_id) is None or merged[user_id] < seen:
+                merged[user_id] = seen
+        self._last_seen = merged
+        self._last_seen_loaded = True
+
+    @staticmethod
+    def _select_last_seen(session, now: datetime):
+        return session.execute(
+            select(User.user_id, User.last_seen_at)
+            .where(User.last_seen_at >= now - timedelta(days=ACTIVITY_WINDOW_DAYS))
+        ).all()
+
+    def _ensure_loaded(self):
+        """Загрузка зеркала из rollup-таблиц (не чаще раза в mirror_ttl)"""
+        now = time.monotonic()
+        if self._loaded and now - self._loaded_at < self.mirror_ttl:
+            return
+
+        with self.db.get_session() as session:
+            totals = dict(session.execute(
+                select(StatsRollup.name, StatsRollup.value)
+            ).all())
+            since = datetime.now().date() - timedelta(days=7)
+            days = session.execute(
+                select(LinkDailyStats.day, LinkDailyStats.links_created, LinkDailyStats.links_active)
+                .where(LinkDailyStats.day >= since)
+            ).all()
+            last_seen = None if self._last_seen_loaded else \
+                self._select_last_seen(session, datetime.now())
+
+        if not totals:
+            # Первый запуск: rollup-таблицы еще пусты
+            self.reconcile()
+            return
+
+        self._totals = totals
+        self._days = {day: [created, active] for day, created, active in days}
+        if last_seen is not None:
+            self._merge_last_seen(last_seen)
+        self._loaded = True
+        self._loaded_at = now
+
+    # ============================================
+    # ПЛАН 1: СВЕРКА
+    # ============================================
+
+    def reconcile(self) -> Dict[str, int]:
+        """Точный пересчет агрегатов по исходным таблицам"""
+        today = datetime.now().date()
+        since_day = today - timedelta(days=self.reconcile_days - 1)
+        since = datetime.combine(since_day, datetime.min.time())
+        now = datetime.now()
+
+        # Сканы и коммит идут без _lock: иначе на время пересчета встают все
+        # _after_commit. Дельты, закоммиченные во время сверки, могут разойтись
+        # с пересчитанным значением - это исправит следующая сверка
+        with self.db.get_session() as session:
+            totals = {
+                TOTAL_USERS: session.query(func.count(User.id)).scalar() or 0,
+                TOTAL_ADMINS: session.query(func.count(User.id)).filter(
+                    User.is_admin == True
+                ).scalar() or 0,
+                TOTAL_LINKS: session.query(func.count(Link.id)).filter(
+                    Link.is_active == True
+                ).scalar() or 0,
+                # Включая ссылки, перенесенные в архив (link_archives)
+                TOTAL_LINKS_ALL: (session.query(func.count(Link.id)).scalar() or 0) +
+                                 (session.query(func.sum(LinkArchive.rows)).scalar() or 0),
+            }
+
+            last_seen = self._select_last_seen(session, now)
+            with self._lock:
+                self._merge_last_seen(last_seen)
+                totals[ACTIVE_USERS_WEEK], totals[ACTIVE_USERS_MONTH] = self._count_active(now)
+
+            day_col = func.date(Link.created_at)
+            rows = session.query(
+                day_col,
+                func.count(Link.id),
+                func.sum(case((Link.is_active == True, 1), else_=0))
+            ).filter(Link.created_at >= since).group_by(day_col).all()
+
+            days = {}
+            for day, created, active in rows:
+                if isinstance(day, str):
+                    day = date.fromisoformat(day)
+                days[day] = [int(created or 0), int(active or 0)]
+
+            for name, value in totals.items():
+                updated = session.execute(
+                    update(StatsRollup).where(StatsRollup.name == name).values(value=value)
+                ).rowcount
+                if not updated:
+                    session.add(StatsRollup(name=name, value=value))
+
+            session.query(LinkDailyStats).filter(
+                LinkDailyStats.day >= since_day
+            ).delete(synchronize_session=False)
+            for day, (created, active) in days.items():
+                session.add(LinkDailyStats(day=day, links_created=created, links_active=active))
+
+        with self._lock:
+            self._totals = dict(totals)
+            self._days = days
+            self._loaded = True
+            self._loaded_at = time.monotonic()
+            self._reconciled_at = datetime.now()
+
+        logger.info(f"✅ Статистика сверена: {totals}")
+        return totals
@@ -0,0 +1,244 @@
+"""
+Кеш профилей пользователей Do Presave Reminder Bot v25+
+Отложенное обновление last_seen_at и имен пользователей
+
+ПЛАН 1: Кеш профилей с отслеживанием изменений (АКТИВНАЯ)
+
+Для известных пользователей сообщение в группе не обращается к БД:
+в памяти отмечается last_seen_at и изменившиеся username/имя, а раз в
+USER_CACHE_FLUSH_INTERVAL секунд все «грязные» профили сбрасываются
+одним INSERT ... ON CONFLICT (user_id) DO UPDATE (на СУБД без него -
+UPDATE по строке, при промахе INSERT). Новые пользователи по-прежнему
+создаются синхронно через get_or_create_user.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Any
+
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+
+from database.models import User
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class UserProfileCache:
+    """Кеш профилей пользователей с пакетным upsert"""
+
+    def __init__(self, db_manager, flush_interval: float = None, max_size: int = None):
+        """Инициализация кеша профилей"""
+        self.db = db_manager
+        self.flush_interval = flush_interval if flush_interval is not None else \
+            float(os.getenv('USER_CACHE_FLUSH_INTERVAL', '5'))
+        self.max_size = max_size if max_size is not None else \
+            int(os.getenv('USER_CACHE_MAX_SIZE', '10000'))
+
+        # user_id -> (username, first_name, last_name), порядок LRU
+        self._known: "OrderedDict[int, tuple]" = OrderedDict()
+        # user_id -> строка для upsert
+        self._dirty: Dict[int, Dict[str, Any]] = {}
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = False
+
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'flushes': 0,
+            'flushed_rows': 0,
+        }
+
+    # ============================================
+    # ПЛАН 1: ЖИЗНЕННЫЙ ЦИКЛ
+    # ============================================
+
+    def start(self):
+        """Запуск фонового сброса профилей"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="user-cache-flusher", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"✅ Кеш профилей запущен (сброс каждые {self.flush_interval}s)")
+
+    def stop(self):
+        """Остановка фонового сброса с финальным сбросом"""
+        self._stop.set()
+        self._started = False
+
+        if self._thread:
+            self._thread.join(timeout=max(self.flush_interval, 5))
+            self._thread = None
+
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"❌ Ошибка финального сброса профилей: {e}")
+
+    def _run(self):
+        """Фоновый цикл сброса"""
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"❌ Ошибка фонового сброса профилей: {e}")
+
+    # ============================================
+    # ПЛАН 1: ОТМЕТКА АКТИВНОСТИ
+    # ============================================
+
+    def touch(self, user_id: int, username: str = None,
+              first_name: str = None, last_name: str = None) -> bool:
+        """
+        Отметка активности известного пользователя без обращения к БД
+
+        Returns:
+            bool: False если пользователь еще не известен кешу
+        """
+        with self._lock:
+            known = self._known.get(user_id)
+            if known is None:
+                self._stats['misses'] += 1
+                return False
+
+            self._known.move_to_end(user_id)
+            self._stats['hits'] += 1
+
+            # Как и get_or_create_user: пустые значения не затирают сохраненные
+            new_profile = (
+                username or known[0],
+                first_name or known[1],
+                last_name or known[2],
+            )
+            self._known[user_id] = new_profile
+
+            self._dirty[user_id] = {
+                'user_id': user_id,
+                'username': new_profile[0],
+                'first_name': new_profile[1],
+                'last_name': new_profile[2],
+                'last_seen_at': datetime.now(),
+            }
+            need_start = not self._started
+            self._started = True
+
+        if need_start:
+            self.start()
+
+        return True
+
+    def remember(self, user_id: int, username: str = None,
+                 first_name: str = None, last_name: str = None):
+        """Запоминание профиля, прочитанного или созданного синхронно"""
+        with self._lock:
+            self._known[user_id] = (username, first_name, last_name)
+            self._known.move_to_end(user_id)
+
+            while len(self._known) > self.max_size:
+                evicted, _ = self._known.popitem(last=False)
+                # Грязная запись вытесненного пользователя уйдет при следующем сбросе
+                logger.debug(f"Профиль {evicted} вытеснен из кеша")
+
+    def forget(self, user_id: int):
+        """Удаление профиля из кеша"""
+        with self._lock:
+            self._known.pop(user_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика кеша профилей"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._known)
+            stats['dirty'] = len(self._dirty)
+        return stats
+
+    # ============================================
+    # ПЛАН 1: ПАКЕТНЫЙ UPSERT
+    # ============================================
+
+    def flush(self) -> int:
+        """Сброс изменившихся профилей одним upsert, возвращает количество"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return 0
+                batch = self._dirty
+                self._dirty = {}
+
+            try:
+                self._upsert(list(batch.values()))
+            except Exception:
+                with self._lock:
+                    # Более свежие отметки, пришедшие во время сброса, важнее
+                    for user_id, row in batch.items():
+                        self._dirty.setdefault(user_id, row)
+                raise
+
+            with self._lock:
+                self._stats['flushes'] += 1
+                self._stats['flushed_rows'] += len(batch)
+
+            logger.debug(f"💾 Профили пользователей сброшены: {len(batch)} шт.")
+            return len(batch)
+
+    def _upsert(self, rows):
+        """INSERT ... ON CONFLICT (user_id) DO UPDATE для PostgreSQL и SQLite"""
+        dialect = self.db.engine.dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            self._merge_rows(rows)
+            return
+
+        stmt = insert(User).values(rows)
+        excluded = stmt.excluded
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[User.user_id],
+            set_={
+                'username': func.coalesce(excluded.username, User.username),
+                'first_name': func.coalesce(excluded.first_name, User.first_name),
+                'last_name': func.coalesce(excluded.last_name, User.last_name),
+                'last_seen_at': excluded.last_seen_at,
+                'updated_at': func.now(),
+            }
+        )
+
+        with self.db.get_session() as session:
+            session.execute(stmt)
+
+    def _merge_rows(self, rows):
+        """Построчный upsert для СУБД без ON CONFLICT: UPDATE, при промахе INSERT"""
+        with self.db.get_session() as session:
+            for row in rows:
+                if self._update_row(session, row):
+                    continue
+                try:
+                    with session.begin_nested():
+                        session.add(User(**row))
+                except IntegrityError:
+                    # Пользователя успели создать параллельно
+                    self._update_row(session, row)
+
+    @staticmethod
+    def _update_row(session, row) -> bool:
+        values = {
+            name: row[name] for name in ('username', 'first_name', 'last_name')
+            if row[name] is not None
+        }
+        return bool(session.execute(
+            update(User).where(User.user_id == row['user_id'])
+            .values(last_seen_at=row['last_seen_at'], updated_at=func.now(), **values)
+        ).rowcount)
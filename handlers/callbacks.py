@@ -8,18 +8,30 @@
 ПЛАН 4: Callback'ы backup (ЗАГЛУШКИ)
 """
 
-from typing import Dict, Callable, Any
+from typing import Dict, Callable, Any, Optional
+import html
 import telebot
 from telebot.types import CallbackQuery
 import os
 
 from database.manager import DatabaseManager
+from database.instrumentation import statement_scope
+from database.pagination import encode_cursor
 from utils.security import SecurityManager
 from utils.logger import get_logger, log_user_action
 from handlers.menu import MenuHandler
 
 logger = get_logger(__name__)
 
+# Префикс callback'ов постраничного списка ссылок:
+# links_page_<scope>_<page>_<cursor>, scope = r<размер> (последние) или u<user_id>;
+# курсор с префиксом p - страница перед ним (кнопка «назад»)
+LINKS_PAGE_PREFIX = 'links_page'
+USER_LINKS_PAGE_SIZE = 20
+
+# Префикс callback'ов страниц поиска: search_page_<ключ запроса>_page_<page>
+SEARCH_PAGE_PREFIX = 'search_page'
+
 class CallbackHandler:
     """Обработчик всех callback'ов (нажатий кнопок)"""
     
@@ -158,7 +170,8 @@ class CallbackHandler:
         def handle_all_callbacks(callback_query: CallbackQuery):
             """Универсальный обработчик всех callback'ов"""
             try:
-                self._process_callback(callback_query)
+                with statement_scope(f"callback:{callback_query.data}"):
+                    self._process_callback(callback_query)
             except Exception as e:
                 logger.error(f"❌ Критическая ошибка callback handler: {e}")
                 try:
@@ -232,6 +245,8 @@ class CallbackHandler:
             'mystats_': self.menu_handler.handle_menu_callback,
             'about_': self.menu_handler.handle_menu_callback,
             'dev_': self._handle_dev_callback,
+            f'{LINKS_PAGE_PREFIX}_': self._handle_links_page,
+            f'{SEARCH_PAGE_PREFIX}_': self._handle_search_page,
             
             # ПЛАН 2: Префиксы кармы (ЗАГЛУШКИ)
             # 'karma_': self._handle_karma_callback,
@@ -519,22 +534,50 @@ class CallbackHandler:
         )
         return keyboard
     
-    def create_pagination_keyboard(self, page: int, total_pages: int, prefix: str) -> telebot.types.InlineKeyboardMarkup:
-        """Создание клавиатуры с пагинацией"""
+    @staticmethod
+    def create_pagination_keyboard(page: int, total_pages: Optional[int], prefix: str,
+                                   next_cursor: str = None, keyset: bool = False,
+                                   prev_cursor: str = None) -> telebot.types.InlineKeyboardMarkup:
+        """
+        Создание клавиатуры с пагинацией
+        
+        В режиме keyset курсор следующей страницы передается в callback_data
+        ({prefix}_{page}_{cursor}), «назад» - курсор первой ссылки текущей
+        страницы с префиксом p ({prefix}_{page}_p{cursor}).
+        """
         keyboard = telebot.types.InlineKeyboardMarkup(row_width=3)
         
         buttons = []
         
-        # Кнопка "Предыдущая страница"
-        if page > 1:
-            buttons.append(telebot.types.InlineKeyboardButton("⬅️", callback_data=f"{prefix}_page_{page-1}"))
-        
-        # Информация о текущей странице
-        buttons.append(telebot.types.InlineKeyboardButton(f"{page}/{total_pages}", callback_data="noop"))
-        
-        # Кнопка "Следующая страница"
-        if page < total_pages:
-            buttons.append(telebot.types.InlineKeyboardButton("➡️", callback_data=f"{prefix}_page_{page+1}"))
+        if keyset:
+            # Возврат к началу списка (пустой курсор)
+            if page > 2:
+                buttons.append(telebot.types.InlineKeyboardButton("⏮", callback_data=f"{prefix}_1_"))
+            
+            if page > 1:
+                back_cursor = f"p{prev_cursor}" if prev_cursor and page > 2 else ""
+                buttons.append(telebot.types.InlineKeyboardButton(
+                    "⬅️", callback_data=f"{prefix}_{page-1}_{back_cursor}"
+                ))
+            
+            page_label = f"{page}/{total_pages}" if total_pages else f"{page}"
+            buttons.append(telebot.types.InlineKeyboardButton(page_label, callback_data="noop"))
+            
+            if next_cursor:
+                buttons.append(telebot.types.InlineKeyboardButton(
+                    "➡️", callback_data=f"{prefix}_{page+1}_{next_cursor}"
+                ))
+        else:
+            # Кнопка "Предыдущая страница"
+            if page > 1:
+                buttons.append(telebot.types.InlineKeyboardButton("⬅️", callback_data=f"{prefix}_page_{page-1}"))
+            
+            # Информация о текущей странице
+            buttons.append(telebot.types.InlineKeyboardButton(f"{page}/{total_pages}", callback_data="noop"))
+            
+            # Кнопка "Следующая страница"
+            if page < total_pages:
+                buttons.append(telebot.types.InlineKeyboardButton("➡️", callback_data=f"{prefix}_page_{page+1}"))
         
         if buttons:
             keyboard.add(*buttons)
@@ -547,6 +590,43 @@ class CallbackHandler:
         
         return keyboard
     
+    def _handle_links_page(self, callback_query: CallbackQuery):
+        """Переход по страницам списка ссылок"""
+        try:
+            payload = callback_query.data[len(LINKS_PAGE_PREFIX) + 1:]
+            scope, page, cursor = payload.split('_', 2)
+            
+            text, keyboard, _ = build_links_page(self.db, scope, int(page), cursor)
+            
+            self.safe_edit_message(callback_query, text, reply_markup=keyboard)
+            self.bot.answer_callback_query(callback_query.id)
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка _handle_links_page: {e}")
+            self.safe_answer_callback(callback_query, "❌ Ошибка загрузки страницы")
+    
+    def _handle_search_page(self, callback_query: CallbackQuery):
+        """Переход по страницам результатов поиска"""
+        try:
+            payload = callback_query.data[len(SEARCH_PAGE_PREFIX) + 1:]
+            key, _, page = payload.split('_', 2)
+            
+            query = self.db.search.lookup_query(key)
+            if query is None:
+                self.safe_answer_callback(
+                    callback_query, "⌛ Результаты устарели, повторите /searchlinks", show_alert=True
+                )
+                return
+            
+            text, keyboard, _ = build_search_page(self.db, query, int(page))
+            
+            self.safe_edit_message(callback_query, text, reply_markup=keyboard)
+            self.bot.answer_callback_query(callback_query.id)
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка _handle_search_page: {e}")
+            self.safe_answer_callback(callback_query, "❌ Ошибка загрузки страницы")
+    
     def safe_answer_callback(self, callback_query: CallbackQuery, text: str, show_alert: bool = False):
         """Безопасная отправка ответа на callback"""
         try:
@@ -582,6 +662,89 @@ class CallbackHandler:
                 logger.error(f"❌ Ошибка fallback отправки: {e2}")
 
 
+def build_links_page(db_manager: DatabaseManager, scope: str, page: int = 1,
+                     cursor: str = None):
+    """
+    Текст и клавиатура страницы списка ссылок (для команд и callback'ов)
+    
+    Заголовок определяется scope, поэтому одинаков на всех страницах.
+    
+    Returns:
+        tuple: (текст, клавиатура или None, количество ссылок на странице)
+    """
+    if scope.startswith('u'):
+        user_id = int(scope[1:])
+        page_size = USER_LINKS_PAGE_SIZE
+        total_pages = None
+    else:
+        user_id = None
+        page_size = int(scope[1:])
+        total_links = db_manager.get_basic_stats().get('total_links', 0)
+        total_pages = max(1, -(-total_links // page_size))
+    
+    backward = bool(cursor) and cursor.startswith('p')
+    if backward:
+        cursor = cursor[1:]
+    if page <= 1:
+        # Первая страница - всегда самые новые ссылки
+        page, cursor, backward = 1, None, False
+    
+    links, next_cursor = db_manager.get_links_page(
+        limit=page_size, cursor=cursor or None, user_id=user_id, backward=backward
+    )
+    
+    if backward and len(links) < page_size:
+        # Выше курсора меньше страницы ссылок (часть очищена) - это уже начало списка
+        page = 1
+        links, next_cursor = db_manager.get_links_page(limit=page_size, user_id=user_id)
+    
+    if user_id:
+        author = links[0]['username'] if links and links[0]['username'] else f"ID{user_id}"
+        title = f"Ссылки пользователя @{author}"
+    else:
+        title = f"Последние {page_size} ссылок"
+    
+    text = db_manager.format_links_for_display(
+        links, title, start_index=(page - 1) * page_size + 1
+    )
+    
+    keyboard = None
+    if next_cursor or page > 1:
+        keyboard = CallbackHandler.create_pagination_keyboard(
+            page, total_pages, f"{LINKS_PAGE_PREFIX}_{scope}",
+            next_cursor=next_cursor, keyset=True,
+            prev_cursor=encode_cursor(links[0]['created_at'], links[0]['id']) if links else None
+        )
+    
+    return text, keyboard, len(links)
+
+
+def build_search_page(db_manager: DatabaseManager, query: str, page: int = 1):
+    """
+    Текст и клавиатура страницы результатов поиска по ссылкам
+    
+    Returns:
+        tuple: (текст, клавиатура или None, всего найдено)
+    """
+    result = db_manager.search_links(query, page)
+    if result is None:
+        return "❌ Ошибка поиска по ссылкам", None, 0
+    
+    title = f"Поиск «{html.escape(query)}»: найдено {result['total']}"
+    start_index = (result['page'] - 1) * db_manager.search.page_size + 1
+    text = db_manager.format_links_for_display(result['links'], title, start_index=start_index)
+    text += f"\n\n⚡ {result['elapsed_ms']} мс ({result['backend']})"
+    
+    keyboard = None
+    if result['total_pages'] > 1:
+        key = db_manager.search.remember_query(query)
+        keyboard = CallbackHandler.create_pagination_keyboard(
+            result['page'], result['total_pages'], f"{SEARCH_PAGE_PREFIX}_{key}"
+        )
+    
+    return text, keyboard, result['total']
+
+
 if __name__ == "__main__":
     """Тестирование CallbackHandler"""
     from database.manager import DatabaseManager
@@ -9,15 +9,18 @@
 """
 
 import os
+import functools
 from datetime import datetime
 from typing import List, Optional
 import telebot
 from telebot.types import Message
 
 from database.manager import DatabaseManager
+from database.instrumentation import statement_scope
 from utils.security import SecurityManager, admin_required, whitelist_required, extract_command_args
 from utils.logger import get_logger, log_user_action, log_admin_action
 from utils.helpers import format_user_mention
+from handlers.callbacks import build_links_page, build_search_page
 
 logger = get_logger(__name__)
 
@@ -32,94 +35,113 @@ class CommandHandler:
         
         logger.info("CommandHandler инициализирован")
     
+    @staticmethod
+    def _scoped(handler):
+        """Обработка команды в отдельной области статистики SQL (детектор N+1)"""
+        @functools.wraps(handler)
+        def wrapper(message: Message):
+            with statement_scope(f"command:{handler.__name__}"):
+                return handler(message)
+        return wrapper
+    
     def register_handlers(self):  # ← ПРАВИЛЬНОЕ ИМЯ!
         """Регистрация всех обработчиков команд"""
         
         # ПЛАН 1: Базовые команды (АКТИВНЫЕ)
         self.bot.register_message_handler(
-            self.cmd_start,
+            self._scoped(self.cmd_start),
             commands=['start']
         )
         
         self.bot.register_message_handler(
-            self.cmd_help,
+            self._scoped(self.cmd_help),
             commands=['help']
         )
         
         self.bot.register_message_handler(
-            self.cmd_mystat,
+            self._scoped(self.cmd_mystat),
             commands=['mystat']
         )
         
         self.bot.register_message_handler(
-            self.cmd_last10links,
+            self._scoped(self.cmd_last10links),
             commands=['last10links']
         )
         
         self.bot.register_message_handler(
-            self.cmd_last30links,
+            self._scoped(self.cmd_last30links),
             commands=['last30links']
         )
 
         # Команды меню (только админы)
         self.bot.register_message_handler(
-            self.cmd_menu,
+            self._scoped(self.cmd_menu),
             commands=['menu']
         )
         
         self.bot.register_message_handler(
-            self.cmd_resetmenu,
+            self._scoped(self.cmd_resetmenu),
             commands=['resetmenu']
         )
         
         self.bot.register_message_handler(
-            self.cmd_about25,
+            self._scoped(self.cmd_about25),
             commands=['about25']
         )
 
         # Команды управления ботом (только админы)
         self.bot.register_message_handler(
-            self.cmd_enablebot,
+            self._scoped(self.cmd_enablebot),
             commands=['enablebot']
         )
         
         self.bot.register_message_handler(
-            self.cmd_disablebot,
+            self._scoped(self.cmd_disablebot),
             commands=['disablebot']
         )
         
         # Команды режимов лимитов (только админы)
         self.bot.register_message_handler(
-            self.cmd_setmode_conservative,
+            self._scoped(self.cmd_setmode_conservative),
             commands=['setmode_conservative']
         )
         
         self.bot.register_message_handler(
-            self.cmd_setmode_normal,
+            self._scoped(self.cmd_setmode_normal),
             commands=['setmode_normal']
         )
         
         self.bot.register_message_handler(
-            self.cmd_setmode_burst,
+            self._scoped(self.cmd_setmode_burst),
             commands=['setmode_burst']
         )
         
         self.bot.register_message_handler(
-            self.cmd_setmode_adminburst,
+            self._scoped(self.cmd_setmode_adminburst),
             commands=['setmode_adminburst']
         )
         
         self.bot.register_message_handler(
-            self.cmd_currentmode,
+            self._scoped(self.cmd_currentmode),
             commands=['currentmode']
         )
         
         # Команды аналитики (только админы)
         self.bot.register_message_handler(
-            self.cmd_linksby,
+            self._scoped(self.cmd_linksby),
             commands=['linksby']
         )
         
+        self.bot.register_message_handler(
+            self._scoped(self.cmd_backfillactivity),
+            commands=['backfillactivity']
+        )
+        
+        self.bot.register_message_handler(
+            self._scoped(self.cmd_searchlinks),
+            commands=['searchlinks']
+        )
+        
         # ПЛАН 2: Команды кармы (ЗАГЛУШКИ)
         # self.bot.register_message_handler(
         #     self.cmd_karma,
@@ -157,11 +179,11 @@ class CommandHandler:
         #     commands=['checkapprovals']
         # )
         
-        # ПЛАН 4: Команды backup (ЗАГЛУШКИ)
-        # self.bot.register_message_handler(
-        #     self.cmd_downloadsql,
-        #     commands=['downloadsql']
-        # )
+        # ПЛАН 4: Команды backup
+        self.bot.register_message_handler(
+            self._scoped(self.cmd_downloadsql),
+            commands=['downloadsql']
+        )
         
         # self.bot.register_message_handler(
         #     self.cmd_backupstatus,
@@ -279,10 +301,13 @@ class CommandHandler:
 /last10links - Последние 10 ссылок в пресейвах
 /last30links - Последние 30 ссылок в пресейвах
 /linksby @username - Ссылки конкретного пользователя
+/backfillactivity - Пересчитать активность по дням
+/searchlinks запрос - Поиск по ссылкам и тексту постов (артист, домен, релиз)
 
 ⚙️ <b>Управление ботом:</b>
 /enablebot - Активировать офигенного бота
 /disablebot - До скорой встречи)
+/downloadsql - Скачать backup базы (только в личке с ботом)
 
 ⚡ <b>Режимы лимитов Telegram API:</b>
 /setmode_conservative - Режим <b>Консерва</b> (60/час)
@@ -296,11 +321,11 @@ class CommandHandler:
 • /karmastat - Рейтинг по карме. Все на карандаше хD
 • /askpresave - Интерактивная форма пресейва прикола ради
 • /claimpresave - Заявка о совершенном пресейве (админы смогут аппрувить проверенные совершенные пресейвы, а это - плюс в карму)
-• /downloadsql - Backup базы д... Ой, всё
 • И многое другое...
 
 💡 <b>Примеры использования:</b>
 • <code>/linksby @username</code> - ссылки пользователя
+• <code>/searchlinks spotify</code> - все посты со ссылками на Spotify
 • <code>/setmode_burst</code> - установить быстрый режим
 • <code>/menu</code> - открыть интерактивное меню
 • <code>/karma @username +1</code>  - повысить карму на 1 пункт 😇 А можно и понизить... и не на один 😈
@@ -486,24 +511,19 @@ class CommandHandler:
             user_id = message.from_user.id
             log_user_action(logger, user_id, f"запросил последние {count} ссылок")
             
-            # ✅ ИСПРАВЛЕНИЕ: Используем безопасный метод
-            links = self.db.get_recent_links_safe(count)
-            
-            # ✅ ИСПРАВЛЕНИЕ: Используем красивое форматирование
-            formatted_text = self.db.format_links_for_display(
-                links, 
-                f"Последние {count} ссылок"
-            )
+            # Первая страница keyset-пагинации, дальше - кнопками «⬅️»/«➡️»
+            formatted_text, keyboard, found = build_links_page(self.db, f"r{count}")
             
             # Отправляем результат
             self.bot.send_message(
                 message.chat.id,
                 formatted_text,
                 parse_mode='HTML',
+                reply_markup=keyboard,
                 message_thread_id=thread_id
             )
             
-            logger.info(f"✅ Показано последние {count} ссылок ({len(links)} найдено)")
+            logger.info(f"✅ Показано последние {count} ссылок ({found} найдено)")
             
         except Exception as e:
             logger.error(f"❌ Ошибка _show_recent_links: {e}")
@@ -729,10 +749,15 @@ class CommandHandler:
             
             username = args[0].lstrip('@')
             
-            # ✅ ИСПРАВЛЕНИЕ: Используем безопасный метод
-            links = self.db.get_links_by_username_safe(username, limit=20)
+            target_user_id = self.db.get_user_id_by_username(username)
+            
+            if target_user_id:
+                # Первая страница keyset-пагинации, дальше - кнопками «⬅️»/«➡️»
+                formatted_text, keyboard, found = build_links_page(self.db, f"u{target_user_id}")
+            else:
+                found = 0
             
-            if not links:
+            if not found:
                 self.bot.send_message(
                     message.chat.id,
                     f"🔍 <b>Ссылки пользователя @{username}</b>\n\n"
@@ -742,22 +767,13 @@ class CommandHandler:
                 )
                 return
             
-            # ✅ ИСПРАВЛЕНИЕ: Используем красивое форматирование
-            formatted_text = self.db.format_links_for_display(
-                links, 
-                f"Ссылки пользователя @{username}"
-            )
-            
-            # Добавляем статистику в конец
-            if len(links) >= 20:
-                formatted_text += f"\n\n💡 Показано последние 20 ссылок. Всего может быть больше."
-            
             log_admin_action(logger, user_id, f"запросил ссылки пользователя @{username}")
             
             self.bot.send_message(
                 message.chat.id,
                 formatted_text,
                 parse_mode='HTML',
+                reply_markup=keyboard,
                 message_thread_id=thread_id
             )
             
@@ -769,6 +785,89 @@ class CommandHandler:
                 message_thread_id=getattr(message, 'message_thread_id', None)
             )
     
+    @admin_required
+    def cmd_backfillactivity(self, message: Message):
+        """Команда /backfillactivity - пересчет агрегатов активности по истории ссылок"""
+        # Определяем thread_id СРАЗУ, до try блока
+        thread_id = getattr(message, 'message_thread_id', None)
+        
+        try:
+            user_id = message.from_user.id
+            
+            self.bot.send_message(
+                message.chat.id,
+                "⏳ Пересчет активности по истории ссылок...",
+                message_thread_id=thread_id
+            )
+            
+            result = self.db.backfill_activity()
+            if not result:
+                raise RuntimeError("пересчет не выполнен")
+            
+            log_admin_action(logger, user_id, f"пересчитал активность: {result}")
+            
+            self.bot.send_message(
+                message.chat.id,
+                f"✅ <b>Активность пересчитана</b>\n\n"
+                f"🔗 Ссылок обработано: {result['links']}\n"
+                f"📦 Корзин активности: {result['buckets']}",
+                parse_mode='HTML',
+                message_thread_id=thread_id
+            )
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка cmd_backfillactivity: {e}")
+            self.bot.send_message(
+                message.chat.id,
+                "❌ Ошибка при пересчете активности",
+                message_thread_id=getattr(message, 'message_thread_id', None)
+            )
+    
+    @admin_required
+    def cmd_searchlinks(self, message: Message):
+        """Команда /searchlinks запрос - поиск по URL и тексту сообщений со ссылками"""
+        # Определяем thread_id СРАЗУ, до try блока
+        thread_id = getattr(message, 'message_thread_id', None)
+        
+        try:
+            user_id = message.from_user.id
+            args = extract_command_args(message)
+            
+            if not args:
+                self.bot.send_message(
+                    message.chat.id,
+                    "❌ <b>Неверный формат команды!</b>\n\n"
+                    "📝 <b>Правильный формат:</b>\n"
+                    "<code>/searchlinks запрос</code>\n\n"
+                    "💡 <b>Примеры:</b>\n"
+                    "<code>/searchlinks spotify</code>\n"
+                    "<code>/searchlinks имя артиста</code>",
+                    parse_mode='HTML',
+                    message_thread_id=thread_id
+                )
+                return
+            
+            query = " ".join(args)
+            formatted_text, keyboard, found = build_search_page(self.db, query)
+            
+            log_admin_action(logger, user_id, f"искал ссылки: {query} (найдено {found})")
+            
+            self.bot.send_message(
+                message.chat.id,
+                formatted_text,
+                parse_mode='HTML',
+                reply_markup=keyboard,
+                message_thread_id=thread_id
+            )
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка cmd_searchlinks: {e}")
+            self.bot.send_message(
+                message.chat.id,
+                "❌ Ошибка поиска по ссылкам",
+                message_thread_id=getattr(message, 'message_thread_id', None)
+            )
+    
     # @admin_required # Если хочется ограничить юзеров
     @whitelist_required
     def cmd_menu(self, message: Message):
@@ -979,49 +1078,59 @@ class CommandHandler:
     #         )
     
     # ============================================
-    # ПЛАН 4: КОМАНДЫ BACKUP (ЗАГЛУШКИ)
+    # ПЛАН 4: КОМАНДЫ BACKUP
     # ============================================
     
-    # @admin_required
-    # def cmd_downloadsql(self, message: Message):
-    #     """Команда /downloadsql - создание backup БД"""
-    #     # Определяем thread_id СРАЗУ, до try блока
-    #     thread_id = getattr(message, 'message_thread_id', None)
-    #     
-    #     try:
-    #         # Проверяем что это личка
-    #         if message.chat.type != 'private':
-    #             self.bot.send_message(
-    #                 message.chat.id,
-    #                 "❌ Команда /downloadsql доступна только в личных сообщениях боту!",
-    #                 message_thread_id=thread_id
-    #             )
-    #             return
-    #         
-    #         from services.backup_restore import BackupRestoreManager
-    #         backup_manager = BackupRestoreManager(self.db, None)  # Передаем config
-    #         
-    #         # Создаем backup
-    #         backup_file, filename = backup_manager.export_full_database()
-    #         
-    #         # Отправляем файл
-    #         self.bot.send_document(
-    #             message.chat.id,
-    #             backup_file,
-    #             visible_file_name=filename,
-    #             caption="💾 Backup базы данных создан успешно!"
-    #         )
-    #         
-    #         log_admin_action(logger, message.from_user.id, f"создал backup БД: {filename}")
-    #         
-    #     except Exception as e:
-    #         logger.error(f"❌ Ошибка cmd_downloadsql: {e}")
-    #         self.bot.send_message(
-    #             message.chat.id,
-    #             "❌ Ошибка при создании backup",
-    #             message_thread_id=getattr(message, 'message_thread_id', None)
-    #         )
-
+    @admin_required
+    def cmd_downloadsql(self, message: Message):
+        """Команда /downloadsql - создание backup БД"""
+        # Определяем thread_id СРАЗУ, до try блока
+        thread_id = getattr(message, 'message_thread_id', None)
+        
+        try:
+            # Проверяем что это личка
+            if message.chat.type != 'private':
+                self.bot.send_message(
+                    message.chat.id,
+                    "❌ Команда /downloadsql доступна только в личных сообщениях боту!",
+                    message_thread_id=thread_id
+                )
+                return
+            
+            from services.backup_restore import BackupRestoreManager, validate_backup_file_size
+            backup_manager = BackupRestoreManager(self.db)
+            
+            self.bot.send_message(message.chat.id, "⏳ Создаю backup базы данных...")
+            
+            # Дамп пишется потоково во временный файл, в память не загружается
+            backup_path, filename = backup_manager.export_full_database()
+            try:
+                if not validate_backup_file_size(os.path.getsize(backup_path)):
+                    self.bot.send_message(
+                        message.chat.id,
+                        "❌ Backup больше лимита BACKUP_MAX_SIZE_MB, Telegram его не примет"
+                    )
+                    return
+                
+                with open(backup_path, 'rb') as backup_file:
+                    self.bot.send_document(
+                        message.chat.id,
+                        backup_file,
+                        visible_file_name=filename,
+                        caption="💾 Backup базы данных создан успешно!"
+                    )
+            finally:
+                os.unlink(backup_path)
+            
+            log_admin_action(logger, message.from_user.id, f"создал backup БД: {filename}")
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка cmd_downloadsql: {e}")
+            self.bot.send_message(
+                message.chat.id,
+                "❌ Ошибка при создании backup",
+                message_thread_id=getattr(message, 'message_thread_id', None)
+            )
 
 if __name__ == "__main__":
     """Тестирование CommandHandler"""
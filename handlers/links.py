@@ -18,6 +18,7 @@ from telebot.types import Message
 from database.manager import DatabaseManager
 from utils.security import SecurityManager
 from utils.logger import get_logger, log_user_action
+from utils.urls import url_hash
 from config import Config
 
 logger = get_logger(__name__)
@@ -109,6 +110,11 @@ class LinkHandler:
             
             log_user_action(logger, user_id, f"опубликовал {len(urls)} ссылок в топике {thread_id}")
             
+            # Повторы: та же каноническая ссылка уже была в топике недавно (один запрос)
+            repeated = len(self.db.find_recent_links(urls, thread_id))
+            if repeated:
+                logger.info(f"♻️ Повторных ссылок в топике {thread_id}: {repeated} из {len(urls)}")
+            
             # Сохраняем ссылки в БД
             self._save_links_to_database(user_id, urls, text, message_id, thread_id)
             
@@ -116,7 +122,7 @@ class LinkHandler:
             # self._update_request_count(user_id, len(urls))
             
             # Отправляем напоминание о взаимности
-            self._send_reminder_message(message, len(urls))
+            self._send_reminder_message(message, len(urls), repeated)
             
             # ПЛАН 3: Уведомление о новой заявке админам (ЗАГЛУШКА)
             # if self._is_presave_link(urls):
@@ -130,14 +136,21 @@ class LinkHandler:
         try:
             urls = self.url_pattern.findall(text)
             
-            # Очистка и валидация URL
+            # Очистка и валидация URL; повторы внутри сообщения - по каноническому виду
             cleaned_urls = []
+            seen_hashes = set()
             for url in urls:
                 # Убираем лишние символы в конце
                 url = url.rstrip('.,!?;)')
                 
                 # Проверяем что URL валидный
-                if self._is_valid_url(url):
+                if not self._is_valid_url(url):
+                    continue
+                
+                # Сохраняется ссылка как есть, канонический вид - только для хеша
+                hash_value = url_hash(url)
+                if hash_value not in seen_hashes:
+                    seen_hashes.add(hash_value)
                     cleaned_urls.append(url)
             
             logger.info(f"🔍 Извлечено {len(cleaned_urls)} валидных URL из {len(urls)} найденных")
@@ -169,10 +182,10 @@ class LinkHandler:
     
     def _save_links_to_database(self, user_id: int, urls: List[str], 
                                message_text: str, message_id: int, thread_id: int):
-        """Сохранение ссылок в базу данных"""
+        """Сохранение ссылок в базу данных (через буфер пакетной записи)"""
         try:
             for url in urls:
-                self.db.add_link(
+                self.db.enqueue_link(
                     user_id=user_id,
                     url=url,
                     message_text=message_text,
@@ -180,12 +193,13 @@ class LinkHandler:
                     thread_id=thread_id
                 )
             
-            logger.info(f"✅ Сохранено {len(urls)} ссылок от пользователя {user_id}")
+            logger.info(f"✅ В очередь записи поставлено {len(urls)} ссылок от пользователя {user_id}")
             
         except Exception as e:
             logger.error(f"❌ Ошибка _save_links_to_database: {e}")
     
-    def _send_reminder_message(self, original_message: Message, links_count: int):
+    def _send_reminder_message(self, original_message: Message, links_count: int,
+                               repeated_count: int = 0):
         """Отправка напоминания о взаимности"""
         try:
             # Проверяем лимиты API и delay
@@ -206,16 +220,21 @@ class LinkHandler:
             if links_count > 1:
                 reminder_text += f"\n\n📊 Обнаружено ссылок: {links_count}"
             
+            if repeated_count:
+                reminder_text += (
+                    "\n\n♻️ Эта ссылка уже недавно публиковалась в топике"
+                    if links_count == 1 else
+                    f"\n\n♻️ Уже недавно публиковались в топике: {repeated_count}"
+                )
+            
             # Отправляем напоминание
             self.bot.reply_to(original_message, reminder_text)
             
             log_user_action(logger, original_message.from_user.id, 
                            f"получил напоминание о {links_count} ссылках")
             
-            # Обновляем счетчик напоминаний
-            current_count = self.db.get_setting('reminder_count', 0)
-            self.db.set_setting('reminder_count', current_count + 1, 'int', 
-                               'Количество отправленных напоминаний')
+            # Обновляем счетчик напоминаний (атомарно, пакетным сбросом)
+            self.db.increment_counter('reminder_count')
             
         except Exception as e:
             logger.error(f"❌ Ошибка _send_reminder_message: {e}")
@@ -489,7 +508,7 @@ class LinkHandler:
                     'links_today': today_links,
                     'unique_users_with_links': unique_users,
                     'top_users': top_users,
-                    'reminder_count': self.db.get_setting('reminder_count', 0)
+                    'reminder_count': self.db.get_counter('reminder_count')
                 })
             
             return stats
@@ -12,7 +12,9 @@ from typing import List, Dict, Any, Optional, Tuple
 import telebot
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton, Message
 import os
+import html
 from database.manager import DatabaseManager
+from database.activity_rollup import render_bar_chart
 from utils.security import SecurityManager, admin_required, whitelist_required
 from utils.logger import get_logger, log_user_action
 from utils.helpers import format_user_mention
@@ -112,6 +114,9 @@ class MenuHandler:
         # Структура меню для всех планов
         self.menu_structure = self._build_menu_structure()
         
+        # Прогресс фоновых пакетных операций - правкой исходного сообщения
+        self.db.bulk_jobs.add_listener(self._on_bulk_job_progress)
+        
         logger.info("MenuHandler инициализирован")
     
     def _build_menu_structure(self) -> Dict[str, Any]:
@@ -215,6 +220,8 @@ class MenuHandler:
                 'description': 'Детальная аналитика по пользователям',
                 'buttons': [
                     ('🔗 Ссылки по @username', 'analytics_links_by_user'),
+                    ('📅 Активность по дням', 'analytics_daily_activity'),
+                    ('🔎 Поиск по ссылкам', 'analytics_search_links'),
                     # ПЛАН 2: Аналитика кармы (ЗАГЛУШКА)
                     # ('🏆 Карма по @username', 'analytics_karma_by_user'),
                     # ('⚖️ Соотношение по @username', 'analytics_ratio_by_user'),
@@ -245,6 +252,7 @@ class MenuHandler:
                     ('🔍 Проверка системы', 'diag_system_check'),
                     ('📊 Статус и статистика бота', 'diag_bot_status'),
                     ('🔗 Проверка LinkHandler', 'diag_link_integration'),  # ← НОВАЯ КНОПКА
+                    ('🧮 Статистика SQL', 'diag_sql_stats'),
                     ('🔙 Назад', 'menu_main'),
                     ('🏠 Главное меню', 'menu_main')
                 ]
@@ -386,7 +394,8 @@ class MenuHandler:
                 f"• Админов: {stats.get('total_admins', 0)}",
                 f"• Ссылок всего: {stats.get('total_links', 0)}",
                 f"• Ссылок сегодня: {stats.get('links_today', 0)}",
-                f"• Активных за неделю: {stats.get('active_users_week', 0)}"
+                f"• Активных за неделю: {stats.get('active_users_week', 0)}",
+                f"• Напоминаний отправлено: {stats.get('reminders_sent', 0)}"
             ])
         
         return "\n".join(message_parts)
@@ -708,6 +717,8 @@ class MenuHandler:
             self._toggle_bot_status(callback_query, False)
         elif data == 'action_clear_links':
             self._clear_links(callback_query)
+        elif data.startswith('action_cancel_job_'):
+            self._cancel_bulk_job(callback_query)
         elif data == 'action_current_mode':
             self._show_current_mode(callback_query)
         elif data == 'action_reload_modes':
@@ -803,27 +814,29 @@ class MenuHandler:
             )
     
     def _clear_links(self, callback_query):
-        """Очистка истории ссылок"""
+        """Очистка истории ссылок (фоновое пакетное задание)"""
         try:
-            count = self.db.clear_all_links()
+            job = self.db.start_clear_links(
+                created_by=callback_query.from_user.id,
+                chat_id=callback_query.message.chat.id,
+                message_id=callback_query.message.message_id
+            )
+            
+            if not job:
+                self.bot.answer_callback_query(
+                    callback_query.id,
+                    "❌ Ошибка очистки ссылок"
+                )
+                return
             
             self.bot.answer_callback_query(
                 callback_query.id,
-                f"🗑️ Очищено ссылок: {count}",
-                show_alert=True
+                f"🗑️ Очистка запущена (задание #{job['id']})"
             )
             
-            # Остаемся в меню настроек
-            text = self.get_menu_message('settings')
-            keyboard = self.create_keyboard('settings')
-            
-            self.bot.edit_message_text(
-                text,
-                callback_query.message.chat.id,
-                callback_query.message.message_id,
-                reply_markup=keyboard,
-                parse_mode='HTML'
-            )
+            if job['chat_id'] == callback_query.message.chat.id and \
+                    job['message_id'] == callback_query.message.message_id:
+                self._on_bulk_job_progress(job)
             
         except Exception as e:
             logger.error(f"❌ Ошибка _clear_links: {e}")
@@ -832,6 +845,63 @@ class MenuHandler:
                 "❌ Ошибка очистки ссылок"
             )
     
+    def _cancel_bulk_job(self, callback_query):
+        """Отмена фонового пакетного задания"""
+        try:
+            job_id = int(callback_query.data.rsplit('_', 1)[-1])
+            cancelled = self.db.cancel_bulk_job(job_id)
+            
+            self.bot.answer_callback_query(
+                callback_query.id,
+                "⛔ Отмена принята, задание остановится после текущего пакета" if cancelled
+                else "ℹ️ Задание уже завершено"
+            )
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка _cancel_bulk_job: {e}")
+            self.bot.answer_callback_query(
+                callback_query.id,
+                "❌ Ошибка отмены задания"
+            )
+    
+    def _on_bulk_job_progress(self, job: Dict[str, Any]):
+        """Обновление сообщения, из которого запущено пакетное задание"""
+        if not job.get('chat_id') or not job.get('message_id'):
+            return
+        
+        filled = int(job['progress'] * 10)
+        text_parts = [
+            f"{job['title']} <b>(задание #{job['id']})</b>\n",
+            f"{'█' * filled}{'░' * (10 - filled)} {job['progress'] * 100:.0f}%",
+            f"📎 Обработано ссылок: {job['processed']}",
+        ]
+        
+        if job['status'] == 'running':
+            keyboard = InlineKeyboardMarkup()
+            keyboard.add(InlineKeyboardButton(
+                '⛔ Отменить', callback_data=f"action_cancel_job_{job['id']}"
+            ))
+        else:
+            status_text = {
+                'done': '✅ Завершено',
+                'cancelled': '⛔ Отменено',
+                'failed': f"❌ Ошибка: {job.get('error') or 'неизвестно'}",
+            }.get(job['status'], job['status'])
+            text_parts.append(f"\n{status_text}")
+            keyboard = self.create_keyboard('settings')
+        
+        try:
+            self.bot.edit_message_text(
+                "\n".join(text_parts),
+                job['chat_id'],
+                job['message_id'],
+                reply_markup=keyboard,
+                parse_mode='HTML'
+            )
+        except Exception as e:
+            # «message is not modified» и удаленные сообщения не мешают заданию
+            logger.debug(f"Прогресс задания #{job['id']} не обновлен: {e}")
+    
     def _handle_limit_setting(self, callback_query):
         """Обработка настройки лимитов"""
         data = callback_query.data
@@ -914,6 +984,20 @@ class MenuHandler:
                 parse_mode='HTML',
                 message_thread_id=thread_id
             )
+        elif data == 'analytics_daily_activity':
+            self._show_daily_activity(callback_query)
+        elif data == 'analytics_search_links':
+            thread_id = getattr(callback_query.message, 'message_thread_id', None)
+            
+            self.bot.answer_callback_query(callback_query.id)
+            self.bot.send_message(
+                callback_query.message.chat.id,
+                "🔎 <b>Поиск по ссылкам</b>\n\n"
+                "Ищет по адресам ссылок и тексту постов: артист, домен, название релиза.\n"
+                "Отправьте команду: <code>/searchlinks запрос</code>",
+                parse_mode='HTML',
+                message_thread_id=thread_id
+            )
         # ПЛАН 2: Дополнительная аналитика (ЗАГЛУШКИ)
         # elif data == 'analytics_karma_by_user':
         #     # Аналитика кармы по пользователю
@@ -937,6 +1021,8 @@ class MenuHandler:
             self._show_bot_status(callback_query)
         elif data == 'diag_link_integration':
             self._check_link_integration(callback_query)
+        elif data == 'diag_sql_stats':
+            self._show_sql_stats(callback_query)
         else:
             self.bot.answer_callback_query(
                 callback_query.id,
@@ -1008,6 +1094,58 @@ class MenuHandler:
         except:
             return False
     
+    def _show_sql_stats(self, callback_query):
+        """Показ статистики SQL запросов и подозрений на N+1"""
+        try:
+            report = self.db.get_sql_stats(top=5)
+            
+            text_parts = [
+                "🧮 <b>Статистика SQL</b>\n",
+                f"• Запросов: {report['statements']}",
+                f"• Суммарное время: {report['total_ms']:.0f} мс",
+                f"• Уникальных запросов: {report['fingerprints']}",
+                "",
+                "🐢 <b>Самые затратные:</b>"
+            ]
+            
+            for i, item in enumerate(report['top'], 1):
+                sql = html.escape(item['fingerprint'][:120])
+                text_parts.append(
+                    f"{i}. {item['count']}× avg {item['avg_ms']} мс, "
+                    f"p95 ≤{item['p95_ms']:.0f} мс, max {item['max_ms']} мс"
+                )
+                text_parts.append(f"   <code>{sql}</code>")
+            
+            if not report['top']:
+                text_parts.append("🤷 Запросов пока не было")
+            
+            text_parts.extend(["", "🔁 <b>Вероятные N+1:</b>"])
+            for suspect in report['n_plus_one'][:3]:
+                text_parts.append(
+                    f"• {html.escape(suspect['scope'])}: {suspect['count']}× "
+                    f"<code>{html.escape(suspect['fingerprint'][:100])}</code>"
+                )
+            
+            if not report['n_plus_one']:
+                text_parts.append("✅ Не обнаружены")
+            
+            self.bot.edit_message_text(
+                "\n".join(text_parts),
+                callback_query.message.chat.id,
+                callback_query.message.message_id,
+                reply_markup=self.create_keyboard('diagnostics'),
+                parse_mode='HTML'
+            )
+            
+            self.bot.answer_callback_query(callback_query.id)
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка _show_sql_stats: {e}")
+            self.bot.answer_callback_query(
+                callback_query.id,
+                "❌ Ошибка получения статистики SQL"
+            )
+    
     def _show_bot_status(self, callback_query):
         """Показ статуса бота"""
         try:
@@ -1024,6 +1162,7 @@ class MenuHandler:
                 "📎 <b>Ссылки:</b>",
                 f"• Всего: {stats.get('total_links', 0)}",
                 f"• Сегодня: {stats.get('links_today', 0)}",
+                f"• Напоминаний отправлено: {stats.get('reminders_sent', 0)}",
                 "",
                 "⚙️ <b>Настройки:</b>",
                 f"• Бот: {'✅ Активен' if settings.get('bot_enabled', True) else '⏸️ Отключен'}",
@@ -1144,18 +1283,18 @@ class MenuHandler:
     def _show_user_activity(self, callback_query, user_id):
         """Показ активности пользователя по дням"""
         try:
-            # Используем существующий метод get_user_stats для получения базовой статистики
-            stats = self.db.get_user_stats(user_id)
+            # Агрегаты активности: до 14 дневных строк, без чтения таблицы links
+            days = self.db.get_daily_activity(14, user_id=user_id)
+            total = sum(count for _, count in days)
             
             text = "📅 <b>Активность по дням</b>\n\n"
-            if not stats:
-                text += "Данных об активности пока нет."
+            if not total:
+                text += "За последние 14 дней ссылок не было."
             else:
-                text += f"📊 Всего ссылок: {stats.get('total_links', 0)}\n"
-                text += f"📅 Ссылок за месяц: {stats.get('links_this_month', 0)}\n"
-                text += f"👤 Участник с: {stats.get('member_since', 'Неизвестно')}\n"
-                text += f"🕒 Последняя активность: {stats.get('last_seen', 'Неизвестно')}\n\n"
-                text += "⚠️ Детальная активность по дням будет доступна в следующих обновлениях."
+                active_days = sum(1 for _, count in days if count)
+                text += f"📊 Ссылок за 14 дней: {total}\n"
+                text += f"📆 Активных дней: {active_days} из {len(days)}\n\n"
+                text += f"<code>{render_bar_chart(days)}</code>"
             
             keyboard = self.create_keyboard('mystats')
             
@@ -1593,12 +1732,39 @@ class MenuHandler:
             )
 
     def _show_daily_activity(self, callback_query):
-        """ЗАГЛУШКА: Показ активности по дням"""
-        self.bot.answer_callback_query(
-            callback_query.id,
-            "📅 Статистика активности по дням будет доступна в следующих версиях",
-            show_alert=True
-        )
+        """Показ активности группы по дням и топикам"""
+        try:
+            days = self.db.get_daily_activity(14)
+            threads = self.db.get_thread_activity(14)
+            total = sum(count for _, count in days)
+            
+            text = "📅 <b>Активность группы по дням</b>\n\n"
+            if not total:
+                text += "За последние 14 дней ссылок не было."
+            else:
+                text += f"📊 Ссылок за 14 дней: {total}\n\n"
+                text += f"<code>{render_bar_chart(days)}</code>\n\n"
+                text += "🧵 <b>По топикам:</b>\n"
+                for thread_id, count in sorted(threads.items(), key=lambda item: item[1], reverse=True)[:10]:
+                    name = f"#{thread_id}" if thread_id else "без топика"
+                    text += f"• {name}: {count}\n"
+            
+            self.bot.edit_message_text(
+                text,
+                callback_query.message.chat.id,
+                callback_query.message.message_id,
+                reply_markup=self.create_keyboard('analytics'),
+                parse_mode='HTML'
+            )
+            
+            self.bot.answer_callback_query(callback_query.id)
+            
+        except Exception as e:
+            logger.error(f"❌ Ошибка _show_daily_activity: {e}")
+            self.bot.answer_callback_query(
+                callback_query.id,
+                "❌ Ошибка загрузки активности"
+            )
 
     def _show_my_ranking(self, callback_query):
         """ЗАГЛУШКА: Показ рейтинга пользователя"""
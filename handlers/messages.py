@@ -14,6 +14,7 @@ import telebot
 from telebot.types import Message
 
 from database.manager import DatabaseManager
+from database.instrumentation import statement_scope
 from utils.security import SecurityManager
 from utils.logger import get_logger, log_user_action
 from handlers.links import LinkHandler
@@ -32,6 +33,9 @@ class MessageHandler:
         # Интеграция с обработчиком ссылок
         self.link_handler = None  # Будет инициализирован в main.py
         
+        # Дневные счетчики модуля user_management (DailyStatsAccumulator)
+        self.daily_stats = None
+        
         # Паттерны для обработки
         self.url_pattern = re.compile(
             r'https?://(?:[-\w.])+(?:[:\d]+)?(?:/(?:[\w/_.])*(?:\?(?:[\w&=%.])*)?(?:\#(?:[\w.])*)?)?',
@@ -55,6 +59,11 @@ class MessageHandler:
         else:
             logger.error("❌ КРИТИЧЕСКАЯ ОШИБКА: Метод handle_link_message отсутствует в LinkHandler!")
 
+    def set_daily_stats(self, daily_stats):
+        """Подключение дневной статистики модуля user_management (messages_sent)"""
+        self.daily_stats = daily_stats
+        logger.info("✅ Дневная статистика подключена к MessageHandler")
+
     def is_link_handler_ready(self) -> bool:
         """Проверка готовности LinkHandler"""
         return self.link_handler is not None and hasattr(self.link_handler, 'handle_link_message')
@@ -76,7 +85,8 @@ class MessageHandler:
         def handle_text_message(message: Message):
             """Обработка текстовых сообщений (исключая команды)"""
             try:
-                self._process_text_message(message)
+                with statement_scope("message:text"):
+                    self._process_text_message(message)
             except Exception as e:
                 logger.error(f"❌ Критическая ошибка message handler: {e}")
         
@@ -109,8 +119,8 @@ class MessageHandler:
             if text.startswith('/'):
                 return
             
-            # Регистрируем пользователя
-            self.db.get_or_create_user(
+            # Регистрируем пользователя (известные - через кеш профилей)
+            self.db.touch_user(
                 user_id,
                 message.from_user.username,
                 message.from_user.first_name,
@@ -189,6 +199,10 @@ class MessageHandler:
                 logger.info("🔒 Бот отключен, игнорируем сообщения")
                 return  # Бот отключен, игнорируем сообщения
             
+            # Счетчик сообщений за день: прирост в памяти, в БД - пакетным сбросом
+            if self.daily_stats is not None:
+                self.daily_stats.record(user_id, message.chat.id, messages_sent=1)
+            
             # ПЛАН 3: Проверка на упоминание бота (ЗАГЛУШКА)
             # if self._is_bot_mentioned(text):
             #     self._handle_bot_mention(message)
@@ -7,8 +7,13 @@ Do Presave Reminder Bot v29.07
 """
 
 from .module import UserManagementModule
-from .models import MusicUser, KarmaHistory
+from .models import MusicUser, KarmaHistory, KarmaSnapshot
 from .services import UserService
+from .ledger import KarmaLedger
+from .leaderboard import LeaderboardIndex
+from .group_stats import GroupStatsCache
+from .user_index import UsernameIndex
+from .daily_stats import DailyStatsAccumulator
 from .handlers import UserManagementHandlers
 from .validators import (
     UserDataValidator, 
@@ -66,7 +71,7 @@ __module_info__ = {
         EVENT_ONBOARDING_COMPLETED
     ],
     "webapp_integration": True,
-    "database_tables": ["music_users", "karma_history"]
+    "database_tables": ["music_users", "karma_history", "karma_snapshots"]
 }
 
 # Экспорт основных классов и функций
@@ -77,9 +82,15 @@ __all__ = [
     # Модели данных
     'MusicUser',
     'KarmaHistory',
+    'KarmaSnapshot',
     
     # Сервисы
     'UserService',
+    'KarmaLedger',
+    'LeaderboardIndex',
+    'GroupStatsCache',
+    'UsernameIndex',
+    'DailyStatsAccumulator',
     
     # Обработчики
     'UserManagementHandlers',
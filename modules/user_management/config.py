@@ -29,6 +29,9 @@ class KarmaConfig:
     # Автоматическая карма
     auto_karma_enabled: bool = True
     gratitude_karma_amount: int = 1
+    
+    # Журнал кармы: период снимков балансов и сверки
+    snapshot_interval_hours: int = 24
 
 
 @dataclass
@@ -150,7 +153,8 @@ class UserManagementConfig:
             max_karma_change_per_command=self._get_int('MAX_KARMA_CHANGE_PER_COMMAND', 100500),
             min_message_length_for_karma=self._get_int('MIN_MESSAGE_LENGTH_FOR_KARMA', 10),
             auto_karma_enabled=self._get_bool('ENABLE_AUTO_KARMA', True),
-            gratitude_karma_amount=self._get_int('GRATITUDE_KARMA_AMOUNT', 1)
+            gratitude_karma_amount=self._get_int('GRATITUDE_KARMA_AMOUNT', 1),
+            snapshot_interval_hours=self._get_int('KARMA_SNAPSHOT_INTERVAL_HOURS', 24)
         )
     
     def _init_rank_config(self) -> RankConfig:
@@ -0,0 +1,274 @@
+"""
+Modules/user_management/daily_stats.py - Дневная статистика пользователей
+Do Presave Reminder Bot v29.07
+
+Счетчики user_statistics (сообщения, команды, ссылки, карма, WebApp)
+копятся в памяти по ключу (user_id, group_id, дата) и раз в
+flush_interval секунд, а также при остановке модуля, сбрасываются одним
+INSERT ... ON CONFLICT (user_id, group_id, stat_date) DO UPDATE
+SET x = user_statistics.x + excluded.x (на СУБД без ON CONFLICT -
+UPDATE с прибавлением по строке, при промахе INSERT). Отметка
+активности - сложение в словаре, без обращения к БД.
+
+Запросы по диапазону дат добавляют к данным БД еще не сброшенные
+счетчики, поэтому видят активность без задержки.
+"""
+
+import os
+import asyncio
+import threading
+from datetime import date, datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+from sqlalchemy import select, func, update, and_
+
+from .models import UserStatistics
+from core.interfaces import EventTypes
+from utils.logger import get_module_logger
+
+
+COUNTERS = (
+    'messages_sent',
+    'commands_used',
+    'links_shared',
+    'presaves_made',
+    'karma_received',
+    'karma_given',
+    'webapp_sessions',
+    'webapp_time_spent'
+)
+
+# События, из которых счетчики пополняются автоматически
+TRACKED_EVENTS = (
+    EventTypes.USER_KARMA_CHANGED,
+    EventTypes.USER_LINKS_CHANGED,
+    EventTypes.WEBAPP_SESSION_STARTED
+)
+
+FLUSH_BATCH_SIZE = 500
+
+StatsKey = Tuple[int, int, date]
+
+
+class DailyStatsAccumulator:
+    """Накопитель дневных счетчиков с пакетным upsert"""
+
+    def __init__(self, database, flush_interval: float = None):
+        """
+        Инициализация накопителя
+
+        Args:
+            database: Ядро базы данных
+            flush_interval: Период сброса в БД, секунд
+        """
+        self.database = database
+        self.flush_interval = flush_interval if flush_interval is not None else \
+            float(os.getenv('DAILY_STATS_FLUSH_INTERVAL', '30'))
+        self.logger = get_module_logger("daily_stats")
+
+        # (user_id, group_id, дата) -> счетчик -> прирост
+        self._pending: Dict[StatsKey, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = asyncio.Lock()
+
+        self._stats = {'recorded': 0, 'flushes': 0, 'flushed_rows': 0}
+
+    # === НАКОПЛЕНИЕ ===
+
+    def record(self, user_id: int, group_id: int, stat_date: date = None, **counters: int):
+        """
+        Прирост счетчиков за день (без обращения к БД)
+
+        Пример: record(user_id, group_id, messages_sent=1)
+        """
+        unknown = set(counters) - set(COUNTERS)
+        if unknown:
+            raise ValueError(f"Неизвестные счетчики: {', '.join(sorted(unknown))}")
+
+        key = (user_id, group_id, stat_date or date.today())
+        with self._lock:
+            pending = self._pending.setdefault(key, {})
+            for name, value in counters.items():
+                if value:
+                    pending[name] = pending.get(name, 0) + value
+            self._stats['recorded'] += 1
+
+    async def on_event(self, event_type: str, data: Dict[str, Any]):
+        """Обработчик событий диспетчера"""
+        user_id = data.get('user_id')
+        group_id = data.get('group_id')
+        if user_id is None or group_id is None:
+            return
+
+        if event_type == EventTypes.USER_KARMA_CHANGED:
+            change = data.get('change') or 0
+            if change > 0:
+                self.record(user_id, group_id, karma_received=change)
+                if data.get('change_type') == 'gratitude' and data.get('changed_by'):
+                    self.record(data['changed_by'], group_id, karma_given=change)
+        elif event_type == EventTypes.USER_LINKS_CHANGED:
+            self.record(user_id, group_id, links_shared=max(data.get('links_added') or 0, 0))
+        elif event_type == EventTypes.WEBAPP_SESSION_STARTED:
+            self.record(user_id, group_id, webapp_sessions=1)
+
+    # === СБРОС В БД ===
+
+    async def flush(self) -> int:
+        """Сброс накопленных счетчиков, возвращает количество строк"""
+        async with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, {}
+
+            rows = [
+                {
+                    'user_id': user_id,
+                    'group_id': group_id,
+                    'stat_date': stat_date,
+                    **{name: counters.get(name, 0) for name in COUNTERS}
+                }
+                for (user_id, group_id, stat_date), counters in batch.items()
+                if counters
+            ]
+
+            try:
+                async with self.database.get_async_session() as session:
+                    for start in range(0, len(rows), FLUSH_BATCH_SIZE):
+                        await self._upsert(session, rows[start:start + FLUSH_BATCH_SIZE])
+            except Exception:
+                # Приросты, накопленные во время сброса, складываются с несброшенными
+                with self._lock:
+                    for key, counters in batch.items():
+                        pending = self._pending.setdefault(key, {})
+                        for name, value in counters.items():
+                            pending[name] = pending.get(name, 0) + value
+                raise
+
+            self._stats['flushes'] += 1
+            self._stats['flushed_rows'] += len(rows)
+            self.logger.debug(f"💾 Дневная статистика сброшена: {len(rows)} строк")
+            return len(rows)
+
+    async def _upsert(self, session, rows: List[Dict[str, Any]]):
+        """INSERT ... ON CONFLICT DO UPDATE с прибавлением для PostgreSQL и SQLite"""
+        dialect = (await session.connection()).dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            await self._merge_rows(session, rows)
+            return
+
+        now = datetime.now()
+        stmt = insert(UserStatistics).values([{**row, 'created_at': now, 'updated_at': now} for row in rows])
+        excluded = stmt.excluded
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=[UserStatistics.user_id, UserStatistics.group_id, UserStatistics.stat_date],
+            set_={
+                **{name: getattr(UserStatistics, name) + excluded[name] for name in COUNTERS},
+                'updated_at': excluded.updated_at
+            }
+        ))
+
+    @staticmethod
+    async def _merge_rows(session, rows: List[Dict[str, Any]]):
+        """Построчное прибавление для СУБД без ON CONFLICT: UPDATE, при промахе INSERT"""
+        now = datetime.now()
+        for row in rows:
+            result = await session.execute(
+                update(UserStatistics).where(and_(
+                    UserStatistics.user_id == row['user_id'],
+                    UserStatistics.group_id == row['group_id'],
+                    UserStatistics.stat_date == row['stat_date']
+                )).values(
+                    **{name: getattr(UserStatistics, name) + row[name] for name in COUNTERS},
+                    updated_at=now
+                )
+            )
+            if not result.rowcount:
+                # Параллельная вставка той же строки откатит весь сброс - приросты вернутся в очередь
+                session.add(UserStatistics(**row, created_at=now, updated_at=now))
+                await session.flush()
+
+    async def run_periodic(self):
+        """Фоновая задача: сброс раз в flush_interval"""
+        while True:
+            try:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                self.logger.error(f"❌ Ошибка сброса дневной статистики: {e}")
+
+    # === ЗАПРОСЫ ===
+
+    async def get_user_range(self, user_id: int, start: date, end: date,
+                             group_id: int = None) -> List[Dict[str, Any]]:
+        """
+        Счетчики пользователя по дням за [start, end] (без group_id - по всем группам)
+
+        Returns:
+            list: {'stat_date', счетчики...} по возрастанию даты, только дни с активностью
+        """
+        conditions = [UserStatistics.user_id == user_id]
+        if group_id:
+            conditions.append(UserStatistics.group_id == group_id)
+
+        return await self._range(
+            conditions, start, end,
+            lambda key: key[0] == user_id and (not group_id or key[1] == group_id)
+        )
+
+    async def get_group_range(self, group_id: int, start: date, end: date) -> List[Dict[str, Any]]:
+        """
+        Счетчики группы по дням за [start, end] (сумма по участникам)
+
+        Returns:
+            list: {'stat_date', 'active_users', счетчики...} по возрастанию даты
+        """
+        return await self._range(
+            [UserStatistics.group_id == group_id], start, end,
+            lambda key: key[1] == group_id,
+            count_users=True
+        )
+
+    async def _range(self, conditions, start: date, end: date, matches,
+                     count_users: bool = False) -> List[Dict[str, Any]]:
+        columns = [func.sum(getattr(UserStatistics, name)).label(name) for name in COUNTERS]
+
+        async with self.database.get_read_session() as session:
+            rows = (await session.execute(
+                select(UserStatistics.stat_date, UserStatistics.user_id, *columns)
+                .where(*conditions, UserStatistics.stat_date.between(start, end))
+                .group_by(UserStatistics.stat_date, UserStatistics.user_id)
+            )).all()
+
+        # (дата, user_id) -> счетчики: так несброшенные приросты не создают лишних участников
+        cells: Dict[Tuple[date, int], Dict[str, int]] = {}
+        for row in rows:
+            cells[(row.stat_date, row.user_id)] = {name: int(getattr(row, name) or 0) for name in COUNTERS}
+
+        with self._lock:
+            pending = [(key, dict(counters)) for key, counters in self._pending.items()
+                       if start <= key[2] <= end and matches(key)]
+        for (user_id, _, stat_date), counters in pending:
+            cell = cells.setdefault((stat_date, user_id), {name: 0 for name in COUNTERS})
+            for name, value in counters.items():
+                cell[name] += value
+
+        days: Dict[date, Dict[str, Any]] = {}
+        for (stat_date, _), counters in cells.items():
+            day = days.setdefault(stat_date, {'stat_date': stat_date, **{name: 0 for name in COUNTERS}})
+            if count_users:
+                day['active_users'] = day.get('active_users', 0) + 1
+            for name, value in counters.items():
+                day[name] += value
+
+        return [days[stat_date] for stat_date in sorted(days)]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, 'pending_rows': len(self._pending)}
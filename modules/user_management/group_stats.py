@@ -0,0 +1,205 @@
+"""
+Modules/user_management/group_stats.py - Статистика групп
+Do Presave Reminder Bot v29.07
+
+Статистика группы (участники, звания, суммы активности, топ жанров)
+читается одним запросом: CTE с активными участниками группы и UNION ALL
+трех агрегатов по нему. GROUPING SETS не используется - SQLite в
+разработке и тестах его не поддерживает, а CTE работает и там.
+
+Результат кешируется по группе. События кармы, ссылок, профиля и
+онбординга помечают запись устаревшей, но не удаляют: следующий запрос
+получает старое значение сразу, а пересчет идет фоном (stale-while-
+revalidate). Ждать пересчета приходится только при первом запросе и
+если запись устарела дольше max_stale.
+"""
+
+import os
+import time
+import asyncio
+from typing import Dict, Any, Optional
+
+from sqlalchemy import select, func, literal_column, null, cast, String, Integer, Float, union_all
+
+from .models import MusicUser
+from core.interfaces import EventTypes
+from utils.logger import get_module_logger
+
+
+TOP_GENRES_LIMIT = 5
+
+# События, после которых статистика группы устаревает
+INVALIDATING_EVENTS = (
+    EventTypes.USER_KARMA_CHANGED,
+    EventTypes.USER_LINKS_CHANGED,
+    EventTypes.USER_PROFILE_UPDATED,
+    EventTypes.USER_REGISTERED
+)
+
+
+def group_statistics_query(group_id: int):
+    """Один запрос: итоги группы, распределение по званиям и жанрам"""
+    members = (
+        select(
+            MusicUser.rank_title,
+            MusicUser.music_genre,
+            MusicUser.presaves_given,
+            MusicUser.presaves_received,
+            MusicUser.links_published,
+            MusicUser.karma_points
+        )
+        .where(MusicUser.group_id == group_id, MusicUser.is_active == True)
+        .cte('members')
+    )
+
+    no_key = cast(null(), String)
+    no_sum = cast(null(), Integer)
+    no_avg = cast(null(), Float)
+
+    totals = select(
+        literal_column("'total'").label('kind'),
+        no_key.label('key'),
+        func.count().label('users'),
+        func.sum(members.c.presaves_given).label('presaves_given'),
+        func.sum(members.c.presaves_received).label('presaves_received'),
+        func.sum(members.c.links_published).label('links_published'),
+        cast(func.avg(members.c.karma_points), Float).label('average_karma')
+    )
+    ranks = (
+        select(literal_column("'rank'"), members.c.rank_title, func.count(), no_sum, no_sum, no_sum, no_avg)
+        .group_by(members.c.rank_title)
+    )
+    genres = (
+        select(literal_column("'genre'"), members.c.music_genre, func.count(), no_sum, no_sum, no_sum, no_avg)
+        .where(members.c.music_genre.isnot(None))
+        .group_by(members.c.music_genre)
+    )
+    return union_all(totals, ranks, genres)
+
+
+async def load_group_statistics(database, group_id: int) -> Dict[str, Any]:
+    """Статистика группы из БД (один запрос)"""
+    async with database.get_read_session() as session:
+        rows = (await session.execute(group_statistics_query(group_id))).all()
+
+    stats = {
+        'total_users': 0,
+        'rank_distribution': {},
+        'activity': {
+            'total_presaves_given': 0,
+            'total_presaves_received': 0,
+            'total_links_published': 0,
+            'average_karma': 0
+        },
+        'top_genres': []
+    }
+    genres = []
+
+    for kind, key, users, given, received, links, average in rows:
+        if kind == 'total':
+            stats['total_users'] = users or 0
+            stats['activity'] = {
+                'total_presaves_given': given or 0,
+                'total_presaves_received': received or 0,
+                'total_links_published': links or 0,
+                'average_karma': round(average or 0, 1)
+            }
+        elif kind == 'rank':
+            stats['rank_distribution'][key] = users
+        else:
+            genres.append({'genre': key, 'count': users})
+
+    genres.sort(key=lambda item: (-item['count'], item['genre']))
+    stats['top_genres'] = genres[:TOP_GENRES_LIMIT]
+    return stats
+
+
+class GroupStatsCache:
+    """Кеш статистики групп со stale-while-revalidate"""
+
+    def __init__(self, database, ttl: float = None, max_stale: float = None):
+        """
+        Инициализация кеша
+
+        Args:
+            database: Ядро базы данных
+            ttl: Сколько секунд запись считается свежей
+            max_stale: Дольше этого устаревшая запись не отдается, запрос ждет пересчета
+        """
+        self.database = database
+        self.ttl = ttl if ttl is not None else float(os.getenv('GROUP_STATS_TTL', '300'))
+        self.max_stale = max_stale if max_stale is not None else \
+            float(os.getenv('GROUP_STATS_MAX_STALE', '3600'))
+        self.logger = get_module_logger("group_stats")
+
+        # group_id -> {'value', 'loaded_at', 'invalidated_at'}
+        self._entries: Dict[int, Dict[str, Any]] = {}
+        self._refreshing: Dict[int, asyncio.Task] = {}
+
+        self._stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0}
+
+    async def get(self, group_id: int) -> Dict[str, Any]:
+        """Статистика группы: из кеша, устаревшая - с фоновым пересчетом"""
+        entry = self._entries.get(group_id)
+
+        if entry is not None:
+            stale_since = self._stale_since(entry)
+            if stale_since is None:
+                self._stats['hits'] += 1
+                return entry['value']
+
+            if time.monotonic() - stale_since < self.max_stale:
+                self._stats['stale_hits'] += 1
+                self._schedule_refresh(group_id)
+                return entry['value']
+
+        self._stats['misses'] += 1
+        return await self._refresh(group_id)
+
+    def _stale_since(self, entry: Dict[str, Any]) -> Optional[float]:
+        """Момент, с которого запись устарела (None - свежая)"""
+        expires_at = entry['loaded_at'] + self.ttl
+        invalidated_at = entry['invalidated_at']
+        if invalidated_at is not None and invalidated_at >= entry['loaded_at']:
+            return min(invalidated_at, expires_at)
+        return expires_at if time.monotonic() >= expires_at else None
+
+    def invalidate(self, group_id: Optional[int] = None):
+        """Пометка статистики группы (без group_id - всех групп) устаревшей"""
+        now = time.monotonic()
+        for key, entry in self._entries.items():
+            if group_id is None or key == group_id:
+                entry['invalidated_at'] = now
+
+    async def on_event(self, event_type: str, data: Dict[str, Any]):
+        """Обработчик событий диспетчера"""
+        if event_type in INVALIDATING_EVENTS:
+            self.invalidate(data.get('group_id'))
+
+    def _schedule_refresh(self, group_id: int):
+        task = self._refreshing.get(group_id)
+        if task is None or task.done():
+            self._refreshing[group_id] = asyncio.create_task(self._refresh_quietly(group_id))
+
+    async def _refresh_quietly(self, group_id: int):
+        try:
+            await self._refresh(group_id)
+        except Exception as e:
+            self.logger.warning(f"⚠️ Статистика группы {group_id} не обновлена, отдается прежняя: {e}")
+
+    async def _refresh(self, group_id: int) -> Dict[str, Any]:
+        # Инвалидация во время запроса оставит запись устаревшей: loaded_at - момент начала
+        started = time.monotonic()
+        value = await load_group_statistics(self.database, group_id)
+
+        previous = self._entries.get(group_id)
+        self._entries[group_id] = {
+            'value': value,
+            'loaded_at': started,
+            'invalidated_at': previous['invalidated_at'] if previous else None
+        }
+        self._stats['refreshes'] += 1
+        return value
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self._stats, 'groups': len(self._entries)}
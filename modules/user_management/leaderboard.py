@@ -0,0 +1,253 @@
+"""
+Modules/user_management/leaderboard.py - Лидерборды в памяти
+Do Presave Reminder Bot v29.07
+
+Для каждой группы и каждого измерения (карма, просьбы о пресейвах,
+соотношение просьба/карма) хранится отсортированный список ключей
+(-значение, user_id). Топ-N - срез списка, «мое место» - bisect по
+ключу пользователя, без ORDER BY по всей группе.
+
+Индекс строится из БД при старте модуля и дальше обновляется событиями
+USER_KARMA_CHANGED, USER_LINKS_CHANGED, USER_REGISTERED и
+USER_PROFILE_UPDATED (деактивация убирает пользователя из лидербордов,
+смена группы переносит его). Пользователя, которого нет в индексе,
+добавляют только регистрация и активный профиль с обоими значениями.
+События, пришедшие во время перестроения, применяются после него.
+"""
+
+import bisect
+from typing import Dict, Any, Optional, List, Tuple
+
+from sqlalchemy import select
+
+from .models import MusicUser
+from core.interfaces import EventTypes
+from utils.logger import get_module_logger
+
+
+DIMENSIONS = ('karma', 'requests', 'ratio')
+
+# Синонимы полей сортировки UserService.get_leaderboard
+DIMENSION_ALIASES = {
+    'karma': 'karma',
+    'karma_points': 'karma',
+    'requests': 'requests',
+    'links_published': 'requests',
+    'ratio': 'ratio',
+    'karma_to_links_ratio': 'ratio'
+}
+
+
+def request_karma_ratio(requests: int, karma: int) -> float:
+    """Соотношение просьба/карма: сколько просьб приходится на единицу кармы"""
+    return round(requests / max(karma, 1), 2)
+
+
+class _RankedList:
+    """Отсортированные ключи (-значение, user_id) одной группы по одному измерению"""
+
+    def __init__(self):
+        self.keys: List[Tuple[float, int]] = []
+
+    def insert(self, value: float, user_id: int):
+        bisect.insort(self.keys, (-value, user_id))
+
+    def remove(self, value: float, user_id: int):
+        key = (-value, user_id)
+        index = bisect.bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            del self.keys[index]
+
+    def position(self, value: float) -> int:
+        """Место (с 1): равные значения делят место"""
+        return bisect.bisect_left(self.keys, (-value,)) + 1
+
+    def top(self, limit: int) -> List[Tuple[int, float]]:
+        return [(user_id, -negative) for negative, user_id in self.keys[:limit]]
+
+
+class LeaderboardIndex:
+    """Лидерборды групп в памяти"""
+
+    def __init__(self, database):
+        """
+        Инициализация индекса
+
+        Args:
+            database: Ядро базы данных
+        """
+        self.database = database
+        self.logger = get_module_logger("leaderboard")
+
+        # user_id -> {'group_id', 'karma', 'requests'}
+        self._users: Dict[int, Dict[str, Any]] = {}
+        # group_id -> измерение -> список
+        self._groups: Dict[int, Dict[str, _RankedList]] = {}
+
+        self._pending: Optional[List[Tuple[str, Dict[str, Any]]]] = None
+        self.is_ready = False
+
+    # === ПОСТРОЕНИЕ ===
+
+    async def rebuild(self) -> int:
+        """
+        Построение индекса из БД (активные пользователи)
+
+        Returns:
+            int: Количество пользователей в индексе
+        """
+        self._pending = []
+        try:
+            async with self.database.get_read_session() as session:
+                rows = (await session.execute(
+                    select(MusicUser.user_id, MusicUser.group_id,
+                           MusicUser.karma_points, MusicUser.links_published)
+                    .where(MusicUser.is_active == True)
+                )).all()
+
+            self._users = {}
+            self._groups = {}
+            for user_id, group_id, karma, requests in rows:
+                self._set(user_id, group_id, karma or 0, requests or 0)
+
+            pending, self._pending = self._pending, None
+            for event_type, data in pending:
+                self._apply(event_type, data)
+
+            self.is_ready = True
+            self.logger.info(f"✅ Лидерборды построены: {len(self._users)} пользователей, {len(self._groups)} групп")
+            return len(self._users)
+
+        except Exception as e:
+            self._pending = None
+            self.logger.error(f"❌ Ошибка построения лидербордов: {e}")
+            raise
+
+    # === ОБНОВЛЕНИЕ ===
+
+    async def on_event(self, event_type: str, data: Dict[str, Any]):
+        """Обработчик событий диспетчера"""
+        if self._pending is not None:
+            self._pending.append((event_type, data))
+            return
+        self._apply(event_type, data)
+
+    def _apply(self, event_type: str, data: Dict[str, Any]):
+        user_id = data.get('user_id')
+        if user_id is None:
+            return
+
+        current = self._users.get(user_id)
+        if current is None and not self._adds_user(event_type, data):
+            # Неактивный или еще не загруженный пользователь: второе
+            # измерение неизвестно, и деактивированный не должен вернуться
+            return
+
+        group_id = data.get('group_id') or (current['group_id'] if current else None)
+        if group_id is None:
+            return
+
+        karma = current['karma'] if current else 0
+        requests = current['requests'] if current else 0
+
+        if event_type == EventTypes.USER_KARMA_CHANGED:
+            karma = data.get('new_karma', karma)
+        elif event_type == EventTypes.USER_LINKS_CHANGED:
+            requests = data.get('links_published', requests)
+        elif event_type == EventTypes.USER_REGISTERED:
+            karma = data.get('karma', karma)
+        elif event_type == EventTypes.USER_PROFILE_UPDATED:
+            if data.get('is_active') is False:
+                self.remove_user(user_id)
+                return
+            karma = data.get('karma', karma)
+            requests = data.get('links_published', requests)
+        else:
+            return
+
+        self._set(user_id, group_id, karma, requests)
+
+    @staticmethod
+    def _adds_user(event_type: str, data: Dict[str, Any]) -> bool:
+        """Событие, по которому пользователь попадает в индекс"""
+        if event_type == EventTypes.USER_REGISTERED:
+            return True
+        return (
+            event_type == EventTypes.USER_PROFILE_UPDATED
+            and data.get('is_active') is True
+            and 'karma' in data and 'links_published' in data
+        )
+
+    def _set(self, user_id: int, group_id: int, karma: int, requests: int):
+        """Перемещение пользователя в списках всех измерений"""
+        self.remove_user(user_id)
+
+        values = self._values(karma, requests)
+        lists = self._groups.get(group_id)
+        if lists is None:
+            lists = self._groups[group_id] = {dimension: _RankedList() for dimension in DIMENSIONS}
+        for dimension in DIMENSIONS:
+            lists[dimension].insert(values[dimension], user_id)
+
+        self._users[user_id] = {'group_id': group_id, 'karma': karma, 'requests': requests}
+
+    def remove_user(self, user_id: int):
+        """Удаление пользователя из индекса (деактивация)"""
+        current = self._users.pop(user_id, None)
+        if current is None:
+            return
+
+        values = self._values(current['karma'], current['requests'])
+        lists = self._groups[current['group_id']]
+        for dimension in DIMENSIONS:
+            lists[dimension].remove(values[dimension], user_id)
+
+    @staticmethod
+    def _values(karma: int, requests: int) -> Dict[str, float]:
+        return {
+            'karma': karma,
+            'requests': requests,
+            'ratio': request_karma_ratio(requests, karma)
+        }
+
+    # === ЗАПРОСЫ ===
+
+    def top(self, group_id: int, dimension: str = 'karma', limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Топ-N группы по измерению
+
+        Returns:
+            list: {'position', 'user_id', 'value'} по убыванию значения
+        """
+        lists = self._groups.get(group_id)
+        if lists is None:
+            return []
+
+        ranked = lists[dimension]
+        return [
+            {'position': ranked.position(value), 'user_id': user_id, 'value': value}
+            for user_id, value in ranked.top(limit)
+        ]
+
+    def position(self, user_id: int, dimension: str = 'karma') -> Optional[Dict[str, Any]]:
+        """
+        Место пользователя в лидерборде своей группы
+
+        Returns:
+            dict: {'position', 'total', 'value', 'group_id'}, None - пользователя нет в индексе
+        """
+        current = self._users.get(user_id)
+        if current is None:
+            return None
+
+        value = self._values(current['karma'], current['requests'])[dimension]
+        ranked = self._groups[current['group_id']][dimension]
+        return {
+            'position': ranked.position(value),
+            'total': len(ranked.keys),
+            'value': value,
+            'group_id': current['group_id']
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {'users': len(self._users), 'groups': len(self._groups), 'ready': self.is_ready}
@@ -0,0 +1,344 @@
+"""
+Modules/user_management/ledger.py - Журнал кармы
+Do Presave Reminder Bot v29.07
+
+Карма как журнал событий: karma_history - неизменяемый журнал изменений,
+music_users.karma_points - текущий баланс, karma_snapshots - периодические
+снимки балансов.
+
+Изменение кармы - один UPDATE ... SET karma_points = karma_points + :d
+RETURNING с проверкой границ в WHERE и запись журнала в той же
+транзакции: строка пользователя не читается заранее, одновременные
+начисления не теряются и не ждут друг друга дольше одного UPDATE.
+
+«Карма на момент T» - ближайший снимок не позже T (индекс
+user_id, as_of) плюс хвост журнала после него, а не весь журнал.
+Периодическая задача делает снимки и сверяет их и текущие балансы
+с журналом.
+
+Ненулевой стартовый баланс тоже запись журнала (change_type
+'opening_balance'), иначе сверка и karma_at считали бы карму с нуля.
+Для балансов, появившихся до журнала, такие записи добавляет миграция
+core 4 (core/database_core.py).
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List, Tuple
+
+from sqlalchemy import select, update, func, and_
+
+from .models import MusicUser, KarmaHistory, KarmaSnapshot, rank_title_expression
+from core.exceptions import UserNotFoundError, KarmaError
+from utils.logger import get_module_logger
+
+# Тип записи журнала со стартовым балансом пользователя
+OPENING_BALANCE = 'opening_balance'
+
+
+class KarmaLedger:
+    """Журнал кармы со снимками балансов"""
+
+    def __init__(self, database, min_karma: int = 0, max_karma: int = 100500,
+                 snapshot_interval_hours: float = 24, settle_seconds: float = 60):
+        """
+        Инициализация журнала
+
+        Args:
+            database: Ядро базы данных
+            snapshot_interval_hours: Период снимков и сверки
+            settle_seconds: Записи журнала моложе этого в снимок не попадают -
+                            транзакции с меньшим id могут быть еще не закоммичены
+        """
+        self.database = database
+        self.min_karma = min_karma
+        self.max_karma = max_karma
+        self.snapshot_interval_hours = snapshot_interval_hours
+        self.settle_seconds = settle_seconds
+        self.logger = get_module_logger("karma_ledger")
+
+    # === ИЗМЕНЕНИЕ КАРМЫ ===
+
+    async def apply(self, session, user_id: int, change_amount: int, reason: str,
+                    change_type: str = "manual", changed_by: int = None,
+                    changed_by_username: str = None) -> Tuple[int, int, int]:
+        """
+        Атомарное изменение баланса и запись в журнал (в транзакции session)
+
+        Returns:
+            tuple: (karma_before, karma_after, group_id)
+
+        Raises:
+            UserNotFoundError: пользователя нет
+            KarmaError: баланс вышел бы за границы
+        """
+        new_karma = MusicUser.karma_points + change_amount
+        result = await session.execute(
+            update(MusicUser)
+            .where(
+                MusicUser.user_id == user_id,
+                new_karma >= self.min_karma,
+                new_karma <= self.max_karma
+            )
+            .values(
+                karma_points=new_karma,
+                rank_title=rank_title_expression(new_karma),
+                last_activity=func.now()
+            )
+            .returning(MusicUser.karma_points, MusicUser.group_id)
+            .execution_options(synchronize_session=False)
+        )
+        row = result.first()
+
+        if row is None:
+            current = await session.scalar(
+                select(MusicUser.karma_points).where(MusicUser.user_id == user_id)
+            )
+            if current is None:
+                raise UserNotFoundError(f"Пользователь {user_id} не найден")
+            if current + change_amount < self.min_karma:
+                raise KarmaError("Карма не может быть отрицательной")
+            raise KarmaError(f"Карма не может превышать {self.max_karma}")
+
+        karma_after, group_id = row
+        karma_before = karma_after - change_amount
+
+        session.add(KarmaHistory(
+            user_id=user_id,
+            group_id=group_id,
+            karma_change=change_amount,
+            karma_before=karma_before,
+            karma_after=karma_after,
+            reason=reason,
+            change_type=change_type,
+            changed_by_user_id=changed_by,
+            changed_by_username=changed_by_username
+        ))
+
+        return karma_before, karma_after, group_id
+
+    def open_balance(self, session, user_id: int, group_id: int, karma: int,
+                     reason: str = "Стартовая карма") -> bool:
+        """
+        Запись стартового баланса нового пользователя (в транзакции session)
+
+        Returns:
+            bool: True - запись добавлена, False - баланс нулевой
+        """
+        if not karma:
+            return False
+
+        session.add(KarmaHistory(
+            user_id=user_id,
+            group_id=group_id,
+            karma_change=karma,
+            karma_before=0,
+            karma_after=karma,
+            reason=reason,
+            change_type=OPENING_BALANCE
+        ))
+        return True
+
+    async def set_balance(self, session, user_id: int, karma_value: int, reason: str,
+                          change_type: str = "admin_adjustment",
+                          changed_by: int = None) -> Optional[Tuple[int, int, int]]:
+        """
+        Установка точного баланса через запись журнала (строка блокируется)
+
+        Returns:
+            tuple: как у apply, None - баланс уже равен karma_value
+        """
+        current = await session.scalar(
+            select(MusicUser.karma_points)
+            .where(MusicUser.user_id == user_id)
+            .with_for_update()
+        )
+        if current is None:
+            raise UserNotFoundError(f"Пользователь {user_id} не найден")
+        if current == karma_value:
+            return None
+
+        return await self.apply(session, user_id, karma_value - current, reason,
+                                change_type, changed_by)
+
+    # === СНИМКИ ===
+
+    async def take_snapshots(self) -> int:
+        """
+        Снимки балансов пользователей, у которых журнал вырос после прошлого снимка
+
+        Returns:
+            int: Количество новых снимков
+        """
+        settled = datetime.now() - timedelta(seconds=self.settle_seconds)
+
+        async with self.database.get_async_session() as session:
+            latest = await self._latest_snapshots(session)
+
+            # Снимок покрывает префикс журнала до первой свежей записи
+            fresh = await session.scalar(
+                select(func.min(KarmaHistory.id)).where(KarmaHistory.created_at > settled)
+            )
+            conditions = [] if fresh is None else [KarmaHistory.id < fresh]
+
+            last_seen = (
+                select(KarmaSnapshot.user_id, func.max(KarmaSnapshot.history_id).label('history_id'))
+                .group_by(KarmaSnapshot.user_id)
+                .subquery()
+            )
+            tails = (await session.execute(
+                select(
+                    KarmaHistory.user_id,
+                    func.max(KarmaHistory.group_id),
+                    func.max(KarmaHistory.id),
+                    func.sum(KarmaHistory.karma_change)
+                )
+                .outerjoin(last_seen, last_seen.c.user_id == KarmaHistory.user_id)
+                .where(KarmaHistory.id > func.coalesce(last_seen.c.history_id, 0), *conditions)
+                .group_by(KarmaHistory.user_id)
+            )).all()
+
+            if not tails:
+                return 0
+
+            as_of = dict((await session.execute(
+                select(KarmaHistory.id, KarmaHistory.created_at)
+                .where(KarmaHistory.id.in_([history_id for _, _, history_id, _ in tails]))
+            )).all())
+
+            for user_id, group_id, history_id, change in tails:
+                base = latest.get(user_id)
+                session.add(KarmaSnapshot(
+                    user_id=user_id,
+                    group_id=group_id,
+                    karma_points=(base['karma_points'] if base else 0) + int(change),
+                    history_id=history_id,
+                    as_of=as_of[history_id]
+                ))
+
+        self.logger.info(f"📸 Снимки кармы: {len(tails)}")
+        return len(tails)
+
+    @staticmethod
+    async def _latest_snapshots(session) -> Dict[int, Dict[str, Any]]:
+        """Последний снимок каждого пользователя"""
+        last = (
+            select(KarmaSnapshot.user_id, func.max(KarmaSnapshot.history_id).label('history_id'))
+            .group_by(KarmaSnapshot.user_id)
+            .subquery()
+        )
+        rows = (await session.execute(
+            select(KarmaSnapshot.user_id, KarmaSnapshot.karma_points, KarmaSnapshot.history_id)
+            .join(last, and_(last.c.user_id == KarmaSnapshot.user_id,
+                             last.c.history_id == KarmaSnapshot.history_id))
+        )).all()
+        return {
+            user_id: {'karma_points': karma, 'history_id': history_id}
+            for user_id, karma, history_id in rows
+        }
+
+    async def karma_at(self, user_id: int, moment: datetime) -> Optional[int]:
+        """
+        Карма пользователя на момент moment
+
+        Returns:
+            int: Баланс (0 - до первой записи журнала), None - пользователя нет
+        """
+        async with self.database.get_read_session() as session:
+            exists = await session.scalar(
+                select(MusicUser.id).where(MusicUser.user_id == user_id)
+            )
+            if exists is None:
+                return None
+
+            snapshot = (await session.execute(
+                select(KarmaSnapshot.karma_points, KarmaSnapshot.history_id)
+                .where(KarmaSnapshot.user_id == user_id, KarmaSnapshot.as_of <= moment)
+                .order_by(KarmaSnapshot.as_of.desc(), KarmaSnapshot.history_id.desc())
+                .limit(1)
+            )).first()
+            base, after_id = snapshot if snapshot else (0, 0)
+
+            tail = await session.scalar(
+                select(func.coalesce(func.sum(KarmaHistory.karma_change), 0))
+                .where(
+                    KarmaHistory.user_id == user_id,
+                    KarmaHistory.id > after_id,
+                    KarmaHistory.created_at <= moment
+                )
+            )
+            return base + int(tail)
+
+    # === СВЕРКА ===
+
+    async def verify(self) -> Dict[str, Any]:
+        """
+        Сверка снимков и текущих балансов с журналом
+
+        Returns:
+            dict: users_checked, snapshots_checked, balance_mismatches,
+                  snapshot_mismatches (списки расхождений)
+        """
+        async with self.database.get_async_session() as session:
+            totals = dict((await session.execute(
+                select(KarmaHistory.user_id, func.sum(KarmaHistory.karma_change))
+                .group_by(KarmaHistory.user_id)
+            )).all())
+
+            balances = (await session.execute(
+                select(MusicUser.user_id, MusicUser.karma_points)
+            )).all()
+
+            latest = await self._latest_snapshots(session)
+            replayed = {}
+            if latest:
+                snapshot = (
+                    select(KarmaSnapshot.user_id, func.max(KarmaSnapshot.history_id).label('history_id'))
+                    .group_by(KarmaSnapshot.user_id)
+                    .subquery()
+                )
+                replayed = dict((await session.execute(
+                    select(snapshot.c.user_id, func.sum(KarmaHistory.karma_change))
+                    .join(KarmaHistory, and_(KarmaHistory.user_id == snapshot.c.user_id,
+                                             KarmaHistory.id <= snapshot.c.history_id))
+                    .group_by(snapshot.c.user_id)
+                )).all())
+
+        balance_mismatches: List[Dict[str, Any]] = [
+            {'user_id': user_id, 'karma_points': karma, 'ledger': int(totals.get(user_id) or 0)}
+            for user_id, karma in balances
+            if karma != int(totals.get(user_id) or 0)
+        ]
+        snapshot_mismatches: List[Dict[str, Any]] = [
+            {'user_id': user_id, 'history_id': snap['history_id'],
+             'snapshot': snap['karma_points'], 'ledger': int(replayed.get(user_id) or 0)}
+            for user_id, snap in latest.items()
+            if snap['karma_points'] != int(replayed.get(user_id) or 0)
+        ]
+
+        if balance_mismatches or snapshot_mismatches:
+            self.logger.warning(
+                f"⚠️ Журнал кармы расходится: балансов {len(balance_mismatches)}, "
+                f"снимков {len(snapshot_mismatches)}"
+            )
+        else:
+            self.logger.info(f"✅ Журнал кармы сходится: {len(balances)} пользователей")
+
+        return {
+            'users_checked': len(balances),
+            'snapshots_checked': len(latest),
+            'balance_mismatches': balance_mismatches,
+            'snapshot_mismatches': snapshot_mismatches
+        }
+
+    async def run_periodic(self):
+        """Фоновая задача: снимки и сверка раз в snapshot_interval_hours"""
+        while True:
+            try:
+                await asyncio.sleep(self.snapshot_interval_hours * 3600)
+                await self.take_snapshots()
+                await self.verify()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                self.logger.error(f"❌ Ошибка обслуживания журнала кармы: {e}")
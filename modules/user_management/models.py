@@ -5,9 +5,9 @@ Do Presave Reminder Bot v29.07
 SQLAlchemy модели для управления пользователями и системы кармы
 """
 
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Dict, Any, Optional
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, DECIMAL, BigInteger, Date
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, DECIMAL, BigInteger, Date, case
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 
@@ -174,8 +174,8 @@ class KarmaHistory(Base):
     changed_by_user_id = Column(BigInteger, nullable=True)
     changed_by_username = Column(String(100), nullable=True)
     
-    # Дополнительные данные
-    metadata = Column(Text, nullable=True)  # JSON строка с дополнительной информацией
+    # Дополнительные данные (имя metadata занято Declarative API - атрибут extra_data)
+    extra_data = Column('metadata', Text, nullable=True)  # JSON строка с дополнительной информацией
     
     # Временные метки
     created_at = Column(DateTime, default=func.now(), nullable=False, index=True)
@@ -196,7 +196,7 @@ class KarmaHistory(Base):
             'change_type': self.change_type,
             'changed_by_user_id': self.changed_by_user_id,
             'changed_by_username': self.changed_by_username,
-            'metadata': self.metadata,
+            'metadata': self.extra_data,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
     
@@ -225,6 +225,43 @@ class KarmaHistory(Base):
         return time_diff.total_seconds() < (hours * 3600)
 
 
+class KarmaSnapshot(Base):
+    """Снимок баланса кармы на записи журнала karma_history"""
+    __tablename__ = 'karma_snapshots'
+    
+    # Первичный ключ
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    
+    # Связь с пользователем
+    user_id = Column(BigInteger, nullable=False)
+    group_id = Column(BigInteger, nullable=False)
+    
+    # Баланс после записи журнала history_id (включительно)
+    karma_points = Column(Integer, nullable=False)
+    history_id = Column(Integer, nullable=False)
+    
+    # Время записи журнала history_id - граница для «кармы на момент»
+    as_of = Column(DateTime, nullable=False)
+    
+    # Временные метки
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+    
+    def __repr__(self):
+        return f"<KarmaSnapshot(user_id={self.user_id}, karma={self.karma_points}, history_id={self.history_id})>"
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Преобразование в словарь"""
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'group_id': self.group_id,
+            'karma_points': self.karma_points,
+            'history_id': self.history_id,
+            'as_of': self.as_of.isoformat() if self.as_of else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
 class UserStatistics(Base):
     """Ежедневная статистика пользователей"""
     __tablename__ = 'user_statistics'
@@ -372,25 +409,45 @@ Index('idx_music_users_group_karma', MusicUser.group_id, MusicUser.karma_points)
 # Индекс для истории кармы по пользователю и дате
 Index('idx_karma_history_user_date', KarmaHistory.user_id, KarmaHistory.created_at)
 
+# Индекс для поиска снимка кармы «не позже момента» по пользователю
+Index('idx_karma_snapshots_user_as_of', KarmaSnapshot.user_id, KarmaSnapshot.as_of)
+
 # Индекс для статистики по пользователю и дате
 Index('idx_user_statistics_user_date', UserStatistics.user_id, UserStatistics.stat_date)
 
+# Одна строка статистики на пользователя, группу и день (цель ON CONFLICT)
+Index('uq_user_statistics_user_group_date', UserStatistics.user_id, UserStatistics.group_id,
+      UserStatistics.stat_date, unique=True)
+
 # Индекс для активных сессий
 Index('idx_user_sessions_active', UserSession.user_id, UserSession.is_active, UserSession.last_activity)
 
 
 # === ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ===
 
+# Пороги званий по убыванию: (минимальная карма, звание)
+RANK_TITLES = [
+    (31, "💎 Амбассадорище"),
+    (16, "🥇 Мега-помощничье"),
+    (6, "🥈 Надежда сообщества"),
+]
+NEWBIE_RANK_TITLE = "🥉 Новенький"
+
+
 def get_rank_title_by_karma(karma: int) -> str:
     """Получение звания по количеству кармы"""
-    if karma >= 31:
-        return "💎 Амбассадорище"
-    elif karma >= 16:
-        return "🥇 Мега-помощничье"
-    elif karma >= 6:
-        return "🥈 Надежда сообщества"
-    else:
-        return "🥉 Новенький"
+    for threshold, title in RANK_TITLES:
+        if karma >= threshold:
+            return title
+    return NEWBIE_RANK_TITLE
+
+
+def rank_title_expression(karma):
+    """SQL-выражение звания по карме (для UPDATE без чтения строки)"""
+    return case(
+        *[(karma >= threshold, title) for threshold, title in RANK_TITLES],
+        else_=NEWBIE_RANK_TITLE
+    )
 
 
 def calculate_presave_ratio(given: int, received: int) -> float:
@@ -7,16 +7,22 @@ Do Presave Reminder Bot v29.07
 """
 
 import asyncio
-import re
 import time
 from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime, timedelta
 
-from telebot.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
+from telebot.types import Message
 
-from core.interfaces import BaseModule, ModuleInfo, EventTypes, log_execution_time, rate_limit
-from core.exceptions import UserError, UserNotFoundError, KarmaError, ValidationError
-from utils.logger import get_module_logger, log_user_action, log_command_execution
+from core.interfaces import BaseModule, ModuleInfo, EventTypes
+from utils.logger import get_module_logger
+
+from .services import UserService
+from .handlers import UserManagementHandlers
+from .ledger import KarmaLedger
+from .leaderboard import LeaderboardIndex
+from .group_stats import GroupStatsCache, INVALIDATING_EVENTS
+from .user_index import UsernameIndex
+from .daily_stats import DailyStatsAccumulator, TRACKED_EVENTS
 
 
 class UserManagementModule(BaseModule):
@@ -27,12 +33,6 @@ class UserManagementModule(BaseModule):
         super().__init__(bot, database, config, event_dispatcher)
         self.logger = get_module_logger("user_management")
         
-        # Сессии онбординга
-        self.onboarding_sessions: Dict[int, Dict[str, Any]] = {}
-        
-        # Кулдауны команд
-        self.command_cooldowns: Dict[int, Dict[str, float]] = {}
-        
         # Настройки кармы из конфигурации
         self.karma_settings = {
             'max_karma': 100500,
@@ -43,13 +43,51 @@ class UserManagementModule(BaseModule):
             'gratitude_cooldown_minutes': config.get('gratitude_cooldown_minutes', 60)
         }
         
-        # Система званий
-        self.rank_thresholds = {
-            'Новенький': (0, 5),
-            'Надежда сообщества': (6, 15), 
-            'Мега-помощничье': (16, 30),
-            'Амбассадорище': (31, 100500)
-        }
+        # Журнал кармы (снимки и сверка - фоновая задача)
+        self.karma_ledger = KarmaLedger(
+            database,
+            min_karma=self.karma_settings['min_karma'],
+            max_karma=self.karma_settings['max_karma'],
+            snapshot_interval_hours=config.get('karma_snapshot_interval_hours', 24)
+        )
+        
+        # Лидерборды групп в памяти (строятся при запуске, дальше - по событиям)
+        self.leaderboard = LeaderboardIndex(database)
+        
+        # Индекс @username и имен для упоминаний и автодополнения
+        self.user_index = UsernameIndex(database)
+        
+        # Дневные счетчики активности (сброс в user_statistics пакетами)
+        self.daily_stats = DailyStatsAccumulator(
+            database,
+            flush_interval=config.get('daily_stats_flush_seconds')
+        )
+        
+        # Статистика групп: кеш, устаревающий по событиям пользователей
+        self.group_stats = GroupStatsCache(
+            database,
+            ttl=config.get('group_stats_ttl_seconds')
+        )
+        
+        # Единственный сервис пользователей: карма, благодарности и WebApp
+        # идут через него, его события обновляют индексы и кеши модуля
+        self.user_service = UserService(
+            database,
+            config,
+            event_dispatcher,
+            leaderboard=self.leaderboard,
+            group_stats=self.group_stats,
+            user_index=self.user_index,
+            daily_stats=self.daily_stats,
+            ledger=self.karma_ledger
+        )
+        
+        # Обработчики команд, онбординга и благодарностей
+        self.handlers = UserManagementHandlers(bot, database, config, self.user_service)
+        
+        # Сессии онбординга и кулдауны - общие с обработчиками
+        self.onboarding_sessions = self.handlers.onboarding_sessions
+        self.command_cooldowns = self.handlers.command_cooldowns
         
     def get_info(self) -> ModuleInfo:
         """Информация о модуле"""
@@ -90,6 +128,46 @@ class UserManagementModule(BaseModule):
             cleanup_task = asyncio.create_task(self._cleanup_old_sessions())
             self._tasks.append(cleanup_task)
             
+            # Снимки балансов кармы и сверка с журналом
+            ledger_task = asyncio.create_task(self.karma_ledger.run_periodic())
+            self._tasks.append(ledger_task)
+            
+            # Сброс дневной статистики
+            stats_task = asyncio.create_task(self.daily_stats.run_periodic())
+            self._tasks.append(stats_task)
+            
+            # Лидерборды: подписка до построения - события во время него не теряются
+            if self.event_dispatcher:
+                self.event_dispatcher.subscribe(
+                    [EventTypes.USER_KARMA_CHANGED, EventTypes.USER_LINKS_CHANGED,
+                     EventTypes.USER_REGISTERED, EventTypes.USER_PROFILE_UPDATED],
+                    self.leaderboard.on_event,
+                    module_name="user_management"
+                )
+                self.event_dispatcher.subscribe(
+                    list(INVALIDATING_EVENTS),
+                    self.group_stats.on_event,
+                    module_name="user_management"
+                )
+                self.event_dispatcher.subscribe(
+                    [EventTypes.USER_REGISTERED, EventTypes.USER_PROFILE_UPDATED],
+                    self.user_index.on_event,
+                    module_name="user_management"
+                )
+                self.event_dispatcher.subscribe(
+                    list(TRACKED_EVENTS),
+                    self.daily_stats.on_event,
+                    module_name="user_management"
+                )
+            try:
+                await self.leaderboard.rebuild()
+            except Exception as e:
+                self.logger.warning(f"⚠️ Лидерборды будут читаться из БД: {e}")
+            try:
+                await self.user_index.rebuild()
+            except Exception as e:
+                self.logger.warning(f"⚠️ Поиск по username будет идти через БД: {e}")
+            
             self.logger.info("✅ Модуль управления пользователями запущен")
             return True
             
@@ -106,6 +184,15 @@ class UserManagementModule(BaseModule):
             self.onboarding_sessions.clear()
             self.command_cooldowns.clear()
             
+            if self.event_dispatcher:
+                self.event_dispatcher.unsubscribe_module("user_management")
+            
+            # Несброшенные счетчики дня
+            try:
+                await self.daily_stats.flush()
+            except Exception as e:
+                self.logger.error(f"❌ Дневная статистика не сброшена при остановке: {e}")
+            
             return True
             
         except Exception as e:
@@ -115,24 +202,26 @@ class UserManagementModule(BaseModule):
     def register_handlers(self):
         """Регистрация обработчиков команд"""
         
+        handlers = self.handlers
+        
         # Основные команды пользователей
-        self.bot.register_command_handler('start', self._handle_start)
-        self.bot.register_command_handler('mystat', self._handle_mystat)
-        self.bot.register_command_handler('mystats', self._handle_mystats)
-        self.bot.register_command_handler('profile', self._handle_profile)
-        self.bot.register_command_handler('karma_history', self._handle_karma_history)
+        self.bot.register_command_handler('start', self._counted(handlers.handle_start))
+        self.bot.register_command_handler('mystat', self._counted(handlers.handle_mystat))
+        self.bot.register_command_handler('mystats', self._counted(handlers.handle_mystats))
+        self.bot.register_command_handler('profile', self._counted(handlers.handle_profile))
+        self.bot.register_command_handler('karma_history', self._counted(handlers.handle_karma_history))
         
         # Админские команды кармы
-        self.bot.register_command_handler('karma', self._handle_karma_admin)
-        self.bot.register_command_handler('karma_ratio', self._handle_karma_ratio_admin)
+        self.bot.register_command_handler('karma', self._counted(handlers.handle_karma_admin))
+        self.bot.register_command_handler('karma_ratio', self._counted(handlers.handle_karma_ratio_admin))
         
         # Обработчики callback query для онбординга
-        self.bot.register_callback_handler('onboarding_', self._handle_onboarding_callback)
-        self.bot.register_callback_handler('genre_', self._handle_genre_selection)
+        self.bot.register_callback_handler('onboarding_', handlers.handle_onboarding_callback)
+        self.bot.register_callback_handler('genre_', handlers.handle_genre_selection)
         
         # Обработчик благодарностей
         self.bot.register_message_handler(
-            self._handle_gratitude_message,
+            handlers.handle_gratitude_message,
             func=lambda message: self._is_gratitude_message(message)
         )
         
@@ -141,472 +230,19 @@ class UserManagementModule(BaseModule):
         
         self.logger.info(f"📝 Зарегистрировано {len(self._commands)} команд")
     
-    # === ОБРАБОТЧИКИ КОМАНД ===
-    
-    @log_execution_time("start_command")
-    async def _handle_start(self, message: Message):
-        """Обработчик команды /start - онбординг"""
-        try:
-            user_id = message.from_user.id
-            group_id = getattr(message.chat, 'id', None)
-            
-            # Проверяем, зарегистрирован ли пользователь
-            async with self.database.get_async_session() as session:
-                from .models import MusicUser
-                
-                existing_user = await session.get(MusicUser, user_id)
-                if existing_user:
-                    # Пользователь уже зарегистрирован
-                    await self.bot.bot.reply_to(
-                        message,
-                        f"👋 Привет, {message.from_user.first_name}!\n\n"
-                        f"Ты уже зарегистрирован в системе.\n"
-                        f"🏆 Твоя карма: {existing_user.karma_points}\n"
-                        f"🎵 Звание: {existing_user.rank_title}\n\n"
-                        f"Используй /mystat для подробной статистики."
-                    )
-                    return
-            
-            # Начинаем онбординг
-            await self._start_onboarding(message)
-            
-            log_user_action(user_id, "start_onboarding", {"group_id": group_id})
-            
-        except Exception as e:
-            self.logger.error(f"❌ Ошибка команды /start: {e}")
-            await self.bot.bot.reply_to(
-                message,
-                "❌ Произошла ошибка при регистрации. Попробуйте позже."
-            )
-    
-    @rate_limit(calls_per_minute=30)
-    async def _handle_mystat(self, message: Message):
-        """Обработчик команды /mystat - личная статистика"""
-        try:
-            user_id = message.from_user.id
-            
-            # Получаем данные пользователя
-            user = await self._get_user(user_id)
-            if not user:
-                await self.bot.bot.reply_to(
-                    message,
-                    "👤 Вы не зарегистрированы в системе.\n"
-                    "Нажмите /start для регистрации."
-                )
-                return
-            
-            # Формируем статистику
-            stats_text = await self._format_user_stats(user)
-            
-            await self.bot.bot.reply_to(message, stats_text, parse_mode='Markdown')
-            
-            log_command_execution(user_id, "mystat", success=True)
-            
-        except Exception as e:
-            self.logger.error(f"❌ Ошибка команды /mystat: {e}")
-            log_command_execution(message.from_user.id, "mystat", success=False, error=str(e))
-    
-    @rate_limit(calls_per_minute=20)
-    async def _handle_mystats(self, message: Message):
-        """Обработчик команды /mystats - подробная статистика"""
-        try:
-            user_id = message.from_user.id
-            
-            user = await self._get_user(user_id)
-            if not user:
-                await self.bot.bot.reply_to(
-                    message,
-                    "👤 Вы не зарегистрированы в системе."
-                )
-                return
-            
-            # Получаем подробную статистику
-            detailed_stats = await self._get_detailed_user_stats(user)
-            
-            await self.bot.bot.reply_to(message, detailed_stats, parse_mode='Markdown')
-            
-        except Exception as e:
-            self.logger.error(f"❌ Ошибка команды /mystats: {e}")
-    
-    async def _handle_profile(self, message: Message):
-        """Обработчик команды /profile - профиль пользователя"""
-        try:
-            user_id = message.from_user.id
-            
-            user = await self._get_user(user_id)
-            if not user:
-                await self.bot.bot.reply_to(message, "👤 Пользователь не найден.")
-                return
-            
-            profile_text = await self._format_user_profile(user)
-            
-            # Кнопки управления профилем
-            keyboard = InlineKeyboardMarkup()
-            keyboard.row(
-                InlineKeyboardButton("🎵 Сменить жанр", callback_data="change_genre"),
-                InlineKeyboardButton("📊 Статистика", callback_data="show_stats")
-            )
-            
-            await self.bot.bot.reply_to(
-                message, 
-                profile_text, 
-                parse_mode='Markdown',
-                reply_markup=keyboard
-            )
-            
-        except Exception as e:
-            self.logger.error(f"❌ Ошибка команды /profile: {e}")
-    
-    async def _handle_karma_history(self, message: Message):
-        """Обработчик команды /karma_history - история изменений кармы"""
-        try:
-            user_id = message.from_user.id
-            
-            history = await self._get_karma_history(user_id, limit=10)
-            
-            if not history:
-                await self.bot.bot.reply_to(
-                    message,
-                    "📈 История изменений кармы пуста."
-                )
-                return
-            
-            history_text = "📈 **История изменений кармы (последние 10):**\n\n"
-            
-            for entry in history:
-                change_icon = "📈" if entry['change'] > 0 else "📉"
-                history_text += (
-                    f"{change_icon} `{entry['change']:+d}` карма\n"
-                    f"💬 {entry['reason']}\n"
-                    f"📅 {entry['date']}\n\n"
-                )
-            
-            await self.bot.bot.reply_to(message, history_text, parse_mode='Markdown')
-            
-        except Exception as e:
-            self.logger.error(f"❌ Ошибка команды /karma_history: {e}")
-    
-    # === АДМИНСКИЕ КОМАНДЫ КАРМЫ ===
-    
-    async def _handle_karma_admin(self, message: Message):
-        """Обработчик команды /karma (только админы)"""
-        try:
-            # Проверяем права админа
-            if not self._is_admin(message.from_user.id):
-                return  # Игнорируем команду для не-админов
-            
-            parts = message.text.split()
-            
-            if len(parts) < 2:
-                await self._send_karma_help(message)
-                return
-            
-            # Извлекаем упоминание пользователя
-            target_mention = parts[1]
-            if not target_mention.startswith('@'):
-                await self._send_karma_help(message)
-                return
-            
-            target_username = target_mention[1:]  # Убираем @
-            
-            if len(parts) == 2:
-                # Просто показать карму
-                await self._show_user_karma(message, target_username)
-            else:
-                # Изменение кармы
-                operation = parts[2]
-                await self._change_user_karma(message, target_username, operation)
-                
-        except Exception as e:
-            self.logger.error(f"❌ Ошибка команды /karma: {e}")
-    
-    async def _handle_karma_ratio_admin(self, message: Message):
-        """Обработчик команды /karma_ratio (только админы)"""
-        try:
-            if not self._is_admin(message.from_user.id):
-                return
-            
-            parts = message.text.split()
-            
-            if len(parts) < 2:
-                await self._send_karma_ratio_help(message)
-                return
-            
-            target_mention = parts[1]
-            if not target_mention.startswith('@'):
-                await self._send_karma_ratio_help(message)
-                return
-            
-            target_username = target_mention[1:]
-            
-            if len(parts) == 2:
-                # Показать текущее соотношение
-                await self._show_karma_ratio(message, target_username)
-            else:
-                # Изменить соотношение
-                ratio_str = parts[2]
-                await self._change_karma_ratio(message, target_username, ratio_str)
-                
-        except Exception as e:
-            self.logger.error(f"❌ Ошибка команды /karma_ratio: {e}")
-    
-    # === ОБРАБОТЧИКИ БЛАГОДАРНОСТЕЙ ===
-    
-    async def _handle_gratitude_message(self, message: Message):
-        """Обработчик сообщений с благодарностями"""
-        try:
-            # Проверяем кулдаун
-            if not self._check_gratitude_cooldown(message.from_user.id):
-                return
-            
-            # Извлекаем упоминания пользователей
-            mentions = self._extract_mentions(message.text)
-            if not mentions:
-                return
-            
-            giver_id = message.from_user.id
-            
-            # Начисляем карму каждому упомянутому пользователю
-            for username in mentions:
-                await self._give_gratitude_karma(giver_id, username, message.text)
-            
-        except Exception as e:
-            self.logger.error(f"❌ Ошибка обработки благодарности: {e}")
-    
-    # === ОНБОРДИНГ ===
-    
-    async def _start_onboarding(self, message: Message):
-        """Начало процесса онбординга"""
-        user_id = message.from_user.id
-        
-        # Сохраняем сессию онбординга
-        self.onboarding_sessions[user_id] = {
-            'step': 'welcome',
-            'started_at': time.time(),
-            'user_data': {
-                'user_id': user_id,
-                'username': message.from_user.username,
-                'first_name': message.from_user.first_name,
-                'last_name': message.from_user.last_name
-            }
-        }
-        
-        welcome_text = (
-            f"🎵 **Добро пожаловать, {message.from_user.first_name}!**\n\n"
-            f"Я Do Presave Reminder Bot — помогаю музыкантам "
-            f"находить поддержку и развивать карьеру!\n\n"
-            f"🎯 **Что я умею:**\n"
-            f"• Веду систему кармы за взаимопомощь\n"
-            f"• Помогаю найти поддержку для треков\n"
-            f"• Напоминаю о пресейвах и бустах\n"
-            f"• Показываю статистику и рейтинги\n\n"
-            f"🚀 Готов зарегистрироваться?"
-        )
-        
-        keyboard = InlineKeyboardMarkup()
-        keyboard.row(
-            InlineKeyboardButton("✅ Да, регистрируюсь!", callback_data="onboarding_start"),
-            InlineKeyboardButton("❌ Отмена", callback_data="onboarding_cancel")
-        )
-        
-        await self.bot.bot.reply_to(
-            message,
-            welcome_text,
-            parse_mode='Markdown',
-            reply_markup=keyboard
-        )
-    
-    async def _handle_onboarding_callback(self, call: CallbackQuery):
-        """Обработчик callback для онбординга"""
-        try:
-            user_id = call.from_user.id
-            action = call.data.replace('onboarding_', '')
-            
-            if user_id not in self.onboarding_sessions:
-                await self.bot.bot.answer_callback_query(
-                    call.id,
-                    "❌ Сессия онбординга истекла. Нажмите /start"
-                )
-                return
-            
-            if action == 'start':
-                await self._onboarding_choose_genre(call)
-            elif action == 'cancel':
-                await self._onboarding_cancel(call)
-                
-            await self.bot.bot.answer_callback_query(call.id)
-            
-        except Exception as e:
-            self.logger.error(f"❌ Ошибка onboarding callback: {e}")
-    
-    async def _onboarding_choose_genre(self, call: CallbackQuery):
-        """Выбор музыкального жанра"""
-        user_id = call.from_user.id
-        self.onboarding_sessions[user_id]['step'] = 'genre'
-        
-        genre_text = (
-            "🎵 **Выбери свой основной музыкальный жанр:**\n\n"
-            "Это поможет другим музыкантам найти единомышленников "
-            "и лучше понимать твою музыку."
-        )
-        
-        # Кнопки жанров
-        keyboard = InlineKeyboardMarkup()
-        genres = [
-            ('🎸 Рок', 'rock'), ('🎤 Поп', 'pop'), ('🎵 Хип-хоп', 'hiphop'),
-            ('🎹 Электронная', 'electronic'), ('🎺 Джаз', 'jazz'), ('🎻 Классика', 'classical'),
-            ('🪕 Фолк', 'folk'), ('🎸 Блюз', 'blues'), ('🥁 Другое', 'other')
-        ]
-        
-        for i in range(0, len(genres), 2):
-            row = []
-            for j in range(2):
-                if i + j < len(genres):
-                    name, code = genres[i + j]
-                    row.append(InlineKeyboardButton(name, callback_data=f"genre_{code}"))
-            keyboard.row(*row)
+    def _counted(self, handler):
+        """Обертка команды: +1 к commands_used за день (в памяти, без запроса к БД)"""
+        async def wrapper(message: Message):
+            chat = getattr(message, 'chat', None)
+            if message.from_user and chat is not None:
+                self.daily_stats.record(message.from_user.id, chat.id, commands_used=1)
+            return await handler(message)
         
-        keyboard.row(InlineKeyboardButton("⬅️ Назад", callback_data="onboarding_back"))
-        
-        await self.bot.bot.edit_message_text(
-            genre_text,
-            call.message.chat.id,
-            call.message.message_id,
-            parse_mode='Markdown',
-            reply_markup=keyboard
-        )
-    
-    async def _handle_genre_selection(self, call: CallbackQuery):
-        """Обработчик выбора жанра"""
-        try:
-            user_id = call.from_user.id
-            genre_code = call.data.replace('genre_', '')
-            
-            if user_id not in self.onboarding_sessions:
-                await self.bot.bot.answer_callback_query(call.id, "Сессия истекла")
-                return
-            
-            # Маппинг кодов в названия
-            genre_names = {
-                'rock': 'Рок', 'pop': 'Поп', 'hiphop': 'Хип-хоп',
-                'electronic': 'Электронная музыка', 'jazz': 'Джаз',
-                'classical': 'Классическая музыка', 'folk': 'Фолк',
-                'blues': 'Блюз', 'other': 'Другое'
-            }
-            
-            genre_name = genre_names.get(genre_code, 'Не указан')
-            
-            # Сохраняем жанр
-            self.onboarding_sessions[user_id]['user_data']['music_genre'] = genre_name
-            
-            # Завершаем регистрацию
-            await self._complete_onboarding(call, genre_name)
-            
-            await self.bot.bot.answer_callback_query(call.id)
-            
-        except Exception as e:
-            self.logger.error(f"❌ Ошибка выбора жанра: {e}")
-    
-    async def _complete_onboarding(self, call: CallbackQuery, genre: str):
-        """Завершение онбординга"""
-        try:
-            user_id = call.from_user.id
-            session = self.onboarding_sessions[user_id]
-            user_data = session['user_data']
-            
-            # Создаем пользователя в БД
-            async with self.database.get_async_session() as db_session:
-                from .models import MusicUser
-                
-                new_user = MusicUser(
-                    user_id=user_data['user_id'],
-                    group_id=call.message.chat.id,
-                    username=user_data.get('username'),
-                    first_name=user_data.get('first_name'),
-                    last_name=user_data.get('last_name'),
-                    music_genre=genre,
-                    karma_points=self.karma_settings['newbie_karma'],
-                    rank_title=self._get_rank_title(self.karma_settings['newbie_karma']),
-                    is_admin=self._is_admin(user_id)
-                )
-                
-                db_session.add(new_user)
-                await db_session.commit()
-            
-            # Если админ, устанавливаем админскую карму
-            if self._is_admin(user_id):
-                await self._set_user_karma(user_id, self.karma_settings['admin_karma'], "Админские права")
-            
-            success_text = (
-                f"🎉 **Регистрация завершена!**\n\n"
-                f"👤 **Имя:** {user_data.get('first_name', 'Не указано')}\n"
-                f"🎵 **Жанр:** {genre}\n"
-                f"🏆 **Стартовая карма:** {self.karma_settings['newbie_karma']}\n"
-                f"🎖️ **Звание:** {self._get_rank_title(self.karma_settings['newbie_karma'])}\n\n"
-                f"🚀 **Что дальше?**\n"
-                f"• Используй /mystat для просмотра статистики\n"
-                f"• Публикуй ссылки на поддержку в топике #3\n"
-                f"• Поддерживай других музыкантов\n"
-                f"• Благодари участников за помощь\n\n"
-                f"🎵 Добро пожаловать в музыкальное сообщество!"
-            )
-            
-            await self.bot.bot.edit_message_text(
-                success_text,
-                call.message.chat.id,
-                call.message.message_id,
-                parse_mode='Markdown'
-            )
-            
-            # Удаляем сессию
-            del self.onboarding_sessions[user_id]
-            
-            # Генерируем событие
-            if self.event_dispatcher:
-                await self.event_dispatcher.emit(
-                    EventTypes.USER_REGISTERED,
-                    {
-                        'user_id': user_id,
-                        'username': user_data.get('username'),
-                        'genre': genre,
-                        'karma': self.karma_settings['newbie_karma']
-                    }
-                )
-            
-            log_user_action(user_id, "registration_completed", {
-                'genre': genre,
-                'karma': self.karma_settings['newbie_karma']
-            })
-            
-        except Exception as e:
-            self.logger.error(f"❌ Ошибка завершения онбординга: {e}")
+        wrapper.__name__ = getattr(handler, '__name__', 'handler')
+        return wrapper
     
     # === ВСПОМОГАТЕЛЬНЫЕ МЕТОДЫ ===
     
-    async def _get_user(self, user_id: int):
-        """Получение пользователя из БД"""
-        try:
-            async with self.database.get_async_session() as session:
-                from .models import MusicUser
-                user = await session.get(MusicUser, user_id)
-                return user
-        except Exception as e:
-            self.logger.error(f"❌ Ошибка получения пользователя {user_id}: {e}")
-            return None
-    
-    def _is_admin(self, user_id: int) -> bool:
-        """Проверка, является ли пользователь админом"""
-        # Получаем список админов из настроек
-        admin_ids = getattr(self.config, 'admin_ids', [])
-        return user_id in admin_ids
-    
-    def _get_rank_title(self, karma: int) -> str:
-        """Получение звания по карме"""
-        for title, (min_karma, max_karma) in self.rank_thresholds.items():
-            if min_karma <= karma <= max_karma:
-                return title
-        return "Новенький"  # По умолчанию
-    
     def _is_gratitude_message(self, message: Message) -> bool:
         """Проверка, является ли сообщение благодарностью"""
         if not message.text:
@@ -623,56 +259,6 @@ class UserManagementModule(BaseModule):
         
         return has_gratitude and has_mention
     
-    def _extract_mentions(self, text: str) -> List[str]:
-        """Извлечение упоминаний пользователей из текста"""
-        pattern = r'@(\w+)'
-        mentions = re.findall(pattern, text)
-        return mentions
-    
-    def _check_gratitude_cooldown(self, user_id: int) -> bool:
-        """Проверка кулдауна для благодарностей"""
-        now = time.time()
-        cooldown = self.karma_settings['gratitude_cooldown_minutes'] * 60
-        
-        if user_id not in self.command_cooldowns:
-            self.command_cooldowns[user_id] = {}
-        
-        last_gratitude = self.command_cooldowns[user_id].get('gratitude', 0)
-        
-        if now - last_gratitude < cooldown:
-            return False
-        
-        self.command_cooldowns[user_id]['gratitude'] = now
-        return True
-    
-    async def _format_user_stats(self, user) -> str:
-        """Форматирование статистики пользователя"""
-        rank_emoji = {
-            'Новенький': '🥉',
-            'Надежда сообщества': '🥈', 
-            'Мега-помощничье': '🥇',
-            'Амбассадорище': '💎'
-        }
-        
-        emoji = rank_emoji.get(user.rank_title, '🎵')
-        
-        stats = (
-            f"📊 **Твоя статистика**\n\n"
-            f"{emoji} **Звание:** {user.rank_title}\n"
-            f"🏆 **Карма:** {user.karma_points}/{self.karma_settings['max_karma']}\n"
-            f"🎵 **Жанр:** {user.music_genre or 'Не указан'}\n\n"
-            f"📈 **Активность:**\n"
-            f"• Опубликовано ссылок: {user.links_published}\n"
-            f"• Пресейвов сделано: {user.presaves_given}\n"
-            f"• Пресейвов получено: {user.presaves_received}\n"
-            f"• Соотношение дал/получил: {user.presave_ratio:.2f}\n"
-            f"• Соотношение карма/ссылки: {user.karma_to_links_ratio:.2f}\n\n"
-            f"📅 **Регистрация:** {user.registration_date.strftime('%d.%m.%Y')}\n"
-            f"🕐 **Последняя активность:** {user.last_activity.strftime('%d.%m.%Y %H:%M')}"
-        )
-        
-        return stats
-    
     async def _ensure_database_tables(self):
         """Обеспечение создания таблиц БД"""
         try:
@@ -690,17 +276,35 @@ class UserManagementModule(BaseModule):
             if not admin_ids:
                 return
             
+            changes = []
             async with self.database.get_async_session() as session:
+                from sqlalchemy import update
                 from .models import MusicUser
                 
                 for admin_id in admin_ids:
-                    user = await session.get(MusicUser, admin_id)
-                    if user and user.karma_points != self.karma_settings['admin_karma']:
-                        user.karma_points = self.karma_settings['admin_karma']
-                        user.rank_title = self._get_rank_title(self.karma_settings['admin_karma'])
-                        user.is_admin = True
+                    # Баланс меняется записью журнала, чтобы сверка сходилась
+                    exists = await session.execute(
+                        update(MusicUser).where(MusicUser.user_id == admin_id).values(is_admin=True)
+                    )
+                    if exists.rowcount:
+                        changed = await self.karma_ledger.set_balance(
+                            session, admin_id, self.karma_settings['admin_karma'], "Админские права"
+                        )
+                        if changed:
+                            changes.append((admin_id, changed))
                 
                 await session.commit()
+            
+            for admin_id, (karma_before, karma_after, group_id) in changes:
+                await self.emit_event(EventTypes.USER_KARMA_CHANGED, {
+                    'user_id': admin_id,
+                    'group_id': group_id,
+                    'old_karma': karma_before,
+                    'new_karma': karma_after,
+                    'change': karma_after - karma_before,
+                    'reason': "Админские права",
+                    'change_type': "admin_adjustment"
+                })
                 
             self.logger.info(f"✅ Обновлена карма {len(admin_ids)} админов")
             
@@ -714,7 +318,7 @@ class UserManagementModule(BaseModule):
                 current_time = time.time()
                 expired_sessions = []
                 
-                for user_id, session in self.onboarding_sessions.items():
+                for user_id, session in list(self.onboarding_sessions.items()):
                     if current_time - session['started_at'] > 1800:  # 30 минут
                         expired_sessions.append(user_id)
                 
@@ -736,24 +340,39 @@ class UserManagementModule(BaseModule):
         """Обработка команд от WebApp"""
         try:
             if command == 'get_user_stats':
-                user = await self._get_user(session.user_id)
-                if user:
-                    stats = await self._format_user_stats(user)
-                    # Отправляем статистику в WebApp формате
-                    response = {
-                        "action": "user_stats_response",
-                        "data": {
-                            "karma": user.karma_points,
-                            "rank": user.rank_title,
-                            "genre": user.music_genre,
-                            "stats": stats
-                        }
+                stats = await self.user_service.get_user_stats(session.user_id)
+                # Отправляем статистику в WebApp формате
+                response = {
+                    "action": "user_stats_response",
+                    "data": {
+                        "karma": stats['karma']['points'],
+                        "rank": stats['karma']['rank'],
+                        "genre": stats['user_info']['music_genre'],
+                        "stats": self.handlers._format_user_stats(stats)
                     }
-                    await self.bot.bot.reply_to(message, str(response))
+                }
+                await self.bot.bot.reply_to(message, str(response))
                 
             elif command == 'get_leaderboard':
-                # Реализация лидерборда для WebApp
-                pass
+                # Группа из запроса, по умолчанию - группа пользователя
+                order_by = data.get('order_by', 'karma')
+                position = await self.user_service.get_leaderboard_position(session.user_id, order_by)
+                group_id = data.get('group_id') or (position['group_id'] if position else None)
+                if group_id is None:
+                    return
+                
+                response = {
+                    "action": "leaderboard_response",
+                    "data": {
+                        "group_id": group_id,
+                        "order_by": order_by,
+                        "leaders": await self.user_service.get_leaderboard(
+                            group_id, limit=min(int(data.get('limit', 10)), 50), order_by=order_by
+                        ),
+                        "position": position
+                    }
+                }
+                await self.bot.bot.reply_to(message, str(response))
                 
         except Exception as e:
             self.logger.error(f"❌ Ошибка WebApp команды {command}: {e}")
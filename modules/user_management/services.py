@@ -9,11 +9,17 @@ import asyncio
 import json
 from datetime import datetime, date, timedelta
 from typing import Dict, Any, Optional, List, Tuple
-from sqlalchemy import and_, desc, func
+from sqlalchemy import and_, or_, case, desc, func, select
 from sqlalchemy.orm import selectinload
 
 from .models import MusicUser, KarmaHistory, UserStatistics, UserSession
 from .models import get_rank_title_by_karma, calculate_presave_ratio, calculate_karma_links_ratio
+from .ledger import KarmaLedger
+from .leaderboard import DIMENSION_ALIASES, request_karma_ratio
+from .group_stats import GroupStatsCache
+from .user_index import normalize_username
+from .daily_stats import DailyStatsAccumulator
+from core.interfaces import EventTypes
 from core.exceptions import UserError, UserNotFoundError, KarmaError, ValidationError
 from utils.logger import get_module_logger, log_user_action
 
@@ -21,16 +27,29 @@ from utils.logger import get_module_logger, log_user_action
 class UserService:
     """Сервис управления пользователями"""
     
-    def __init__(self, database, settings):
+    def __init__(self, database, settings, event_dispatcher=None, leaderboard=None,
+                 group_stats: GroupStatsCache = None, user_index=None,
+                 daily_stats: DailyStatsAccumulator = None, ledger: KarmaLedger = None):
         """
         Инициализация сервиса
         
         Args:
             database: Ядро базы данных
             settings: Настройки системы
+            event_dispatcher: Диспетчер событий (изменения кармы и ссылок)
+            leaderboard: Индекс лидербордов в памяти (LeaderboardIndex)
+            group_stats: Кеш статистики групп (общий с модулем)
+            user_index: Индекс username и имен в памяти (UsernameIndex)
+            daily_stats: Накопитель дневной статистики (общий с модулем)
+            ledger: Журнал кармы (общий с модулем - с его периодом снимков)
         """
         self.database = database
         self.settings = settings
+        self.event_dispatcher = event_dispatcher
+        self.leaderboard = leaderboard
+        self.group_stats = group_stats or GroupStatsCache(database)
+        self.user_index = user_index
+        self.daily_stats = daily_stats or DailyStatsAccumulator(database)
         self.logger = get_module_logger("user_service")
         
         # Настройки кармы
@@ -40,6 +59,13 @@ class UserService:
             'admin_karma': 100500,
             'newbie_karma': 0
         }
+        
+        # Журнал кармы: все изменения баланса идут через него
+        self.ledger = ledger or KarmaLedger(
+            database,
+            min_karma=self.karma_settings['min_karma'],
+            max_karma=self.karma_settings['max_karma']
+        )
     
     # === УПРАВЛЕНИЕ ПОЛЬЗОВАТЕЛЯМИ ===
     
@@ -54,20 +80,35 @@ class UserService:
             return None
     
     async def get_user_by_username(self, username: str, group_id: int = None) -> Optional[MusicUser]:
-        """Получение пользователя по username"""
+        """Получение активного пользователя по username (без учета регистра)"""
         try:
-            async with self.database.get_async_session() as session:
-                query = session.query(MusicUser).filter(MusicUser.username == username)
-                
-                if group_id:
-                    query = query.filter(MusicUser.group_id == group_id)
-                
-                user = await query.first()
-                return user
+            async with self.database.get_read_session() as session:
+                if self.user_index and self.user_index.is_ready:
+                    user_id = self.user_index.find_by_username(username, group_id)
+                    if user_id is None:
+                        return None
+                    condition = MusicUser.user_id == user_id
+                else:
+                    condition = func.lower(MusicUser.username) == normalize_username(username)
+                    if group_id:
+                        condition = and_(condition, MusicUser.group_id == group_id)
+                
+                # Индекс хранит только активных - то же правило для запроса к БД
+                return (await session.execute(
+                    select(MusicUser).where(condition, MusicUser.is_active == True).limit(1)
+                )).scalar_one_or_none()
         except Exception as e:
             self.logger.error(f"❌ Ошибка получения пользователя @{username}: {e}")
             return None
     
+    async def resolve_username(self, username: str, group_id: int = None) -> Optional[int]:
+        """user_id по @username: из индекса в памяти, без него - из БД"""
+        if self.user_index and self.user_index.is_ready:
+            return self.user_index.find_by_username(username, group_id)
+        
+        user = await self.get_user_by_username(username, group_id)
+        return user.user_id if user else None
+    
     async def create_user(self, user_data: Dict[str, Any]) -> MusicUser:
         """Создание нового пользователя"""
         try:
@@ -97,6 +138,7 @@ class UserService:
                 )
                 
                 session.add(user)
+                self.ledger.open_balance(session, user.user_id, user.group_id, user.karma_points)
                 await session.commit()
                 await session.refresh(user)
                 
@@ -117,7 +159,17 @@ class UserService:
                 })
                 
                 self.logger.info(f"✅ Создан пользователь: {user.user_id} (@{user.username})")
-                return user
+            
+            await self._emit(EventTypes.USER_REGISTERED, {
+                'user_id': user.user_id,
+                'group_id': user.group_id,
+                'username': user.username,
+                'first_name': user.first_name,
+                'last_name': user.last_name,
+                'genre': user.music_genre,
+                'karma': user.karma_points
+            })
+            return user
                 
         except Exception as e:
             self.logger.error(f"❌ Ошибка создания пользователя: {e}")
@@ -142,7 +194,19 @@ class UserService:
                 await session.commit()
                 
                 log_user_action(user_id, "user_updated", updates)
-                return True
+            
+            await self._emit(EventTypes.USER_PROFILE_UPDATED, {
+                'user_id': user_id,
+                'group_id': user.group_id,
+                'username': user.username,
+                'first_name': user.first_name,
+                'last_name': user.last_name,
+                'is_active': user.is_active,
+                'karma': user.karma_points,
+                'links_published': user.links_published,
+                'fields': list(updates)
+            })
+            return True
                 
         except Exception as e:
             self.logger.error(f"❌ Ошибка обновления пользователя {user_id}: {e}")
@@ -187,52 +251,27 @@ class UserService:
     
     async def change_karma(self, user_id: int, change_amount: int, reason: str, 
                           changed_by: int = None, change_type: str = "manual") -> bool:
-        """Изменение кармы пользователя"""
+        """Изменение кармы пользователя (атомарно, с записью в журнал кармы)"""
         try:
             async with self.database.get_async_session() as session:
-                user = await session.get(MusicUser, user_id)
-                if not user:
-                    raise UserNotFoundError(f"Пользователь {user_id} не найден")
-                
-                # Проверяем возможность изменения
-                can_change, error_msg = user.can_change_karma(change_amount, self.karma_settings['max_karma'])
-                if not can_change:
-                    raise KarmaError(error_msg)
-                
-                # Сохраняем старое значение
-                karma_before = user.karma_points
-                new_karma = karma_before + change_amount
-                
-                # Обновляем карму
-                user.karma_points = new_karma
-                user.rank_title = get_rank_title_by_karma(new_karma)
-                user.update_activity()
-                
-                # Записываем в историю
-                history_entry = KarmaHistory(
-                    user_id=user_id,
-                    group_id=user.group_id,
-                    karma_change=change_amount,
-                    karma_before=karma_before,
-                    karma_after=new_karma,
-                    reason=reason,
-                    change_type=change_type,
-                    changed_by_user_id=changed_by
+                karma_before, new_karma, group_id = await self.ledger.apply(
+                    session, user_id, change_amount, reason,
+                    change_type=change_type, changed_by=changed_by
                 )
-                
-                session.add(history_entry)
-                await session.commit()
-                
-                log_user_action(user_id, "karma_changed", {
-                    'old_karma': karma_before,
-                    'new_karma': new_karma,
-                    'change': change_amount,
-                    'reason': reason,
-                    'changed_by': changed_by
-                })
-                
-                self.logger.info(f"✅ Карма изменена: {user_id} {karma_before}→{new_karma} ({change_amount:+d})")
-                return True
+            
+            await self._emit_karma_changed(user_id, group_id, karma_before, new_karma, reason,
+                                           change_type, changed_by)
+            
+            log_user_action(user_id, "karma_changed", {
+                'old_karma': karma_before,
+                'new_karma': new_karma,
+                'change': change_amount,
+                'reason': reason,
+                'changed_by': changed_by
+            })
+            
+            self.logger.info(f"✅ Карма изменена: {user_id} {karma_before}→{new_karma} ({change_amount:+d})")
+            return True
                 
         except Exception as e:
             self.logger.error(f"❌ Ошибка изменения кармы {user_id}: {e}")
@@ -242,32 +281,37 @@ class UserService:
                        changed_by: int = None, change_type: str = "manual") -> bool:
         """Установка точного значения кармы"""
         try:
-            user = await self.get_user(user_id)
-            if not user:
-                raise UserNotFoundError(f"Пользователь {user_id} не найден")
-            
-            change_amount = karma_value - user.karma_points
-            
-            if change_amount == 0:
-                return True  # Карма уже имеет нужное значение
+            async with self.database.get_async_session() as session:
+                changed = await self.ledger.set_balance(
+                    session, user_id, karma_value, reason,
+                    change_type=change_type, changed_by=changed_by
+                )
             
-            return await self.change_karma(user_id, change_amount, reason, changed_by, change_type)
+            if changed:
+                karma_before, new_karma, group_id = changed
+                await self._emit_karma_changed(user_id, group_id, karma_before, new_karma, reason,
+                                               change_type, changed_by)
+            return True
             
         except Exception as e:
             self.logger.error(f"❌ Ошибка установки кармы {user_id}: {e}")
             raise KarmaError(f"Не удалось установить карму: {e}")
     
+    async def get_karma_at(self, user_id: int, moment: datetime) -> Optional[int]:
+        """Карма пользователя на момент времени (снимок + хвост журнала)"""
+        return await self.ledger.karma_at(user_id, moment)
+    
     async def give_gratitude_karma(self, giver_id: int, receiver_username: str, context: str = "") -> bool:
         """Начисление кармы за благодарность"""
         try:
-            # Находим получателя по username
-            receiver = await self.get_user_by_username(receiver_username)
-            if not receiver:
+            # Находим получателя по username (индекс в памяти, без запроса к БД)
+            receiver_id = await self.resolve_username(receiver_username)
+            if receiver_id is None:
                 self.logger.warning(f"⚠️ Пользователь @{receiver_username} не найден для благодарности")
                 return False
             
             # Проверяем, что не благодарят самого себя
-            if giver_id == receiver.user_id:
+            if giver_id == receiver_id:
                 return False
             
             # Начисляем 1 карму
@@ -276,7 +320,7 @@ class UserService:
                 reason += f" | {context[:100]}"
             
             await self.change_karma(
-                receiver.user_id,
+                receiver_id,
                 1,  # +1 карма за благодарность
                 reason,
                 changed_by=giver_id,
@@ -284,7 +328,7 @@ class UserService:
             )
             
             log_user_action(giver_id, "gratitude_given", {
-                'receiver_id': receiver.user_id,
+                'receiver_id': receiver_id,
                 'receiver_username': receiver_username
             })
             
@@ -371,107 +415,138 @@ class UserService:
     
     async def get_leaderboard(self, group_id: int, limit: int = 10, 
                              order_by: str = "karma") -> List[Dict[str, Any]]:
-        """Получение лидерборда"""
+        """Получение лидерборда (карма, просьбы и соотношение - из индекса в памяти)"""
         try:
-            async with self.database.get_async_session() as session:
-                # Определяем поле сортировки
-                order_field = {
-                    'karma': MusicUser.karma_points,
-                    'presaves_given': MusicUser.presaves_given,
-                    'presaves_received': MusicUser.presaves_received,
-                    'links_published': MusicUser.links_published,
-                    'activity': MusicUser.last_activity
-                }.get(order_by, MusicUser.karma_points)
+            dimension = DIMENSION_ALIASES.get(order_by)
+            if self.leaderboard and self.leaderboard.is_ready and dimension:
+                ranked = self.leaderboard.top(group_id, dimension, limit)
+                if not ranked:
+                    return []
+                
+                # Из БД читаются только N строк топа по user_id
+                async with self.database.get_read_session() as session:
+                    users = {
+                        user.user_id: user for user in (await session.execute(
+                            select(MusicUser).where(MusicUser.user_id.in_([item['user_id'] for item in ranked]))
+                        )).scalars()
+                    }
                 
-                query = (
-                    session.query(MusicUser)
-                    .filter(MusicUser.group_id == group_id)
-                    .filter(MusicUser.is_active == True)
-                    .order_by(desc(order_field))
+                return [
+                    self._leaderboard_entry(item['position'], users[item['user_id']])
+                    for item in ranked if item['user_id'] in users
+                ]
+            
+            # Определяем поле сортировки
+            order_field = {
+                'karma': MusicUser.karma_points,
+                'presaves_given': MusicUser.presaves_given,
+                'presaves_received': MusicUser.presaves_received,
+                'links_published': MusicUser.links_published,
+                'requests': MusicUser.links_published,
+                'ratio': MusicUser.links_published * 1.0 / case(
+                    (MusicUser.karma_points > 1, MusicUser.karma_points), else_=1
+                ),
+                'activity': MusicUser.last_activity
+            }.get(order_by, MusicUser.karma_points)
+            
+            async with self.database.get_read_session() as session:
+                users = (await session.execute(
+                    select(MusicUser)
+                    .where(MusicUser.group_id == group_id, MusicUser.is_active == True)
+                    .order_by(desc(order_field), MusicUser.user_id)
                     .limit(limit)
-                )
-                
-                users = await query.all()
-                
-                leaderboard = []
-                for position, user in enumerate(users, 1):
-                    leaderboard.append({
-                        'position': position,
-                        'user_id': user.user_id,
-                        'display_name': user.get_display_name(),
-                        'karma': user.karma_points,
-                        'rank': user.rank_title,
-                        'rank_emoji': user.get_rank_emoji(),
-                        'presaves_given': user.presaves_given,
-                        'presaves_received': user.presaves_received,
-                        'links_published': user.links_published,
-                        'music_genre': user.music_genre
-                    })
-                
-                return leaderboard
+                )).scalars().all()
+            
+            return [self._leaderboard_entry(position, user) for position, user in enumerate(users, 1)]
                 
         except Exception as e:
             self.logger.error(f"❌ Ошибка получения лидерборда: {e}")
             return []
     
+    async def get_leaderboard_position(self, user_id: int, order_by: str = "karma") -> Optional[Dict[str, Any]]:
+        """
+        Место пользователя в лидерборде группы
+        
+        Returns:
+            dict: {'position', 'total', 'value', 'group_id'}, None - пользователь не найден
+        """
+        dimension = DIMENSION_ALIASES.get(order_by, 'karma')
+        if self.leaderboard and self.leaderboard.is_ready:
+            return self.leaderboard.position(user_id, dimension)
+        
+        # Без индекса: подсчет тех, кто выше, одним запросом
+        try:
+            value_of = {
+                'karma': MusicUser.karma_points,
+                'requests': MusicUser.links_published,
+                'ratio': MusicUser.links_published * 1.0 / case(
+                    (MusicUser.karma_points > 1, MusicUser.karma_points), else_=1
+                )
+            }[dimension]
+            
+            async with self.database.get_read_session() as session:
+                me = (await session.execute(
+                    select(MusicUser.group_id, value_of).where(MusicUser.user_id == user_id)
+                )).first()
+                if me is None:
+                    return None
+                group_id, value = me
+                
+                above, total = (await session.execute(
+                    select(
+                        func.count().filter(value_of > value),
+                        func.count()
+                    ).where(MusicUser.group_id == group_id, MusicUser.is_active == True)
+                )).one()
+            
+            return {'position': above + 1, 'total': total, 'value': value, 'group_id': group_id}
+            
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка получения места {user_id} в лидерборде: {e}")
+            return None
+    
+    @staticmethod
+    def _leaderboard_entry(position: int, user: MusicUser) -> Dict[str, Any]:
+        """Строка лидерборда"""
+        return {
+            'position': position,
+            'user_id': user.user_id,
+            'display_name': user.get_display_name(),
+            'karma': user.karma_points,
+            'rank': user.rank_title,
+            'rank_emoji': user.get_rank_emoji(),
+            'presaves_given': user.presaves_given,
+            'presaves_received': user.presaves_received,
+            'links_published': user.links_published,
+            'ratio': request_karma_ratio(user.links_published, user.karma_points),
+            'music_genre': user.music_genre
+        }
+    
     async def get_group_statistics(self, group_id: int) -> Dict[str, Any]:
-        """Получение общей статистики группы"""
+        """Получение общей статистики группы (один запрос, кеш по группе)"""
         try:
-            async with self.database.get_async_session() as session:
-                # Общее количество пользователей
-                total_users = await session.query(func.count(MusicUser.id)).filter(
-                    MusicUser.group_id == group_id,
-                    MusicUser.is_active == True
-                ).scalar()
-                
-                # Статистика по рангам
-                rank_stats = await session.query(
-                    MusicUser.rank_title,
-                    func.count(MusicUser.id)
-                ).filter(
-                    MusicUser.group_id == group_id,
-                    MusicUser.is_active == True
-                ).group_by(MusicUser.rank_title).all()
-                
-                # Общая статистика активности
-                activity_stats = await session.query(
-                    func.sum(MusicUser.presaves_given),
-                    func.sum(MusicUser.presaves_received),
-                    func.sum(MusicUser.links_published),
-                    func.avg(MusicUser.karma_points)
-                ).filter(
-                    MusicUser.group_id == group_id,
-                    MusicUser.is_active == True
-                ).first()
-                
-                # Топ жанры
-                genre_stats = await session.query(
-                    MusicUser.music_genre,
-                    func.count(MusicUser.id)
-                ).filter(
-                    MusicUser.group_id == group_id,
-                    MusicUser.is_active == True,
-                    MusicUser.music_genre.isnot(None)
-                ).group_by(MusicUser.music_genre).order_by(
-                    desc(func.count(MusicUser.id))
-                ).limit(5).all()
-                
-                return {
-                    'total_users': total_users or 0,
-                    'rank_distribution': {rank: count for rank, count in rank_stats},
-                    'activity': {
-                        'total_presaves_given': activity_stats[0] or 0,
-                        'total_presaves_received': activity_stats[1] or 0,
-                        'total_links_published': activity_stats[2] or 0,
-                        'average_karma': round(activity_stats[3] or 0, 1)
-                    },
-                    'top_genres': [{'genre': genre, 'count': count} for genre, count in genre_stats]
-                }
-                
+            return await self.group_stats.get(group_id)
         except Exception as e:
             self.logger.error(f"❌ Ошибка получения статистики группы {group_id}: {e}")
             return {}
     
+    async def get_daily_stats(self, user_id: int, start: date, end: date,
+                              group_id: int = None) -> List[Dict[str, Any]]:
+        """Дневная статистика пользователя за период (включая несброшенные счетчики)"""
+        try:
+            return await self.daily_stats.get_user_range(user_id, start, end, group_id)
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка получения дневной статистики {user_id}: {e}")
+            return []
+    
+    async def get_group_daily_stats(self, group_id: int, start: date, end: date) -> List[Dict[str, Any]]:
+        """Дневная статистика группы за период"""
+        try:
+            return await self.daily_stats.get_group_range(group_id, start, end)
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка получения дневной статистики группы {group_id}: {e}")
+            return []
+    
     # === СООТНОШЕНИЯ И МЕТРИКИ ===
     
     async def update_presave_stats(self, user_id: int, presaves_given: int = 0, 
@@ -497,8 +572,15 @@ class UserService:
                 
                 user.update_activity()
                 await session.commit()
-                
-                return True
+            
+            if links_published > 0:
+                await self._emit(EventTypes.USER_LINKS_CHANGED, {
+                    'user_id': user_id,
+                    'group_id': user.group_id,
+                    'links_published': user.links_published,
+                    'links_added': links_published
+                })
+            return True
                 
         except Exception as e:
             self.logger.error(f"❌ Ошибка обновления статистики пресейвов {user_id}: {e}")
@@ -528,8 +610,13 @@ class UserService:
                     'karma': karma,
                     'ratio': float(user.karma_to_links_ratio)
                 })
-                
-                return True
+            
+            await self._emit(EventTypes.USER_LINKS_CHANGED, {
+                'user_id': user_id,
+                'group_id': user.group_id,
+                'links_published': links
+            })
+            return True
                 
         except Exception as e:
             self.logger.error(f"❌ Ошибка установки соотношения кармы {user_id}: {e}")
@@ -537,33 +624,67 @@ class UserService:
     
     # === ВСПОМОГАТЕЛЬНЫЕ МЕТОДЫ ===
     
+    async def _emit(self, event_type: str, data: Dict[str, Any]):
+        """Отправка события после фиксации транзакции"""
+        # Свой кеш статистики устаревает сразу, не дожидаясь диспетчера
+        await self.group_stats.on_event(event_type, data)
+        if self.event_dispatcher:
+            await self.event_dispatcher.emit(event_type, data, source_module="user_management")
+    
+    async def _emit_karma_changed(self, user_id: int, group_id: int, old_karma: int,
+                                  new_karma: int, reason: str, change_type: str = None,
+                                  changed_by: int = None):
+        await self._emit(EventTypes.USER_KARMA_CHANGED, {
+            'user_id': user_id,
+            'group_id': group_id,
+            'old_karma': old_karma,
+            'new_karma': new_karma,
+            'change': new_karma - old_karma,
+            'reason': reason,
+            'change_type': change_type,
+            'changed_by': changed_by
+        })
+    
     def _is_admin(self, user_id: int) -> bool:
         """Проверка, является ли пользователь админом"""
         admin_ids = getattr(self.settings, 'admin_ids', [])
         return user_id in admin_ids
     
     async def search_users(self, query: str, group_id: int = None, limit: int = 10) -> List[MusicUser]:
-        """Поиск пользователей по имени/username"""
+        """Поиск пользователей по началу username/имени (автодополнение)"""
         try:
-            async with self.database.get_async_session() as session:
-                search_filter = f"%{query}%"
-                
-                db_query = session.query(MusicUser).filter(
-                    and_(
-                        MusicUser.is_active == True,
-                        func.or_(
-                            MusicUser.username.ilike(search_filter),
-                            MusicUser.first_name.ilike(search_filter),
-                            MusicUser.last_name.ilike(search_filter)
-                        )
-                    )
+            if self.user_index and self.user_index.is_ready:
+                user_ids = self.user_index.complete(query, group_id, limit)
+                if not user_ids:
+                    return []
+                
+                async with self.database.get_read_session() as session:
+                    users = {
+                        user.user_id: user for user in (await session.execute(
+                            select(MusicUser).where(MusicUser.user_id.in_(user_ids))
+                        )).scalars()
+                    }
+                return [users[user_id] for user_id in user_ids if user_id in users]
+            
+            prefix = normalize_username(query)
+            if not prefix:
+                return []
+            
+            conditions = [
+                MusicUser.is_active == True,
+                or_(
+                    func.lower(MusicUser.username).startswith(prefix, autoescape=True),
+                    func.lower(MusicUser.first_name).startswith(prefix, autoescape=True),
+                    func.lower(MusicUser.last_name).startswith(prefix, autoescape=True)
                 )
-                
-                if group_id:
-                    db_query = db_query.filter(MusicUser.group_id == group_id)
-                
-                users = await db_query.limit(limit).all()
-                return users
+            ]
+            if group_id:
+                conditions.append(MusicUser.group_id == group_id)
+            
+            async with self.database.get_read_session() as session:
+                return list((await session.execute(
+                    select(MusicUser).where(*conditions).order_by(MusicUser.username).limit(limit)
+                )).scalars())
                 
         except Exception as e:
             self.logger.error(f"❌ Ошибка поиска пользователей: {e}")
@@ -0,0 +1,209 @@
+"""
+Modules/user_management/user_index.py - Индекс имен пользователей
+Do Presave Reminder Bot v29.07
+
+Поиск и автодополнение по @username и отображаемым именам без запроса
+к БД. Для каждой группы (и общий, без группы) хранится отсортированный
+список ключей (имя в нижнем регистре, user_id): точное совпадение и
+префикс - bisect и короткий проход вперед. Ключи пользователя:
+username, имя, фамилия и «имя фамилия».
+
+Индекс строится из БД при старте модуля и обновляется событиями
+USER_REGISTERED и USER_PROFILE_UPDATED. Пока индекс не готов, UserService
+ищет в БД по lower(username) - для этого есть функциональный индекс
+idx_music_users_username_lower (CORE_MIGRATIONS).
+"""
+
+import bisect
+from typing import Dict, Any, Optional, List, Tuple
+
+from sqlalchemy import select
+
+from .models import MusicUser
+from core.interfaces import EventTypes
+from utils.logger import get_module_logger
+
+
+def normalize_username(username: Optional[str]) -> str:
+    """Ключ username: без @, в нижнем регистре (username в Telegram регистронезависимы)"""
+    return (username or '').strip().lstrip('@').lower()
+
+
+def name_keys(username: Optional[str], first_name: Optional[str],
+              last_name: Optional[str]) -> Tuple[str, ...]:
+    """Ключи поиска пользователя"""
+    keys = {normalize_username(username)}
+    first = (first_name or '').strip().lower()
+    last = (last_name or '').strip().lower()
+    keys.update((first, last, f"{first} {last}".strip()))
+    keys.discard('')
+    return tuple(sorted(keys))
+
+
+class UsernameIndex:
+    """Индекс username и имен пользователей по группам"""
+
+    def __init__(self, database):
+        """
+        Инициализация индекса
+
+        Args:
+            database: Ядро базы данных
+        """
+        self.database = database
+        self.logger = get_module_logger("user_index")
+
+        # user_id -> {'group_id', 'username', 'first_name', 'last_name', 'keys'}
+        self._users: Dict[int, Dict[str, Any]] = {}
+        # username (нижний регистр) -> user_id
+        self._by_username: Dict[str, int] = {}
+        # group_id (None - все группы) -> отсортированные (ключ, user_id)
+        self._keys: Dict[Optional[int], List[Tuple[str, int]]] = {None: []}
+
+        self._pending: Optional[List[Tuple[str, Dict[str, Any]]]] = None
+        self.is_ready = False
+
+    # === ПОСТРОЕНИЕ ===
+
+    async def rebuild(self) -> int:
+        """
+        Построение индекса из БД (активные пользователи)
+
+        Returns:
+            int: Количество пользователей в индексе
+        """
+        self._pending = []
+        try:
+            async with self.database.get_read_session() as session:
+                rows = (await session.execute(
+                    select(MusicUser.user_id, MusicUser.group_id, MusicUser.username,
+                           MusicUser.first_name, MusicUser.last_name)
+                    .where(MusicUser.is_active == True)
+                )).all()
+
+            self._users = {}
+            self._by_username = {}
+            self._keys = {None: []}
+            for user_id, group_id, username, first_name, last_name in rows:
+                self._set(user_id, group_id, username, first_name, last_name)
+
+            pending, self._pending = self._pending, None
+            for event_type, data in pending:
+                self._apply(event_type, data)
+
+            self.is_ready = True
+            self.logger.info(f"✅ Индекс имен построен: {len(self._users)} пользователей")
+            return len(self._users)
+
+        except Exception as e:
+            self._pending = None
+            self.logger.error(f"❌ Ошибка построения индекса имен: {e}")
+            raise
+
+    # === ОБНОВЛЕНИЕ ===
+
+    async def on_event(self, event_type: str, data: Dict[str, Any]):
+        """Обработчик событий диспетчера"""
+        if self._pending is not None:
+            self._pending.append((event_type, data))
+            return
+        self._apply(event_type, data)
+
+    def _apply(self, event_type: str, data: Dict[str, Any]):
+        if event_type not in (EventTypes.USER_REGISTERED, EventTypes.USER_PROFILE_UPDATED):
+            return
+
+        user_id = data.get('user_id')
+        if user_id is None:
+            return
+
+        if data.get('is_active') is False:
+            self.remove_user(user_id)
+            return
+
+        # Поля, которых нет в событии, остаются прежними
+        current = self._users.get(user_id) or {}
+        group_id = data.get('group_id', current.get('group_id'))
+        if group_id is None:
+            return
+
+        self._set(
+            user_id,
+            group_id,
+            data.get('username', current.get('username')),
+            data.get('first_name', current.get('first_name')),
+            data.get('last_name', current.get('last_name'))
+        )
+
+    def _set(self, user_id: int, group_id: int, username: Optional[str],
+             first_name: Optional[str], last_name: Optional[str]):
+        self.remove_user(user_id)
+
+        keys = name_keys(username, first_name, last_name)
+        group_keys = self._keys.setdefault(group_id, [])
+        for key in keys:
+            bisect.insort(group_keys, (key, user_id))
+            bisect.insort(self._keys[None], (key, user_id))
+
+        login = normalize_username(username)
+        if login:
+            self._by_username[login] = user_id
+
+        self._users[user_id] = {
+            'group_id': group_id,
+            'username': username,
+            'first_name': first_name,
+            'last_name': last_name,
+            'keys': keys
+        }
+
+    def remove_user(self, user_id: int):
+        """Удаление пользователя из индекса"""
+        current = self._users.pop(user_id, None)
+        if current is None:
+            return
+
+        for group_id in (current['group_id'], None):
+            group_keys = self._keys.get(group_id, [])
+            for key in current['keys']:
+                index = bisect.bisect_left(group_keys, (key, user_id))
+                if index < len(group_keys) and group_keys[index] == (key, user_id):
+                    del group_keys[index]
+
+        login = normalize_username(current['username'])
+        if self._by_username.get(login) == user_id:
+            del self._by_username[login]
+
+    # === ЗАПРОСЫ ===
+
+    def find_by_username(self, username: str, group_id: int = None) -> Optional[int]:
+        """user_id по @username (без учета регистра), None - не найден"""
+        user_id = self._by_username.get(normalize_username(username))
+        if user_id is None:
+            return None
+        if group_id and self._users[user_id]['group_id'] != group_id:
+            return None
+        return user_id
+
+    def complete(self, prefix: str, group_id: int = None, limit: int = 10) -> List[int]:
+        """
+        Автодополнение: пользователи, у которых username или имя начинается с prefix
+
+        Returns:
+            list: user_id в порядке ключей, без повторов
+        """
+        prefix = normalize_username(prefix)
+        if not prefix:
+            return []
+
+        group_keys = self._keys.get(group_id or None, [])
+        found: List[int] = []
+        for key, user_id in group_keys[bisect.bisect_left(group_keys, (prefix,)):]:
+            if not key.startswith(prefix) or len(found) >= limit:
+                break
+            if user_id not in found:
+                found.append(user_id)
+        return found
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {'users': len(self._users), 'keys': len(self._keys[None]), 'ready': self.is_ready}
@@ -127,13 +127,13 @@ def init_all_services(config, db_manager, bot):
             # services['forms'] = init_forms_system(db_manager, bot)
             logger.info("⏸️ ПЛАН 3 - в разработке")
         
-        # ПЛАН 4: Инициализация backup системы (ЗАГЛУШКИ)
+        # ПЛАН 4: Инициализация backup системы
         if getattr(config, 'ENABLE_PLAN_4_FEATURES', False):
             logger.info("🔄 Инициализация сервисов ПЛАН 4...")
-            # TODO: Активировать в ПЛАНЕ 4
-            # services['backup'] = init_backup_manager(db_manager)
-            # services['scheduler'] = init_backup_scheduler(bot, config)
-            logger.info("⏸️ ПЛАН 4 - в разработке")
+            from .backup_restore import init_backup_manager, init_backup_scheduler
+            services['backup'] = init_backup_manager(db_manager)
+            services['scheduler'] = init_backup_scheduler(bot)
+            logger.info("✅ ПЛАН 4 - backup и ежедневный планировщик активны")
         
         logger.info(f"✅ Сервисы инициализированы: {len(services)}")
         return services
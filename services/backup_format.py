@@ -0,0 +1,244 @@
+"""
+Формат backup Do Presave Reminder Bot v25+
+Потоковая запись дампа БД: сжатый NDJSON с контрольными суммами чанков
+
+ПЛАН 4: Формат файла backup (АКТИВНАЯ)
+
+Файл - gzip с одной JSON-записью на строку:
+
+    {"type": "header", "format": ..., "version": 1, "created_at": ..., ...}
+    {"type": "table", "name": "users", "columns": [["user_id", "BigInteger"], ...]}
+    {"type": "chunk", "table": "users", "seq": 0, "count": 1000,
+     "sha256": "...", "rows": [[...], ...]}
+    ...
+    {"type": "end", "tables": {"users": 1234, ...}, "chunks": 42}
+
+Инкрементальный backup (kind "incremental" в заголовке, parent_id -
+предыдущий backup цепочки) содержит только новые и измененные строки:
+у записи "table" есть mode - "replace" (таблица целиком) или "upsert"
+(строки заменяют одноименные по первичному ключу), а перед чанками
+могут идти записи удаления диапазона:
+
+    {"type": "delete", "table": "links", "column": "created_at",
+     "from": "2025-01-01T00:00:00", "to": "2025-02-01T00:00:00"}
+
+Строки таблицы - списки значений в порядке columns. sha256 считается по
+каноническому JSON списка rows, поэтому поврежденный или обрезанный
+чанк обнаруживается без чтения всего файла в память. Запись "end"
+подтверждает, что дамп дописан до конца.
+
+Значения: datetime/date/time - ISO 8601, bytes - base64, Decimal - строка;
+обратное преобразование - по типу колонки из записи "table" (decode_value).
+
+Для проверки восстановления считается дайджест таблицы (TableDigest):
+сумма хешей строк, не зависящая от порядка - его можно посчитать и по
+файлу, и по загруженной таблице.
+"""
+
+import json
+import gzip
+import base64
+import hashlib
+from datetime import datetime, date, time
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from core.exceptions import BackupCorruptedError
+
+FORMAT_NAME = 'presave-bot-backup'
+FORMAT_VERSION = 1
+FILE_SUFFIX = '.ndjson.gz'
+
+
+def _encode_value(value: Any) -> Any:
+    """Значение, которое json не умеет сериализовать сам"""
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(value)).decode('ascii')
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Тип {type(value).__name__} не поддерживается в backup")
+
+
+def dumps(value: Any) -> str:
+    """Канонический JSON (одинаковый при записи и проверке чанка)"""
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=_encode_value)
+
+
+def checksum(rows_json: str) -> str:
+    """Контрольная сумма чанка"""
+    return hashlib.sha256(rows_json.encode('utf-8')).hexdigest()
+
+
+def encode_row(row: Sequence[Any]) -> List[Any]:
+    """Строка БД в значения формата backup (как после записи и чтения файла)"""
+    return json.loads(dumps(list(row)))
+
+
+def decode_value(value: Any, type_name: str) -> Any:
+    """Значение из файла в тип Python для колонки типа type_name"""
+    if value is None:
+        return None
+    if type_name == 'DateTime':
+        return datetime.fromisoformat(value)
+    if type_name == 'Date':
+        return date.fromisoformat(value)
+    if type_name == 'Time':
+        return time.fromisoformat(value)
+    if type_name == 'LargeBinary':
+        return base64.b64decode(value)
+    if type_name == 'Numeric':
+        return Decimal(value)
+    return value
+
+
+class TableDigest:
+    """Дайджест содержимого таблицы, не зависящий от порядка строк"""
+
+    _MOD = 1 << 64
+
+    def __init__(self):
+        self.rows = 0
+        self.value = 0
+
+    def update(self, rows: List[List[Any]]):
+        """rows - строки в значениях формата backup"""
+        for row in rows:
+            line = json.dumps(row, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+            self.value = (self.value + int(hashlib.sha256(line.encode('utf-8')).hexdigest()[:16], 16)) % self._MOD
+        self.rows += len(rows)
+
+    def hexdigest(self) -> str:
+        return f"{self.value:016x}"
+
+
+class BackupWriter:
+    """Потоковая запись backup в файл или канал (в памяти - только текущий чанк)"""
+
+    def __init__(self, fileobj, compresslevel: int = 6):
+        """
+        Args:
+            fileobj: бинарный файл/канал для записи (закрывает вызывающий)
+            compresslevel: уровень gzip
+        """
+        self._gzip = gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=compresslevel)
+        self._table: Optional[str] = None
+        self._seq = 0
+        self.tables: Dict[str, int] = {}
+        self.chunks = 0
+
+    def _write(self, line: str):
+        self._gzip.write(line.encode('utf-8'))
+        self._gzip.write(b'\n')
+
+    def write_header(self, metadata: Dict[str, Any]):
+        """Заголовок дампа"""
+        self._write(dumps({'type': 'header', 'format': FORMAT_NAME,
+                           'version': FORMAT_VERSION, **metadata}))
+
+    def begin_table(self, name: str, columns: Sequence[Sequence[str]], mode: str = None):
+        """Начало таблицы: имена и типы колонок (mode - для инкрементального backup)"""
+        self._table = name
+        self._seq = 0
+        self.tables[name] = 0
+        record = {'type': 'table', 'name': name, 'columns': [list(c) for c in columns]}
+        if mode:
+            record['mode'] = mode
+        self._write(dumps(record))
+
+    def write_delete(self, column: str, start: Any, end: Any = None):
+        """Удаление диапазона [start, end) текущей таблицы перед загрузкой ее строк"""
+        self._write(dumps({'type': 'delete', 'table': self._table, 'column': column,
+                           'from': start, 'to': end}))
+
+    def write_rows(self, rows: List[Sequence[Any]]):
+        """Чанк строк текущей таблицы"""
+        if not rows:
+            return
+
+        rows_json = dumps([list(row) for row in rows])
+        # rows вставляется готовой строкой: сумма считается по тем же байтам
+        self._write(
+            f'{{"type":"chunk","table":{dumps(self._table)},"seq":{self._seq},'
+            f'"count":{len(rows)},"sha256":"{checksum(rows_json)}","rows":{rows_json}}}'
+        )
+        self._seq += 1
+        self.chunks += 1
+        self.tables[self._table] += len(rows)
+
+    def finish(self, extra: Dict[str, Any] = None):
+        """Завершающая запись и сброс gzip"""
+        self._write(dumps({'type': 'end', 'tables': self.tables, 'chunks': self.chunks,
+                           **(extra or {})}))
+        self._gzip.close()
+
+
+def iter_records(fileobj) -> Iterator[Dict[str, Any]]:
+    """
+    Записи backup по одной с проверкой структуры и контрольных сумм
+
+    Raises:
+        BackupCorruptedError: чужой формат, битый чанк, нарушен порядок
+                              чанков или файл обрезан (нет записи "end")
+    """
+    table = None
+    expected_seq = 0
+    ended = False
+
+    with gzip.GzipFile(fileobj=fileobj, mode='rb') as stream:
+        try:
+            for number, line in enumerate(stream, 1):
+                record = json.loads(line)
+                kind = record.get('type')
+
+                if ended:
+                    raise BackupCorruptedError("Данные после завершающей записи")
+
+                if number == 1:
+                    if kind != 'header' or record.get('format') != FORMAT_NAME:
+                        raise BackupCorruptedError("Файл не является backup бота")
+                    if record.get('version', 0) > FORMAT_VERSION:
+                        raise BackupCorruptedError(
+                            f"Backup версии {record.get('version')} новее поддерживаемой {FORMAT_VERSION}"
+                        )
+                elif kind == 'table':
+                    table, expected_seq = record['name'], 0
+                elif kind == 'delete':
+                    if record['table'] != table or expected_seq:
+                        raise BackupCorruptedError(
+                            f"Удаление вне начала таблицы: {record['table']}", details={'line': number}
+                        )
+                elif kind == 'chunk':
+                    if record['table'] != table or record['seq'] != expected_seq:
+                        raise BackupCorruptedError(
+                            f"Нарушен порядок чанков: {record['table']}#{record['seq']}",
+                            details={'line': number}
+                        )
+                    rows = record['rows']
+                    if len(rows) != record['count'] or checksum(dumps(rows)) != record['sha256']:
+                        raise BackupCorruptedError(
+                            f"Контрольная сумма не совпала: {table}#{expected_seq}",
+                            details={'line': number, 'table': table, 'seq': expected_seq}
+                        )
+                    expected_seq += 1
+                elif kind == 'end':
+                    ended = True
+
+                yield record
+        except (OSError, EOFError, ValueError, KeyError) as e:
+            raise BackupCorruptedError(f"Файл backup поврежден: {e}")
+
+    if not ended:
+        raise BackupCorruptedError("Файл backup обрезан: нет завершающей записи")
+
+
+def read_header(fileobj) -> Dict[str, Any]:
+    """Заголовок backup без чтения остального файла"""
+    records = iter_records(fileobj)
+    try:
+        return next(records)
+    except StopIteration:
+        raise BackupCorruptedError("Файл backup пуст")
+    finally:
+        records.close()
@@ -0,0 +1,247 @@
+"""
+Инкрементальные backup Do Presave Reminder Bot v25+
+Водяные знаки таблиц и выбор новых/измененных строк для экспорта
+
+ПЛАН 4: Инкрементальный backup по водяным знакам id/updated_at (АКТИВНАЯ)
+
+Каждый backup (полный или инкрементальный) сохраняет в backup_history
+водяные знаки таблиц на момент своего снимка. Следующий инкрементальный
+backup выгружает только строки за водяными знаками, по политике таблицы:
+
+- CHANGES: строки с id больше прошлого максимума или updated_at не
+  раньше прошлого максимума (с перекрытием BACKUP_INCREMENTAL_ID_OVERLAP
+  и BACKUP_INCREMENTAL_OVERLAP_MINUTES - строки транзакций, не успевших
+  закоммититься к прошлому снимку). При восстановлении - upsert по
+  первичному ключу, повторы безвредны.
+- RECENT: агрегаты по времени (link_activity) - все строки новее
+  отсечки «прошлый максимум минус lookback»; старше отсечки строки не
+  меняются, это проверяется по числу строк и сумме, при расхождении
+  (пересчет активности) таблица выгружается целиком.
+- SNAPSHOT: маленькие служебные таблицы - всегда целиком.
+
+Удаления: ссылки удаляет только архивация месяцев, поэтому новые строки
+link_archives превращаются в записи удаления диапазона created_at
+для links.
+
+Таблицы: схема database.models и таблицы модулей (core.database_core.Base:
+music_users, karma_history, karma_snapshots, user_statistics,
+user_sessions). Если ядро модулей не импортируется (нет его зависимостей),
+таблицы модулей не входят в backup - об этом пишется предупреждение.
+
+Водяные знаки берутся из самих данных (max по колонке) в той же
+транзакции REPEATABLE READ, что и экспорт, - часы приложения и БД
+не участвуют.
+"""
+
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, func, or_, inspect, Integer
+
+from database.models import Base, LinkArchive
+from database.partitions import add_months
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+SNAPSHOT = 'snapshot'
+CHANGES = 'changes'
+RECENT = 'recent'
+
+# Режимы записи "table" в файле backup (services/backup_format.py)
+MODE_REPLACE = 'replace'
+MODE_UPSERT = 'upsert'
+
+# История backup в сами backup не входит: после восстановления
+# следующий backup начинает новую цепочку с полного
+EXCLUDED_TABLES = {'backup_history'}
+
+
+class TablePolicy:
+    """Способ выбора строк таблицы для инкрементального backup"""
+
+    def __init__(self, kind: str, columns: Sequence[str] = (), lookback: timedelta = None,
+                 sum_column: str = None, archive_deletes: bool = False):
+        self.kind = kind
+        self.columns = list(columns)
+        self.lookback = lookback
+        self.sum_column = sum_column
+        self.archive_deletes = archive_deletes
+
+
+TABLE_POLICIES = {
+    'users': TablePolicy(CHANGES, ['updated_at']),
+    'links': TablePolicy(CHANGES, ['id', 'updated_at'], archive_deletes=True),
+    'link_archives': TablePolicy(CHANGES, ['id']),
+    # Таблицы модулей: журнал кармы и снимки только дополняются
+    'karma_history': TablePolicy(CHANGES, ['id']),
+    'karma_snapshots': TablePolicy(CHANGES, ['id']),
+    'user_statistics': TablePolicy(CHANGES, ['id', 'updated_at']),
+    # Уплотнение часовых корзин в дневные меняет строки не старше
+    # ACTIVITY_HOURLY_RETENTION_DAYS + суток: запас - еще сутки
+    'link_activity': TablePolicy(
+        RECENT, ['bucket_start'], sum_column='links',
+        lookback=timedelta(days=int(os.getenv('ACTIVITY_HOURLY_RETENTION_DAYS', '2')) + 2),
+    ),
+}
+
+_SNAPSHOT_POLICY = TablePolicy(SNAPSHOT)
+
+
+def module_tables() -> List[Any]:
+    """Таблицы модулей (core.database_core.Base), пустой список - ядро недоступно"""
+    try:
+        from core.database_core import Base as CoreBase
+        # Регистрация моделей модулей в CoreBase.metadata
+        import modules.user_management.models  # noqa: F401
+    except ImportError as e:
+        logger.warning(f"⚠️ Таблицы модулей не входят в backup (ядро не импортируется): {e}")
+        return []
+    return list(CoreBase.metadata.sorted_tables)
+
+
+def backup_tables(bind=None) -> List[Any]:
+    """
+    Таблицы backup в порядке зависимостей: схема бота, затем таблицы модулей
+
+    bind - движок или соединение: таблицы модулей, которых нет в этой БД
+    (модули не запускались), пропускаются
+    """
+    tables = list(Base.metadata.sorted_tables)
+    names = {table.name for table in tables}
+    # Внешних ключей между схемами нет: таблицы модулей просто идут следом
+    modules = [table for table in module_tables() if table.name not in names]
+    if bind is not None and modules:
+        existing = set(inspect(bind).get_table_names())
+        modules = [table for table in modules if table.name in existing]
+    tables += modules
+    return [table for table in tables if table.name not in EXCLUDED_TABLES]
+
+
+def _to_json(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _from_json(value: Any) -> Any:
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+class TablePlan:
+    """Что выгружать из таблицы: режим, условие отбора строк, удаления диапазонов"""
+
+    def __init__(self, mode: str = MODE_REPLACE, where=None,
+                 deletes: List[Tuple[str, Any, Any]] = None):
+        self.mode = mode
+        self.where = where
+        self.deletes = deletes or []
+
+
+class IncrementalPlanner:
+    """Планирование экспорта таблиц по водяным знакам прошлого backup"""
+
+    def __init__(self, conn, previous: Optional[Dict[str, Any]] = None,
+                 time_overlap: timedelta = None, id_overlap: int = None):
+        """
+        Args:
+            conn: соединение снимка экспорта
+            previous: водяные знаки прошлого backup (None - полный backup)
+        """
+        self.conn = conn
+        self.previous = previous
+        self.time_overlap = time_overlap if time_overlap is not None else \
+            timedelta(minutes=float(os.getenv('BACKUP_INCREMENTAL_OVERLAP_MINUTES', '10')))
+        self.id_overlap = id_overlap if id_overlap is not None else \
+            int(os.getenv('BACKUP_INCREMENTAL_ID_OVERLAP', '1000'))
+
+    @staticmethod
+    def policy(table) -> TablePolicy:
+        return TABLE_POLICIES.get(table.name, _SNAPSHOT_POLICY)
+
+    # ============================================
+    # ПЛАН 4: ВЫБОР СТРОК
+    # ============================================
+
+    def plan(self, table) -> TablePlan:
+        """План выгрузки таблицы (полный backup - всегда вся таблица)"""
+        state = (self.previous or {}).get(table.name)
+        policy = self.policy(table)
+
+        if self.previous is None or state is None or policy.kind == SNAPSHOT:
+            return TablePlan(MODE_REPLACE)
+
+        if policy.kind == RECENT:
+            return self._plan_recent(table, policy, state)
+
+        conditions = []
+        for name in policy.columns:
+            last = state['max'].get(name)
+            if last is None:
+                # При прошлом backup колонка была пуста: все строки с значением
+                conditions.append(table.c[name].isnot(None))
+            elif isinstance(table.c[name].type, Integer):
+                conditions.append(table.c[name] > last - self.id_overlap)
+            else:
+                conditions.append(table.c[name] >= _from_json(last) - self.time_overlap)
+
+        deletes = self._archive_deletes() if policy.archive_deletes else []
+        return TablePlan(MODE_UPSERT, or_(*conditions), deletes)
+
+    def _plan_recent(self, table, policy: TablePolicy, state: Dict[str, Any]) -> TablePlan:
+        column = table.c[policy.columns[0]]
+        cutoff = _from_json(state.get('cutoff'))
+        if cutoff is None:
+            return TablePlan(MODE_REPLACE)
+
+        # Строки старше отсечки не должны были измениться
+        if self._stable(table, policy, cutoff) != (state.get('stable_rows'), state.get('stable_sum')):
+            return TablePlan(MODE_REPLACE)
+
+        return TablePlan(MODE_UPSERT, column >= cutoff, [(column.name, cutoff, None)])
+
+    def _stable(self, table, policy: TablePolicy, cutoff: datetime) -> Tuple[int, int]:
+        column = table.c[policy.columns[0]]
+        rows, total = self.conn.execute(
+            select(func.count(), func.coalesce(func.sum(table.c[policy.sum_column]), 0))
+            .where(column < cutoff)
+        ).one()
+        return rows, int(total)
+
+    def _archive_deletes(self) -> List[Tuple[str, Any, Any]]:
+        """Месяцы, архивированные после прошлого backup: удалить их ссылки"""
+        last_id = (self.previous.get(LinkArchive.__tablename__) or {}).get('max', {}).get('id') or 0
+        months = self.conn.execute(
+            select(LinkArchive.month).where(LinkArchive.id > last_id).distinct()
+        ).scalars().all()
+
+        deletes = []
+        for month in sorted(months):
+            start = datetime(month.year, month.month, 1)
+            deletes.append(('created_at', start, add_months(start, 1)))
+        return deletes
+
+    # ============================================
+    # ПЛАН 4: ВОДЯНЫЕ ЗНАКИ
+    # ============================================
+
+    def watermark(self, table) -> Dict[str, Any]:
+        """Водяные знаки таблицы в снимке экспорта (JSON для backup_history)"""
+        policy = self.policy(table)
+        state: Dict[str, Any] = {
+            'rows': self.conn.execute(select(func.count()).select_from(table)).scalar(),
+        }
+
+        if policy.kind == CHANGES:
+            values = self.conn.execute(
+                select(*[func.max(table.c[name]) for name in policy.columns])
+            ).one()
+            state['max'] = {name: _to_json(value) for name, value in zip(policy.columns, values)}
+
+        elif policy.kind == RECENT:
+            last = self.conn.execute(select(func.max(table.c[policy.columns[0]]))).scalar()
+            cutoff = last - policy.lookback if last is not None else None
+            state['cutoff'] = _to_json(cutoff)
+            if cutoff is not None:
+                state['stable_rows'], state['stable_sum'] = self._stable(table, policy, cutoff)
+
+        return state
@@ -0,0 +1,648 @@
+"""
+Восстановление backup Do Presave Reminder Bot v25+
+Массовая загрузка дампа (services/backup_format.py) в пустую или рабочую БД
+
+ПЛАН 4: Параллельная загрузка с COPY и перестройкой индексов (АКТИВНАЯ)
+
+Восстановление идет в два прохода:
+
+1. Файл читается потоково: проверяются контрольные суммы чанков и
+   завершающая запись, строки каждой таблицы раскладываются по
+   временным файлам (gzip), по пути считаются число строк и дайджест
+   таблицы. До загрузки БД не трогается - битый backup ее не испортит.
+2. Таблицы очищаются одной транзакцией и загружаются по уровням
+   зависимостей внешних ключей: независимые таблицы одного уровня -
+   параллельно в BACKUP_RESTORE_WORKERS потоков, каждая в своей
+   транзакции. Перед загрузкой таблицы ее вторичные индексы удаляются,
+   после - создаются заново по сохраненным определениям. Если таблица
+   не загрузилась, в ошибке (details) - какие таблицы уже загружены,
+   какая упала и какие остались очищенными: восстановление нужно повторить.
+
+На PostgreSQL строки идут через COPY FROM STDIN (CSV формируется на лету
+из временного файла), затем выравниваются последовательности id и
+выполняется ANALYZE. На других СУБД (SQLite в разработке) - executemany
+пачками в один поток, а очистка и загрузка всех таблиц идут одной
+транзакцией: при ошибке БД остается как до восстановления.
+
+В конце число строк и дайджест каждой загруженной таблицы сверяются
+с подсчитанными по файлу.
+
+Инкрементальный backup (apply_incremental) накатывается поверх уже
+восстановленных данных: удаления диапазонов, затем upsert строк по
+первичному ключу (на СУБД без ON CONFLICT - UPDATE по строке, при
+промахе INSERT; таблицы в режиме replace - очистка и вставка). Индексы
+не перестраиваются - изменений немного. Итог сверяется с числом строк
+в водяных знаках завершающей записи.
+"""
+
+import os
+import time
+import gzip
+import json
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, func, text, and_, literal, Integer
+
+from core.exceptions import BackupCorruptedError, BackupRestoreError
+from services.backup_format import (
+    iter_records, dumps, encode_row, decode_value, TableDigest
+)
+from services.backup_incremental import MODE_REPLACE, MODE_UPSERT, backup_tables
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_PG_INDEXES_SQL = text(
+    "SELECT i.relname, pg_get_indexdef(i.oid) FROM pg_index x "
+    "JOIN pg_class i ON i.oid = x.indexrelid "
+    "JOIN pg_class t ON t.oid = x.indrelid "
+    "WHERE t.relname = :table AND pg_table_is_visible(t.oid) "
+    "AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)"
+)
+
+_SQLITE_INDEXES_SQL = text(
+    "SELECT name, sql FROM sqlite_master "
+    "WHERE type = 'index' AND tbl_name = :table AND sql IS NOT NULL"
+)
+
+
+def dependency_levels(tables) -> List[List[Any]]:
+    """
+    Таблицы по уровням внешних ключей: уровень N ссылается только на уровни < N
+
+    Таблицы одного уровня друг от друга не зависят и грузятся параллельно.
+    """
+    names = {table.name for table in tables}
+    levels: Dict[str, int] = {}
+
+    # sorted_tables уже упорядочен по зависимостям
+    for table in tables:
+        parents = {
+            fk.column.table.name for fk in table.foreign_keys
+            if fk.column.table.name in names and fk.column.table.name != table.name
+        }
+        levels[table.name] = max((levels[name] + 1 for name in parents), default=0)
+
+    grouped: List[List[Any]] = []
+    for table in tables:
+        level = levels[table.name]
+        while len(grouped) <= level:
+            grouped.append([])
+        grouped[level].append(table)
+    return grouped
+
+
+class _SpooledTable:
+    """Строки одной таблицы из backup во временном файле"""
+
+    def __init__(self, name: str, columns: List[Tuple[str, str]], path: str,
+                 mode: str = MODE_REPLACE):
+        self.name = name
+        self.columns = columns
+        self.path = path
+        self.mode = mode
+        self.deletes: List[Tuple[str, Any, Any]] = []
+        self.digest = TableDigest()
+        self._file = gzip.open(path, 'wt', encoding='utf-8', compresslevel=1)
+
+    def append(self, rows: List[List[Any]]):
+        self._file.write(dumps(rows))
+        self._file.write('\n')
+        self.digest.update(rows)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def iter_chunks(self):
+        """Чанки строк в порядке backup"""
+        with gzip.open(self.path, 'rt', encoding='utf-8') as stream:
+            for line in stream:
+                yield json.loads(line)
+
+
+class _CopyStream:
+    """Файлоподобный источник CSV для COPY FROM STDIN (без буферизации таблицы)"""
+
+    def __init__(self, lines):
+        self._lines = lines
+        self._buffer = ''
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line
+
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _csv_field(value: Any, type_name: str) -> str:
+    """Поле CSV для COPY: NULL - пустое без кавычек, остальное - в кавычках"""
+    if value is None:
+        return ''
+    if type_name == 'LargeBinary':
+        value = '\\x' + decode_value(value, type_name).hex()
+    elif type_name == 'JSON':
+        value = dumps(value)
+    elif isinstance(value, bool):
+        value = 't' if value else 'f'
+    else:
+        value = str(value)
+    return '"' + value.replace('"', '""') + '"'
+
+
+class BackupLoader:
+    """Загрузка backup в БД DatabaseManager"""
+
+    def __init__(self, db_manager, workers: int = None, batch_size: int = None):
+        """Инициализация загрузчика"""
+        self.db = db_manager
+        self.workers = workers if workers is not None else \
+            int(os.getenv('BACKUP_RESTORE_WORKERS', '4'))
+        self.batch_size = batch_size if batch_size is not None else \
+            int(os.getenv('BACKUP_RESTORE_BATCH_SIZE', '1000'))
+        self.temp_dir = os.getenv('BACKUP_TEMP_DIR') or None
+
+        self.is_postgresql = self.db.engine.dialect.name == 'postgresql'
+
+    # ============================================
+    # ПЛАН 4: ВОССТАНОВЛЕНИЕ
+    # ============================================
+
+    def restore(self, backup_path: str, verify: bool = True) -> Dict[str, Any]:
+        """
+        Полное восстановление: содержимое таблиц заменяется данными backup
+
+        Returns:
+            dict: header, tables ({имя: rows, seconds}), indexes_rebuilt,
+                  skipped_tables, verified, elapsed_s
+
+        Raises:
+            BackupCorruptedError: файл поврежден (БД не изменялась)
+            BackupRestoreError: ошибка загрузки или сверки
+        """
+        started = time.perf_counter()
+        workdir = tempfile.mkdtemp(prefix='presave_restore_', dir=self.temp_dir)
+
+        try:
+            header, spooled, skipped, _ = self._spool(backup_path, workdir)
+            if header.get('kind') == 'incremental':
+                raise BackupRestoreError(
+                    "Инкрементальный backup восстанавливается только после полного",
+                    details={'backup_id': header.get('backup_id'), 'base_id': header.get('base_id')}
+                )
+            logger.info(
+                f"✅ Backup проверен: {sum(t.digest.rows for t in spooled.values())} строк "
+                f"в {len(spooled)} таблицах, {time.perf_counter() - started:.1f} с"
+            )
+
+            tables = [table for table in backup_tables() if table.name in spooled]
+            if self.is_postgresql:
+                report, rebuilt = self._load_parallel(tables, spooled)
+            else:
+                report, rebuilt = self._load_single_transaction(tables, spooled)
+
+            if verify:
+                self._verify(tables, spooled)
+
+            return {
+                'header': header,
+                'tables': report,
+                'indexes_rebuilt': rebuilt,
+                'skipped_tables': skipped,
+                'verified': verify,
+                'elapsed_s': round(time.perf_counter() - started, 1),
+            }
+
+        except (BackupCorruptedError, BackupRestoreError):
+            raise
+        except Exception as e:
+            raise BackupRestoreError(f"Ошибка восстановления backup: {e}")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _spool(self, backup_path: str, workdir: str):
+        """Первый проход: проверка файла и раскладка строк по таблицам"""
+        known = {table.name: table for table in backup_tables()}
+        header: Dict[str, Any] = {}
+        end: Dict[str, Any] = {}
+        spooled: Dict[str, _SpooledTable] = {}
+        skipped: List[str] = []
+        current: Optional[_SpooledTable] = None
+
+        try:
+            with open(backup_path, 'rb') as fileobj:
+                for record in iter_records(fileobj):
+                    kind = record['type']
+                    if kind == 'header':
+                        header = record
+                    elif kind == 'table':
+                        if current is not None:
+                            current.close()
+                        current = None
+                        if record['name'] not in known:
+                            logger.warning(f"⚠️ Таблицы {record['name']} нет в схеме, пропускаем")
+                            skipped.append(record['name'])
+                            continue
+                        current = _SpooledTable(
+                            record['name'], [tuple(c) for c in record['columns']],
+                            os.path.join(workdir, f"{record['name']}.ndjson.gz"),
+                            record.get('mode', MODE_REPLACE)
+                        )
+                        spooled[current.name] = current
+                    elif kind == 'delete' and current is not None:
+                        current.deletes.append((record['column'], record['from'], record['to']))
+                    elif kind == 'chunk' and current is not None:
+                        current.append(record['rows'])
+                    elif kind == 'end':
+                        end = record
+                        for name, rows in record['tables'].items():
+                            if name in spooled and spooled[name].digest.rows != rows:
+                                raise BackupCorruptedError(
+                                    f"Число строк {name} не совпадает с итогом backup",
+                                    details={'table': name, 'expected': rows,
+                                             'found': spooled[name].digest.rows}
+                                )
+        finally:
+            if current is not None:
+                current.close()
+
+        return header, spooled, skipped, end
+
+    def _load_single_transaction(self, tables, spooled: Dict[str, _SpooledTable]):
+        """Очистка и загрузка всех таблиц одной транзакцией (СУБД без параллельной загрузки)"""
+        report: Dict[str, Dict[str, Any]] = {}
+        rebuilt = 0
+        with self.db.engine.begin() as conn:
+            self._truncate(conn, tables)
+            for table in tables:
+                name, rows, seconds, indexes = self._load_table(table, spooled[table.name], conn)
+                report[name] = {'rows': rows, 'seconds': seconds}
+                rebuilt += indexes
+        return report, rebuilt
+
+    def _load_parallel(self, tables, spooled: Dict[str, _SpooledTable]):
+        """Очистка одной транзакцией и параллельная загрузка по уровням (PostgreSQL)"""
+        with self.db.engine.begin() as conn:
+            self._truncate(conn, tables)
+
+        report: Dict[str, Dict[str, Any]] = {}
+        rebuilt = 0
+        for level in dependency_levels(tables):
+            workers = min(self.workers, len(level))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='restore') as pool:
+                futures = [pool.submit(self._load_table, table, spooled[table.name]) for table in level]
+
+            failed = {}
+            for table, future in zip(level, futures):
+                try:
+                    name, rows, seconds, indexes = future.result()
+                except Exception as e:
+                    failed[table.name] = str(e)
+                    continue
+                report[name] = {'rows': rows, 'seconds': seconds}
+                rebuilt += indexes
+
+            if failed:
+                remaining = [t.name for t in tables if t.name not in report and t.name not in failed]
+                logger.error(
+                    f"❌ Восстановление прервано, БД восстановлена частично: загружены "
+                    f"{sorted(report)}, ошибка в {sorted(failed)}, очищены и не загружены {remaining}"
+                )
+                raise BackupRestoreError(
+                    "Восстановление прервано: БД восстановлена частично, повторите восстановление",
+                    details={'partial': True, 'loaded': report, 'failed': failed, 'not_loaded': remaining}
+                )
+
+        return report, rebuilt
+
+    def _truncate(self, conn, tables):
+        """Очистка восстанавливаемых таблиц в транзакции conn"""
+        if self.is_postgresql:
+            quote = conn.dialect.identifier_preparer.quote
+            conn.execute(text(
+                f"TRUNCATE {', '.join(quote(t.name) for t in tables)} RESTART IDENTITY CASCADE"
+            ))
+        else:
+            for table in reversed(tables):
+                conn.execute(table.delete())
+
+    # ============================================
+    # ПЛАН 4: ИНКРЕМЕНТАЛЬНЫЙ BACKUP
+    # ============================================
+
+    def apply_incremental(self, backup_path: str, verify: bool = True) -> Dict[str, Any]:
+        """
+        Наложение инкрементального backup на восстановленную БД
+
+        Returns:
+            dict: header, tables ({имя: rows, deleted, mode, seconds}),
+                  skipped_tables, verified, elapsed_s
+
+        Raises:
+            BackupCorruptedError: файл поврежден (БД не изменялась)
+            BackupRestoreError: ошибка загрузки или сверки
+        """
+        started = time.perf_counter()
+        workdir = tempfile.mkdtemp(prefix='presave_restore_', dir=self.temp_dir)
+
+        try:
+            header, spooled, skipped, end = self._spool(backup_path, workdir)
+            if header.get('kind') != 'incremental':
+                raise BackupRestoreError(
+                    "Файл не является инкрементальным backup",
+                    details={'backup_id': header.get('backup_id')}
+                )
+
+            tables = [table for table in backup_tables() if table.name in spooled]
+            report: Dict[str, Dict[str, Any]] = {}
+            # Удаления дочерних таблиц раньше вставок родительских не нужны:
+            # родительские таблицы только дополняются (upsert)
+            for level in dependency_levels(tables):
+                workers = min(self.workers, len(level)) if self.is_postgresql else 1
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='restore') as pool:
+                    results = list(pool.map(lambda table: self._apply_table(table, spooled[table.name]), level))
+                for name, item in results:
+                    report[name] = item
+
+            if verify:
+                self._verify_counts(tables, end.get('watermarks') or {})
+                self._verify([t for t in tables if spooled[t.name].mode == MODE_REPLACE], spooled)
+
+            logger.info(
+                f"✅ Инкрементальный backup {header.get('backup_id')} применен: "
+                f"{sum(t['rows'] for t in report.values())} строк, "
+                f"{time.perf_counter() - started:.1f} с"
+            )
+            return {
+                'header': header,
+                'tables': report,
+                'skipped_tables': skipped,
+                'verified': verify,
+                'elapsed_s': round(time.perf_counter() - started, 1),
+            }
+
+        except (BackupCorruptedError, BackupRestoreError):
+            raise
+        except Exception as e:
+            raise BackupRestoreError(f"Ошибка применения инкрементального backup: {e}")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _apply_table(self, table, spool: _SpooledTable) -> Tuple[str, Dict[str, Any]]:
+        """Удаления и upsert строк одной таблицы (выполняется в пуле)"""
+        started = time.perf_counter()
+        columns = [(name, type_name) for name, type_name in spool.columns if name in table.c]
+        positions = [i for i, (name, _) in enumerate(spool.columns) if name in table.c]
+
+        try:
+            with self.db.engine.begin() as conn:
+                deleted = 0
+                if spool.mode == MODE_REPLACE:
+                    deleted = conn.execute(table.delete()).rowcount
+                for name, start, end in spool.deletes:
+                    column = table.c[name]
+                    type_name = type(column.type).__name__
+                    condition = column >= decode_value(start, type_name)
+                    if end is not None:
+                        condition = condition & (column < decode_value(end, type_name))
+                    deleted += conn.execute(table.delete().where(condition)).rowcount
+
+                stmt = self._upsert_statement(table, [name for name, _ in columns]) \
+                    if spool.mode == MODE_UPSERT else None
+                merge = spool.mode == MODE_UPSERT and stmt is None
+                rows = self._insert(conn, table, columns, positions, spool, stmt, merge=merge)
+
+                if self.is_postgresql:
+                    self._reset_sequence(conn, table)
+
+        except Exception as e:
+            raise BackupRestoreError(
+                f"Ошибка применения изменений таблицы {table.name}: {e}", details={'table': table.name}
+            )
+
+        return table.name, {'rows': rows, 'deleted': deleted, 'mode': spool.mode,
+                            'seconds': round(time.perf_counter() - started, 2)}
+
+    def _upsert_statement(self, table, names: List[str]):
+        """INSERT ... ON CONFLICT (первичный ключ) DO UPDATE для PostgreSQL и SQLite (иначе None)"""
+        dialect = self.db.engine.dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            return None
+
+        stmt = insert(table)
+        keys = [column.name for column in table.primary_key.columns]
+        values = {name: stmt.excluded[name] for name in names if name not in keys}
+        if not values:
+            return stmt.on_conflict_do_nothing(index_elements=keys)
+        return stmt.on_conflict_do_update(index_elements=keys, set_=values)
+
+    def _verify_counts(self, tables, watermarks: Dict[str, Any]):
+        """Число строк таблиц после наложения - как в снимке инкрементального backup"""
+        mismatched = {}
+        with self.db.engine.connect() as conn:
+            for table in tables:
+                expected = (watermarks.get(table.name) or {}).get('rows')
+                if expected is None:
+                    continue
+                rows = conn.execute(select(func.count()).select_from(table)).scalar()
+                if rows != expected:
+                    mismatched[table.name] = {'expected_rows': expected, 'rows': rows}
+
+        if mismatched:
+            raise BackupRestoreError("Сверка после инкрементального backup не прошла", details=mismatched)
+
+    # ============================================
+    # ПЛАН 4: ЗАГРУЗКА ТАБЛИЦЫ
+    # ============================================
+
+    def _load_table(self, table, spool: _SpooledTable, conn=None) -> Tuple[str, int, float, int]:
+        """
+        Загрузка одной таблицы с перестройкой индексов
+
+        Без conn - в своей транзакции (так таблица грузится в пуле потоков).
+        """
+        started = time.perf_counter()
+        columns = [(name, type_name) for name, type_name in spool.columns if name in table.c]
+        dropped = set(name for name, _ in spool.columns) - set(name for name, _ in columns)
+        if dropped:
+            logger.warning(f"⚠️ {table.name}: колонок {sorted(dropped)} нет в схеме, пропускаем")
+        positions = [i for i, (name, _) in enumerate(spool.columns) if name in table.c]
+
+        try:
+            if conn is None:
+                with self.db.engine.begin() as own_conn:
+                    rows, indexes = self._load_rows(own_conn, table, columns, positions, spool)
+            else:
+                rows, indexes = self._load_rows(conn, table, columns, positions, spool)
+
+        except Exception as e:
+            raise BackupRestoreError(
+                f"Ошибка загрузки таблицы {table.name}: {e}", details={'table': table.name}
+            )
+
+        seconds = round(time.perf_counter() - started, 2)
+        logger.info(f"✅ {table.name}: {rows} строк за {seconds} с, индексов пересоздано: {len(indexes)}")
+        return table.name, rows, seconds, len(indexes)
+
+    def _load_rows(self, conn, table, columns, positions, spool: _SpooledTable):
+        indexes = self._drop_indexes(conn, table.name)
+
+        if self.is_postgresql:
+            rows = self._copy(conn, table, columns, positions, spool)
+        else:
+            rows = self._insert(conn, table, columns, positions, spool)
+
+        for _, definition in indexes:
+            conn.execute(text(definition))
+
+        if self.is_postgresql:
+            self._reset_sequence(conn, table)
+            conn.execute(text(f"ANALYZE {conn.dialect.identifier_preparer.quote(table.name)}"))
+
+        return rows, indexes
+
+    def _drop_indexes(self, conn, table_name: str) -> List[Tuple[str, str]]:
+        """Удаление вторичных индексов, возвращает их определения для пересоздания"""
+        if self.is_postgresql:
+            rows = conn.execute(_PG_INDEXES_SQL, {'table': table_name}).all()
+            # У секционированной таблицы определение - «ON ONLY»: без индексов партиций
+            indexes = [(name, definition.replace(' ON ONLY ', ' ON ', 1)) for name, definition in rows]
+        else:
+            indexes = [tuple(row) for row in conn.execute(_SQLITE_INDEXES_SQL, {'table': table_name}).all()]
+
+        quote = conn.dialect.identifier_preparer.quote
+        for name, _ in indexes:
+            conn.execute(text(f"DROP INDEX IF EXISTS {quote(name)}"))
+        return indexes
+
+    def _copy(self, conn, table, columns, positions, spool: _SpooledTable) -> int:
+        """COPY FROM STDIN потоком CSV из временного файла"""
+        counted = [0]
+
+        def lines():
+            for rows in spool.iter_chunks():
+                counted[0] += len(rows)
+                for row in rows:
+                    yield ','.join(
+                        _csv_field(row[i], type_name) for i, (_, type_name) in zip(positions, columns)
+                    ) + '\n'
+
+        quote = conn.dialect.identifier_preparer.quote
+        sql = (
+            f"COPY {quote(table.name)} ({', '.join(quote(name) for name, _ in columns)}) "
+            f"FROM STDIN WITH (FORMAT csv)"
+        )
+        cursor = conn.connection.dbapi_connection.cursor()
+        try:
+            cursor.copy_expert(sql, _CopyStream(lines()), size=65536)
+        finally:
+            cursor.close()
+        return counted[0]
+
+    def _insert(self, conn, table, columns, positions, spool: _SpooledTable, stmt=None,
+                merge: bool = False) -> int:
+        """
+        executemany пачками (СУБД без COPY; stmt - вместо table.insert(), например upsert)
+
+        merge - построчный upsert для СУБД без ON CONFLICT
+        """
+        stmt = stmt if stmt is not None else table.insert()
+        total = 0
+        batch: List[Dict[str, Any]] = []
+        for rows in spool.iter_chunks():
+            for row in rows:
+                batch.append({
+                    name: decode_value(row[i], type_name)
+                    for i, (name, type_name) in zip(positions, columns)
+                })
+                if len(batch) >= self.batch_size:
+                    self._execute_batch(conn, table, stmt, batch, merge)
+                    total += len(batch)
+                    batch = []
+        if batch:
+            self._execute_batch(conn, table, stmt, batch, merge)
+            total += len(batch)
+        return total
+
+    @staticmethod
+    def _execute_batch(conn, table, stmt, batch: List[Dict[str, Any]], merge: bool):
+        if not merge:
+            conn.execute(stmt, batch)
+            return
+
+        keys = [column.name for column in table.primary_key.columns]
+        for row in batch:
+            condition = and_(*[table.c[name] == row[name] for name in keys])
+            values = {name: value for name, value in row.items() if name not in keys}
+            if values:
+                if conn.execute(table.update().where(condition).values(values)).rowcount:
+                    continue
+            elif conn.execute(select(literal(1)).select_from(table).where(condition)).first():
+                continue
+            conn.execute(table.insert().values(row))
+
+    @staticmethod
+    def _reset_sequence(conn, table):
+        """Продолжение последовательности id после явно загруженных значений"""
+        primary = list(table.primary_key.columns)
+        if len(primary) != 1 or not isinstance(primary[0].type, Integer):
+            return
+
+        column = primary[0].name
+        quote = conn.dialect.identifier_preparer.quote
+        # Для не-serial ключей (users.user_id) pg_get_serial_sequence вернет NULL
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence(:table, :column), "
+            f"coalesce(max({quote(column)}), 0) + 1, false) FROM {quote(table.name)}"
+        ), {'table': table.name, 'column': column})
+
+    # ============================================
+    # ПЛАН 4: СВЕРКА
+    # ============================================
+
+    def _verify(self, tables, spooled: Dict[str, _SpooledTable]):
+        """Сверка числа строк и дайджеста загруженных таблиц с backup"""
+        mismatched = {}
+        with self.db.engine.connect().execution_options(
+            stream_results=True, max_row_buffer=self.batch_size
+        ) as conn:
+            for table in tables:
+                spool = spooled[table.name]
+                positions = [i for i, (name, _) in enumerate(spool.columns) if name in table.c]
+                names = [spool.columns[i][0] for i in positions]
+                if len(positions) == len(spool.columns):
+                    expected = spool.digest
+                else:
+                    # Часть колонок backup отброшена: дайджест по загруженным
+                    expected = TableDigest()
+                    for rows in spool.iter_chunks():
+                        expected.update([[row[i] for i in positions] for row in rows])
+
+                actual = TableDigest()
+                result = conn.execute(select(*[table.c[name] for name in names]))
+                for rows in result.partitions(self.batch_size):
+                    actual.update([encode_row(row) for row in rows])
+
+                if (actual.rows, actual.hexdigest()) != (expected.rows, expected.hexdigest()):
+                    mismatched[table.name] = {
+                        'expected_rows': expected.rows, 'rows': actual.rows,
+                        'expected_digest': expected.hexdigest(), 'digest': actual.hexdigest(),
+                    }
+
+        if mismatched:
+            raise BackupRestoreError("Сверка после восстановления не прошла", details=mismatched)
+        logger.info(f"✅ Сверка восстановления: {len(tables)} таблиц совпадают с backup")
@@ -2,29 +2,73 @@
 ПЛАН 4: Система backup/restore для обхода 30-дневного лимита PostgreSQL
 Do Presave Reminder Bot v27.1+
 
-СТАТУС: В РАЗРАБОТКЕ (ЗАГЛУШКА)
+СТАТУС: ЭКСПОРТ, ИНКРЕМЕНТАЛЬНЫЙ BACKUP И ВОССТАНОВЛЕНИЕ АКТИВНЫ
 АКТИВАЦИЯ: ENABLE_PLAN_4_FEATURES=true (включен всегда!)
+
+Экспорт потоковый: каждая таблица читается серверным курсором пачками
+по BACKUP_EXPORT_BATCH_SIZE строк и сразу пишется во временный файл
+(сжатый NDJSON, формат - services/backup_format.py). В памяти процесса
+одновременно находится только одна пачка, поэтому расход памяти не
+зависит от размера БД. На PostgreSQL все таблицы читаются в одной
+транзакции REPEATABLE READ - дамп согласован на момент начала.
+
+Автоматический backup (BackupScheduler, раз в день в BACKUP_CHECK_TIME)
+строит цепочки: полный backup, затем инкрементальные - только строки,
+новые или измененные после предыдущего backup цепочки (водяные знаки -
+services/backup_incremental.py). Новая цепочка начинается каждые
+BACKUP_FULL_EVERY backup. История и водяные знаки - таблица
+backup_history.
+
+Восстановление (import_database) - services/backup_loader.py: проверка
+файлов целиком до изменения БД, параллельная загрузка независимых таблиц
+полного backup через COPY, перестройка индексов после загрузки, затем
+инкрементальные backup цепочки по порядку и сверка результата.
 """
 
 import os
+import time
+import uuid
+import asyncio
+import tempfile
+import threading
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, Tuple
-from io import BytesIO
+from typing import Optional, Dict, Any, List, Sequence, Tuple, Union
+
+from sqlalchemy import select, func, update
+
+from database.models import BackupHistory
+from core.exceptions import BackupCorruptedError
+from services.backup_format import BackupWriter, iter_records, read_header, FILE_SUFFIX
+from services.backup_incremental import IncrementalPlanner, backup_tables
+from services.backup_loader import BackupLoader
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# Виды backup
+FULL = 'full'
+INCREMENTAL = 'incremental'
+AUTO = 'auto'
+
 # ============================================
-# ЗАГЛУШКИ ДЛЯ ПЛАНА 4 (BACKUP СИСТЕМА)
+# ПЛАН 4: BACKUP СИСТЕМА
 # ============================================
 
 class BackupRestoreManager:
     """Управление backup и restore базы данных"""
     
-    def __init__(self, db_manager=None):
-        # self.db_manager = db_manager
-        # self.backup_filename = f"presave_bot_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        logger.info("💾 BackupRestoreManager инициализирован (ЗАГЛУШКА)")
+    def __init__(self, db_manager=None, batch_size: int = None, compresslevel: int = None):
+        self.db_manager = db_manager
+        self.batch_size = batch_size if batch_size is not None else \
+            int(os.getenv('BACKUP_EXPORT_BATCH_SIZE', '1000'))
+        self.compresslevel = compresslevel if compresslevel is not None else \
+            int(os.getenv('BACKUP_COMPRESSION_LEVEL', '6'))
+        self.temp_dir = os.getenv('BACKUP_TEMP_DIR') or None
+        # Каталог для хранения автоматических backup (пусто - только отправка)
+        self.backup_dir = os.getenv('BACKUP_DIR') or None
+        self.full_every = int(os.getenv('BACKUP_FULL_EVERY', '7'))
+        self.keep_chains = int(os.getenv('BACKUP_KEEP_CHAINS', '2'))
+        logger.info("💾 BackupRestoreManager инициализирован")
     
     def get_database_age_days(self) -> int:
         """Получить возраст БД в днях"""
@@ -50,46 +94,455 @@ class BackupRestoreManager:
         """Дней до истечения БД"""
         return max(0, 30 - self.get_database_age_days())
     
-    # def export_full_database(self) -> Tuple[BytesIO, str]:
-    #     """
-    #     Полный экспорт БД в JSON + SQL формате
-    #     Возвращает: (file_buffer, filename)
-    #     """
-    #     pass
+    # ============================================
+    # ЭКСПОРТ
+    # ============================================
+    
+    def export_full_database(self, created_by: int = None) -> Tuple[str, str]:
+        """
+        Полный экспорт БД во временный файл (ручной backup, /downloadsql)
+        
+        Returns:
+            tuple: (путь к файлу, имя файла для отправки). Файл удаляет
+                   вызывающий после отправки
+        """
+        info = self.create_backup(FULL, backup_type='manual', created_by=created_by, keep=False)
+        return info['path'], info['filename']
+    
+    def create_backup(self, kind: str = AUTO, backup_type: str = 'auto',
+                      created_by: int = None, keep: bool = None) -> Dict[str, Any]:
+        """
+        Создание backup с записью в backup_history
+        
+        Args:
+            kind: full, incremental (к последнему backup того же backup_type)
+                  или auto - полный, если цепочка пуста или длиннее BACKUP_FULL_EVERY
+            backup_type: manual или auto - цепочки типов не смешиваются
+            keep: хранить файл в BACKUP_DIR (по умолчанию - если каталог задан),
+                  иначе временный файл удаляет вызывающий
+        
+        Returns:
+            dict: backup_id, kind, parent_id, base_id, path, filename, size,
+                  tables, chunks, elapsed_s
+        """
+        parent = None if kind == FULL else self._last_backup(backup_type)
+        if parent is not None and kind == AUTO and self._chain_length(parent['base_id']) >= self.full_every:
+            parent = None
+        if parent is None and kind == INCREMENTAL:
+            logger.warning("⚠️ Нет предыдущего backup для инкрементального, создается полный")
+        
+        actual_kind = INCREMENTAL if parent else FULL
+        backup_id = f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        chain = {
+            'kind': actual_kind,
+            'backup_id': backup_id,
+            'parent_id': parent['backup_id'] if parent else None,
+            'base_id': parent['base_id'] if parent else backup_id,
+        }
+        
+        keep = bool(self.backup_dir) if keep is None else keep
+        filename = f"presave_bot_{actual_kind}_{backup_id}{FILE_SUFFIX}"
+        if keep:
+            os.makedirs(self.backup_dir, exist_ok=True)
+            path = os.path.join(self.backup_dir, filename)
+            fileobj = open(path, 'wb')
+        else:
+            fd, path = tempfile.mkstemp(prefix='presave_backup_', suffix=FILE_SUFFIX, dir=self.temp_dir)
+            fileobj = os.fdopen(fd, 'wb')
+        
+        try:
+            with fileobj:
+                summary = self.write_export(fileobj, chain, parent['watermarks'] if parent else None)
+        except Exception:
+            os.unlink(path)
+            raise
+        
+        size = os.path.getsize(path)
+        records = sum(summary['tables'].values())
+        with self.db_manager.get_session() as session:
+            session.add(BackupHistory(
+                backup_id=backup_id,
+                kind=actual_kind,
+                parent_id=chain['parent_id'],
+                base_id=chain['base_id'],
+                filename=filename,
+                path=path if keep else None,
+                file_size_mb=round(size / 1024 / 1024, 3),
+                backup_type=backup_type,
+                watermarks=summary['watermarks'],
+                created_by=created_by,
+                tables_count=len(summary['tables']),
+                records_count=records,
+            ))
+        
+        logger.info(
+            f"✅ Backup {filename} ({actual_kind}): {records} строк, "
+            f"{size / 1024 / 1024:.1f} МБ, {summary['elapsed_s']} с"
+        )
+        if not validate_backup_file_size(size):
+            logger.warning(f"⚠️ Backup {filename} больше BACKUP_MAX_SIZE_MB: {size} байт")
+        
+        if keep and actual_kind == FULL:
+            self.prune_backups(backup_type)
+        
+        return {
+            **chain,
+            'path': path,
+            'filename': filename,
+            'size': size,
+            'tables': summary['tables'],
+            'chunks': summary['chunks'],
+            'elapsed_s': summary['elapsed_s'],
+        }
+    
+    def write_export(self, fileobj, chain: Dict[str, Any] = None,
+                     previous: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        Потоковая запись дампа в бинарный файл или канал
+        
+        Args:
+            chain: kind, backup_id, parent_id, base_id для заголовка
+            previous: водяные знаки прошлого backup - инкрементальный дамп
+        
+        Returns:
+            dict: tables (строк по таблицам), chunks, watermarks, elapsed_s
+        """
+        started = time.perf_counter()
+        writer = BackupWriter(fileobj, self.compresslevel)
+        writer.write_header({**self.create_backup_metadata(), **(chain or {})})
+        watermarks: Dict[str, Any] = {}
+        
+        with self._snapshot_connection() as conn:
+            planner = IncrementalPlanner(conn, previous)
+            for table in backup_tables(conn):
+                plan = planner.plan(table)
+                writer.begin_table(
+                    table.name,
+                    [(column.name, type(column.type).__name__) for column in table.columns],
+                    plan.mode if previous is not None else None
+                )
+                for column, start, end in plan.deletes:
+                    writer.write_delete(column, start, end)
+                
+                stmt = select(table)
+                if plan.where is not None:
+                    stmt = stmt.where(plan.where)
+                result = conn.execute(stmt)
+                for rows in result.partitions(self.batch_size):
+                    writer.write_rows(rows)
+                
+                watermarks[table.name] = planner.watermark(table)
+        
+        elapsed = round(time.perf_counter() - started, 1)
+        writer.finish({'elapsed_s': elapsed, 'watermarks': watermarks})
+        return {'tables': dict(writer.tables), 'chunks': writer.chunks,
+                'watermarks': watermarks, 'elapsed_s': elapsed}
+    
+    def _snapshot_connection(self):
+        """Соединение с основной БД для чтения дампа серверным курсором"""
+        engine = self.db_manager.engine
+        options = {'stream_results': True, 'max_row_buffer': self.batch_size}
+        if engine.dialect.name == 'postgresql':
+            # Один снимок на все таблицы
+            options.update(isolation_level='REPEATABLE READ', postgresql_readonly=True)
+        return engine.connect().execution_options(**options)
+    
+    def create_backup_metadata(self) -> Dict[str, Any]:
+        """Создание метаданных backup"""
+        engine = self.db_manager.engine
+        return {
+            'created_at': datetime.now().isoformat(),
+            'dialect': engine.dialect.name,
+            'database_age_days': self.get_database_age_days(),
+            'tables': [table.name for table in backup_tables(engine)],
+        }
+    
+    # ============================================
+    # ИСТОРИЯ И ЦЕПОЧКИ
+    # ============================================
+    
+    def _last_backup(self, backup_type: str) -> Optional[Dict[str, Any]]:
+        """Последний backup типа: основа следующего инкрементального"""
+        with self.db_manager.get_session() as session:
+            row = session.execute(
+                select(BackupHistory.backup_id, BackupHistory.base_id, BackupHistory.watermarks)
+                .where(BackupHistory.backup_type == backup_type)
+                .order_by(BackupHistory.id.desc()).limit(1)
+            ).first()
+        if row is None or not row.watermarks:
+            return None
+        return {'backup_id': row.backup_id, 'base_id': row.base_id, 'watermarks': row.watermarks}
+    
+    def _chain_length(self, base_id: str) -> int:
+        with self.db_manager.get_session() as session:
+            return session.execute(
+                select(func.count()).select_from(BackupHistory).where(BackupHistory.base_id == base_id)
+            ).scalar()
+    
+    def get_backup_history(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Последние backup (новые первыми)"""
+        with self.db_manager.get_session() as session:
+            rows = session.execute(
+                select(BackupHistory.backup_id, BackupHistory.kind, BackupHistory.parent_id,
+                       BackupHistory.base_id, BackupHistory.filename, BackupHistory.path,
+                       BackupHistory.file_size_mb, BackupHistory.backup_type,
+                       BackupHistory.created_at, BackupHistory.records_count)
+                .order_by(BackupHistory.id.desc()).limit(limit)
+            ).mappings().all()
+        return [dict(row) for row in rows]
+    
+    def restore_chain(self, backup_id: str = None) -> List[str]:
+        """
+        Файлы цепочки для восстановления до backup_id (по умолчанию - последний)
+        
+        Returns:
+            list: пути - полный backup, затем инкрементальные по порядку
+        
+        Raises:
+            BackupCorruptedError: файла цепочки нет в BACKUP_DIR
+        """
+        with self.db_manager.get_session() as session:
+            query = select(BackupHistory.base_id, BackupHistory.id)
+            if backup_id:
+                query = query.where(BackupHistory.backup_id == backup_id)
+            target = session.execute(query.order_by(BackupHistory.id.desc()).limit(1)).first()
+            if target is None:
+                raise BackupCorruptedError(f"Backup {backup_id or ''} не найден в истории")
+            
+            rows = session.execute(
+                select(BackupHistory.filename, BackupHistory.path)
+                .where(BackupHistory.base_id == target.base_id, BackupHistory.id <= target.id)
+                .order_by(BackupHistory.id)
+            ).all()
+        
+        missing = [row.filename for row in rows if not row.path or not os.path.exists(row.path)]
+        if missing:
+            raise BackupCorruptedError("Нет локальных файлов цепочки", details={'missing': missing})
+        return [row.path for row in rows]
+    
+    def prune_backups(self, backup_type: str = 'auto') -> int:
+        """Удаление файлов цепочек старше BACKUP_KEEP_CHAINS последних (история остается)"""
+        with self.db_manager.get_session() as session:
+            bases = session.execute(
+                select(BackupHistory.backup_id)
+                .where(BackupHistory.backup_type == backup_type, BackupHistory.kind == FULL,
+                       BackupHistory.path.isnot(None))
+                .order_by(BackupHistory.id.desc())
+            ).scalars().all()
+            expired = bases[self.keep_chains:]
+            if not expired:
+                return 0
+            
+            rows = session.execute(
+                select(BackupHistory.id, BackupHistory.path)
+                .where(BackupHistory.base_id.in_(expired), BackupHistory.path.isnot(None))
+            ).all()
+            for row in rows:
+                try:
+                    os.unlink(row.path)
+                except FileNotFoundError:
+                    pass
+            session.execute(
+                update(BackupHistory).where(BackupHistory.id.in_([row.id for row in rows])).values(path=None)
+            )
+        
+        logger.info(f"🗑️ Удалено старых файлов backup: {len(rows)}")
+        return len(rows)
     
-    # def import_database(self, zip_file_path: str) -> bool:
-    #     """
-    #     Импорт данных из backup архива
-    #     """
-    #     pass
+    # ============================================
+    # ВОССТАНОВЛЕНИЕ
+    # ============================================
+    
+    def import_database(self, backup_path: Union[str, Sequence[str]], verify: bool = True) -> Dict[str, Any]:
+        """
+        Восстановление БД из backup (содержимое таблиц заменяется)
+        
+        Args:
+            backup_path: файл полного backup или цепочка - полный, затем
+                         инкрементальные по порядку (restore_chain)
+        
+        Returns:
+            dict: отчет BackupLoader.restore, increments - отчеты
+                  BackupLoader.apply_incremental
+        
+        Raises:
+            BackupCorruptedError: файл поврежден или цепочка разорвана, БД не изменялась
+            BackupRestoreError: ошибка загрузки или сверки
+        """
+        paths = [backup_path] if isinstance(backup_path, str) else list(backup_path)
+        self._check_chain(paths)
+        # Полный backup проверяется загрузчиком, инкрементальные - заранее:
+        # битое звено в конце цепочки не должно оставить БД на полпути
+        for path in paths[1:]:
+            with open(path, 'rb') as fileobj:
+                for _ in iter_records(fileobj):
+                    pass
+        
+        db = self.db_manager
+        
+        # Отложенные записи процесса не должны лечь поверх восстановленных данных
+        db.counters.flush()
+        db.user_cache.flush()
+        
+        loader = BackupLoader(db)
+        report = loader.restore(paths[0], verify=verify)
+        report['increments'] = [loader.apply_incremental(path, verify=verify) for path in paths[1:]]
+        
+        # Водяные знаки истории описывают данные до восстановления:
+        # следующий backup - полный
+        with db.get_session() as session:
+            session.execute(update(BackupHistory).values(watermarks=None))
+        
+        # Кеши процесса построены по старым данным
+        db.settings_cache.invalidate()
+        db.partitions.reset_active_floor()
+        db.search.reset_index()
+        db.reconcile_stats()
+        
+        last = report['increments'][-1]['header'] if report['increments'] else report['header']
+        logger.info(
+            f"✅ БД восстановлена из backup от {last.get('created_at')}: "
+            f"{sum(t['rows'] for t in report['tables'].values())} строк полного backup, "
+            f"инкрементальных: {len(report['increments'])}, {report['elapsed_s']} с"
+        )
+        return report
     
-    # def create_backup_metadata(self) -> Dict[str, Any]:
-    #     """Создание метаданных backup"""
-    #     pass
+    @staticmethod
+    def _check_chain(paths: List[str]):
+        """Файлы образуют цепочку: полный backup, затем инкрементальные от него"""
+        if not paths:
+            raise BackupCorruptedError("Не указаны файлы backup")
+        
+        headers = []
+        for path in paths:
+            with open(path, 'rb') as fileobj:
+                headers.append(read_header(fileobj))
+        
+        base = headers[0]
+        if base.get('kind', FULL) != FULL:
+            raise BackupCorruptedError("Цепочка должна начинаться с полного backup")
+        
+        for previous, header in zip(headers, headers[1:]):
+            if header.get('kind') != INCREMENTAL or header.get('parent_id') != previous.get('backup_id') \
+                    or header.get('base_id') != base.get('backup_id'):
+                raise BackupCorruptedError(
+                    "Цепочка backup разорвана",
+                    details={'expected_parent': previous.get('backup_id'),
+                             'backup_id': header.get('backup_id'), 'parent_id': header.get('parent_id')}
+                )
     
-    # def validate_backup_file(self, zip_file_path: str) -> bool:
-    #     """Валидация backup файла"""
-    #     pass
+    def validate_backup_file(self, backup_path: str) -> bool:
+        """Валидация backup файла (контрольные суммы всех чанков, без загрузки)"""
+        try:
+            with open(backup_path, 'rb') as fileobj:
+                for _ in iter_records(fileobj):
+                    pass
+            return True
+        except (BackupCorruptedError, OSError) as e:
+            logger.error(f"❌ Backup {backup_path} не прошел проверку: {e}")
+            return False
 
 class BackupScheduler:
-    """Планировщик автоматических уведомлений о backup"""
+    """Ежедневный автоматический backup: полный или инкрементальный к цепочке"""
+    
+    def __init__(self, bot=None, backup_manager: BackupRestoreManager = None,
+                 chat_ids: List[int] = None, check_time: str = None):
+        """
+        Args:
+            bot: бот для отправки файлов (None - только сохранение в BACKUP_DIR)
+            chat_ids: получатели файлов (по умолчанию BACKUP_CHAT_IDS, иначе ADMIN_IDS)
+            check_time: время запуска ЧЧ:ММ (BACKUP_CHECK_TIME)
+        """
+        self.bot = bot
+        self.backup_manager = backup_manager
+        self.chat_ids = chat_ids if chat_ids is not None else _parse_ids(
+            os.getenv('BACKUP_CHAT_IDS') or os.getenv('ADMIN_IDS', '')
+        )
+        self.check_time = check_time or get_backup_check_time()
+        
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = False
+        self._lock = threading.Lock()
+        logger.info(f"⏰ BackupScheduler инициализирован (ежедневно в {self.check_time})")
     
-    def __init__(self, bot=None):
-        # self.bot = bot
-        # self.backup_manager = None
-        logger.info("⏰ BackupScheduler инициализирован (ЗАГЛУШКА)")
+    def start(self):
+        """Запуск ежедневного backup"""
+        if not is_backup_enabled():
+            logger.info("⏸️ AUTO_BACKUP_ENABLED=false, автоматический backup выключен")
+            return
+        
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="backup-scheduler", daemon=True)
+        self._thread.start()
+        logger.info("✅ Планировщик backup запущен")
     
-    # def start_scheduler(self):
-    #     """Запуск планировщика"""
-    #     pass
+    def stop(self):
+        """Остановка планировщика"""
+        self._stop.set()
+        self._started = False
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
     
-    # def check_backup_status(self):
-    #     """Ежедневная проверка статуса backup"""
-    #     pass
+    def seconds_until_next_run(self, now: datetime = None) -> float:
+        """Секунд до ближайшего BACKUP_CHECK_TIME"""
+        now = now or datetime.now()
+        hours, minutes = (int(part) for part in self.check_time.split(':'))
+        next_run = now.replace(hour=hours, minute=minutes, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        return (next_run - now).total_seconds()
     
-    # def send_backup_warning(self, days_left: int):
-    #     """Отправка предупреждения о backup"""
-    #     pass
+    def _run(self):
+        """Фоновый цикл: ожидание времени запуска, затем backup"""
+        while not self._stop.wait(self.seconds_until_next_run()):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"❌ Ошибка автоматического backup: {e}")
+    
+    def run_once(self) -> Dict[str, Any]:
+        """Один автоматический backup с отправкой файла получателям"""
+        info = self.backup_manager.create_backup(AUTO, backup_type='auto')
+        kept = bool(self.backup_manager.backup_dir)
+        
+        try:
+            if self.bot and self.chat_ids:
+                self._send(info)
+        finally:
+            if not kept:
+                os.unlink(info['path'])
+        
+        return info
+    
+    def _send(self, info: Dict[str, Any]):
+        if not validate_backup_file_size(info['size']):
+            logger.warning(f"⚠️ Backup {info['filename']} больше BACKUP_MAX_SIZE_MB, не отправлен")
+            return
+        
+        if info['kind'] == FULL:
+            caption = "💾 Автоматический backup: полный (начало новой цепочки)"
+        else:
+            caption = "💾 Автоматический backup: инкрементальный (восстанавливается после полного и предыдущих)"
+        
+        for chat_id in self.chat_ids:
+            try:
+                with open(info['path'], 'rb') as backup_file:
+                    self.bot.send_document(chat_id, backup_file,
+                                           visible_file_name=info['filename'], caption=caption)
+            except Exception as e:
+                logger.error(f"❌ Не удалось отправить backup в {chat_id}: {e}")
+
+
+def _parse_ids(value: str) -> List[int]:
+    """Список id из строки через запятую"""
+    return [int(part) for part in value.split(',') if part.strip()]
 
 # Глобальные менеджеры
 backup_manager = None
@@ -103,14 +556,18 @@ def init_backup_manager(db_manager=None):
     logger.info("🔄 Инициализация backup системы...")
     backup_manager = BackupRestoreManager(db_manager)
     logger.info("✅ Backup система инициализирована")
+    return backup_manager
 
 def init_backup_scheduler(bot=None):
-    """Инициализация планировщика backup"""
+    """Инициализация и запуск планировщика backup"""
     global backup_scheduler
     
     logger.info("🔄 Инициализация планировщика backup...")
-    backup_scheduler = BackupScheduler(bot)
+    backup_scheduler = BackupScheduler(bot, backup_manager)
+    if backup_manager is not None:
+        backup_scheduler.start()
     logger.info("✅ Планировщик backup инициализирован")
+    return backup_scheduler
 
 def get_backup_manager() -> Optional[BackupRestoreManager]:
     """Получить менеджер backup"""
@@ -121,24 +578,27 @@ def get_backup_scheduler() -> Optional[BackupScheduler]:
     return backup_scheduler
 
 # ============================================
-# КОМАНДЫ BACKUP (ЗАГЛУШКИ)
+# КОМАНДЫ BACKUP
 # ============================================
 
-async def handle_backup_download_command(user_id: int) -> Tuple[str, Optional[BytesIO]]:
+async def handle_backup_download_command(user_id: int) -> Tuple[str, Optional[Tuple[str, str]]]:
     """
     Обработка команды /downloadsql
     
     Returns:
-        Tuple[str, Optional[BytesIO]]: (сообщение, файл backup или None)
+        Tuple[str, Optional[Tuple[str, str]]]: (сообщение, (путь, имя файла) или None).
+        Временный файл удаляет вызывающий после отправки
     """
-    # Заглушка для создания backup
-    message = "💾 Команда /downloadsql пока в разработке (ПЛАН 4)\n\n"
-    message += "🚧 Скоро вы сможете:\n"
-    message += "• Скачать полный backup БД в ZIP\n"
-    message += "• Получить инструкции по восстановлению\n"
-    message += "• Автоматически мигрировать на новую БД"
-    
-    return message, None
+    if not backup_manager:
+        return "❌ Backup система не инициализирована", None
+    
+    path, filename = await asyncio.to_thread(backup_manager.export_full_database)
+    
+    if not validate_backup_file_size(os.path.getsize(path)):
+        os.unlink(path)
+        return "❌ Backup больше лимита BACKUP_MAX_SIZE_MB, отправка в Telegram невозможна", None
+    
+    return "💾 Backup базы данных создан успешно!", (path, filename)
 
 async def handle_backup_status_command(user_id: int) -> str:
     """
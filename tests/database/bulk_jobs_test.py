@@ -0,0 +1,136 @@
+"""
+Tests/database/bulk_jobs_test.py - Тесты пакетных заданий
+Do Presave Reminder Bot v25+
+
+Очистка ссылок пакетами, продолжение после остановки и отмена.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, func
+
+from database.bulk_jobs import BulkJobManager, RUNNING, DONE, CANCELLED
+from database.models import Link, User
+
+LINKS = 45
+
+
+@pytest.fixture
+def db(db):
+    """БД из conftest с LINKS активными ссылками"""
+    now = datetime.now()
+    with db.get_session() as session:
+        session.add(User(user_id=1, username='author'))
+        for i in range(LINKS):
+            session.add(Link(user_id=1, url=f"https://example.com/{i}",
+                             created_at=now - timedelta(minutes=i)))
+    return db
+
+
+def make_jobs(db, **kwargs) -> BulkJobManager:
+    """Исполнитель без пауз и с уведомлением о каждом пакете"""
+    return BulkJobManager(db, batch_size=10, pause=0, progress_interval=0, **kwargs)
+
+
+def active_links(db) -> int:
+    with db.get_session() as session:
+        return session.execute(
+            select(func.count(Link.id)).where(Link.is_active == True)
+        ).scalar()
+
+
+class TestClearLinks:
+    """Очистка ссылок пакетами"""
+
+    def test_job_runs_to_completion(self, db):
+        jobs = make_jobs(db)
+        progress = []
+        jobs.add_listener(lambda job: progress.append(job['last_key']))
+
+        job = jobs.submit('clear_links', background=False)
+
+        assert job['status'] == DONE
+        assert job['processed'] == LINKS
+        assert job['progress'] == 1.0
+        assert active_links(db) == 0
+        # Пакеты по 10 ключей: уведомление после каждого и о завершении
+        assert progress == sorted(progress) and len(progress) == 6
+
+    def test_running_job_not_duplicated(self, db):
+        jobs = make_jobs(db)
+        jobs.add_listener(lambda job: jobs._stop.set())
+        first = jobs.submit('clear_links', background=False)
+
+        again = make_jobs(db).submit('clear_links', background=True)
+
+        assert again['id'] == first['id']
+
+
+class TestResume:
+    """Продолжение после остановки процесса"""
+
+    def test_stopped_job_resumes_from_last_key(self, db):
+        interrupted = make_jobs(db)
+        interrupted.add_listener(lambda job: interrupted._stop.set())
+
+        job = interrupted.submit('clear_links', background=False)
+
+        assert job['status'] == RUNNING
+        assert job['last_key'] == job['min_key'] + 10
+        assert active_links(db) == LINKS - 10
+
+        job = make_jobs(db).execute(job['id'])
+
+        assert job['status'] == DONE
+        assert job['processed'] == LINKS
+        assert active_links(db) == 0
+
+    def test_start_picks_up_running_jobs(self, db):
+        interrupted = make_jobs(db)
+        interrupted.add_listener(lambda job: interrupted._stop.set())
+        job_id = interrupted.submit('clear_links', background=False)['id']
+
+        restarted = make_jobs(db)
+        restarted.start()
+        try:
+            for _ in range(100):
+                if restarted.get_job(job_id)['status'] != RUNNING:
+                    break
+                restarted._stop.wait(0.05)
+        finally:
+            restarted.stop()
+
+        assert restarted.get_job(job_id)['status'] == DONE
+        assert active_links(db) == 0
+
+
+class TestCancel:
+    """Отмена задания"""
+
+    def test_cancel_stops_at_next_batch(self, db):
+        jobs = make_jobs(db)
+        jobs.add_listener(
+            lambda job: job['status'] == RUNNING and jobs.cancel(job['id'])
+        )
+
+        job = jobs.submit('clear_links', background=False)
+
+        assert job['status'] == CANCELLED
+        assert job['finished_at'] is not None
+        # Применен только первый пакет: второй не сдвинул last_key и откатился
+        assert job['processed'] == 10
+        assert active_links(db) == LINKS - 10
+
+    def test_cancelled_job_not_resumed(self, db):
+        interrupted = make_jobs(db)
+        interrupted.add_listener(lambda job: interrupted._stop.set())
+        job_id = interrupted.submit('clear_links', background=False)['id']
+
+        assert make_jobs(db).cancel(job_id)
+        assert not make_jobs(db).cancel(job_id)
+
+        job = make_jobs(db).execute(job_id)
+
+        assert job['status'] == CANCELLED
+        assert active_links(db) == LINKS - 10
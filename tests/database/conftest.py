@@ -0,0 +1,18 @@
+"""
+Tests/database/conftest.py - Общие фикстуры тестов слоя БД
+Do Presave Reminder Bot v25+
+"""
+
+import pytest
+
+from database.manager import DatabaseManager
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """DatabaseManager на файловой SQLite без реплик и без spool буфера ссылок"""
+    monkeypatch.setenv('LINK_BUFFER_SPOOL_PATH', '')
+    manager = DatabaseManager(f"sqlite:///{tmp_path / 'bot.db'}", replica_urls=[])
+    manager.create_tables()
+    yield manager
+    manager.close()
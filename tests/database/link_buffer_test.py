@@ -0,0 +1,199 @@
+"""
+Tests/database/link_buffer_test.py - Тесты буфера записи ссылок
+Do Presave Reminder Bot v25+
+
+Сброс пакета, resolve() во время чужого сброса, восстановление spool
+и карантин ссылок, которые БД отвергает.
+"""
+
+import json
+import threading
+
+import pytest
+from sqlalchemy import select, func
+
+from database.link_buffer import LinkIngestionBuffer
+from database.models import Link
+
+
+def make_buffer(db, tmp_path, **kwargs):
+    """Буфер без фонового потока: сброс только вручную"""
+    kwargs.setdefault('flush_interval', 3600)
+    kwargs.setdefault('batch_size', 1000)
+    return LinkIngestionBuffer(db, spool_path=str(tmp_path / 'links.spool'), **kwargs)
+
+
+def count_links(db) -> int:
+    with db.get_session() as session:
+        return session.execute(select(func.count(Link.id))).scalar()
+
+
+def read_lines(path) -> list:
+    if not path.exists():
+        return []
+    return [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines() if line]
+
+
+class TestFlush:
+    """Пакетная запись"""
+
+    def test_flush_writes_batch_and_resolves_tokens(self, db, tmp_path):
+        buffer = make_buffer(db, tmp_path)
+        tokens = [buffer.enqueue(100 + i, f"https://example.com/{i}", thread_id=3) for i in range(5)]
+
+        first_hash = buffer._pending[0][1]['url_hash']
+        assert buffer.pending_count() == 5
+        assert buffer.has_pending(first_hash, thread_id=3)
+
+        result = buffer.flush()
+
+        assert set(result) == set(tokens)
+        assert count_links(db) == 5
+        assert buffer.pending_count() == 0
+        assert not buffer.has_pending(first_hash, thread_id=3)
+        assert read_lines(tmp_path / 'links.spool') == []
+        assert all(buffer.resolve(token) == result[token] for token in tokens)
+        with db.get_session() as session:
+            urls = dict(session.execute(select(Link.id, Link.url)).all())
+        assert [urls[result[token]] for token in tokens] == [f"https://example.com/{i}" for i in range(5)]
+
+    def test_resolve_flushes_pending_token(self, db, tmp_path):
+        buffer = make_buffer(db, tmp_path)
+        token = buffer.enqueue(1, "https://example.com/a")
+
+        link_id = buffer.resolve(token)
+
+        assert link_id is not None
+        with db.get_session() as session:
+            assert session.get(Link, link_id).url == "https://example.com/a"
+
+    def test_resolve_waits_for_concurrent_flush(self, db, tmp_path):
+        buffer = make_buffer(db, tmp_path)
+        token = buffer.enqueue(1, "https://example.com/a")
+
+        insert_started = threading.Event()
+        release_insert = threading.Event()
+        original_insert = buffer._insert_batch
+
+        def slow_insert(rows):
+            insert_started.set()
+            release_insert.wait(5)
+            return original_insert(rows)
+
+        buffer._insert_batch = slow_insert
+        flusher = threading.Thread(target=buffer.flush)
+        flusher.start()
+        assert insert_started.wait(5)
+
+        # Токен уже не в очереди, но еще не записан
+        resolved = {}
+        resolver = threading.Thread(target=lambda: resolved.setdefault('id', buffer.resolve(token)))
+        resolver.start()
+        release_insert.set()
+        flusher.join(5)
+        resolver.join(5)
+
+        assert resolved['id'] is not None
+
+
+class TestSpoolRecovery:
+    """Восстановление после падения процесса"""
+
+    def test_unflushed_links_recovered_on_start(self, db, tmp_path):
+        crashed = make_buffer(db, tmp_path)
+        crashed.enqueue(1, "https://example.com/a")
+        crashed.enqueue(2, "https://example.com/b")
+        assert len(read_lines(tmp_path / 'links.spool')) == 2
+
+        buffer = make_buffer(db, tmp_path)
+        buffer.start()
+        try:
+            buffer.flush()
+        finally:
+            buffer.stop()
+
+        assert count_links(db) == 2
+        assert buffer.get_stats()['recovered'] == 2
+        assert read_lines(tmp_path / 'links.spool') == []
+
+    def test_inflight_batch_not_duplicated(self, db, tmp_path):
+        crashed = make_buffer(db, tmp_path)
+        crashed.enqueue(1, "https://example.com/a")
+        crashed.flush()
+        # Падение после COMMIT, но до удаления inflight
+        crashed.enqueue(2, "https://example.com/b")
+        with crashed._lock:
+            crashed._move_spool_to_inflight()
+        crashed._insert_batch([row for _, row in crashed._pending])
+
+        buffer = make_buffer(db, tmp_path)
+        buffer.start()
+        try:
+            buffer.flush()
+        finally:
+            buffer.stop()
+
+        assert count_links(db) == 2
+
+
+class TestFailedFlush:
+    """Повторы и карантин"""
+
+    def test_failed_batch_requeued(self, db, tmp_path):
+        buffer = make_buffer(db, tmp_path, max_retries=3)
+        token = buffer.enqueue(1, "https://example.com/a")
+
+        def broken_insert(rows):
+            raise ConnectionError("БД недоступна")
+
+        original_insert = buffer._insert_batch
+        buffer._insert_batch = broken_insert
+        with pytest.raises(ConnectionError):
+            buffer.flush()
+
+        assert buffer.pending_count() == 1
+        assert len(read_lines(tmp_path / 'links.spool')) == 1
+
+        buffer._insert_batch = original_insert
+        assert buffer.resolve(token) is not None
+        assert buffer.get_stats()['failed_flushes'] == 1
+
+    def test_rejected_row_quarantined_after_retries(self, db, tmp_path):
+        buffer = make_buffer(db, tmp_path, max_retries=2)
+        good = buffer.enqueue(1, "https://example.com/good")
+        bad = buffer.enqueue(2, "https://example.com/bad")
+        # NOT NULL на url: БД отвергает строку сама по себе
+        buffer._pending[1][1]['url'] = None
+
+        with pytest.raises(Exception):
+            buffer.flush()
+        assert buffer.pending_count() == 2
+
+        result = buffer.flush()
+
+        assert good in result and bad not in result
+        assert buffer.resolve(good) is not None
+        assert buffer.resolve(bad) is None
+        assert buffer.pending_count() == 0
+        assert count_links(db) == 1
+        assert read_lines(tmp_path / 'links.spool') == []
+
+        rejected = read_lines(tmp_path / 'links.spool.rejected')
+        assert [row['user_id'] for row in rejected] == [2]
+        assert rejected[0]['error']
+        assert buffer.get_stats()['quarantined'] == 1
+
+    def test_unavailable_db_keeps_rows_after_retries(self, db, tmp_path):
+        buffer = make_buffer(db, tmp_path, max_retries=1)
+        buffer.enqueue(1, "https://example.com/a")
+        buffer.enqueue(2, "https://example.com/b")
+
+        def broken_insert(rows):
+            raise ConnectionError("БД недоступна")
+
+        buffer._insert_batch = broken_insert
+        assert buffer.flush() == {}
+
+        assert buffer.pending_count() == 2
+        assert len(read_lines(tmp_path / 'links.spool')) == 2
+        assert not (tmp_path / 'links.spool.rejected').exists()
@@ -0,0 +1,182 @@
+"""
+Tests/database/migrations_test.py - Тесты миграций схемы
+Do Presave Reminder Bot v25+
+
+Порядок версий, пропуск примененных, dry-run, упавший шаг без записи
+версии, продолжение пакетного заполнения и миграции после пересоздания
+схемы (FORCE_RECREATE_TABLES).
+"""
+
+import pytest
+from sqlalchemy import select, update, func, text
+
+from database.migrations import (
+    MigrationsManager, Migration, MigrationStep, MigrationError, ComputedBackfillStep, MIGRATIONS
+)
+from database.models import Link, User, force_recreate_database_schema
+
+
+class RecordingStep(MigrationStep):
+    """Шаг, записывающий свое выполнение; fail - падает при применении"""
+
+    def __init__(self, name: str, log: list, fail: bool = False):
+        self.name = name
+        self.log = log
+        self.fail = fail
+
+    def describe(self) -> str:
+        return f"step {self.name}"
+
+    def apply(self, engine):
+        if self.fail:
+            raise RuntimeError(f"шаг {self.name} упал")
+        self.log.append(self.name)
+
+
+def make_manager(db, migrations) -> MigrationsManager:
+    return MigrationsManager(db.engine, migrations, scope='test', dry_run=False)
+
+
+def null_hashes(db) -> int:
+    with db.get_session() as session:
+        return session.execute(select(func.count(Link.id)).where(Link.url_hash == None)).scalar()
+
+
+def index_names(db) -> set:
+    # Индексы по выражениям SQLite не отражает через inspect()
+    with db.engine.connect() as conn:
+        return set(conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars())
+
+
+class TestRun:
+    """Применение версий"""
+
+    def test_versions_applied_in_order(self, db):
+        log = []
+        manager = make_manager(db, [
+            Migration(2, 'second', [RecordingStep('2a', log), RecordingStep('2b', log)]),
+            Migration(1, 'first', [RecordingStep('1', log)]),
+        ])
+
+        report = manager.run()
+
+        assert log == ['1', '2a', '2b']
+        assert [item['version'] for item in report] == [1, 2]
+        assert manager.status()['current_version'] == 2
+
+    def test_applied_versions_skipped(self, db):
+        log = []
+        first = Migration(1, 'first', [RecordingStep('1', log)])
+        make_manager(db, [first]).run()
+
+        report = make_manager(db, [first, Migration(2, 'second', [RecordingStep('2', log)])]).run()
+
+        assert log == ['1', '2']
+        assert [item['version'] for item in report] == [2]
+        assert make_manager(db, [first]).run() == []
+
+    def test_target_limits_versions(self, db):
+        log = []
+        manager = make_manager(db, [
+            Migration(1, 'first', [RecordingStep('1', log)]),
+            Migration(2, 'second', [RecordingStep('2', log)]),
+        ])
+
+        manager.run(target=1)
+
+        assert log == ['1']
+        assert [item['version'] for item in manager.status()['pending']] == [2]
+
+    def test_duplicate_versions_rejected(self, db):
+        with pytest.raises(MigrationError):
+            make_manager(db, [Migration(1, 'a', []), Migration(1, 'b', [])])
+
+    def test_dry_run_changes_nothing(self, db):
+        log = []
+        manager = make_manager(db, [Migration(1, 'first', [RecordingStep('1', log)])])
+
+        report = manager.run(dry_run=True)
+
+        assert report == [{'version': 1, 'name': 'first', 'steps': ['step 1'], 'applied': False}]
+        assert log == []
+        assert manager.get_applied_versions() == {}
+
+
+class TestFailedStep:
+    """Упавший шаг"""
+
+    def test_failed_version_not_recorded_and_retried(self, db):
+        log = []
+        broken = RecordingStep('2b', log, fail=True)
+        manager = make_manager(db, [
+            Migration(1, 'first', [RecordingStep('1', log)]),
+            Migration(2, 'second', [RecordingStep('2a', log), broken]),
+            Migration(3, 'third', [RecordingStep('3', log)]),
+        ])
+
+        with pytest.raises(MigrationError):
+            manager.run()
+
+        assert set(manager.get_applied_versions()) == {1}
+        assert log == ['1', '2a']
+
+        broken.fail = False
+        manager.run()
+
+        assert set(manager.get_applied_versions()) == {1, 2, 3}
+        # Шаги упавшей версии должны быть идемпотентны: она повторяется целиком
+        assert log == ['1', '2a', '2a', '2b', '3']
+
+    def test_backfill_resumes_after_failure(self, db):
+        with db.get_session() as session:
+            session.add(User(user_id=1, username='author'))
+            for i in range(20):
+                session.add(Link(user_id=1, url=f"https://example.com/{i}"))
+        with db.get_session() as session:
+            session.execute(update(Link).values(url_hash=None))
+
+        computed = []
+        state = {'fail_on': 'https://example.com/12'}
+
+        def compute(url):
+            if url == state['fail_on']:
+                raise RuntimeError("сбой посреди заполнения")
+            computed.append(url)
+            return url[-8:]
+
+        step = ComputedBackfillStep('links', 'url', 'url_hash', compute, batch_size=5)
+        manager = make_manager(db, [Migration(1, 'backfill', [step])])
+
+        with pytest.raises(MigrationError):
+            manager.run()
+
+        # Пакеты до упавшего закоммичены, упавший откатан целиком
+        assert null_hashes(db) == 10
+        state['fail_on'] = None
+        computed.clear()
+
+        manager.run()
+
+        assert computed == [f"https://example.com/{i}" for i in range(10, 20)]
+        assert null_hashes(db) == 0
+
+
+class TestRecreate:
+    """Пересоздание схемы сбрасывает историю версий"""
+
+    def test_migrations_rerun_after_recreate(self, db):
+        bot_scope = MigrationsManager(db.engine)
+        other_scope = make_manager(db, [Migration(1, 'other', [])])
+        other_scope.run()
+        assert set(bot_scope.get_applied_versions()) == {m.version for m in MIGRATIONS}
+
+        assert force_recreate_database_schema(db.engine)
+
+        assert bot_scope.get_applied_versions() == {}
+        assert set(other_scope.get_applied_versions()) == {1}
+        assert 'idx_users_username_lower' not in index_names(db)
+
+        db.run_migrations()
+
+        assert bot_scope.status()['pending'] == []
+        assert 'idx_users_username_lower' in index_names(db)
@@ -0,0 +1,105 @@
+"""
+Tests/database/partitions_test.py - Тесты архивации ссылок
+Do Presave Reminder Bot v25+
+
+Архивация старых месяцев на несекционированной таблице (SQLite):
+выключена по умолчанию, выбор месяцев по неактивности и по возрасту,
+чтение архива и итоги статистики после архивации.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, func
+
+from database.models import Link, User
+from database.partitions import LinkPartitionManager, month_start, add_months
+from database.stats_rollup import TOTAL_LINKS, TOTAL_LINKS_ALL
+
+CURRENT = month_start(datetime.now())
+OLD_ACTIVE = add_months(CURRENT, -6)
+OLD_INACTIVE = add_months(CURRENT, -5)
+RECENT_INACTIVE = add_months(CURRENT, -1)
+
+
+def add_links(db, month, count, active):
+    with db.get_session() as session:
+        for i in range(count):
+            session.add(Link(user_id=1, url=f"https://example.com/{month:%Y%m}/{i}",
+                             created_at=month + timedelta(days=1, minutes=i), is_active=active))
+
+
+@pytest.fixture
+def links(db):
+    """Месяцы: старый активный, старый неактивный, прошлый неактивный, текущий"""
+    with db.get_session() as session:
+        session.add(User(user_id=1, username='author'))
+    add_links(db, OLD_ACTIVE, 2, True)
+    add_links(db, OLD_INACTIVE, 4, False)
+    add_links(db, RECENT_INACTIVE, 3, False)
+    add_links(db, CURRENT, 2, True)
+    db.stats.reconcile()
+    return db
+
+
+def month_urls(db, month):
+    with db.get_session() as session:
+        return session.execute(
+            select(Link.url).where(Link.created_at >= month, Link.created_at < add_months(month, 1))
+            .order_by(Link.id)
+        ).scalars().all()
+
+
+def totals(db):
+    snapshot = db.stats.get_snapshot()
+    return snapshot[TOTAL_LINKS], snapshot[TOTAL_LINKS_ALL]
+
+
+class TestArchive:
+    """Выбор и перенос месяцев в архив"""
+
+    def test_disabled_by_default(self, links, monkeypatch):
+        monkeypatch.delenv('LINK_ARCHIVE_AFTER_MONTHS', raising=False)
+        monkeypatch.delenv('LINK_ARCHIVE_MAX_AGE_MONTHS', raising=False)
+
+        assert LinkPartitionManager(links).archive() == []
+        with links.get_session() as session:
+            assert session.query(func.count(Link.id)).scalar() == 11
+
+    def test_old_inactive_month_archived(self, links):
+        manager = LinkPartitionManager(links, archive_after_months=3, max_age_months=0, archive_dir='')
+        urls = month_urls(links, OLD_INACTIVE)
+        before = totals(links)
+
+        planned = manager.archive(dry_run=True)
+        assert [entry['month'] for entry in planned] == [OLD_INACTIVE.date()]
+        assert month_urls(links, OLD_INACTIVE) == urls
+
+        report = manager.archive()
+
+        assert [(entry['month'], entry['rows'], entry['active_rows']) for entry in report] == [
+            (OLD_INACTIVE.date(), 4, 0)
+        ]
+        assert month_urls(links, OLD_INACTIVE) == []
+        assert len(month_urls(links, OLD_ACTIVE)) == 2
+        assert [row['url'] for row in manager.read_archive(OLD_INACTIVE.date())] == urls
+        # Архивированные ссылки остаются в «всего ссылок», в том числе после сверки
+        assert totals(links) == before
+        links.stats.reconcile()
+        assert totals(links) == before
+        assert manager.archive() == []
+
+    def test_max_age_archives_active_month(self, links, tmp_path):
+        manager = LinkPartitionManager(links, archive_after_months=0, max_age_months=5,
+                                       archive_dir=str(tmp_path / 'archive'))
+        active, total = totals(links)
+
+        report = manager.archive()
+
+        assert [entry['month'] for entry in report] == [OLD_ACTIVE.date()]
+        assert report[0]['path'].startswith(str(tmp_path / 'archive'))
+        assert len(manager.read_archive(OLD_ACTIVE.date())) == 2
+        assert totals(links) == (active - 2, total)
+        links.stats.reconcile()
+        assert totals(links) == (active - 2, total)
+        assert manager.get_stats()['archived_rows'] == 2
@@ -0,0 +1,133 @@
+"""
+Tests/database/search_test.py - Тесты поиска по ссылкам
+Do Presave Reminder Bot v25+
+
+Индекс в памяти (SQLite): ранжирование, слова запроса как префиксы,
+очищенные и архивированные ссылки, догрузка новых ссылок, страницы
+результатов и ключи запросов для кнопок пагинации.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update, delete
+
+from database.models import Link, User
+from database.search import LinkSearchManager, tokenize
+
+
+def add_link(db, url, message_text=None, **values) -> int:
+    with db.get_session() as session:
+        link = Link(user_id=1, url=url, message_text=message_text, **values)
+        session.add(link)
+        session.flush()
+        return link.id
+
+
+@pytest.fixture
+def search(db):
+    with db.get_session() as session:
+        session.add(User(user_id=1, username='author'))
+    return LinkSearchManager(db, page_size=2, max_results=100)
+
+
+def found_ids(result):
+    return [link['id'] for link in result['links']]
+
+
+class TestRanking:
+    """Совпадения и порядок результатов"""
+
+    def test_tokenize_drops_punctuation_and_short_words(self):
+        assert tokenize("Open.Spotify.com/artist/A1-b") == ['open', 'spotify', 'com', 'artist', 'a1']
+
+    def test_exact_word_ranks_above_prefix(self, db, search):
+        prefix = add_link(db, "https://band.example.com/singles")
+        exact = add_link(db, "https://band.example.com/page", "новый single")
+
+        result = search.search("single")
+
+        assert result['backend'] == 'memory'
+        assert found_ids(result) == [exact, prefix]
+
+    def test_rare_word_outweighs_common(self, db, search):
+        rare = add_link(db, "https://example.com/lima")
+        common = [add_link(db, f"https://example.com/live/{i}") for i in range(4)]
+
+        result = search.search("li", page=1)
+
+        # Оба слова - продолжения префикса, но «lima» встречается реже
+        assert result['total'] == 5
+        assert found_ids(result) == [rare, common[-1]]
+
+    def test_all_words_required_and_prefix_match(self, db, search):
+        spotify = add_link(db, "https://open.spotify.com/album/xyz", "пресейв альбома")
+        add_link(db, "https://music.yandex.ru/album/1", "пресейв сингла")
+
+        assert found_ids(search.search("spot альб")) == [spotify]
+        assert search.search("spotify yandex")['total'] == 0
+        assert search.search("!")['total'] == 0
+
+
+class TestIndexContents:
+    """Какие ссылки попадают в результаты"""
+
+    def test_cleared_links_found_archived_skipped(self, db, search):
+        cleared = add_link(db, "https://example.com/release/one")
+        archived = add_link(db, "https://example.com/release/two",
+                            created_at=datetime.now() - timedelta(days=200))
+        with db.get_session() as session:
+            session.execute(update(Link).values(is_active=False))
+
+        # Поиск - по всей истории, включая очищенные /clearlinks
+        assert found_ids(search.search("release")) == [archived, cleared]
+
+        with db.get_session() as session:
+            session.execute(delete(Link).where(Link.id == archived))
+
+        result = search.search("release")
+        assert found_ids(result) == [cleared]
+
+    def test_new_links_indexed_on_next_search(self, db, search):
+        first = add_link(db, "https://example.com/demo/1")
+        assert found_ids(search.search("demo")) == [first]
+
+        second = add_link(db, "https://example.com/demo/2")
+
+        assert found_ids(search.search("demo")) == [second, first]
+        assert search.get_stats()['memory_index']['documents'] == 2
+
+
+class TestPaging:
+    """Страницы результатов и ключи запросов"""
+
+    def test_pages_cover_results_once(self, db, search):
+        ids = [add_link(db, f"https://example.com/mix/{i}") for i in range(5)]
+
+        pages = [search.search("mix", page=page) for page in (1, 2, 3)]
+
+        assert [result['total_pages'] for result in pages] == [3, 3, 3]
+        assert [found_ids(result) for result in pages] == [ids[4:2:-1], ids[2:0:-1], ids[:1]]
+        assert found_ids(search.search("mix", page=4)) == []
+
+    def test_max_results_limits_total(self, db, search):
+        limited = LinkSearchManager(db, page_size=2, max_results=3)
+        for i in range(5):
+            add_link(db, f"https://example.com/mix/{i}")
+
+        result = limited.search("mix", page=2)
+
+        assert (result['total'], result['total_pages']) == (3, 2)
+        assert len(result['links']) == 1
+
+    def test_remember_query_round_trip(self, search):
+        key = search.remember_query("open spotify")
+
+        assert key == search.remember_query("open spotify")
+        assert len(key) == 8
+        assert search.lookup_query(key) == "open spotify"
+        assert search.lookup_query("00000000") is None
+
+        for i in range(256):
+            search.remember_query(f"query {i}")
+        assert search.lookup_query(key) is None
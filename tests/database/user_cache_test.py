@@ -0,0 +1,58 @@
+"""
+Tests/database/user_cache_test.py - Тесты кеша профилей пользователей
+Do Presave Reminder Bot v25+
+
+Пакетный сброс отметок активности: ON CONFLICT на SQLite и построчный
+UPDATE/INSERT для СУБД без него дают одинаковый результат.
+"""
+
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+
+from database.models import User
+from database.user_cache import UserProfileCache
+
+
+@pytest.fixture
+def cache(db):
+    with db.get_session() as session:
+        session.add(User(user_id=1, username='old', first_name='Ann'))
+    cache = UserProfileCache(db, flush_interval=3600)
+    cache._started = True  # без фонового потока: сброс только вручную
+    cache.remember(1, 'old', 'Ann')
+    return cache
+
+
+def stored_users(db):
+    with db.get_session() as session:
+        return [
+            (row.user_id, row.username, row.first_name, row.last_seen_at is not None)
+            for row in session.execute(select(User).order_by(User.user_id)).scalars()
+        ]
+
+
+@pytest.mark.parametrize('per_row', [False, True], ids=['on_conflict', 'per_row'])
+def test_flush_updates_profiles(db, cache, monkeypatch, per_row):
+    if per_row:
+        # СУБД без INSERT ... ON CONFLICT
+        monkeypatch.setattr(db.engine.dialect, 'name', 'mssql')
+
+    assert cache.touch(1, username='new')
+    assert not cache.touch(2, username='unknown')
+    assert cache.flush() == 1
+    assert cache.flush() == 0
+
+    assert stored_users(db) == [(1, 'new', 'Ann', True)]
+
+
+def test_per_row_merge_inserts_missing_user(db, cache):
+    cache._merge_rows([
+        {'user_id': 1, 'username': None, 'first_name': 'Anna', 'last_name': None,
+         'last_seen_at': datetime.now()},
+        {'user_id': 3, 'username': 'fresh', 'first_name': None, 'last_name': None,
+         'last_seen_at': datetime.now()},
+    ])
+
+    assert stored_users(db) == [(1, 'old', 'Anna', True), (3, 'fresh', None, True)]
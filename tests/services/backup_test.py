@@ -0,0 +1,254 @@
+"""
+Tests/services/backup_test.py - Тесты backup и восстановления
+Do Presave Reminder Bot v27.1+
+
+Полный backup и восстановление, цепочка с инкрементальным backup
+(включая удаление архивированного месяца), отказ от поврежденных
+файлов и откат неудачной загрузки на SQLite.
+"""
+
+import os
+import gzip
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, func, update
+
+from core.exceptions import BackupCorruptedError, BackupRestoreError
+from database.manager import DatabaseManager
+from database.models import Link, LinkArchive, User
+from database.partitions import LinkPartitionManager, month_start, add_months
+from services.backup_restore import BackupRestoreManager, FULL, INCREMENTAL
+from services.backup_loader import BackupLoader
+from services.backup_incremental import module_tables
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """DatabaseManager на файловой SQLite с пользователями и ссылками"""
+    monkeypatch.setenv('LINK_BUFFER_SPOOL_PATH', '')
+    monkeypatch.setenv('BACKUP_DIR', str(tmp_path / 'backups'))
+    manager = DatabaseManager(f"sqlite:///{tmp_path / 'bot.db'}", replica_urls=[])
+    manager.create_tables()
+
+    now = datetime.now()
+    with manager.get_session() as session:
+        for user_id in (1, 2, 3):
+            session.add(User(user_id=user_id, username=f"user{user_id}"))
+        for i in range(30):
+            session.add(Link(user_id=i % 3 + 1, url=f"https://example.com/{i}",
+                             created_at=now - timedelta(minutes=i)))
+
+    yield manager
+    manager.close()
+
+
+@pytest.fixture
+def backups(db):
+    return BackupRestoreManager(db, batch_size=7)
+
+
+def table_state(db):
+    """Содержимое таблиц, которые проверяют тесты"""
+    with db.get_session() as session:
+        users = session.execute(select(User.user_id, User.username).order_by(User.user_id)).all()
+        links = session.execute(
+            select(Link.id, Link.url, Link.is_active).order_by(Link.id)
+        ).all()
+    return [tuple(row) for row in users], [tuple(row) for row in links]
+
+
+def rewrite_backup(path, change):
+    """Перезапись файла backup: change(records) меняет записи на месте"""
+    with gzip.open(path, 'rt', encoding='utf-8') as stream:
+        records = [json.loads(line) for line in stream]
+    change(records)
+    with gzip.open(path, 'wt', encoding='utf-8') as stream:
+        for record in records:
+            stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+class TestFullBackup:
+    """Полный backup и восстановление"""
+
+    def test_round_trip_restores_contents(self, db, backups):
+        before = table_state(db)
+        info = backups.create_backup(FULL)
+
+        with db.get_session() as session:
+            session.execute(update(User).where(User.user_id == 1).values(username='renamed'))
+            session.execute(update(Link).values(is_active=False))
+            session.add(User(user_id=99, username='late'))
+
+        report = backups.import_database(info['path'])
+
+        assert table_state(db) == before
+        assert report['verified']
+        assert report['tables']['links']['rows'] == 30
+        assert report['tables']['users']['rows'] == 3
+
+    def test_module_tables_included_when_present(self, db, backups):
+        tables = {table.name: table for table in module_tables()}
+        if not tables:
+            pytest.skip("ядро модулей не импортируется")
+
+        assert 'karma_history' not in backups.create_backup_metadata()['tables']
+
+        history = tables['karma_history']
+        history.create(db.engine)
+        with db.engine.begin() as conn:
+            conn.execute(history.insert().values(
+                group_id=-100, user_id=1, karma_change=5, karma_before=0, karma_after=5,
+                reason="тест", change_type='manual', created_at=datetime.now()
+            ))
+
+        info = backups.create_backup(FULL)
+        with db.engine.begin() as conn:
+            conn.execute(history.delete())
+
+        report = backups.import_database(info['path'])
+
+        assert report['tables']['karma_history']['rows'] == 1
+        with db.engine.connect() as conn:
+            assert conn.execute(select(history.c.karma_change)).scalars().all() == [5]
+
+    def test_validate_accepts_intact_file(self, backups):
+        info = backups.create_backup(FULL)
+        assert backups.validate_backup_file(info['path'])
+
+
+class TestTamperedBackup:
+    """Поврежденный файл отвергается до изменения БД"""
+
+    def test_modified_rows_rejected(self, db, backups):
+        info = backups.create_backup(FULL)
+
+        def change(records):
+            chunk = next(r for r in records if r['type'] == 'chunk' and r['table'] == 'links')
+            chunk['rows'][0][2] = 'https://evil.example.com/'
+
+        rewrite_backup(info['path'], change)
+        before = table_state(db)
+
+        assert not backups.validate_backup_file(info['path'])
+        with pytest.raises(BackupCorruptedError):
+            backups.import_database(info['path'])
+        assert table_state(db) == before
+
+    def test_removed_chunk_rejected(self, db, backups):
+        info = backups.create_backup(FULL)
+
+        def change(records):
+            index = next(i for i, r in enumerate(records) if r['type'] == 'chunk' and r['table'] == 'links')
+            del records[index]
+
+        rewrite_backup(info['path'], change)
+
+        with pytest.raises(BackupCorruptedError):
+            backups.import_database(info['path'])
+
+    def test_truncated_file_rejected(self, db, backups):
+        info = backups.create_backup(FULL)
+        rewrite_backup(info['path'], lambda records: records.pop())
+
+        with pytest.raises(BackupCorruptedError):
+            backups.import_database(info['path'])
+
+
+class TestIncrementalBackup:
+    """Цепочка: полный backup, затем инкрементальный"""
+
+    def test_chain_restores_latest_state(self, db, backups):
+        full = backups.create_backup(FULL)
+
+        with db.get_session() as session:
+            session.add(Link(user_id=1, url="https://example.com/new", created_at=datetime.now()))
+            session.execute(update(User).where(User.user_id == 2).values(username='changed'))
+
+        incremental = backups.create_backup(INCREMENTAL)
+        assert incremental['kind'] == INCREMENTAL
+        expected = table_state(db)
+
+        with db.get_session() as session:
+            session.execute(update(Link).values(is_active=False))
+
+        report = backups.import_database([full['path'], incremental['path']])
+
+        assert table_state(db) == expected
+        assert len(report['increments']) == 1
+
+    def test_chain_merges_rows_without_on_conflict(self, db, backups, monkeypatch):
+        full = backups.create_backup(FULL)
+        with db.get_session() as session:
+            session.add(Link(user_id=1, url="https://example.com/new", created_at=datetime.now()))
+            session.execute(update(User).where(User.user_id == 2).values(username='changed'))
+        incremental = backups.create_backup(INCREMENTAL)
+        expected = table_state(db)
+
+        # СУБД без INSERT ... ON CONFLICT: upsert по строке
+        monkeypatch.setattr(db.engine.dialect, 'name', 'mssql')
+        backups.import_database([full['path'], incremental['path']])
+
+        assert table_state(db) == expected
+
+    def test_archived_month_deleted_by_increment(self, db, backups):
+        old_month = add_months(month_start(datetime.now()), -5)
+        with db.get_session() as session:
+            for i in range(4):
+                session.add(Link(user_id=1, url=f"https://example.com/old/{i}", is_active=False,
+                                 created_at=old_month + timedelta(days=1, minutes=i)))
+        full = backups.create_backup(FULL)
+
+        report = LinkPartitionManager(db, archive_after_months=3, max_age_months=0,
+                                      archive_dir='').archive()
+        assert [entry['rows'] for entry in report] == [4]
+        incremental = backups.create_backup(INCREMENTAL)
+        expected = table_state(db)
+
+        backups.import_database([full['path'], incremental['path']])
+
+        assert table_state(db) == expected
+        with db.get_session() as session:
+            assert session.query(func.count(LinkArchive.id)).scalar() == 1
+
+    def test_broken_chain_rejected(self, db, backups):
+        first = backups.create_backup(FULL)
+        second = backups.create_backup(FULL)
+        incremental = backups.create_backup(INCREMENTAL)
+
+        assert incremental['parent_id'] == second['backup_id']
+        with pytest.raises(BackupCorruptedError):
+            backups.import_database([first['path'], incremental['path']])
+
+    def test_incremental_alone_rejected(self, backups):
+        backups.create_backup(FULL)
+        incremental = backups.create_backup(INCREMENTAL)
+
+        with pytest.raises(BackupCorruptedError):
+            backups.import_database(incremental['path'])
+
+
+class TestFailedRestore:
+    """Ошибка загрузки не оставляет БД очищенной"""
+
+    def test_sqlite_restore_rolled_back(self, db, backups, monkeypatch):
+        info = backups.create_backup(FULL)
+        with db.get_session() as session:
+            session.add(User(user_id=99, username='late'))
+        before = table_state(db)
+
+        original_insert = BackupLoader._insert
+
+        def failing_insert(self, conn, table, *args, **kwargs):
+            if table.name == 'links':
+                raise RuntimeError("диск заполнен")
+            return original_insert(self, conn, table, *args, **kwargs)
+
+        monkeypatch.setattr(BackupLoader, '_insert', failing_insert)
+
+        with pytest.raises(BackupRestoreError):
+            backups.import_database(info['path'])
+
+        assert table_state(db) == before
+        assert os.path.exists(info['path'])
@@ -0,0 +1,198 @@
+"""
+Tests/user_management/daily_stats_test.py - Тесты дневной статистики
+Do Presave Reminder Bot v29.07
+
+Пакетный upsert с прибавлением к уже сброшенным счетчикам (и построчно
+на СУБД без ON CONFLICT), несброшенные приросты в запросах по диапазону,
+возврат прироста при ошибке сброса и счетчик messages_sent из
+обработчика сообщений группы.
+"""
+
+import asyncio
+import contextlib
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+
+from core.database_core import Base, CORE_MIGRATIONS
+from core.interfaces import EventTypes
+from database.migrations import MigrationsManager
+from handlers.messages import MessageHandler
+from modules.user_management.daily_stats import DailyStatsAccumulator
+from modules.user_management.models import UserStatistics
+
+GROUP_ID = -100
+TODAY = date.today()
+
+
+class SQLiteDatabase:
+    """Ядро БД на файловой SQLite: сессии как у DatabaseCore"""
+
+    def __init__(self, path):
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+        self.session_factory = async_sessionmaker(self.engine, expire_on_commit=False)
+
+    @contextlib.asynccontextmanager
+    async def get_async_session(self):
+        async with self.session_factory() as session:
+            try:
+                yield session
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+
+    @contextlib.asynccontextmanager
+    async def get_read_session(self, consistent: bool = False):
+        async with self.session_factory() as session:
+            yield session
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Таблицы модулей с уникальным индексом (user_id, group_id, stat_date)"""
+    path = tmp_path / 'bot.db'
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    MigrationsManager(engine, CORE_MIGRATIONS, scope='core').run(dry_run=False)
+    engine.dispose()
+    return SQLiteDatabase(path)
+
+
+@pytest.fixture
+def stats(db):
+    return DailyStatsAccumulator(db, flush_interval=3600)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def stored_rows(db):
+    async with db.get_read_session() as session:
+        return [
+            (row.user_id, row.stat_date, row.messages_sent, row.commands_used)
+            for row in (await session.execute(
+                select(UserStatistics).order_by(UserStatistics.user_id, UserStatistics.stat_date)
+            )).scalars()
+        ]
+
+
+class TestFlush:
+    """Пакетный upsert"""
+
+    def test_flushes_merge_into_one_row(self, stats, db):
+        async def scenario():
+            stats.record(1, GROUP_ID, messages_sent=1)
+            stats.record(1, GROUP_ID, messages_sent=1, commands_used=1)
+            stats.record(2, GROUP_ID, messages_sent=1)
+            assert await stats.flush() == 2
+
+            stats.record(1, GROUP_ID, messages_sent=3)
+            stats.record(1, GROUP_ID, TODAY - timedelta(days=1), messages_sent=1)
+            assert await stats.flush() == 2
+            assert await stats.flush() == 0
+
+            assert await stored_rows(db) == [
+                (1, TODAY - timedelta(days=1), 1, 0),
+                (1, TODAY, 5, 1),
+                (2, TODAY, 1, 0),
+            ]
+
+        run(scenario())
+
+    def test_flushes_merge_without_on_conflict(self, stats, db, monkeypatch):
+        # СУБД без INSERT ... ON CONFLICT: прибавление по строке
+        monkeypatch.setattr(db.engine.sync_engine.dialect, 'name', 'mssql')
+
+        async def scenario():
+            stats.record(1, GROUP_ID, messages_sent=2)
+            assert await stats.flush() == 1
+            stats.record(1, GROUP_ID, messages_sent=1, commands_used=1)
+            stats.record(2, GROUP_ID, messages_sent=1)
+            assert await stats.flush() == 2
+
+            assert await stored_rows(db) == [(1, TODAY, 3, 1), (2, TODAY, 1, 0)]
+
+        run(scenario())
+
+    def test_failed_flush_keeps_counts(self, stats, db, monkeypatch):
+        async def scenario():
+            stats.record(1, GROUP_ID, messages_sent=2)
+
+            async def broken_upsert(session, rows):
+                raise ConnectionError("БД недоступна")
+
+            with monkeypatch.context() as patch:
+                patch.setattr(stats, '_upsert', broken_upsert)
+                with pytest.raises(ConnectionError):
+                    await stats.flush()
+
+            stats.record(1, GROUP_ID, messages_sent=1)
+            assert await stats.flush() == 1
+            assert await stored_rows(db) == [(1, TODAY, 3, 0)]
+
+        run(scenario())
+
+    def test_unknown_counter_rejected(self, stats):
+        with pytest.raises(ValueError):
+            stats.record(1, GROUP_ID, messages=1)
+
+
+class TestRange:
+    """Запросы по диапазону дат"""
+
+    def test_pending_counts_included(self, stats):
+        async def scenario():
+            stats.record(1, GROUP_ID, messages_sent=2)
+            await stats.flush()
+            stats.record(1, GROUP_ID, messages_sent=1)
+            stats.record(2, GROUP_ID, messages_sent=4)
+
+            user = await stats.get_user_range(1, TODAY, TODAY)
+            assert [day['messages_sent'] for day in user] == [3]
+
+            group = await stats.get_group_range(GROUP_ID, TODAY - timedelta(days=7), TODAY)
+            assert len(group) == 1
+            assert group[0]['messages_sent'] == 7
+            assert group[0]['active_users'] == 2
+
+        run(scenario())
+
+    def test_events_update_counters(self, stats):
+        async def scenario():
+            await stats.on_event(EventTypes.USER_KARMA_CHANGED, {
+                'user_id': 1, 'group_id': GROUP_ID, 'change': 2,
+                'change_type': 'gratitude', 'changed_by': 2
+            })
+            await stats.on_event(EventTypes.USER_LINKS_CHANGED,
+                                 {'user_id': 1, 'group_id': GROUP_ID, 'links_added': 1})
+
+            day = (await stats.get_user_range(1, TODAY, TODAY))[0]
+            assert (day['karma_received'], day['links_shared']) == (2, 1)
+            giver = (await stats.get_user_range(2, TODAY, TODAY))[0]
+            assert giver['karma_given'] == 2
+
+        run(scenario())
+
+
+class TestGroupMessages:
+    """messages_sent из обработчика сообщений группы"""
+
+    def test_group_message_recorded(self, stats):
+        handler = MessageHandler(None, SimpleNamespace(get_setting=lambda key, default=None: True), None)
+        handler.set_daily_stats(stats)
+        message = SimpleNamespace(
+            from_user=SimpleNamespace(id=1), chat=SimpleNamespace(id=GROUP_ID),
+            text="привет всем", message_thread_id=3
+        )
+
+        handler._handle_group_message(message)
+        handler._handle_group_message(message)
+
+        day = run(stats.get_user_range(1, TODAY, TODAY, group_id=GROUP_ID))[0]
+        assert day['messages_sent'] == 2
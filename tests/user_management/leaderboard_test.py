@@ -0,0 +1,77 @@
+"""
+Tests/user_management/leaderboard_test.py - Тесты лидербордов в памяти
+Do Presave Reminder Bot v29.07
+
+Обновление индекса событиями пользователей: регистрация, карма,
+деактивация (без возврата по событиям кармы и ссылок) и смена группы
+через USER_PROFILE_UPDATED.
+"""
+
+import asyncio
+
+from core.interfaces import EventTypes
+from modules.user_management.leaderboard import LeaderboardIndex
+
+GROUP_ID = -100
+
+
+def make_index(*users) -> LeaderboardIndex:
+    """Индекс без БД с пользователями (user_id, karma)"""
+    index = LeaderboardIndex(database=None)
+    for user_id, karma in users:
+        emit(index, EventTypes.USER_REGISTERED,
+             {'user_id': user_id, 'group_id': GROUP_ID, 'karma': karma})
+    return index
+
+
+def emit(index, event_type, data):
+    asyncio.run(index.on_event(event_type, data))
+
+
+def top_ids(index, group_id=GROUP_ID):
+    return [item['user_id'] for item in index.top(group_id)]
+
+
+class TestEvents:
+    """События пользователей"""
+
+    def test_karma_change_reorders(self):
+        index = make_index((1, 5), (2, 3))
+
+        emit(index, EventTypes.USER_KARMA_CHANGED, {'user_id': 2, 'group_id': GROUP_ID, 'new_karma': 9})
+
+        assert top_ids(index) == [2, 1]
+        assert index.position(1)['position'] == 2
+
+    def test_deactivated_user_removed(self):
+        index = make_index((1, 5), (2, 3))
+
+        emit(index, EventTypes.USER_PROFILE_UPDATED,
+             {'user_id': 1, 'group_id': GROUP_ID, 'is_active': False, 'karma': 5})
+
+        assert top_ids(index) == [2]
+        assert index.position(1) is None
+
+    def test_deactivated_user_ignores_later_changes(self):
+        index = make_index((1, 5), (2, 3))
+        emit(index, EventTypes.USER_PROFILE_UPDATED,
+             {'user_id': 1, 'group_id': GROUP_ID, 'is_active': False})
+
+        emit(index, EventTypes.USER_KARMA_CHANGED, {'user_id': 1, 'group_id': GROUP_ID, 'new_karma': 9})
+        emit(index, EventTypes.USER_LINKS_CHANGED, {'user_id': 1, 'group_id': GROUP_ID, 'links_published': 4})
+        emit(index, EventTypes.USER_PROFILE_UPDATED, {'user_id': 1, 'group_id': GROUP_ID, 'is_active': True})
+
+        assert top_ids(index) == [2]
+        assert index.position(1) is None
+
+    def test_profile_update_reactivates_and_moves_group(self):
+        index = make_index((1, 5))
+        emit(index, EventTypes.USER_PROFILE_UPDATED,
+             {'user_id': 1, 'group_id': GROUP_ID, 'is_active': False})
+
+        emit(index, EventTypes.USER_PROFILE_UPDATED,
+             {'user_id': 1, 'group_id': -200, 'is_active': True, 'karma': 5, 'links_published': 2})
+
+        assert top_ids(index) == []
+        assert top_ids(index, -200) == [1]
+        assert index.position(1, 'requests')['value'] == 2
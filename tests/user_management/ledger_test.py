@@ -0,0 +1,248 @@
+"""
+Tests/user_management/ledger_test.py - Тесты журнала кармы
+Do Presave Reminder Bot v29.07
+
+Изменение баланса с записью журнала, снимки, карма на момент времени,
+сверка и стартовый баланс (запись при регистрации и миграция core 4).
+"""
+
+import asyncio
+import contextlib
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, select, update, func
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+
+from core.database_core import Base, CORE_MIGRATIONS
+from core.exceptions import KarmaError, UserNotFoundError
+from database.migrations import MigrationsManager
+from modules.user_management.ledger import KarmaLedger, OPENING_BALANCE
+from modules.user_management.models import MusicUser, KarmaHistory
+
+GROUP_ID = -100
+
+
+class SQLiteDatabase:
+    """Ядро БД на файловой SQLite: сессии как у DatabaseCore"""
+
+    def __init__(self, path):
+        self.path = path
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+        self.session_factory = async_sessionmaker(self.engine, expire_on_commit=False)
+
+    @contextlib.asynccontextmanager
+    async def get_async_session(self):
+        async with self.session_factory() as session:
+            try:
+                yield session
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+
+    @contextlib.asynccontextmanager
+    async def get_read_session(self, consistent: bool = False):
+        async with self.session_factory() as session:
+            yield session
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Пустые таблицы модулей и один пользователь с нулевой кармой"""
+    path = tmp_path / 'bot.db'
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(MusicUser.__table__.insert().values(user_id=1, group_id=GROUP_ID))
+    engine.dispose()
+    return SQLiteDatabase(path)
+
+
+@pytest.fixture
+def ledger(db):
+    return KarmaLedger(db, max_karma=100, settle_seconds=0)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def apply(db, ledger, user_id, change, reason="тест"):
+    async with db.get_async_session() as session:
+        return await ledger.apply(session, user_id, change, reason)
+
+
+async def balance(db, user_id) -> int:
+    async with db.get_read_session() as session:
+        return await session.scalar(
+            select(MusicUser.karma_points).where(MusicUser.user_id == user_id)
+        )
+
+
+async def history_count(db) -> int:
+    async with db.get_read_session() as session:
+        return await session.scalar(select(func.count(KarmaHistory.id)))
+
+
+async def age_history(db, created_at):
+    """Перенос всех записей журнала на момент created_at"""
+    async with db.get_async_session() as session:
+        await session.execute(update(KarmaHistory).values(created_at=created_at))
+
+
+class TestApply:
+    """Изменение баланса"""
+
+    def test_apply_updates_balance_and_history(self, db, ledger):
+        async def scenario():
+            assert await apply(db, ledger, 1, 5) == (0, 5, GROUP_ID)
+            assert await apply(db, ledger, 1, -2) == (5, 3, GROUP_ID)
+
+            assert await balance(db, 1) == 3
+            assert await history_count(db) == 2
+            report = await ledger.verify()
+            assert report['balance_mismatches'] == []
+
+        run(scenario())
+
+    def test_bounds_and_unknown_user_rejected(self, db, ledger):
+        async def scenario():
+            with pytest.raises(KarmaError):
+                await apply(db, ledger, 1, -1)
+            with pytest.raises(KarmaError):
+                await apply(db, ledger, 1, 101)
+            with pytest.raises(UserNotFoundError):
+                await apply(db, ledger, 2, 1)
+
+            assert await balance(db, 1) == 0
+            assert await history_count(db) == 0
+
+        run(scenario())
+
+
+class TestSnapshots:
+    """Снимки и карма на момент времени"""
+
+    def test_snapshot_covers_new_history_only(self, db, ledger):
+        async def scenario():
+            await apply(db, ledger, 1, 5)
+            await apply(db, ledger, 1, 3)
+            await age_history(db, datetime.now() - timedelta(hours=1))
+
+            assert await ledger.take_snapshots() == 1
+            assert await ledger.take_snapshots() == 0
+
+            await apply(db, ledger, 1, 2)
+            await age_history(db, datetime.now() - timedelta(minutes=1))
+            assert await ledger.take_snapshots() == 1
+
+            report = await ledger.verify()
+            assert report['snapshots_checked'] == 1
+            assert report['snapshot_mismatches'] == []
+            assert report['balance_mismatches'] == []
+
+        run(scenario())
+
+    def test_karma_at_uses_snapshot_and_tail(self, db, ledger):
+        async def scenario():
+            start = datetime.now() - timedelta(days=3)
+
+            await apply(db, ledger, 1, 5)
+            await age_history(db, start)
+            assert await ledger.take_snapshots() == 1
+
+            await apply(db, ledger, 1, 7)
+            async with db.get_async_session() as session:
+                await session.execute(
+                    update(KarmaHistory).where(KarmaHistory.karma_change == 7)
+                    .values(created_at=start + timedelta(days=1))
+                )
+
+            assert await ledger.karma_at(1, start - timedelta(hours=1)) == 0
+            assert await ledger.karma_at(1, start + timedelta(hours=1)) == 5
+            assert await ledger.karma_at(1, start + timedelta(days=2)) == 12
+            assert await ledger.karma_at(2, start) is None
+
+        run(scenario())
+
+
+class TestVerify:
+    """Сверка балансов с журналом"""
+
+    def test_balance_changed_outside_ledger_reported(self, db, ledger):
+        async def scenario():
+            await apply(db, ledger, 1, 5)
+            async with db.get_async_session() as session:
+                await session.execute(
+                    update(MusicUser).where(MusicUser.user_id == 1).values(karma_points=9)
+                )
+
+            report = await ledger.verify()
+            assert report['balance_mismatches'] == [
+                {'user_id': 1, 'karma_points': 9, 'ledger': 5}
+            ]
+
+        run(scenario())
+
+
+class TestOpeningBalance:
+    """Стартовый баланс в журнале"""
+
+    def test_new_user_opening_entry(self, db, ledger):
+        async def scenario():
+            async with db.get_async_session() as session:
+                session.add(MusicUser(user_id=2, group_id=GROUP_ID, karma_points=10))
+                assert ledger.open_balance(session, 2, GROUP_ID, 10)
+                assert not ledger.open_balance(session, 3, GROUP_ID, 0)
+
+            async with db.get_read_session() as session:
+                entry = (await session.execute(select(KarmaHistory))).scalar_one()
+            assert entry.change_type == OPENING_BALANCE
+            assert (entry.karma_before, entry.karma_after) == (0, 10)
+
+            await apply(db, ledger, 2, 5)
+            assert (await ledger.verify())['balance_mismatches'] == []
+            assert await ledger.karma_at(2, datetime.now() + timedelta(minutes=1)) == 15
+
+        run(scenario())
+
+    def test_migration_backfills_legacy_balances(self, db, ledger):
+        async def scenario():
+            await apply(db, ledger, 1, 5)
+            async with db.get_async_session() as session:
+                # Балансы, выставленные до журнала
+                await session.execute(
+                    update(MusicUser).where(MusicUser.user_id == 1).values(karma_points=20)
+                )
+                session.add(MusicUser(user_id=2, group_id=GROUP_ID, karma_points=30))
+                session.add(MusicUser(user_id=3, group_id=GROUP_ID, karma_points=0))
+
+            assert len((await ledger.verify())['balance_mismatches']) == 2
+
+        run(scenario())
+
+        engine = create_engine(f"sqlite:///{db.path}")
+        try:
+            MigrationsManager(engine, CORE_MIGRATIONS, scope='core').run(dry_run=False)
+            # Повторное выполнение шага ничего не добавляет
+            opening = next(m for m in CORE_MIGRATIONS if m.name == 'karma_history_opening_balance')
+            for step in opening.steps:
+                step.apply(engine)
+        finally:
+            engine.dispose()
+
+        async def check():
+            report = await ledger.verify()
+            assert report['balance_mismatches'] == []
+
+            async with db.get_read_session() as session:
+                entries = (await session.execute(
+                    select(KarmaHistory.user_id, KarmaHistory.karma_change)
+                    .where(KarmaHistory.change_type == OPENING_BALANCE)
+                    .order_by(KarmaHistory.user_id)
+                )).all()
+            assert [tuple(entry) for entry in entries] == [(1, 15), (2, 30)]
+
+        run(check())
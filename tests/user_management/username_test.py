@@ -0,0 +1,87 @@
+"""
+Tests/user_management/username_test.py - Тесты поиска по username
+Do Presave Reminder Bot v29.07
+
+Одинаковый результат поиска по @username из индекса в памяти и из БД:
+деактивированные пользователи не находятся ни одним из путей.
+"""
+
+import asyncio
+import contextlib
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+
+from core.database_core import Base
+from modules.user_management.models import MusicUser
+from modules.user_management.services import UserService
+from modules.user_management.user_index import UsernameIndex
+
+GROUP_ID = -100
+
+
+class SQLiteDatabase:
+    """Ядро БД на файловой SQLite: сессии как у DatabaseCore"""
+
+    def __init__(self, path):
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+        self.session_factory = async_sessionmaker(self.engine, expire_on_commit=False)
+
+    @contextlib.asynccontextmanager
+    async def get_async_session(self):
+        async with self.session_factory() as session:
+            try:
+                yield session
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+
+    @contextlib.asynccontextmanager
+    async def get_read_session(self, consistent: bool = False):
+        async with self.session_factory() as session:
+            yield session
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Активный @Active и деактивированный @Gone"""
+    path = tmp_path / 'bot.db'
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(MusicUser.__table__.insert(), [
+            {'user_id': 1, 'group_id': GROUP_ID, 'username': 'Active', 'is_active': True},
+            {'user_id': 2, 'group_id': GROUP_ID, 'username': 'Gone', 'is_active': False},
+        ])
+    engine.dispose()
+    return SQLiteDatabase(path)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def make_service(db, with_index: bool) -> UserService:
+    user_index = None
+    if with_index:
+        user_index = UsernameIndex(db)
+        await user_index.rebuild()
+    return UserService(db, settings=None, user_index=user_index)
+
+
+@pytest.mark.parametrize('with_index', [False, True], ids=['database', 'index'])
+def test_inactive_users_not_found(db, with_index):
+    async def scenario():
+        service = await make_service(db, with_index)
+
+        user = await service.get_user_by_username('@active')
+        assert user.user_id == 1
+        assert await service.resolve_username('ACTIVE', GROUP_ID) == 1
+
+        assert await service.get_user_by_username('gone') is None
+        assert await service.resolve_username('@Gone') is None
+
+    run(scenario())
@@ -39,6 +39,7 @@ from .validators import (
     validate_all_required_env_vars,
     create_validation_report
 )
+from .urls import canonicalize_url, url_hash
 
 # ============================================
 # ПЛАН 2: УТИЛИТЫ КАРМЫ (ЗАГЛУШКИ)
@@ -118,6 +119,8 @@ __all__ = [
     'ConfigValidator',
     'validate_all_required_env_vars',
     'create_validation_report',
+    'canonicalize_url',
+    'url_hash',
     
     # ПЛАН 2 (ЗАГЛУШКИ)
     # 'format_karma_display',
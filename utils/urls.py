@@ -0,0 +1,123 @@
+"""
+Канонизация URL Do Presave Reminder Bot v25+
+Приведение ссылок к единому виду и хеш для поиска повторов
+
+ПЛАН 1: Локальная нормализация без сетевых запросов (АКТИВНАЯ)
+
+Одна и та же ссылка приходит в разном виде: с utm-метками, с «www.»,
+со слешем в конце, через короткий домен (youtu.be) или с языковым
+префиксом в пути. canonicalize_url() приводит такие варианты к одному
+URL, url_hash() дает по нему короткий ключ для индекса links.url_hash.
+Короткие ссылки, которые раскрываются только редиректом (spoti.fi,
+bit.ly), не трогаются: это потребовало бы сетевого запроса.
+"""
+
+import re
+import hashlib
+from functools import lru_cache
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Параметры отслеживания, удаляемые на любых доменах
+TRACKING_PARAMS = {
+    'fbclid', 'gclid', 'yclid', 'igshid', 'mc_cid', 'mc_eid', '_ga', '_gl', 'ref_src',
+}
+TRACKING_PREFIXES = ('utm_',)
+
+# Параметры отслеживания конкретных площадок
+HOST_TRACKING_PARAMS = {
+    'youtube.com': {'si', 'feature', 'pp'},
+    'music.youtube.com': {'si', 'feature'},
+    'open.spotify.com': {'si', 'nd', 'context'},
+    'music.yandex.ru': {'from'},
+}
+
+# Зеркала доменов: мобильные версии и короткие домены с тем же путем
+HOST_ALIASES = {
+    'm.youtube.com': 'youtube.com',
+    'm.vk.com': 'vk.com',
+    'm.facebook.com': 'facebook.com',
+    'mobile.twitter.com': 'twitter.com',
+    'x.com': 'twitter.com',
+}
+
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Языковой префикс пути: open.spotify.com/intl-de/track/..., deezer.com/ru/track/...
+_SPOTIFY_INTL_RE = re.compile(r'^/intl-[a-z]{2}(?:-[a-z]{2})?(?=/)', re.IGNORECASE)
+_DEEZER_LANG_RE = re.compile(r'^/[a-z]{2}(?=/(?:track|album|artist|playlist)/)', re.IGNORECASE)
+
+
+def _is_tracking_param(name: str, host: str) -> bool:
+    lowered = name.lower()
+    if lowered in TRACKING_PARAMS or lowered.startswith(TRACKING_PREFIXES):
+        return True
+    return lowered in HOST_TRACKING_PARAMS.get(host, ())
+
+
+def _resolve_short_link(host: str, path: str, query: list):
+    """Раскрытие коротких ссылок, чей адрес выводится из пути"""
+    if host == 'youtu.be':
+        video_id = path.strip('/').split('/')[0]
+        if video_id:
+            return 'youtube.com', '/watch', [('v', video_id)] + query
+
+    if host == 'open.spotify.com':
+        path = _SPOTIFY_INTL_RE.sub('', path)
+
+    if host == 'deezer.com':
+        path = _DEEZER_LANG_RE.sub('', path)
+
+    return host, path, query
+
+
+@lru_cache(maxsize=4096)
+def canonicalize_url(url: str) -> str:
+    """
+    Канонический вид URL - ключ сравнения для url_hash, не для показа
+
+    Хранится и показывается исходная ссылка. Схема https (http и https -
+    одна ссылка), хост в нижнем регистре без «www.» и порта по умолчанию,
+    без фрагмента, параметров отслеживания и завершающего слеша;
+    оставшиеся параметры отсортированы. Некорректный URL возвращается
+    как есть (без пробелов по краям).
+    """
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').rstrip('.')
+    if scheme not in _DEFAULT_PORTS or not host:
+        return url
+
+    if host.startswith('www.'):
+        host = host[4:]
+    host = HOST_ALIASES.get(host, host)
+
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    host, path, query = _resolve_short_link(host, parts.path, query)
+
+    query = sorted(
+        (name, value) for name, value in query
+        if not _is_tracking_param(name, host)
+    )
+
+    path = re.sub(r'/{2,}', '/', path).rstrip('/')
+
+    netloc = host
+    if port and port != _DEFAULT_PORTS[scheme]:
+        netloc = f"{host}:{port}"
+
+    return urlunsplit(('https', netloc, path, urlencode(query), ''))
+
+
+def url_hash(url: Optional[str]) -> Optional[str]:
+    """Хеш канонического URL (32 hex-символа) для индекса повторов"""
+    if not url:
+        return None
+    canonical = canonicalize_url(url)
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).hexdigest()
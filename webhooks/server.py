@@ -12,6 +12,8 @@ from urllib.parse import urlparse, parse_qs
 import telebot
 
 from utils.logger import get_logger, log_api_call
+from database.instrumentation import statement_scope
+from database.engines import get_pool_stats
 
 logger = get_logger(__name__)
 
@@ -174,6 +176,7 @@ class WebhookHandler(BaseHTTPRequestHandler):
                         "status": "В разработке"
                     }
                 },
+                "pools": get_pool_stats(include_url=False),
                 "environment": {
                     "host": os.getenv('HOST', '0.0.0.0'),
                     "port": os.getenv('PORT', '8080'),
@@ -229,7 +232,8 @@ class WebhookHandler(BaseHTTPRequestHandler):
             # Обрабатываем update
             try:
                 update = telebot.types.Update.de_json(update_data)
-                self.bot.process_new_updates([update])
+                with statement_scope(f"update:{update.update_id}"):
+                    self.bot.process_new_updates([update])
                 
                 # Логируем успешную обработку
                 update_type = "message" if update.message else "callback_query" if update.callback_query else "unknown"